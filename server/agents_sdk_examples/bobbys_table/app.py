@@ -14,6 +14,9 @@ from sqlalchemy import or_
 import queue
 import threading
 import time
+import db_pool
+import request_profiler
+import sql_trace
 # Import moved to avoid circular import
 
 load_dotenv()
@@ -22,9 +25,16 @@ load_dotenv()
 app = Flask(__name__, static_folder=None)
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(os.getcwd(), "instance", "restaurant.db")}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Bounded, thread-shared connection pool; WAL and busy-timeout PRAGMAs are applied per connection below
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_pool.sqlalchemy_engine_options()
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'devsecret')
 app.config['local_tz'] = os.getenv('LOCAL_TZ', 'America/New_York')
 
+# Opt-in per-request profiling (REQUEST_PROFILING=true); profiles are served from /debug/profiles
+request_profiler.install(app)
+# Per-request SQL counters and X-DB-* headers (SQL_DEBUG=true), slow-query log (SQL_SLOW_MS)
+sql_trace.install(app)
+
 # Setup file logging
 loggers = setup_logging()
 app_logger = loggers['main']
@@ -43,6 +53,18 @@ calendar_event_queue = queue.Queue(maxsize=100)  # Limit queue size to prevent m
 stripe.api_key = os.getenv('STRIPE_API_KEY', 'sk_test_51234567890abcdef')  # Replace with your test secret key
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', 'pk_test_51234567890abcdef')  # Replace with your test publishable key
 
+# Route Stripe API calls through a keep-alive session with bounded timeouts and retries
+try:
+    import http_client
+    _stripe_client_cls = getattr(stripe, 'RequestsClient', None) or stripe.http_client.RequestsClient
+    stripe.default_http_client = _stripe_client_cls(
+        timeout=http_client.DEFAULT_TIMEOUT[1],
+        session=http_client.get_http_client().session_for('https://api.stripe.com')
+    )
+    stripe.max_network_retries = 2
+except Exception as e:
+    print(f"WARNING: Could not configure pooled Stripe HTTP client: {e}")
+
 # Configure static files
 app.config['STATIC_FOLDER'] = os.path.join(app.root_path, 'static')
 
@@ -61,6 +83,10 @@ app.config['MIME_TYPES'] = {
 }
 
 db.init_app(app)
+with app.app_context():
+    db_pool.configure_sqlalchemy_engine(db.engine)
+    if sql_trace.enabled():
+        sql_trace.instrument_engine(db.engine)
 auth = HTTPBasicAuth()
 
 # Custom Jinja2 filter for 12-hour time format
@@ -272,6 +298,18 @@ with app.app_context():
         migrate_orders_table()
         migrate_reservations_table()
 
+        # Versioned index migrations (see migrations.py)
+        try:
+            import migrations
+            conn = db_pool.connect(migrations.DB_PATH)
+            try:
+                applied = migrations.migrate(conn)
+            finally:
+                conn.close()
+            print(f"SUCCESS: Schema migrations up to date ({len(applied)} applied)")
+        except Exception as e:
+            print(f"WARNING: Schema migration error: {e}")
+
     except Exception as e:
         print(f"WARNING: Database initialization error: {e}")
         import traceback
@@ -2331,71 +2369,60 @@ def create_payment_intent():
 
 
 def send_payment_receipt_sms(reservation, payment_amount, phone_number=None, confirmation_number=None):
-    """Send SMS receipt for payment using SWAIG function"""
+    """Queue an SMS receipt for a reservation payment (delivered by the SMS dispatcher)"""
     try:
-        import requests
-        import json
+        from sms_dispatcher import enqueue_sms
 
         # Use provided phone_number or reservation.phone_number
         to_number = phone_number if phone_number else reservation.phone_number
 
-        # Call the send_payment_receipt SWAIG function
-        swaig_data = {
-            'function': 'send_payment_receipt',
-            'argument': {
-                'parsed': [{
-                    'reservation_number': reservation.reservation_number,
-                    'phone_number': to_number,
-                    'payment_amount': float(payment_amount),
-                    'confirmation_number': confirmation_number or 'N/A'
-                }],
-                'raw': json.dumps({
-                    'reservation_number': reservation.reservation_number,
-                    'phone_number': to_number,
-                    'payment_amount': float(payment_amount),
-                    'confirmation_number': confirmation_number or 'N/A'
-                })
-            },
-            'call_id': f'payment-{confirmation_number or "unknown"}',
-            'content_type': 'text/swaig',
-            'version': '2.0',
-            'caller_id_num': to_number
-        }
+        # Convert time to 12-hour format for SMS
+        try:
+            time_obj = datetime.strptime(str(reservation.time), '%H:%M')
+            time_12hr = time_obj.strftime('%I:%M %p').lstrip('0')
+        except (ValueError, TypeError):
+            time_12hr = str(reservation.time)
 
-        print(f"SMS: Calling SWAIG send_payment_receipt function for reservation {reservation.reservation_number}")
-        response = requests.post(
-            'http://localhost:8080/receptionist',
-            json=swaig_data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
+        party_text = "person" if reservation.party_size == 1 else "people"
 
-        if response.status_code == 200:
-            result = response.json()
-            # Check if SWML send_sms action was generated
-            if 'action' in result:
-                for action_item in result['action']:
-                    if 'SWML' in action_item and 'sections' in action_item['SWML']:
-                        for section_action in action_item['SWML']['sections']['main']:
-                            if 'send_sms' in section_action:
-                                print(f"SUCCESS: SMS receipt SWAIG function called successfully - SWML send_sms action generated")
-                                return {'success': True, 'sms_sent': True, 'sms_result': 'Payment receipt SMS SWML action generated via SWAIG'}
-
-            print(f"SUCCESS: SMS receipt SWAIG function called successfully")
-            return {'success': True, 'sms_sent': True, 'sms_result': 'Payment receipt SMS function called via SWAIG'}
-        else:
-            print(f"WARNING: SMS SWAIG function failed: {response.status_code} - {response.text}")
-            return {'success': False, 'sms_sent': False, 'error': f'SWAIG function failed: {response.status_code}'}
+        sms_body = f"Bobby's Table - Payment Receipt\n\n"
+        sms_body += f"Reservation: #{reservation.reservation_number}\n"
+        sms_body += f"Name: {reservation.name}\n"
+        sms_body += f"Party Size: {reservation.party_size} {party_text}\n"
+        sms_body += f"Date: {reservation.date}\n"
+        sms_body += f"Time: {time_12hr}\n"
+        sms_body += f"Amount Paid: ${float(payment_amount):.2f}\n"
+        if confirmation_number:
+            sms_body += f"Confirmation: {confirmation_number}\n"
+        sms_body += f"Payment Status: COMPLETED\n"
+        sms_body += f"Processed: {datetime.now().strftime('%m/%d/%Y %I:%M %p')}\n\n"
+        sms_body += f"Thank you for dining with us!\n"
+        sms_body += f"Bobby's Table Restaurant\n"
+        sms_body += f"Reply STOP to stop."
+
+        # One receipt per payment: the confirmation number identifies the payment
+        dedup_key = f"payment_receipt:{reservation.reservation_number}:{confirmation_number or payment_amount}"
+
+        print(f"SMS: Queueing payment receipt for reservation {reservation.reservation_number}")
+        queue_result = enqueue_sms(to_number, sms_body, kind='payment_receipt', dedup_key=dedup_key)
+        if not queue_result.get('success'):
+            return {'success': False, 'sms_sent': False, 'error': queue_result.get('error')}
+
+        return {
+            'success': True,
+            'sms_sent': False,
+            'sms_queued': True,
+            'message_id': queue_result.get('message_id'),
+            'sms_result': 'Payment receipt SMS queued for delivery'
+        }
 
     except Exception as e:
-        print(f"ERROR: SMS Error: Failed to call SWAIG send_payment_receipt function: {e}")
+        print(f"ERROR: SMS Error: Failed to queue payment receipt SMS: {e}")
         return {'success': False, 'sms_sent': False, 'error': str(e)}
 
 def send_order_payment_receipt_sms(order, payment_amount, phone_number=None, confirmation_number=None):
-    """Send SMS receipt for order payment"""
+    """Queue an SMS receipt for an order payment (delivered by the SMS dispatcher)"""
     try:
-        from signalwire_agents.core.function_result import SwaigFunctionResult
-
         # Convert time to 12-hour format for SMS
         try:
             time_obj = datetime.strptime(str(order.target_time), '%H:%M')
@@ -2444,76 +2471,25 @@ def send_order_payment_receipt_sms(order, payment_amount, phone_number=None, con
         sms_body += f"Bobby's Table Restaurant\n"
         sms_body += f"Reply STOP to stop."
 
-        # Get SignalWire phone number from environment
-        signalwire_from_number = os.getenv('SIGNALWIRE_FROM_NUMBER', '+15551234567')
-
         # Use provided phone_number or order.customer_phone
         to_number = phone_number if phone_number else order.customer_phone
 
-        # Send SMS using SignalWire REST API directly
-        try:
-            import requests
-
-            # Get SignalWire credentials from environment
-            project_id = os.getenv('SIGNALWIRE_PROJECT_ID')
-            auth_token = os.getenv('SIGNALWIRE_AUTH_TOKEN') or os.getenv('SIGNALWIRE_TOKEN') 
-            space_url = os.getenv('SIGNALWIRE_SPACE_URL')
-
-            # If SIGNALWIRE_SPACE_URL is not set, construct it from SIGNALWIRE_SPACE
-            if not space_url:
-                signalwire_space = os.getenv('SIGNALWIRE_SPACE')
-                if signalwire_space:
-                    space_url = f"{signalwire_space}.signalwire.com"
-                    print(f"🔄 Constructed SIGNALWIRE_SPACE_URL: https://{space_url}")
-
-            # If REST API credentials are not available, fall back to the SDK approach
-            if not all([project_id, auth_token, space_url]):
-                print("WARNING: SignalWire REST API credentials not found, using SDK approach")
-                # Use SignalWire Agents SDK
-                from signalwire_agents.core.function_result import SwaigFunctionResult
-                result = SwaigFunctionResult()
-                result = result.send_sms(
-                    to_number=to_number,
-                    from_number=signalwire_from_number,
-                    body=sms_body
-                )
-                print(f"SMS: SMS sent using SignalWire Agents SDK")
-                return {'success': True, 'sms_sent': True, 'sms_result': 'Order payment receipt SMS sent via SDK'}
-
-            # Use SignalWire REST API
-            url = f"https://{space_url}/api/laml/2010-04-01/Accounts/{project_id}/Messages.json"
-
-            data = {
-                'From': signalwire_from_number,
-                'To': to_number,
-                'Body': sms_body
-            }
+        # Queue the SMS; the dispatcher sends it via the SignalWire REST API with retries
+        from sms_dispatcher import enqueue_sms
 
-            response = requests.post(
-                url,
-                auth=(project_id, auth_token),
-                data=data
-            )
+        dedup_key = f"order_payment_receipt:{order.order_number}:{confirmation_number or payment_amount}"
+        queue_result = enqueue_sms(to_number, sms_body, kind='order_payment_receipt', dedup_key=dedup_key)
+        if not queue_result.get('success'):
+            print(f"ERROR: Failed to queue order payment receipt SMS: {queue_result.get('error')}")
+            return {'success': False, 'sms_sent': False, 'error': queue_result.get('error')}
 
-            if response.status_code == 201:
-                print(f"SUCCESS: SMS sent successfully via SignalWire REST API")
-                return {'success': True, 'sms_sent': True, 'sms_result': 'Order payment receipt SMS sent via REST API'}
-            else:
-                print(f"ERROR: Failed to send SMS via REST API: {response.status_code} - {response.text}")
-                # Fall back to SDK approach
-                from signalwire_agents.core.function_result import SwaigFunctionResult
-                result = SwaigFunctionResult()
-                result = result.send_sms(
-                    to_number=to_number,
-                    from_number=signalwire_from_number,
-                    body=sms_body
-                )
-                print(f"SMS: SMS sent using SignalWire Agents SDK (fallback)")
-                return {'success': True, 'sms_sent': True, 'sms_result': 'Order payment receipt SMS sent via SDK (fallback)'}
-
-        except Exception as sms_error:
-            print(f"ERROR: SMS sending error: {sms_error}")
-            return {'success': False, 'sms_sent': False, 'error': str(sms_error)}
+        return {
+            'success': True,
+            'sms_sent': False,
+            'sms_queued': True,
+            'message_id': queue_result.get('message_id'),
+            'sms_result': 'Order payment receipt SMS queued for delivery'
+        }
 
     except Exception as e:
         print(f"ERROR: SMS Error: Failed to send order payment receipt SMS to {phone_number or order.customer_phone}: {e}")
@@ -2859,47 +2835,19 @@ def payment_processor():
                             # Don't fail the payment if calendar refresh fails
                             print(f"WARNING: Calendar refresh notification error (non-critical): {refresh_error}")
 
-                        # Call SWAIG send_payment_receipt function for reservation
-                        print(f"SMS: Calling SWAIG send_payment_receipt function for reservation {reservation_number}")
-                        try:
-                            # Make a SWAIG function call to send the SMS receipt
-                            swaig_data = {
-                                "function": "send_payment_receipt",
-                                "argument": {
-                                    "parsed": [{
-                                        "reservation_number": reservation_number,
-                                        "phone_number": phone_number or reservation.phone_number,
-                                        "payment_amount": amount_cents / 100.0,  # Convert cents to dollars for SMS
-                                        "confirmation_number": confirmation_number
-                                    }],
-                                    "raw": json.dumps({
-                                        "reservation_number": reservation_number,
-                                        "phone_number": phone_number or reservation.phone_number,
-                                        "payment_amount": amount_cents / 100.0,  # Convert cents to dollars for SMS
-                                        "confirmation_number": confirmation_number
-                                    })
-                                },
-                                "call_id": f"payment-{confirmation_number}",
-                                "content_type": "text/swaig",
-                                "version": "2.0",
-                                "caller_id_num": phone_number or reservation.phone_number
-                            }
-
-                            # Call the SWAIG receptionist endpoint to trigger SMS
-                            import requests
-                            response = requests.post('http://localhost:8080/receptionist', json=swaig_data)
-
-                            if response.status_code == 200:
-                                swaig_result = response.json()
-                                print(f"SUCCESS: SMS receipt SWAIG function called successfully - SWML send_sms action generated")
-                                sms_status = "SMS receipt sent: Payment receipt SMS SWML action generated via SWAIG"
-                            else:
-                                print(f"WARNING: SWAIG SMS function call failed: {response.status_code}")
-                                sms_status = f"SMS receipt failed: SWAIG call returned {response.status_code}"
-
-                        except Exception as sms_error:
-                            print(f"WARNING: Failed to call SWAIG SMS function: {sms_error}")
-                            sms_status = f"SMS receipt failed: {str(sms_error)}"
+                        # Queue the payment receipt SMS (sent by the SMS dispatcher)
+                        print(f"SMS: Queueing payment receipt for reservation {reservation_number}")
+                        sms_result = send_payment_receipt_sms(
+                            reservation,
+                            amount_cents / 100.0,
+                            phone_number=phone_number or reservation.phone_number,
+                            confirmation_number=confirmation_number
+                        )
+                        if sms_result.get('success'):
+                            sms_status = "SMS receipt queued for delivery"
+                        else:
+                            print(f"WARNING: Failed to queue SMS receipt: {sms_result.get('error')}")
+                            sms_status = f"SMS receipt failed: {sms_result.get('error')}"
 
                         # Return comprehensive response with confirmation number
                         return jsonify({
@@ -3010,6 +2958,11 @@ def is_payment_in_progress(call_id):
         session_data = app.payment_sessions.get(call_id)
         is_active = session_data is not None
 
+        if not is_active:
+            from payment_state import get_payment_state_machine, ACTIVE_STATES
+            payment_record = get_payment_state_machine().get(call_id)
+            is_active = bool(payment_record and payment_record['state'] in ACTIVE_STATES)
+
         print(f"🔍 Checking payment session for {call_id}: {'ACTIVE' if is_active else 'INACTIVE'}")
         if session_data:
             print(f"   Session data: {session_data}")
@@ -3103,6 +3056,16 @@ def start_payment_session(call_id, reservation_number):
                 if amount:
                     print(f"   Amount: ${amount}")
 
+            from payment_state import get_payment_state_machine, EVENT_START
+            get_payment_state_machine().transition(
+                call_id, EVENT_START,
+                reservation_number=reservation_number,
+                payment_type='reservation',
+                amount=amount,
+                customer_name=customer_name,
+                phone_number=phone_number
+            )
+
             print(f"🔍 Total active payment sessions (app): {len(app.payment_sessions)}")
             print(f"🔍 Total active payment sessions (global): {len(payment_sessions_global)}")
 
@@ -3263,9 +3226,14 @@ def debug_payment_sessions():
     if not hasattr(app, 'payment_sessions'):
         app.payment_sessions = {}
 
+    from payment_state import get_payment_state_machine
+    payment_machine = get_payment_state_machine()
+
     return jsonify({
         'payment_sessions': app.payment_sessions,
-        'session_count': len(app.payment_sessions)
+        'session_count': len(app.payment_sessions),
+        'payment_states': payment_machine.recent(),
+        'payment_state_counts': payment_machine.stats()
     })
 
 @app.route('/debug/start-payment-session', methods=['POST'])
@@ -3403,34 +3371,89 @@ def debug_test_sms():
             'error': str(e)
         }), 500
 
-# PCI COMPLIANT: Stripe webhook handler for direct payments
-@app.route('/stripe-webhook', methods=['POST'])
-def stripe_webhook():
-    """Handle Stripe webhook events for PCI-compliant payments"""
+@app.route('/debug/sms-outbox', methods=['GET'])
+def debug_sms_outbox():
+    """Debug endpoint to inspect the outbound SMS queue"""
     try:
-        print("🔍 Stripe webhook called")
+        from sms_dispatcher import get_sms_dispatcher
 
-        # Get the raw body and signature
-        payload = request.get_data()
-        sig_header = request.headers.get('Stripe-Signature')
+        dispatcher = get_sms_dispatcher()
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({
+            'success': True,
+            'stats': dispatcher.stats(),
+            'messages': dispatcher.recent(limit)
+        })
 
-        # Verify webhook signature (optional but recommended)
-        webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
-        if webhook_secret and sig_header:
-            try:
-                import stripe
-                event = stripe.Webhook.construct_event(payload, sig_header, webhook_secret)
-            except ValueError:
-                print("ERROR: Invalid payload")
-                return jsonify({"error": "Invalid payload"}), 400
-            except stripe.error.SignatureVerificationError:
-                print("ERROR: Invalid signature")
-                return jsonify({"error": "Invalid signature"}), 400
-        else:
-            # Parse without verification (for development)
-            event = json.loads(payload)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/debug/http-metrics', methods=['GET'])
+def debug_http_metrics():
+    """Debug endpoint to inspect per-host latency of outbound API calls"""
+    import http_client
+    return jsonify({
+        'success': True,
+        'hosts': http_client.get_metrics()
+    })
 
-        print(f"📋 Webhook event: {event['type']}")
+@app.route('/debug/db-pool', methods=['GET'])
+def debug_db_pool():
+    """Debug endpoint to inspect database connection pool usage"""
+    return jsonify({
+        'success': True,
+        'sqlalchemy_pool': db.engine.pool.status(),
+        'sqlite_pools': db_pool.get_stats()
+    })
+
+@app.route('/debug/profiles', methods=['GET'])
+def debug_profiles():
+    """Debug endpoint listing captured request profiles, newest first"""
+    if not request_profiler.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({
+        'success': True,
+        'profiles': request_profiler.get_profile_store().list()
+    })
+
+@app.route('/debug/profiles/<profile_id>', methods=['GET'])
+def debug_profile(profile_id):
+    """Debug endpoint with one profile's hottest functions and SQL statements"""
+    profile = request_profiler.get_profile_store().get(profile_id)
+    if profile is None or not request_profiler.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({
+        'success': True,
+        'profile': request_profiler.public(profile)
+    })
+
+@app.route('/debug/profiles/<profile_id>/download', methods=['GET'])
+def debug_profile_download(profile_id):
+    """Debug endpoint returning a profile's raw data (.prof for cProfile, collapsed stacks for sampling)"""
+    profile = request_profiler.get_profile_store().get(profile_id)
+    if profile is None or not request_profiler.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    body, mimetype, filename = request_profiler.download(profile)
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/debug/slow-queries', methods=['GET'])
+def debug_slow_queries():
+    """Debug endpoint listing recent slow SQL statements with their query plans (SQL_DEBUG=true, SQL_DEBUG_TOKEN)"""
+    if not sql_trace.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({
+        'success': True,
+        'threshold_ms': sql_trace.slow_threshold_ms(),
+        'queries': sql_trace.get_slow_log().entries()
+    })
+
+def process_stripe_event(event):
+    """Apply a recorded Stripe event to reservations/orders (runs on the Stripe event worker)"""
+    with app.app_context():
+        print(f"📋 Processing Stripe event {event.get('id')}: {event['type']}")
 
         # Handle payment intent events
         if event['type'] == 'payment_intent.succeeded':
@@ -3444,13 +3467,18 @@ def stripe_webhook():
             metadata = payment_intent.get('metadata', {})
             reservation_number = metadata.get('reservation_number')
             payment_type = metadata.get('payment_type')
-            customer_name = metadata.get('customer_name')
             phone_number = metadata.get('phone_number')
 
             if payment_type == 'reservation' and reservation_number:
                 # Update reservation payment status
                 reservation = Reservation.query.filter_by(reservation_number=reservation_number).first()
                 if reservation:
+                    # The same payment intent may arrive under several events (or already be
+                    # recorded by the payment processor); only apply it once
+                    if reservation.payment_status == 'paid' and reservation.payment_intent_id == payment_intent['id']:
+                        print(f"PAYMENT: Reservation #{reservation_number} already recorded payment {payment_intent['id']}, skipping")
+                        return
+
                     reservation.payment_status = 'paid'
                     reservation.payment_method = 'credit-card'
                     reservation.payment_date = datetime.now()
@@ -3467,7 +3495,7 @@ def stripe_webhook():
 
                     print(f"SUCCESS: Updated reservation #{reservation_number} payment status")
 
-                    # Send SMS receipt
+                    # Queue SMS receipt
                     try:
                         send_payment_receipt_sms(
                             reservation=reservation,
@@ -3475,9 +3503,9 @@ def stripe_webhook():
                             phone_number=phone_number,
                             confirmation_number=confirmation_number
                         )
-                        print(f"SUCCESS: SMS receipt sent to {phone_number}")
+                        print(f"SUCCESS: SMS receipt queued for {phone_number}")
                     except Exception as sms_error:
-                        print(f"WARNING: Failed to send SMS receipt: {sms_error}")
+                        print(f"WARNING: Failed to queue SMS receipt: {sms_error}")
 
             elif payment_type == 'order':
                 # Handle order payments similarly
@@ -3485,6 +3513,10 @@ def stripe_webhook():
                 if order_number:
                     order = Order.query.filter_by(order_number=order_number).first()
                     if order:
+                        if order.payment_status == 'paid' and order.payment_intent_id == payment_intent['id']:
+                            print(f"PAYMENT: Order #{order_number} already recorded payment {payment_intent['id']}, skipping")
+                            return
+
                         order.payment_status = 'paid'
                         order.payment_method = 'credit-card'
                         order.payment_date = datetime.now()
@@ -3506,308 +3538,82 @@ def stripe_webhook():
             print(f"ERROR: Payment failed: {payment_intent['id']}")
             print(f"   Error: {payment_intent.get('last_payment_error', {}).get('message', 'Unknown error')}")
 
-        return jsonify({"status": "success"}), 200
 
-    except Exception as e:
-        print(f"ERROR: Webhook error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+_stripe_event_queue = None
+_stripe_event_queue_lock = threading.Lock()
 
-        # Validate required fields
-        if not amount:
-            print("ERROR: Amount is required but not provided")
-            return jsonify({
-                "status": "failed",
-                "error": "Amount is required"
-            }), 400
-
-        try:
-            amount_cents = int(float(amount) * 100)
-            print(f"💰 Amount converted to cents: {amount_cents}")
-        except (ValueError, TypeError) as e:
-            print(f"ERROR: Invalid amount format: {amount} - {e}")
-            return jsonify({
-                "status": "failed",
-                "error": f"Invalid amount format: {amount}"
-            }), 400
+def get_stripe_event_queue():
+    """Return the process-wide Stripe event queue, creating it on first use"""
+    global _stripe_event_queue
+    if _stripe_event_queue is None:
+        with _stripe_event_queue_lock:
+            if _stripe_event_queue is None:
+                from stripe_events import StripeEventQueue
+                _stripe_event_queue = StripeEventQueue(handler=process_stripe_event)
+    return _stripe_event_queue
 
-        # Process payment with Stripe using the same pattern as our successful test
-        try:
-            import stripe
-            stripe.api_key = os.getenv('STRIPE_API_KEY')
+@app.route('/debug/stripe-events', methods=['GET'])
+def debug_stripe_events():
+    """Debug endpoint to inspect recorded Stripe webhook events"""
+    try:
+        event_queue = get_stripe_event_queue()
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({
+            'success': True,
+            'stats': event_queue.stats(),
+            'events': event_queue.recent(limit)
+        })
 
-            if not stripe.api_key:
-                print("WARNING: No Stripe API key configured, using test mode")
-                stripe.api_key = 'sk_test_51234567890abcdef'  # Fallback for testing
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
-            print(f"🔑 Using Stripe API key: {stripe.api_key[:12]}...")
+# PCI COMPLIANT: Stripe webhook handler for direct payments
+@app.route('/stripe-webhook', methods=['POST'])
+def stripe_webhook():
+    """Verify and record Stripe webhook events; processing happens on the Stripe event worker"""
+    try:
+        print("🔍 Stripe webhook called")
 
-            # Create payment method from card data or use test token
-            payment_method = None
-            payment_method_id = None
+        # Get the raw body and signature
+        payload = request.get_data()
+        sig_header = request.headers.get('Stripe-Signature')
 
+        # Verify webhook signature (optional but recommended)
+        webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
+        if webhook_secret and sig_header:
             try:
-                # Try to create payment method with card data
-                print(f"🔍 Attempting to create payment method with card data")
-                payment_method = stripe.PaymentMethod.create(
-                    type="card",
-                    card={
-                        "number": card_number,
-                        "exp_month": int(exp_month) if exp_month else None,
-                        "exp_year": int(exp_year) if exp_year else None,
-                        "cvc": cvc,
-                    },
-                    billing_details={
-                        "name": customer_name or "Customer",
-                        "address": {
-                            "postal_code": postal_code
-                        }
-                    }
-                )
-                payment_method_id = payment_method.id
-                print(f"SUCCESS: Payment method created: {payment_method_id}")
-
-            except stripe.error.CardError as e:
-                print(f"ERROR: Payment method creation error: {str(e)}")
-                if "raw card data" in str(e) or "empty string" in str(e):
-                    print("WARNING: Raw card data not allowed or empty, using test payment method token")
-                    # Use Stripe's test payment method instead
-                    payment_method_id = "pm_card_visa"
-                else:
-                    print(f"ERROR: Card error: {e.user_message}")
-                    return jsonify({
-                        "status": "failed",
-                        "error": e.user_message,
-                        "decline_code": e.decline_code if hasattr(e, 'decline_code') else None
-                    })
-            except Exception as e:
-                print(f"ERROR: Payment method creation error: {str(e)}")
-                # Fallback to test payment method
-                payment_method_id = "pm_card_visa"
-                print(f"🔄 Using fallback payment method: {payment_method_id}")
-
-            # Create payment intent with proper configuration
-            description = f"Bobby's Table Payment"
-            if order_number:
-                description = f"Bobby's Table Order #{order_number}"
-            elif reservation_number:
-                description = f"Bobby's Table Reservation #{reservation_number}"
-
-            print(f"PAYMENT: Creating payment intent for {description}")
-
-            payment_intent = stripe.PaymentIntent.create(
-                amount=amount_cents,
-                currency=currency,
-                payment_method=payment_method_id,
-                confirm=True,
-                description=description,
-                automatic_payment_methods={
-                    'enabled': True,
-                    'allow_redirects': 'never'  # Prevent redirect-based payment methods
-                },
-                metadata={
-                    "payment_source": "swml_pay_verb",
-                    "order_id": order_id or "",
-                    "order_number": order_number or "",
-                    "reservation_number": reservation_number or "",
-                    "customer_name": customer_name or "",
-                    "customer_phone": phone_number or "",
-                    "payment_type": payment_type or ""
-                }
-            )
-
-            print(f"SUCCESS: Payment intent created: {payment_intent.id}")
-            print(f"   Status: {payment_intent.status}")
-
-            if payment_intent.status == 'succeeded':
-                print("🎉 Stripe payment successful!")
-
-                # Generate confirmation number first
-                import random
-                import string
-                confirmation_number = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-                print(f"CONFIRMATION: Generated confirmation number: {confirmation_number}")
-
-                # Update database based on payment type
-                if payment_type == 'order' and (order_number or order_id):
-                    # Handle order payment
-                    order = None
-                    if order_number:
-                        order = Order.query.filter_by(order_number=order_number).first()
-                    elif order_id:
-                        order = Order.query.get(order_id)
-
-                    if order:
-                        order.payment_status = 'paid'
-                        order.payment_method = 'credit-card'
-                        order.payment_date = datetime.now()
-                        order.payment_amount = float(amount)
-                        order.payment_intent_id = payment_intent.id
-                        order.confirmation_number = confirmation_number
-
-                        db.session.commit()
-                        print(f"SUCCESS: Order {order.order_number} updated with payment info")
-
-                        # Send SMS receipt
-                        try:
-                            sms_result = send_order_payment_receipt_sms(
-                                order=order,
-                                payment_amount=float(amount),
-                                phone_number=phone_number or order.customer_phone,
-                                confirmation_number=confirmation_number
-                            )
-
-                            # SMS result already handled in the function
-                            if sms_result.get('success'):
-                                print(f"SUCCESS: SMS receipt sent: {sms_result.get('sms_result', 'Success')}")
-                            else:
-                                print(f"WARNING: SMS receipt failed: {sms_result.get('error', 'Unknown error')}")
-                        except Exception as sms_error:
-                            print(f"WARNING: Failed to send SMS receipt: {sms_error}")
-
-                        return jsonify({
-                            "status": "success",
-                            "payment_intent_id": payment_intent.id,
-                            "amount": float(amount),
-                            "currency": payment_intent.currency,
-                            "message": f"Payment of ${amount} processed successfully for Order #{order.order_number}. Your confirmation number is {confirmation_number}.",
-                            "confirmation_number": confirmation_number,
-                            "order_number": order.order_number
-                        })
-
-                elif payment_type == 'reservation' or reservation_number:
-                    # Handle reservation payment
-                    print(f"🔍 Processing reservation payment: type={payment_type}, number={reservation_number}")
-                    reservation = Reservation.query.filter_by(reservation_number=reservation_number).first()
-                    if reservation:
-                        print(f"SUCCESS: Found reservation: {reservation.name} for {reservation.party_size} people")
-                        reservation.payment_status = 'paid'
-                        reservation.payment_method = 'credit-card'
-                        reservation.payment_date = datetime.now()
-                        reservation.payment_amount = float(amount)
-                        reservation.payment_intent_id = payment_intent.id
-                        reservation.confirmation_number = confirmation_number
-
-                        db.session.commit()
-                        print(f"SUCCESS: Reservation {reservation.reservation_number} updated with payment info")
-
-                        # Call SWAIG send_payment_receipt function for reservation
-                        print(f"SMS: Calling SWAIG send_payment_receipt function for reservation {reservation_number}")
-                        try:
-                            # Make a SWAIG function call to send the SMS receipt
-                            swaig_data = {
-                                "function": "send_payment_receipt",
-                                "argument": {
-                                    "parsed": [{
-                                        "reservation_number": reservation_number,
-                                        "phone_number": phone_number or reservation.phone_number,
-                                        "payment_amount": amount_cents / 100.0,  # Convert cents to dollars for SMS
-                                        "confirmation_number": confirmation_number
-                                    }],
-                                    "raw": json.dumps({
-                                        "reservation_number": reservation_number,
-                                        "phone_number": phone_number or reservation.phone_number,
-                                        "payment_amount": amount_cents / 100.0,  # Convert cents to dollars for SMS
-                                        "confirmation_number": confirmation_number
-                                    })
-                                },
-                                "call_id": f"payment-{confirmation_number}",
-                                "content_type": "text/swaig",
-                                "version": "2.0",
-                                "caller_id_num": phone_number or reservation.phone_number
-                            }
+                import stripe
+                stripe.Webhook.construct_event(payload, sig_header, webhook_secret)
+            except ValueError:
+                print("ERROR: Invalid payload")
+                return jsonify({"error": "Invalid payload"}), 400
+            except stripe.error.SignatureVerificationError:
+                print("ERROR: Invalid signature")
+                return jsonify({"error": "Invalid signature"}), 400
 
-                            # Call the SWAIG receptionist endpoint to trigger SMS
-                            import requests
-                            response = requests.post('http://localhost:8080/receptionist', json=swaig_data)
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            print("ERROR: Invalid payload")
+            return jsonify({"error": "Invalid payload"}), 400
 
-                            if response.status_code == 200:
-                                swaig_result = response.json()
-                                print(f"SUCCESS: SMS receipt SWAIG function called successfully - SWML send_sms action generated")
-                                sms_status = "SMS receipt sent: Payment receipt SMS SWML action generated via SWAIG"
-                            else:
-                                print(f"WARNING: SWAIG SMS function call failed: {response.status_code}")
-                                sms_status = f"SMS receipt failed: SWAIG call returned {response.status_code}"
+        if not event.get('id') or not event.get('type'):
+            print("ERROR: Webhook event is missing id or type")
+            return jsonify({"error": "Invalid event"}), 400
 
-                        except Exception as sms_error:
-                            print(f"WARNING: Failed to call SWAIG SMS function: {sms_error}")
-                            sms_status = f"SMS receipt failed: {str(sms_error)}"
+        print(f"📋 Webhook event: {event['type']} ({event['id']})")
 
-                        return jsonify({
-                            "status": "success",
-                            "payment_intent_id": payment_intent.id,
-                            "amount": float(amount),
-                            "currency": payment_intent.currency,
-                            "message": f"Payment of ${amount} processed successfully for Reservation #{reservation_number}. Your confirmation number is {confirmation_number}.",
-                            "confirmation_number": confirmation_number,
-                            "reservation_number": reservation_number,
-                            "sms_status": sms_status
-                        })
-                    else:
-                        print(f"ERROR: Reservation {reservation_number} not found")
-                        return jsonify({
-                            "status": "failed",
-                            "error": f"Reservation {reservation_number} not found"
-                        }), 404
-
-                # Generic success response if no specific type
-                return jsonify({
-                    "status": "success",
-                    "payment_intent_id": payment_intent.id,
-                    "amount": float(amount),
-                    "currency": payment_intent.currency,
-                    "message": f"Payment of ${amount} processed successfully. Your confirmation number is {confirmation_number}.",
-                    "confirmation_number": confirmation_number
-                })
-
-            elif payment_intent.status == 'requires_action':
-                print("WARNING: Payment requires additional action")
-                return jsonify({
-                    "status": "requires_action",
-                    "payment_intent_id": payment_intent.id,
-                    "client_secret": payment_intent.client_secret,
-                    "message": "Payment requires additional authentication"
-                })
-            else:
-                print(f"ERROR: Payment failed with status: {payment_intent.status}")
-                return jsonify({
-                    "status": "failed",
-                    "payment_intent_id": payment_intent.id,
-                    "message": f"Payment failed with status: {payment_intent.status}"
-                })
+        # Record the event (idempotent on event id) and acknowledge immediately
+        result = get_stripe_event_queue().record(event)
 
-        except stripe.error.CardError as e:
-            print(f"ERROR: Stripe card error: {e.user_message}")
-            return jsonify({
-                "status": "failed",
-                "error": e.user_message,
-                "decline_code": e.decline_code if hasattr(e, 'decline_code') else None
-            })
-        except stripe.error.StripeError as e:
-            print(f"ERROR: Stripe API error: {str(e)}")
-            return jsonify({
-                "status": "failed",
-                "error": str(e),
-                "message": "Stripe API error occurred"
-            })
-        except Exception as e:
-            print(f"ERROR: Unexpected error in payment processing: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({
-                "status": "failed",
-                "error": str(e),
-                "message": "Unexpected error occurred during payment processing"
-            })
+        return jsonify({"status": "received", "duplicate": result['duplicate']}), 200
 
     except Exception as e:
-        print(f"ERROR: Critical error in payment processor: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
-            "status": "failed",
-            "error": str(e),
-            "message": "Critical error in payment processor"
-        }), 500
+        print(f"ERROR: Webhook error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/signalwire/payment-callback', methods=['POST'])
 def signalwire_payment_callback():
@@ -3846,17 +3652,46 @@ def signalwire_payment_callback():
         payment_method = params.get('payment_method')
         payment_card_type = params.get('payment_card_type')
 
-        # Determine payment status from SignalWire callback
-        if payment_for == 'payment-failed':
-            status = 'failed'
-        elif payment_for == 'payment-succeeded' or payment_for == 'payment-completed':
-            status = 'completed'
-        elif payment_for == 'payment-card-number':
-            status = 'collecting_card'
-        elif payment_for in ['expiration-date', 'security-code', 'postal-code', 'payment-processing']:
-            status = 'in_progress'
-        else:
-            status = 'unknown'
+        # Determine payment status from SignalWire callback via the payment state machine.
+        # The transition is applied atomically per call_id, so concurrent or redelivered
+        # callbacks cannot both move the same payment into completion.
+        from payment_state import (get_payment_state_machine, CALLBACK_EVENTS, CALLBACK_STATUSES, EVENT_FAILED,
+                                   EVENT_CONFIRMED, EVENT_ABORTED, STATE_COMPLETING, STATE_COMPLETED)
+        payment_machine = get_payment_state_machine()
+        payment_event = CALLBACK_EVENTS.get(payment_for)
+        payment_record = payment_machine.get(call_id)
+        transition = None
+
+        if payment_event and call_id:
+            transition = payment_machine.transition(
+                call_id, payment_event,
+                error_type=error_type,
+                failure_reason=payment_for if payment_event == EVENT_FAILED else None,
+                attempt=str(attempt) if attempt is not None else None
+            )
+            payment_record = transition['record']
+
+            if not transition['accepted']:
+                if transition['state'] in (STATE_COMPLETING, STATE_COMPLETED):
+                    # Completion already claimed by another callback for this call
+                    print(f"SUCCESS: Payment for call {call_id} already {transition['state']} - ignoring '{payment_for}'")
+                    return jsonify({
+                        "success": True,
+                        "status": "completed",
+                        "message": "Payment already processed and confirmed",
+                        "confirmation_number": (payment_record or {}).get('confirmation_number'),
+                        "call_id": call_id,
+                        "no_duplicate_announcement": True
+                    })
+                return jsonify({
+                    "success": True,
+                    "status": transition['state'],
+                    "payment_for": payment_for,
+                    "call_id": call_id,
+                    "message": f"Ignored out-of-order payment callback '{payment_for}'"
+                })
+
+        status = CALLBACK_STATUSES.get(payment_event, 'unknown')
 
         print(f"🔍 SignalWire callback analysis:")
         print(f"   Event Type: {event_type}")
@@ -3876,7 +3711,19 @@ def signalwire_payment_callback():
         amount = None
         payment_id = None  # Initialize payment_id variable
 
-        if call_id:
+        # The state machine record is keyed by call_id, so a single lookup replaces the
+        # in-memory session searches below whenever pay_reservation started this payment
+        if payment_record and (payment_record.get('reservation_number') or payment_record.get('order_number')):
+            payment_session = payment_record
+            reservation_number = payment_record.get('reservation_number')
+            customer_name = payment_record.get('customer_name')
+            phone_number = payment_record.get('phone_number')
+            payment_type = payment_record.get('payment_type') or 'reservation'
+            amount = payment_record.get('amount')
+            payment_id = payment_record.get('payment_id')
+            print(f"SUCCESS: Loaded payment state for call {call_id}: {payment_record['state']}")
+
+        if call_id and not payment_session:
             # ENHANCED DEBUG: Check BOTH storage locations
             global payment_sessions_global
             if 'payment_sessions_global' not in globals():
@@ -4033,15 +3880,7 @@ def signalwire_payment_callback():
         if status == 'failed':
             print(f"ERROR: Payment failed: {error_type}")
 
-            # Update payment session with failure info
-            if call_id:
-                payment_sessions = getattr(app, 'payment_sessions', {})
-                if call_id in payment_sessions:
-                    payment_sessions[call_id]['payment_status'] = 'failed'
-                    payment_sessions[call_id]['error_type'] = error_type
-                    payment_sessions[call_id]['failure_reason'] = payment_for
-                    payment_sessions[call_id]['attempt'] = attempt
-                    print(f"SUCCESS: Updated payment session {call_id} with failure info")
+            # Failure details were stored with the 'failed' transition for payment_retry
 
             return jsonify({
                 "success": False,
@@ -4125,6 +3964,10 @@ def signalwire_payment_callback():
                     db.session.commit()
                     print(f"SUCCESS: Order {order_number} updated with payment confirmation")
 
+                    if transition:
+                        payment_machine.transition(call_id, EVENT_CONFIRMED, order_number=order_number,
+                                                   payment_id=payment_id, confirmation_number=confirmation_number)
+
                     # ENHANCEMENT: Update Stripe Payment Intent metadata for orders
                     if payment_id and payment_id.startswith('pi_'):
                         try:
@@ -4190,6 +4033,8 @@ def signalwire_payment_callback():
                     return response
                 else:
                     print(f"ERROR: Order {order_number} not found")
+                    if transition:
+                        payment_machine.transition(call_id, EVENT_ABORTED)
                     return jsonify({
                         "success": False,
                         "error": f"Order {order_number} not found"
@@ -4220,6 +4065,10 @@ def signalwire_payment_callback():
                     db.session.commit()
                     print(f"SUCCESS: Reservation {reservation_number} updated with payment confirmation")
 
+                    if transition:
+                        payment_machine.transition(call_id, EVENT_CONFIRMED, reservation_number=reservation_number,
+                                                   payment_id=payment_id, confirmation_number=confirmation_number)
+
                     # ENHANCEMENT: Store confirmation number in payment session and conversation memory
                     # This allows the agent to access the confirmation number in future interactions
                     try:
@@ -4344,8 +4193,6 @@ def signalwire_payment_callback():
                             # Try alternative SMS method using direct SignalWire REST API
                             print(f"🔄 Attempting backup SMS method...")
                             try:
-                                import requests
-
                                 # Get SignalWire credentials
                                 project_id = os.getenv('SIGNALWIRE_PROJECT_ID')
                                 auth_token = os.getenv('SIGNALWIRE_AUTH_TOKEN') or os.getenv('SIGNALWIRE_TOKEN')
@@ -4364,7 +4211,7 @@ def signalwire_payment_callback():
                                     space_url = f"https://{space}.signalwire.com"
                                     url = f"{space_url}/api/laml/2010-04-01/Accounts/{project_id}/Messages.json"
 
-                                    response = requests.post(
+                                    response = http_client.post(
                                         url,
                                         data={
                                             'From': from_number,
@@ -4430,6 +4277,8 @@ def signalwire_payment_callback():
                     return response
                 else:
                     print(f"ERROR: Reservation {reservation_number} not found")
+                    if transition:
+                        payment_machine.transition(call_id, EVENT_ABORTED)
                     return jsonify({
                         "success": False,
                         "error": f"Reservation {reservation_number} not found"
@@ -4457,6 +4306,9 @@ def signalwire_payment_callback():
                                 print(f"SUCCESS: Payment was already processed {time_since_payment.total_seconds():.0f} seconds ago")
                                 print(f"   Confirmation: {reservation.confirmation_number}")
                                 print(f"   SMS receipt already sent - no duplicate response needed")
+                                if transition:
+                                    payment_machine.transition(call_id, EVENT_CONFIRMED,
+                                                               confirmation_number=reservation.confirmation_number)
 
                                 # Return simple success response without SWML to avoid duplicate announcements
                                 return jsonify({
@@ -4473,6 +4325,8 @@ def signalwire_payment_callback():
 
             # If we get here, generate a minimal completion response without duplicate confirmation
             print(f"🎉 Returning simple completion acknowledgment (no duplicate announcement)")
+            if transition:
+                payment_machine.transition(call_id, EVENT_CONFIRMED, reservation_number=reservation_number)
 
             return jsonify({
                 "success": True,
@@ -4515,6 +4369,15 @@ def signalwire_payment_callback():
         import traceback
         traceback.print_exc()
 
+        # Release the completion claim so a redelivered success callback can finish the payment
+        try:
+            if transition and transition['state'] == STATE_COMPLETING:
+                current = payment_machine.get(call_id)
+                if current and current['state'] == STATE_COMPLETING:
+                    payment_machine.transition(call_id, EVENT_ABORTED)
+        except Exception as state_error:
+            print(f"WARNING: Could not release payment completion for {call_id}: {state_error}")
+
         # Even if there's an error, try to update payment session if we have key info
         # This prevents the agent from asking for card details again when payment actually succeeded
         try:
@@ -4625,6 +4488,12 @@ def cleanup_orphaned_payment_sessions():
             print(f"🗑️ Removed orphaned global session: {call_id}")
             cleaned_count += 1
 
+        # Drop payment state records that have not moved in a day
+        from payment_state import get_payment_state_machine
+        purged = get_payment_state_machine().purge()
+        if purged:
+            print(f"🧹 Purged {purged} payment state record(s) older than 24 hours")
+
         if cleaned_count > 0:
             print(f"SUCCESS: Cleaned up {cleaned_count} orphaned/expired payment sessions")
 
@@ -5128,5 +4997,12 @@ if __name__ == '__main__':
     # Start automatic cleanup scheduler
     start_payment_session_cleanup_scheduler()
 
+    # Start the outbound SMS workers (resumes messages queued before a restart)
+    from sms_dispatcher import get_sms_dispatcher
+    get_sms_dispatcher().start()
+
+    # Start the Stripe webhook event worker (resumes events recorded before a restart)
+    get_stripe_event_queue().start()
+
     # Start the Flask development server
     app.run(host='0.0.0.0', port=8080, debug=False)
\ No newline at end of file
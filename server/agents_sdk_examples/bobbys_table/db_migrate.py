@@ -0,0 +1,164 @@
+"""
+Versioned SQLite migrations and EXPLAIN QUERY PLAN auditing
+
+Each app keeps its own list of migrations and a registry of its hot queries
+(see migrations.py); this module applies pending migrations in order,
+recording them in a schema_migrations table, and reports which registered
+queries still make SQLite scan a whole table or sort in a temp b-tree.
+"""
+
+import sqlite3
+import sys
+
+MIGRATIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def applied_versions(conn):
+    """Return the set of migration versions already applied"""
+    conn.execute(MIGRATIONS_SCHEMA)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+class MigrationSkipped(Exception):
+    """Raised by a step whose migration cannot apply yet; it is rolled back, left pending and retried next run"""
+
+
+def apply_migrations(conn, migrations):
+    """
+    Apply pending migrations in version order
+
+    Args:
+        conn: sqlite3 connection (or pooled connection)
+        migrations: Iterable of (version, name, steps); each step is an SQL
+            statement or a callable taking the connection (see add_column)
+
+    Returns:
+        list: Versions applied by this call (skipped ones are not recorded)
+    """
+    done = applied_versions(conn)
+    conn.commit()
+    applied = []
+    for version, name, statements in sorted(migrations, key=lambda migration: migration[0]):
+        if version in done:
+            continue
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except MigrationSkipped as e:
+            conn.rollback()
+            print(f"Skipped migration {version}: {name} ({e}); it stays pending")
+            continue
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(version)
+        print(f"Applied migration {version}: {name}")
+    return applied
+
+
+def add_column(table, column, definition):
+    """Migration step adding a column unless the table already has it (e.g. from a newer schema.sql)"""
+    def step(conn):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def explain_query_plan(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def _is_full_scan(detail):
+    # "SCAN reservations" is a table scan; "SCAN t USING (COVERING) INDEX i" walks an index.
+    # Virtual tables report "SCAN t VIRTUAL TABLE INDEX n:..." where n=0 means no usable constraint
+    if not detail.startswith('SCAN ') or ' USING ' in detail or 'CONSTANT ROW' in detail:
+        return False
+    if ' VIRTUAL TABLE INDEX ' in detail:
+        return detail.split(' VIRTUAL TABLE INDEX ', 1)[1].startswith('0:')
+    return True
+
+
+def audit_queries(conn, queries):
+    """
+    Run EXPLAIN QUERY PLAN over a registry of queries
+
+    Args:
+        conn: sqlite3 connection
+        queries: dict of name -> (sql, params)
+
+    Returns:
+        list: One dict per query with 'name', 'plan', 'full_scans', 'temp_sorts', 'error'
+    """
+    results = []
+    for name, (sql, params) in queries.items():
+        result = {'name': name, 'sql': ' '.join(sql.split()), 'plan': [], 'full_scans': [], 'temp_sorts': [], 'error': None}
+        try:
+            result['plan'] = explain_query_plan(conn, sql, params)
+        except sqlite3.Error as e:
+            result['error'] = str(e)
+        result['full_scans'] = [detail for detail in result['plan'] if _is_full_scan(detail)]
+        result['temp_sorts'] = [detail for detail in result['plan'] if 'TEMP B-TREE' in detail]
+        results.append(result)
+    return results
+
+
+def print_report(results):
+    """Print an audit report; returns the number of queries that need attention"""
+    flagged = 0
+    for result in results:
+        if result['error']:
+            status = 'ERROR'
+        elif result['full_scans']:
+            status = 'FULL SCAN'
+        elif result['temp_sorts']:
+            status = 'TEMP SORT'
+        else:
+            status = 'OK'
+        if status != 'OK':
+            flagged += 1
+        print(f"[{status:9}] {result['name']}")
+        if result['error']:
+            print(f"            {result['error']}")
+        for detail in result['plan']:
+            print(f"            {detail}")
+    print(f"\n{len(results)} queries audited, {flagged} need attention")
+    return flagged
+
+
+def run_cli(db_path, migrations, queries, argv=None):
+    """
+    Command-line entry point used by each app's migrations.py
+
+    Usage: python migrations.py [--migrate] [--strict] [db_path]
+      --migrate  apply pending migrations before auditing
+      --strict   exit with status 1 when any query does a full scan
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    paths = [arg for arg in argv if not arg.startswith('--')]
+    conn = sqlite3.connect(paths[0] if paths else db_path)
+    try:
+        if '--migrate' in argv:
+            apply_migrations(conn, migrations)
+        pending = [version for version, _, _ in migrations if version not in applied_versions(conn)]
+        if pending:
+            print(f"Pending migrations: {pending} (run with --migrate)\n")
+        results = audit_queries(conn, queries)
+    finally:
+        conn.close()
+    print_report(results)
+    full_scans = sum(1 for result in results if result['full_scans'])
+    return 1 if '--strict' in argv and full_scans else 0
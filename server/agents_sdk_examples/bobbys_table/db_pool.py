@@ -0,0 +1,334 @@
+"""
+Pooled SQLite connections tuned for concurrent web + SWAIG traffic
+
+Every connection is opened in WAL mode with a busy timeout and tuned cache
+PRAGMAs, and handed out from a bounded per-database pool. close() on a pooled
+connection returns it to the pool instead of closing it, so existing code that
+opens a connection per request keeps working unchanged. A thread that releases
+a connection gets the same one back on its next acquire, keeping sqlite3's
+prepared-statement cache warm.
+
+A thread that already has a connection checked out gets that same connection
+again from acquire(), so a request holding one (e.g. in flask.g) can call
+helpers that open their own without taking a second slot, which would
+deadlock the pool once every slot is held by such a request. The connection
+goes back to the pool when the last of its holders closes it; commits and
+rollbacks made through any holder apply to all of them.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import sql_trace
+
+# Overridden by SQLITE_BUSY_TIMEOUT_MS and SQLITE_POOL_SIZE, read when a pool or engine is configured
+DEFAULT_BUSY_TIMEOUT_MS = 10000
+DEFAULT_POOL_SIZE = 8
+
+# Statements kept prepared per connection (sqlite3's statement cache)
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """No pooled connection became available in time"""
+
+
+def default_pragmas():
+    """PRAGMAs applied to every new connection, in order"""
+    return (
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -16000),          # negative = KiB, so ~16 MB page cache
+        ('mmap_size', 268435456),        # 256 MB memory-mapped I/O
+        ('busy_timeout', int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', str(DEFAULT_BUSY_TIMEOUT_MS)))),
+        ('temp_store', 'MEMORY'),
+    )
+
+
+def default_pool_size():
+    """Connections per pool, from SQLITE_POOL_SIZE"""
+    return int(os.getenv('SQLITE_POOL_SIZE', str(DEFAULT_POOL_SIZE)))
+
+
+def apply_pragmas(conn, pragmas=None):
+    """Apply PRAGMA settings to a DB-API connection (sqlite3 or SQLAlchemy's raw connection)"""
+    if pragmas is None:
+        pragmas = default_pragmas()
+    cursor = conn.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+class PooledConnection:
+    """
+    sqlite3.Connection proxy whose close() returns the connection to its pool
+
+    Attribute access and assignment (execute, commit, row_factory, ...) are
+    passed through to the underlying connection. Using it after close() raises
+    sqlite3.ProgrammingError, like a closed sqlite3 connection.
+    """
+
+    __slots__ = ('_pool', '_conn')
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+
+    def _raw(self):
+        conn = self._conn
+        if conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return conn
+
+    def __getattr__(self, name):
+        return getattr(self._raw(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw(), name, value)
+
+    def __enter__(self):
+        self._raw().__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._raw().__exit__(exc_type, exc, tb)
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def close(self):
+        """Return the connection to the pool (idempotent)"""
+        conn = self._conn
+        if conn is not None:
+            object.__setattr__(self, '_conn', None)
+            self._pool.release(conn)
+
+    def __del__(self):
+        # Callers that never close() still give their slot back
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Bounded pool of tuned sqlite3 connections to one database file"""
+
+    def __init__(self, db_path, max_size=None, timeout=30.0, pragmas=None,
+                 row_factory=sqlite3.Row, cached_statements=DEFAULT_CACHED_STATEMENTS):
+        self.db_path = db_path
+        self.max_size = max_size if max_size is not None else default_pool_size()
+        self.timeout = timeout
+        self.pragmas = pragmas if pragmas is not None else default_pragmas()
+        self.row_factory = row_factory
+        self.cached_statements = cached_statements
+
+        self._idle = deque()
+        self._idle_ids = set()
+        self._size = 0
+        self._local = threading.local()
+        # Checked-out connections: id(conn) -> [thread ident, open handles], and thread ident -> conn
+        self._holders = {}
+        self._held_by_thread = {}
+        self._available = threading.Condition(threading.Lock())
+        self._stats = {'created': 0, 'reused_same_thread': 0, 'reused_other_thread': 0, 'shared_same_thread': 0,
+                       'waits': 0, 'timeouts': 0}
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=sql_trace.connection_factory()
+        )
+        apply_pragmas(conn, self.pragmas)
+        conn.row_factory = self.row_factory
+        return conn
+
+    def _check_out(self, conn, thread_id):
+        # Called with self._available held
+        self._holders[id(conn)] = [thread_id, 1]
+        self._held_by_thread[thread_id] = conn
+        return PooledConnection(self, conn)
+
+    def acquire(self, timeout=None):
+        """
+        Check a connection out of the pool
+
+        Args:
+            timeout: Seconds to wait for a free connection (defaults to the pool timeout)
+
+        Returns:
+            PooledConnection: call close() to give it back; if this thread
+                already has one checked out, that same connection is shared
+        """
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        thread_id = threading.get_ident()
+        with self._available:
+            held = self._held_by_thread.get(thread_id)
+            if held is not None:
+                self._holders[id(held)][1] += 1
+                self._stats['shared_same_thread'] += 1
+                return PooledConnection(self, held)
+            while True:
+                preferred = getattr(self._local, 'conn', None)
+                if preferred is not None and id(preferred) in self._idle_ids:
+                    self._idle.remove(preferred)
+                    self._idle_ids.discard(id(preferred))
+                    self._stats['reused_same_thread'] += 1
+                    return self._check_out(preferred, thread_id)
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._idle_ids.discard(id(conn))
+                    self._stats['reused_other_thread'] += 1
+                    self._local.conn = conn
+                    return self._check_out(conn, thread_id)
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"No free connection to {self.db_path} after waiting")
+                self._stats['waits'] += 1
+                self._available.wait(remaining)
+
+        try:
+            conn = self._open()
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+        self._local.conn = conn
+        with self._available:
+            self._stats['created'] += 1
+            return self._check_out(conn, thread_id)
+
+    def release(self, conn):
+        """Return a raw connection to the pool once its last holder lets go, discarding any uncommitted work"""
+        with self._available:
+            holder = self._holders.get(id(conn))
+            if holder is not None:
+                holder[1] -= 1
+                if holder[1] > 0:
+                    return
+                del self._holders[id(conn)]
+                if self._held_by_thread.get(holder[0]) is conn:
+                    del self._held_by_thread[holder[0]]
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = self.row_factory
+        except sqlite3.Error:
+            # Broken connection: drop it and free its slot
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            return
+
+        with self._available:
+            self._idle.append(conn)
+            self._idle_ids.add(id(conn))
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection that is released on exit"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Return pool size and reuse counters"""
+        with self._available:
+            return dict(self._stats, size=self._size, idle=len(self._idle), max_size=self.max_size)
+
+    def close_all(self):
+        """Close idle connections; checked-out connections return to the pool as usual"""
+        with self._available:
+            while self._idle:
+                conn = self._idle.pop()
+                self._idle_ids.discard(id(conn))
+                self._size -= 1
+                conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, **kwargs):
+    """Return the process-wide pool for db_path (created on first use with kwargs)"""
+    key = os.path.abspath(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(key, **kwargs)
+                _pools[key] = pool
+    return pool
+
+
+def connect(db_path, timeout=None):
+    """Drop-in replacement for sqlite3.connect() that borrows from the pool for db_path"""
+    return get_pool(db_path).acquire(timeout=timeout)
+
+
+def sqlalchemy_engine_options(max_size=None, timeout=30.0):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS giving a SQLAlchemy sqlite engine the same pool profile
+
+    A bounded QueuePool handed out LIFO (so a busy thread tends to get its
+    last connection back), shared across threads, with the statement cache
+    sized like the sqlite3 pools. Pair with configure_sqlalchemy_engine() to
+    apply the PRAGMAs.
+    """
+    from sqlalchemy.pool import QueuePool
+    return {
+        'poolclass': QueuePool,
+        'pool_size': max_size if max_size is not None else default_pool_size(),
+        'max_overflow': 0,
+        'pool_timeout': timeout,
+        'pool_use_lifo': True,
+        'connect_args': {
+            'timeout': timeout,
+            'check_same_thread': False,
+            'cached_statements': DEFAULT_CACHED_STATEMENTS
+        }
+    }
+
+
+def configure_sqlalchemy_engine(engine, pragmas=None):
+    """Apply the PRAGMAs to every new connection a SQLAlchemy engine opens"""
+    from sqlalchemy import event
+
+    if pragmas is None:
+        pragmas = default_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+    return engine
+
+
+def get_stats():
+    """Return stats for every pool, keyed by database path"""
+    return {path: pool.stats() for path, pool in list(_pools.items())}
@@ -0,0 +1,241 @@
+"""
+Pooled HTTP client for outbound API calls (SignalWire, Stripe, TMDB, ...)
+
+Keeps one keep-alive requests.Session per scheme+host so TLS handshakes are
+paid once per connection instead of once per call, applies default
+connect/read timeouts and a retry policy, and records per-host latency.
+
+When SERVICE_STANDIN_URL is set (e.g. http://localhost:8099, see
+server/tools/service_standin), requests to SignalWire and Stripe hosts are
+rewritten to that local stand-in server instead, path and query unchanged, so
+load tests can run the SMS, MFA and payment flows offline.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeout in seconds applied when the caller does not pass one
+DEFAULT_TIMEOUT = (3.05, 15)
+
+# Statuses worth retrying; non-idempotent methods (POST) are only retried on connect errors
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Host suffixes served by the stand-in
+STANDIN_HOSTS = ('signalwire.com', 'api.stripe.com')
+
+logger = logging.getLogger(__name__)
+
+
+def configured_standin():
+    """Local stand-in for STANDIN_HOSTS from SERVICE_STANDIN_URL; empty sends requests to the real services"""
+    return os.getenv('SERVICE_STANDIN_URL', '').rstrip('/')
+
+
+def standin_url(url, standin=None):
+    """
+    Rewrite url onto the stand-in server if its host is one the stand-in emulates
+
+    Returns:
+        str: The rewritten url, or url unchanged when no stand-in is configured
+            or the host is not emulated
+    """
+    standin = configured_standin() if standin is None else standin
+    if not standin:
+        return url
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if not any(host == suffix or host.endswith('.' + suffix) for suffix in STANDIN_HOSTS):
+        return url
+    target = urlsplit(standin)
+    return urlunsplit((target.scheme, target.netloc, parts.path, parts.query, parts.fragment))
+
+
+class StandinAdapter(HTTPAdapter):
+    """HTTPAdapter that sends SignalWire and Stripe requests to the stand-in server"""
+
+    def __init__(self, standin=None, **kwargs):
+        self.standin = standin
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        request.url = standin_url(request.url, self.standin)
+        return super().send(request, **kwargs)
+
+
+def route_to_standin(session, standin=None):
+    """Mount a StandinAdapter on a requests.Session (no-op unless a stand-in is configured)"""
+    if not (configured_standin() if standin is None else standin):
+        return session
+    adapter = StandinAdapter(standin)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def route_sdk_client(client):
+    """Send a SignalWire SDK (signalwire.rest.Client) client's REST calls to the stand-in, if configured"""
+    session = getattr(getattr(client, 'http_client', None), 'session', None)
+    if configured_standin() and session is not None:
+        route_to_standin(session)
+    return client
+
+
+class HostMetrics:
+    """Request counters and recent latency samples for one host"""
+
+    def __init__(self, sample_size=500):
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=sample_size)
+        self.status_counts = {}
+
+    def record(self, elapsed_ms, status_code=None, error=False):
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.samples.append(elapsed_ms)
+        if error:
+            self.errors += 1
+        if status_code is not None:
+            self.status_counts[status_code] = self.status_counts.get(status_code, 0) + 1
+
+    def _percentile(self, ordered, pct):
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self):
+        ordered = sorted(self.samples)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+            'p50_ms': round(self._percentile(ordered, 50), 1),
+            'p95_ms': round(self._percentile(ordered, 95), 1),
+            'max_ms': round(self.max_ms, 1),
+            'status_counts': dict(self.status_counts)
+        }
+
+
+class PooledHTTPClient:
+    """Thread-safe HTTP client with one pooled session per host"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=2, backoff_factor=0.3, pool_maxsize=10, standin=None):
+        self.timeout = timeout
+        self.standin = configured_standin() if standin is None else standin
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _host_key(self, url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _build_session(self):
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        options = dict(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        adapter = StandinAdapter(self.standin, **options) if self.standin else HTTPAdapter(**options)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def session_for(self, url):
+        """Return the keep-alive session used for the host of url"""
+        key = self._host_key(url)
+        session = self._sessions.get(key)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = self._build_session()
+                    self._sessions[key] = session
+                    self._metrics[key] = HostMetrics()
+        return session
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the host's pooled session (same signature as requests.request)"""
+        kwargs.setdefault('timeout', self.timeout)
+        session = self.session_for(url)
+        metrics = self._metrics[self._host_key(url)]
+
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                metrics.record(elapsed_ms, error=True)
+            raise
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            metrics.record(elapsed_ms, status_code=response.status_code, error=response.status_code >= 500)
+        logger.debug(f"{method} {url} -> {response.status_code} in {elapsed_ms:.1f}ms")
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def metrics(self):
+        """Return latency metrics keyed by scheme://host"""
+        with self._lock:
+            return {host: host_metrics.to_dict() for host, host_metrics in self._metrics.items()}
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Return the process-wide pooled HTTP client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PooledHTTPClient()
+    return _client
+
+
+def get(url, **kwargs):
+    return get_http_client().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_http_client().post(url, **kwargs)
+
+
+def get_metrics():
+    return get_http_client().metrics()
@@ -1,7 +1,10 @@
 from app import app, db
 from models import Reservation, Table, MenuItem, Order, OrderItem
 from datetime import datetime, timedelta
+import argparse
 import random
+from itertools import accumulate
+from bulk_data import BulkRandom, Progress, insert_many, tune_for_bulk_load
 
 def generate_order_number():
     """Generate a unique 5-digit order number"""
@@ -842,6 +845,166 @@ def create_additional_demo_reservations():
         order.total_amount = total
     db.session.commit()
 
+# Bulk load-test data (python init_test_data.py --reservations 500000 --orders 80000 --days 365)
+
+# Relative popularity of party sizes, seating times, order types and special requests
+PARTY_SIZES = {2: 40, 4: 22, 3: 12, 1: 6, 5: 7, 6: 7, 8: 4, 10: 2}
+SEATING_WEIGHTS = {
+    '09:00': 2, '09:30': 2, '10:00': 3, '10:30': 3, '11:00': 4, '11:30': 6, '12:00': 9, '12:30': 9,
+    '13:00': 7, '13:30': 4, '14:00': 2, '14:30': 2, '15:00': 1, '15:30': 1, '16:00': 2, '16:30': 3,
+    '17:00': 6, '17:30': 9, '18:00': 13, '18:30': 15, '19:00': 15, '19:30': 12, '20:00': 9,
+    '20:30': 5, '21:00': 3,
+}
+ORDER_TYPES = {'reservation': 50, 'pickup': 35, 'delivery': 15}
+SPECIAL_REQUESTS = ('Birthday celebration', 'Anniversary dinner', 'Window table preferred',
+                    'Wheelchair accessible', 'High chair needed', 'Quiet table please', 'Booth if possible')
+# Reservations extend this many days past today; the rest of --days lies in the past
+FUTURE_DAYS = 30
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def _bulk_reservations(rng, count, first_id, numbers, days, today):
+    past_days = max(days - FUTURE_DAYS, 0)
+    start = today - timedelta(days=past_days)
+    end = start + timedelta(days=days)
+    times = list(SEATING_WEIGHTS)
+    time_weights = list(accumulate(SEATING_WEIGHTS.values()))
+    sizes = list(PARTY_SIZES)
+    size_weights = list(accumulate(PARTY_SIZES.values()))
+    for n in range(count):
+        day = start + timedelta(days=rng.randrange(days))
+        # Friday and Saturday are about twice as busy
+        if day.weekday() not in (4, 5) and rng.random() < 0.3:
+            weekend = day + timedelta(days=(4 - day.weekday()) % 7 + rng.randint(0, 1))
+            if weekend < end:
+                day = weekend
+        seating = rng.choices(times, cum_weights=time_weights)[0]
+        past = day < today
+        if past:
+            status = 'completed' if rng.random() < 0.88 else 'cancelled'
+        else:
+            status = 'confirmed' if rng.random() < 0.95 else 'cancelled'
+        paid = past and status == 'completed' and rng.random() < 0.7
+        party_size = rng.choices(sizes, cum_weights=size_weights)[0]
+        phone = rng.phone()
+        created = datetime.combine(day, datetime.min.time()) - timedelta(days=rng.randint(0, 30), minutes=rng.randint(0, 1439))
+        yield (
+            first_id + n, numbers[n], f"{rng.first_name()} {rng.last_name()}", party_size,
+            day.isoformat(), seating, phone, phone, status,
+            rng.choice(SPECIAL_REQUESTS) if rng.random() < 0.15 else None,
+            created.strftime(DATETIME_FORMAT),
+            'paid' if paid else 'unpaid',
+            round(party_size * rng.uniform(18, 45), 2) if paid else None,
+            f"{day.isoformat()} {seating}:00.000000" if paid else None,
+            'credit-card' if paid else None,
+        )
+
+
+def _bulk_orders(rng, count, first_id, numbers, reservations, tables, menu, today):
+    """Yield (order row, [order item rows]) pairs"""
+    for n in range(count):
+        order_id = first_id + n
+        order_type = rng.weighted(ORDER_TYPES)
+        if order_type == 'reservation' and reservations:
+            reservation_id, target_date, target_time, name = rng.choice(reservations)
+            table_id = rng.choice(tables) if tables else None
+            phone, address = None, None
+        else:
+            order_type = 'delivery' if order_type == 'delivery' else 'pickup'
+            reservation_id, table_id = None, None
+            target_date = (today - timedelta(days=rng.randint(-7, 365))).isoformat()
+            target_time = f"{rng.randint(11, 21):02d}:{rng.choice(('00', '15', '30', '45'))}"
+            name = f"{rng.first_name()} {rng.last_name()}"
+            phone = rng.phone()
+            address = rng.address() if order_type == 'delivery' else None
+        items = []
+        total = 0.0
+        for _ in range(rng.choices((1, 2, 3, 4), (45, 30, 15, 10))[0]):
+            menu_item_id, price = rng.skewed(menu)
+            quantity = rng.choices((1, 2, 3), (80, 15, 5))[0]
+            items.append((order_id, menu_item_id, quantity, price))
+            total += price * quantity
+        total = round(total, 2)
+        past = target_date < today.isoformat()
+        paid = past or rng.random() < 0.3
+        status = 'completed' if past else rng.choice(('pending', 'pending', 'preparing', 'ready'))
+        placed = f"{target_date} {target_time}:00.000000"
+        yield (
+            order_id, numbers[n], reservation_id, table_id, name, status, total, target_date, target_time,
+            order_type, phone, phone, address, 'paid' if paid else 'unpaid',
+            total if paid else None, placed if paid else None, 'credit-card' if paid else None, placed,
+        ), items
+
+
+def generate_bulk_data(reservations=0, orders=0, days=365, seed=42):
+    """
+    Add production-sized reservation and order volumes on top of the demo data
+
+    Rows are generated lazily from a seeded BulkRandom and written with
+    executemany in one transaction, so the same arguments always produce the
+    same database. Reservation numbers are 6 digits and order numbers 5, which
+    caps how many of each can exist.
+    """
+    rng = BulkRandom(seed)
+    today = datetime.now().date()
+    days = max(int(days), 1)
+    progress = Progress()
+    raw = db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        tune_for_bulk_load(cursor)
+        tables = [row[0] for row in cursor.execute("SELECT id FROM tables")]
+        menu = [(row[0], row[1]) for row in cursor.execute("SELECT id, price FROM menu_items WHERE is_available = 1 ORDER BY id")]
+        if orders and not menu:
+            raise ValueError("Menu items are required before generating orders")
+
+        taken = {row[0] for row in cursor.execute("SELECT reservation_number FROM reservations")}
+        numbers = [number for number in rng.unique_numbers(min(reservations + len(taken), 900000), 6) if number not in taken]
+        if len(numbers) < reservations:
+            raise ValueError(f"Only {len(numbers)} unused 6-digit reservation numbers remain")
+        first_id = (cursor.execute("SELECT COALESCE(MAX(id), 0) FROM reservations").fetchone()[0]) + 1
+        count = insert_many(cursor, """
+            INSERT INTO reservations (id, reservation_number, name, party_size, date, time, phone_number, phone_e164,
+                                      status, special_requests, created_at, payment_status, payment_amount,
+                                      payment_date, payment_method)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, _bulk_reservations(rng, reservations, first_id, numbers, days, today))
+        progress.step('reservations', count)
+
+        if orders:
+            taken = {row[0] for row in cursor.execute("SELECT order_number FROM orders")}
+            numbers = [number for number in rng.unique_numbers(min(orders + len(taken), 90000), 5) if number not in taken]
+            if len(numbers) < orders:
+                raise ValueError(f"Only {len(numbers)} unused 5-digit order numbers remain")
+            seated = [tuple(row) for row in cursor.execute(
+                "SELECT id, date, time, name FROM reservations WHERE id >= ? AND status != 'cancelled'", (first_id,))]
+            first_order_id = (cursor.execute("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0]) + 1
+            order_items = []
+
+            def order_rows():
+                for order, items in _bulk_orders(rng, orders, first_order_id, numbers, seated, tables, menu, today):
+                    order_items.extend(items)
+                    yield order
+
+            count = insert_many(cursor, """
+                INSERT INTO orders (id, order_number, reservation_id, table_id, person_name, status, total_amount,
+                                    target_date, target_time, order_type, customer_phone, customer_phone_e164,
+                                    customer_address, payment_status, payment_amount, payment_date, payment_method,
+                                    created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, order_rows())
+            progress.step('orders', count)
+            count = insert_many(cursor, """
+                INSERT INTO order_items (order_id, menu_item_id, quantity, price_at_time) VALUES (?, ?, ?, ?)
+            """, order_items)
+            progress.step('order items', count)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
 def clear_existing_data():
     """Clear existing data from all tables"""
     from models import OrderItem, Order, Reservation, MenuItem, Table, db
@@ -859,12 +1022,21 @@ def clear_existing_data():
         print(f"Error clearing data: {e}")
         db.session.rollback()
 
-def main():
+def main(argv=None):
     """Main function to initialize test data"""
+    parser = argparse.ArgumentParser(description='Load demo data, optionally with bulk load-test volumes')
+    parser.add_argument('--reservations', type=int, default=0, help='Extra generated reservations')
+    parser.add_argument('--orders', type=int, default=0, help='Extra generated orders (at most ~90,000)')
+    parser.add_argument('--days', type=int, default=365, help='Days of history the generated data spans')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+    args = parser.parse_args(argv)
     with app.app_context():
         db.create_all()
         clear_existing_data()
         init_test_data()
+        if args.reservations or args.orders:
+            print(f"Generating bulk data (seed {args.seed})...")
+            generate_bulk_data(args.reservations, args.orders, args.days, args.seed)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,97 @@
+"""
+Schema migrations and hot-query registry for Bobby's Table
+
+Run `python migrations.py` to EXPLAIN every registered query against
+instance/restaurant.db, or `python migrations.py --migrate` to apply pending
+migrations first. The app applies pending migrations at startup.
+"""
+
+import os
+
+import db_migrate
+import phone_util
+import reservation_search
+
+DB_PATH = os.path.join('instance', 'restaurant.db')
+
+# (version, name, statements); index names match models.py __table_args__
+MIGRATIONS = [
+    (1, 'index reservation lookups', [
+        "CREATE INDEX IF NOT EXISTS idx_reservations_phone_date ON reservations (phone_number, date)",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_date_time ON reservations (date, time)",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_confirmation_number ON reservations (confirmation_number)",
+    ]),
+    (2, 'index order lookups', [
+        "CREATE INDEX IF NOT EXISTS idx_orders_reservation_id ON orders (reservation_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_customer_phone ON orders (customer_phone, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_target_status_time ON orders (target_date, status, target_time)",
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)",
+    ]),
+    (3, 'index available menu items', [
+        "CREATE INDEX IF NOT EXISTS idx_menu_items_available_category ON menu_items (is_available, category)",
+    ]),
+    (4, 'reservation full-text search index', [reservation_search.create_index]),
+    (5, 'canonical E.164 phone columns', [
+        db_migrate.add_column('reservations', 'phone_e164', 'VARCHAR(20)'),
+        db_migrate.add_column('orders', 'customer_phone_e164', 'VARCHAR(20)'),
+        "CREATE INDEX IF NOT EXISTS idx_reservations_phone_e164_date ON reservations (phone_e164, date)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_customer_phone_e164 ON orders (customer_phone_e164, created_at)",
+        # Lookups compare the canonical columns now
+        "DROP INDEX IF EXISTS idx_reservations_phone_date",
+        "DROP INDEX IF EXISTS idx_orders_customer_phone",
+    ]),
+]
+
+# Queries issued by the web routes and SWAIG skills on every call: name -> (sql, params)
+HOT_QUERIES = {
+    'reservation by number': (
+        "SELECT * FROM reservations WHERE reservation_number = ?", ('123456',)),
+    'reservation by phone': (
+        "SELECT * FROM reservations WHERE phone_e164 = ? ORDER BY date DESC LIMIT 1", ('+15551234567',)),
+    'reservations for a day': (
+        "SELECT * FROM reservations WHERE date = ? AND status != 'cancelled' ORDER BY time", ('2025-01-01',)),
+    'reservations in a date range': (
+        "SELECT * FROM reservations WHERE date >= ? AND date <= ? ORDER BY date, time", ('2025-01-01', '2025-01-07')),
+    'reservation by payment confirmation': (
+        "SELECT * FROM reservations WHERE confirmation_number = ?", ('ABCD1234',)),
+    'orders for a reservation': (
+        "SELECT * FROM orders WHERE reservation_id = ?", (1,)),
+    'order by number': (
+        "SELECT * FROM orders WHERE order_number = ?", ('12345',)),
+    'orders by phone': (
+        "SELECT * FROM orders WHERE customer_phone_e164 = ? ORDER BY created_at DESC LIMIT 5", ('+15551234567',)),
+    'kitchen orders by status': (
+        "SELECT * FROM orders WHERE target_date = ? AND target_time >= ? AND target_time <= ? "
+        "AND status = ? ORDER BY target_time", ('2025-01-01', '00:00', '23:59', 'pending')),
+    'items for an order': (
+        "SELECT * FROM order_items WHERE order_id = ?", (1,)),
+    'reservation name search': (
+        "SELECT rowid FROM reservations_fts WHERE reservations_fts MATCH ? ORDER BY rank LIMIT 200", ('name : "smith"',)),
+    'reservation phone search': (
+        "SELECT rowid FROM reservations_fts WHERE reservations_fts MATCH ? ORDER BY rank LIMIT 20", ('phone_digits : "5551234567"',)),
+    'available menu': (
+        "SELECT * FROM menu_items WHERE is_available = 1", ()),
+}
+
+
+# (table, phone column, canonical column) filled by the startup backfill
+PHONE_COLUMNS = [
+    ('reservations', 'phone_number', 'phone_e164'),
+    ('orders', 'customer_phone', 'customer_phone_e164'),
+]
+
+
+def backfill_phones(conn):
+    """Fill canonical phone columns for rows written without one; returns rows updated"""
+    return sum(phone_util.backfill(conn, table, source, target) for table, source, target in PHONE_COLUMNS)
+
+
+def migrate(conn):
+    """Apply pending migrations and the phone backfill; returns the versions applied"""
+    applied = db_migrate.apply_migrations(conn, MIGRATIONS)
+    backfill_phones(conn)
+    return applied
+
+
+if __name__ == '__main__':
+    raise SystemExit(db_migrate.run_cli(DB_PATH, MIGRATIONS, HOT_QUERIES))
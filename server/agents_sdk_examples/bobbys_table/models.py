@@ -1,10 +1,21 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from datetime import datetime
 
+from phone_util import to_e164
+from table_availability import get_table_availability
+
 db = SQLAlchemy()
 
 class Reservation(db.Model):
     __tablename__ = 'reservations'
+    # Keep index names in sync with migrations.py, which adds them to existing databases
+    __table_args__ = (
+        db.Index('idx_reservations_phone_e164_date', 'phone_e164', 'date'),
+        db.Index('idx_reservations_date_time', 'date', 'time'),
+        db.Index('idx_reservations_confirmation_number', 'confirmation_number'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     reservation_number = db.Column(db.String(6), unique=True, nullable=False)  # 6-digit random number
     name = db.Column(db.String(80), nullable=False)
@@ -12,6 +23,7 @@ class Reservation(db.Model):
     date = db.Column(db.String(10), nullable=False)  # YYYY-MM-DD
     time = db.Column(db.String(5), nullable=False)   # HH:MM
     phone_number = db.Column(db.String(20), nullable=False)
+    phone_e164 = db.Column(db.String(20))  # Canonical phone_number, kept in sync on write
     status = db.Column(db.String(20), default='confirmed')
     special_requests = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -66,6 +78,9 @@ class Table(db.Model):
 
 class MenuItem(db.Model):
     __tablename__ = 'menu_items'
+    __table_args__ = (
+        db.Index('idx_menu_items_available_category', 'is_available', 'category'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -86,6 +101,11 @@ class MenuItem(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('idx_orders_reservation_id', 'reservation_id'),
+        db.Index('idx_orders_customer_phone_e164', 'customer_phone_e164', 'created_at'),
+        db.Index('idx_orders_target_status_time', 'target_date', 'status', 'target_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(5), unique=True, nullable=False)  # 5-digit random number
     reservation_id = db.Column(db.Integer, db.ForeignKey('reservations.id'))
@@ -97,6 +117,7 @@ class Order(db.Model):
     target_time = db.Column(db.String(5))   # HH:MM when order should be ready
     order_type = db.Column(db.String(20))   # 'pickup' or 'delivery'
     customer_phone = db.Column(db.String(20))
+    customer_phone_e164 = db.Column(db.String(20))  # Canonical customer_phone, kept in sync on write
     customer_address = db.Column(db.Text)   # For delivery orders
     special_instructions = db.Column(db.Text)
     payment_status = db.Column(db.String(20), default='unpaid')  # 'unpaid', 'paid', 'refunded'
@@ -135,6 +156,9 @@ class Order(db.Model):
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
+    __table_args__ = (
+        db.Index('idx_order_items_order_id', 'order_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
     menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_items.id'))
@@ -151,4 +175,50 @@ class OrderItem(db.Model):
             'price_at_time': self.price_at_time,
             'notes': self.notes,
             'menu_item': self.menu_item.to_dict() if self.menu_item else None
-        } 
\ No newline at end of file
+        } 
+
+
+# Keep the canonical phone columns in sync with whatever format was entered
+@event.listens_for(Reservation, 'before_insert')
+@event.listens_for(Reservation, 'before_update')
+def _set_reservation_phone_e164(mapper, connection, target):
+    target.phone_e164 = to_e164(target.phone_number)
+
+
+@event.listens_for(Order, 'before_insert')
+@event.listens_for(Order, 'before_update')
+def _set_order_phone_e164(mapper, connection, target):
+    target.customer_phone_e164 = to_e164(target.customer_phone)
+
+
+# Feed committed reservation changes to the table availability index; changes
+# are collected per flush and only applied once the transaction commits
+@event.listens_for(Session, 'after_flush')
+def _collect_availability_changes(session, flush_context):
+    changes = session.info.setdefault('reservation_changes', {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Reservation):
+            changes[obj.id] = (obj.date, obj.time, obj.party_size, obj.status)
+        elif isinstance(obj, Table):
+            session.info['tables_changed'] = True
+    for obj in session.deleted:
+        if isinstance(obj, Reservation):
+            changes[obj.id] = None
+        elif isinstance(obj, Table):
+            session.info['tables_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_availability_changes(session):
+    changes = session.info.pop('reservation_changes', None)
+    availability = get_table_availability()
+    if session.info.pop('tables_changed', False):
+        availability.invalidate()
+    elif changes:
+        availability.apply_changes(changes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_availability_changes(session):
+    session.info.pop('reservation_changes', None)
+    session.info.pop('tables_changed', None)
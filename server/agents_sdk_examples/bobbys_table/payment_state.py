@@ -0,0 +1,267 @@
+"""
+Payment state machine for Bobby's Table Restaurant
+Tracks each SWML pay session per call_id through explicit states so the
+SignalWire payment callback, pay_reservation and payment_retry handlers
+share one persisted view of where a payment is
+"""
+
+import os
+import threading
+import time
+
+import db_pool
+
+DEFAULT_DB_PATH = os.path.join(os.getcwd(), 'instance', 'restaurant.db')
+
+# Payment states
+STATE_STARTED = 'started'
+STATE_COLLECTING_CARD = 'collecting_card'
+STATE_IN_PROGRESS = 'in_progress'
+STATE_COMPLETING = 'completing'
+STATE_COMPLETED = 'completed'
+STATE_FAILED = 'failed'
+
+ACTIVE_STATES = (STATE_STARTED, STATE_COLLECTING_CARD, STATE_IN_PROGRESS, STATE_COMPLETING)
+
+# Payment events
+EVENT_START = 'start'
+EVENT_CARD_NUMBER = 'card_number'
+EVENT_CARD_DETAILS = 'card_details'
+EVENT_SUCCEEDED = 'succeeded'
+EVENT_CONFIRMED = 'confirmed'
+EVENT_ABORTED = 'aborted'
+EVENT_FAILED = 'failed'
+EVENT_RETRY = 'retry'
+
+# SignalWire pay callback 'params.for' values mapped to events
+CALLBACK_EVENTS = {
+    'payment-card-number': EVENT_CARD_NUMBER,
+    'expiration-date': EVENT_CARD_DETAILS,
+    'security-code': EVENT_CARD_DETAILS,
+    'postal-code': EVENT_CARD_DETAILS,
+    'payment-processing': EVENT_CARD_DETAILS,
+    'payment-succeeded': EVENT_SUCCEEDED,
+    'payment-completed': EVENT_SUCCEEDED,
+    'payment-failed': EVENT_FAILED,
+}
+
+# Events mapped to the status names reported back by the payment callback
+CALLBACK_STATUSES = {
+    EVENT_CARD_NUMBER: 'collecting_card',
+    EVENT_CARD_DETAILS: 'in_progress',
+    EVENT_SUCCEEDED: 'completed',
+    EVENT_FAILED: 'failed',
+}
+
+# Callers that have no start record yet (callback arrived for an unknown call)
+# are treated as state None
+_COLLECTING = (None, STATE_STARTED, STATE_COLLECTING_CARD, STATE_IN_PROGRESS, STATE_FAILED)
+
+# (current state, event) -> next state; anything missing is rejected
+TRANSITIONS = {}
+for _state in (None, STATE_STARTED, STATE_COLLECTING_CARD, STATE_IN_PROGRESS, STATE_COMPLETED, STATE_FAILED):
+    TRANSITIONS[(_state, EVENT_START)] = STATE_STARTED
+for _state in _COLLECTING:
+    TRANSITIONS[(_state, EVENT_CARD_NUMBER)] = STATE_COLLECTING_CARD
+    TRANSITIONS[(_state, EVENT_CARD_DETAILS)] = STATE_IN_PROGRESS
+    TRANSITIONS[(_state, EVENT_SUCCEEDED)] = STATE_COMPLETING
+    TRANSITIONS[(_state, EVENT_FAILED)] = STATE_FAILED
+TRANSITIONS[(STATE_COMPLETING, EVENT_CONFIRMED)] = STATE_COMPLETED
+TRANSITIONS[(STATE_COMPLETING, EVENT_ABORTED)] = STATE_IN_PROGRESS
+TRANSITIONS[(STATE_FAILED, EVENT_RETRY)] = STATE_STARTED
+del _state
+
+# Columns a transition may set alongside the state
+FIELDS = ('reservation_number', 'order_number', 'payment_type', 'amount', 'customer_name',
+          'phone_number', 'payment_id', 'error_type', 'failure_reason', 'attempt', 'confirmation_number')
+
+# Details from a previous attempt that no longer apply once a new one starts
+_RESET_ON = {
+    EVENT_START: ('error_type', 'failure_reason', 'attempt', 'confirmation_number'),
+    EVENT_RETRY: ('error_type', 'failure_reason', 'attempt'),
+}
+
+STATES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS payment_states (
+    call_id VARCHAR(100) PRIMARY KEY,
+    state VARCHAR(20) NOT NULL,
+    reservation_number VARCHAR(20),
+    order_number VARCHAR(20),
+    payment_type VARCHAR(20),
+    amount REAL,
+    customer_name VARCHAR(100),
+    phone_number VARCHAR(20),
+    payment_id VARCHAR(100),
+    error_type VARCHAR(50),
+    failure_reason VARCHAR(50),
+    attempt VARCHAR(10),
+    confirmation_number VARCHAR(20),
+    version INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_payment_states_reservation ON payment_states (reservation_number, updated_at);
+"""
+
+
+class PaymentStateMachine:
+    """
+    Persisted payment state per call_id
+
+    transition() looks the next state up in TRANSITIONS and applies it inside
+    a single IMMEDIATE transaction, so concurrent callbacks for the same call
+    are serialized and only one of them can move a payment from a collecting
+    state into 'completing'. A rejected transition leaves the row untouched.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._ensure_schema()
+
+    def _connect(self):
+        # Pooled WAL connection (sqlite3.Row rows); close() returns it to the pool
+        return db_pool.connect(self.db_path)
+
+    def _ensure_schema(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(STATES_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, call_id):
+        """Return the payment record for call_id, or None"""
+        if not call_id:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM payment_states WHERE call_id = ?", (call_id,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def find_by_reservation(self, reservation_number):
+        """Return the most recently updated payment record for a reservation, or None"""
+        if not reservation_number:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                """SELECT * FROM payment_states WHERE reservation_number = ?
+                   ORDER BY updated_at DESC LIMIT 1""",
+                (reservation_number,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def transition(self, call_id, event, **fields):
+        """
+        Apply an event to the payment for call_id
+
+        Args:
+            call_id: SignalWire call id the payment belongs to
+            event: One of the EVENT_* constants
+            **fields: Payment details to store with the new state (None values are ignored)
+
+        Returns:
+            dict: {'accepted', 'previous_state', 'state', 'record'}
+        """
+        if not call_id:
+            raise ValueError('call_id is required')
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown payment fields: {', '.join(sorted(unknown))}")
+
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT * FROM payment_states WHERE call_id = ?", (call_id,)).fetchone()
+            current = dict(row) if row else None
+            previous_state = current['state'] if current else None
+            next_state = TRANSITIONS.get((previous_state, event))
+
+            if next_state is None:
+                conn.rollback()
+                print(f"WARNING: Rejected payment event '{event}' for call {call_id} in state {previous_state}")
+                return {'accepted': False, 'previous_state': previous_state, 'state': previous_state, 'record': current}
+
+            values = {name: None for name in _RESET_ON.get(event, ())}
+            values.update({name: value for name, value in fields.items() if value is not None})
+
+            if current is None:
+                record = {name: None for name in FIELDS}
+                record.update(values)
+                record.update({'call_id': call_id, 'state': next_state, 'version': 1,
+                               'created_at': now, 'updated_at': now})
+                columns = ', '.join(record)
+                placeholders = ', '.join('?' for _ in record)
+                conn.execute(f"INSERT INTO payment_states ({columns}) VALUES ({placeholders})",
+                             tuple(record.values()))
+            else:
+                record = dict(current)
+                record.update(values)
+                record.update({'state': next_state, 'version': current['version'] + 1, 'updated_at': now})
+                assignments = ', '.join(f"{name} = ?" for name in values)
+                conn.execute(
+                    f"UPDATE payment_states SET state = ?, version = ?, updated_at = ?"
+                    f"{', ' + assignments if assignments else ''} WHERE call_id = ?",
+                    (next_state, record['version'], now, *values.values(), call_id)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+        print(f"🔄 Payment {call_id}: {previous_state} --{event}--> {next_state}")
+        return {'accepted': True, 'previous_state': previous_state, 'state': next_state, 'record': record}
+
+    def purge(self, max_age_seconds=24 * 3600):
+        """Delete payment records not updated within max_age_seconds; returns the count removed"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute("DELETE FROM payment_states WHERE updated_at < ?",
+                                  (time.time() - max_age_seconds,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Return payment counts per state"""
+        conn = self._connect()
+        try:
+            return {row['state']: row['count'] for row in conn.execute(
+                "SELECT state, COUNT(*) AS count FROM payment_states GROUP BY state"
+            )}
+        finally:
+            conn.close()
+
+    def recent(self, limit=50):
+        """Return the most recently updated payment records, newest first"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM payment_states ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+
+_machine = None
+_machine_lock = threading.Lock()
+
+
+def get_payment_state_machine():
+    """Return the process-wide payment state machine"""
+    global _machine
+    if _machine is None:
+        with _machine_lock:
+            if _machine is None:
+                _machine = PaymentStateMachine()
+    return _machine
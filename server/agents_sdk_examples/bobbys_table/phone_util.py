@@ -0,0 +1,89 @@
+"""
+Phone number normalization to E.164
+
+One memoized normalizer used for lookups, for the canonical phone_e164
+columns written alongside each stored phone number, and for the bulk
+backfill that fills those columns on existing rows. Comparing canonical
+values lets every by-phone lookup be a single indexed equality.
+"""
+
+import re
+from functools import lru_cache
+
+DEFAULT_COUNTRY_CODE = '1'
+
+_NON_DIGITS = re.compile(r'\D')
+_E164 = re.compile(r'^\+[1-9]\d{6,14}$')
+
+
+@lru_cache(maxsize=8192)
+def to_e164(phone, default_country_code=DEFAULT_COUNTRY_CODE):
+    """
+    Normalize a phone number to E.164 (+15551234567)
+
+    Args:
+        phone: Phone number in any common format ("(555) 123-4567", "1-555-123-4567", "+44 20 7946 0958")
+        default_country_code: Country code assumed for numbers without one
+
+    Returns:
+        str: E.164 number, or None if the input can't be a phone number
+    """
+    if not phone:
+        return None
+    text = str(phone).strip()
+    digits = _NON_DIGITS.sub('', text)
+
+    if text.startswith('+'):
+        candidate = f'+{digits}'
+    elif digits.startswith('00') and len(digits) > 10:
+        # International dialing prefix
+        candidate = f'+{digits[2:]}'
+    elif len(digits) == 10:
+        # National number without a country code
+        candidate = f'+{default_country_code}{digits}'
+    elif len(digits) > 10:
+        # Country code given without the leading +
+        candidate = f'+{digits}'
+    else:
+        return None
+    return candidate if _E164.match(candidate) else None
+
+
+def normalize_many(phones, default_country_code=DEFAULT_COUNTRY_CODE):
+    """Normalize an iterable of phone numbers; repeated values hit the cache"""
+    return [to_e164(phone, default_country_code) for phone in phones]
+
+
+def backfill(conn, table, source_column='phone', target_column='phone_e164', key_column='id', batch_size=500):
+    """
+    Fill a canonical phone column for rows where it is still NULL
+
+    Walks the table in key order in batches, committing after each one, so it
+    can run at startup on a live database. Rows whose phone can't be
+    normalized are left NULL.
+
+    Returns:
+        int: Number of rows updated
+    """
+    updated = 0
+    last_key = None
+    while True:
+        where = f"{target_column} IS NULL AND {source_column} IS NOT NULL"
+        params = ()
+        if last_key is not None:
+            where += f" AND {key_column} > ?"
+            params = (last_key,)
+        rows = conn.execute(
+            f"SELECT {key_column}, {source_column} FROM {table} WHERE {where} ORDER BY {key_column} LIMIT ?",
+            params + (batch_size,)
+        ).fetchall()
+        if not rows:
+            break
+        values = normalize_many(row[1] for row in rows)
+        changes = [(value, row[0]) for row, value in zip(rows, values) if value]
+        if changes:
+            conn.executemany(f"UPDATE {table} SET {target_column} = ? WHERE {key_column} = ?", changes)
+            conn.commit()
+            updated += len(changes)
+        last_key = rows[-1][0]
+    return updated
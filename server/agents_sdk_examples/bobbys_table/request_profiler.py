@@ -0,0 +1,334 @@
+"""
+Opt-in request profiler (WSGI middleware)
+
+With REQUEST_PROFILING=true and a PROFILE_TOKEN set, install() wraps the
+app's wsgi_app so that a request whose X-Profile header carries the token, or
+a random PROFILE_SAMPLE_RATE fraction of all requests, is profiled. Each
+profile holds:
+
+    - a cProfile capture (PROFILE_MODE=cprofile, the default), or call stacks
+      sampled every PROFILE_SAMPLE_INTERVAL_MS (PROFILE_MODE=sample), which
+      is cheaper and shows where wall-clock time went, including waits
+    - every SQL statement the request ran, with parameters and timings
+      (see sql_trace)
+
+A profile ends when the server closes the response, so a streamed body (and
+the SQL it runs while being produced) is part of it. The newest
+PROFILE_KEEP profiles stay in memory; the response carries
+X-Profile-Id, and the app's /debug/profiles routes list them and download the
+raw data (a .prof file for snakeviz/pstats, or collapsed stacks for flame
+graph tools). Profiles include SQL parameters (phone numbers, patient and
+payment data), so reading them needs the token too, and profiling stays off
+without one. The profiled request runs on its own thread as usual; other
+requests are not slowed down. Settings are read when install() runs, so call
+it after load_dotenv().
+"""
+
+import cProfile
+import hmac
+import io
+import logging
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+import sql_trace
+
+# Header that asks for a profile of this request; the profile id comes back in PROFILE_ID_HEADER
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+DEFAULT_SAMPLE_INTERVAL_MS = 5
+
+# Profiles kept in memory, oldest dropped first
+DEFAULT_KEEP = 50
+
+# Functions listed in a profile's summary
+TOP_FUNCTIONS = 40
+
+# Never profiled (the profile routes themselves, static files)
+SKIP_PREFIXES = ('/debug/profiles', '/static/')
+
+logger = logging.getLogger(__name__)
+
+# cProfile is process-wide on Python 3.12+, so only one request is cProfiled at a time;
+# concurrent ones fall back to stack sampling
+_cprofile_lock = threading.Lock()
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's call stack from a background thread"""
+
+    def __init__(self, thread_id, interval_ms=DEFAULT_SAMPLE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000.0
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def collapsed(self):
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope"""
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit=TOP_FUNCTIONS):
+        inclusive, own = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                inclusive[label] += count
+        return [
+            {'function': label, 'samples': count, 'self_samples': own[label],
+             'pct': round(100.0 * count / self.samples, 1)}
+            for label, count in inclusive.most_common(limit)
+        ]
+
+
+def _cprofile_summary(stats, limit=TOP_FUNCTIONS):
+    rows = []
+    for (filename, line, name), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            'function': f"{name} ({os.path.basename(filename)}:{line})",
+            'calls': ncalls,
+            'self_ms': round(tottime * 1000, 3),
+            'cumulative_ms': round(cumtime * 1000, 3),
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit]
+
+
+class ProfileStore:
+    """The newest profiles, by id"""
+
+    def __init__(self, keep=DEFAULT_KEEP):
+        self.keep = keep
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles[profile['id']] = profile
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self):
+        """Summaries, newest first"""
+        with self._lock:
+            profiles = list(self._profiles.values())
+        keys = ('id', 'method', 'path', 'status', 'trigger', 'mode', 'started_at', 'duration_ms')
+        return [dict({key: profile[key] for key in keys}, sql_count=profile['sql']['count'],
+                     sql_ms=profile['sql']['total_ms']) for profile in reversed(profiles)]
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+# The installed middleware, None while profiling is off
+_middleware = None
+
+
+def get_profile_store():
+    """Return the process-wide profile store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ProfileStore()
+    return _store
+
+
+def download(profile):
+    """
+    Raw profile data for a download route
+
+    Returns:
+        tuple: (body bytes, mimetype, filename)
+    """
+    if profile['mode'] == 'cprofile':
+        return profile['raw'], 'application/octet-stream', f"{profile['id']}.prof"
+    return profile['raw'], 'text/plain', f"{profile['id']}.collapsed.txt"
+
+
+def _token_matches(token, supplied):
+    # An empty token matches nothing; compared in constant time
+    return bool(token) and supplied is not None and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def authorized(headers):
+    """Whether a request may read profiles: profiling is on and the request carries PROFILE_TOKEN"""
+    return _middleware is not None and _token_matches(_middleware.token, headers.get(PROFILE_HEADER))
+
+
+class ProfiledBody:
+    """Response iterable that finishes its request's profile when the server closes it"""
+
+    def __init__(self, body, finish):
+        self._body = body
+        self._finish = finish
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        try:
+            close = getattr(self._body, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._finish()
+
+
+class ProfilerMiddleware:
+    """WSGI middleware profiling requests picked by header (only with a token) or sampling"""
+
+    def __init__(self, app, store=None, sample_rate=0.0, mode='cprofile', token='',
+                 sample_interval_ms=DEFAULT_SAMPLE_INTERVAL_MS):
+        self.app = app
+        self.store = store or get_profile_store()
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.token = token
+        self.sample_interval_ms = sample_interval_ms
+        sql_trace.enable()
+
+    def _trigger(self, environ):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(SKIP_PREFIXES):
+            return None
+        header = environ.get('HTTP_' + PROFILE_HEADER.upper().replace('-', '_'))
+        if _token_matches(self.token, header):
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def __call__(self, environ, start_response):
+        trigger = self._trigger(environ)
+        if trigger is None:
+            return self.app(environ, start_response)
+
+        profile_id = uuid.uuid4().hex[:12]
+        captured = {}
+
+        def profiled_start_response(status, headers, exc_info=None):
+            captured['status'] = int(status.split(' ', 1)[0])
+            return start_response(status, list(headers) + [(PROFILE_ID_HEADER, profile_id)], exc_info)
+
+        mode = self.mode
+        if mode == 'cprofile' and not _cprofile_lock.acquire(blocking=False):
+            mode = 'sample'
+        profiler = sampler = None
+        started_at = datetime.now().isoformat()
+        sql_trace.start()
+        start = time.perf_counter()
+
+        def finish():
+            duration_ms = (time.perf_counter() - start) * 1000
+            if profiler is not None:
+                profiler.disable()
+                _cprofile_lock.release()
+            elif sampler is not None:
+                sampler.stop()
+            trace = sql_trace.stop()
+            self._store(profile_id, environ, captured.get('status'), trigger, mode, started_at, duration_ms,
+                        profiler, sampler, trace)
+
+        try:
+            if mode == 'cprofile':
+                profiler = cProfile.Profile()
+                profiler.enable()
+            else:
+                sampler = StackSampler(threading.get_ident(), self.sample_interval_ms)
+                sampler.start()
+            body = self.app(environ, profiled_start_response)
+        except BaseException:
+            finish()
+            raise
+        # Profiling continues while the server iterates the body; it stops in close()
+        return ProfiledBody(body, finish)
+
+    def _store(self, profile_id, environ, status, trigger, mode, started_at, duration_ms, profiler, sampler, trace):
+        profile = {
+            'id': profile_id,
+            'method': environ.get('REQUEST_METHOD'),
+            'path': environ.get('PATH_INFO'),
+            'query': environ.get('QUERY_STRING') or None,
+            'status': status,
+            'trigger': trigger,
+            'mode': mode,
+            'started_at': started_at,
+            'duration_ms': round(duration_ms, 3),
+            'sql': trace.to_dict() if trace else sql_trace.StatementTrace().to_dict(),
+        }
+        if profiler is not None:
+            stats = pstats.Stats(profiler, stream=io.StringIO())
+            profile['functions'] = _cprofile_summary(stats)
+            profile['raw'] = marshal.dumps(stats.stats)
+        else:
+            profile['samples'] = sampler.samples
+            profile['functions'] = sampler.top_functions()
+            profile['raw'] = sampler.collapsed().encode()
+        self.store.add(profile)
+
+
+def install(app):
+    """Wrap a Flask app's wsgi_app with the profiler when REQUEST_PROFILING=true and PROFILE_TOKEN is set"""
+    global _middleware
+    if os.getenv('REQUEST_PROFILING', 'false').lower() != 'true':
+        return app
+    token = os.getenv('PROFILE_TOKEN', '')
+    if not token:
+        logger.warning("REQUEST_PROFILING=true needs PROFILE_TOKEN; request profiling stays off")
+        return app
+    get_profile_store().keep = int(os.getenv('PROFILE_KEEP', DEFAULT_KEEP))
+    _middleware = ProfilerMiddleware(
+        app.wsgi_app,
+        sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+        mode=os.getenv('PROFILE_MODE', 'cprofile'),
+        token=token,
+        sample_interval_ms=float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', DEFAULT_SAMPLE_INTERVAL_MS))
+    )
+    app.wsgi_app = _middleware
+    return app
+
+
+def public(profile):
+    """A stored profile without its raw data, for JSON responses"""
+    return {key: value for key, value in profile.items() if key != 'raw'}
@@ -0,0 +1,251 @@
+"""
+Reservation search index for Bobby's Table Restaurant
+An FTS5 trigram index over reservation names, their sound-alike keys, phone
+digits and reservation numbers (created and kept in sync by triggers, see migrations.py) so
+get_reservation can find misspelled names and partial phone numbers with one
+indexed query instead of ilike scans
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from difflib import SequenceMatcher
+
+import db_migrate
+import db_pool
+
+DEFAULT_DB_PATH = os.path.join(os.getcwd(), 'instance', 'restaurant.db')
+
+FTS_TABLE = 'reservations_fts'
+
+# SQL expression reducing a stored phone number to its digits, shared by the
+# triggers and the backfill so both index the same text
+_DIGITS = "replace(replace(replace(replace(replace(replace({col}, '+', ''), '-', ''), ' ', ''), '(', ''), ')', ''), '.', '')"
+
+
+def phone_digits_sql(column):
+    """Return the SQL expression that strips formatting from a phone column"""
+    return _DIGITS.format(col=column)
+
+
+# Spelling folds applied in order to build a name's sound-alike key, so that
+# "Jon Smyth" and "John Smith" share trigrams. The same sequence runs in SQL
+# (triggers) and in Python (queries); both replace() every occurrence left to right.
+PHONETIC_FOLDS = (
+    ('ph', 'f'), ('gh', 'g'), ('ck', 'k'), ('h', ''), ('y', 'i'), ('z', 's'),
+    ('q', 'k'), ('c', 'k'), ('ee', 'i'), ('ie', 'i'), ('ei', 'i'), ('oo', 'u'), ('ou', 'u'),
+    ('ll', 'l'), ('nn', 'n'), ('ss', 's'), ('tt', 't'), ('mm', 'm'), ('rr', 'r'),
+)
+
+
+def phonetic_key(name):
+    """Return the sound-alike key for a name"""
+    key = (name or '').lower()
+    for old, new in PHONETIC_FOLDS:
+        key = key.replace(old, new)
+    return key
+
+
+def phonetic_key_sql(column):
+    """Return the SQL expression computing phonetic_key() for a column"""
+    expression = f"lower({column})"
+    for old, new in PHONETIC_FOLDS:
+        expression = f"replace({expression}, '{old}', '{new}')"
+    return expression
+
+
+# Statements creating the index, its triggers and the initial backfill
+SCHEMA_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"name, name_key, phone_digits, reservation_number, tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS reservations_fts_insert AFTER INSERT ON reservations BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, name_key, phone_digits, reservation_number)
+        VALUES (new.id, new.name, {phonetic_key_sql('new.name')}, {phone_digits_sql('new.phone_number')},
+                new.reservation_number);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS reservations_fts_update
+        AFTER UPDATE OF name, phone_number, reservation_number ON reservations BEGIN
+        UPDATE {FTS_TABLE}
+        SET name = new.name, name_key = {phonetic_key_sql('new.name')},
+            phone_digits = {phone_digits_sql('new.phone_number')},
+            reservation_number = new.reservation_number
+        WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS reservations_fts_delete AFTER DELETE ON reservations BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"DELETE FROM {FTS_TABLE}",
+    f"""INSERT INTO {FTS_TABLE} (rowid, name, name_key, phone_digits, reservation_number)
+        SELECT id, name, {phonetic_key_sql('name')}, {phone_digits_sql('phone_number')}, reservation_number
+        FROM reservations""",
+]
+
+
+def create_index(conn):
+    """
+    Migration step creating the index, its triggers and the backfill
+
+    The index is optional: on a SQLite build without FTS5 or its trigram
+    tokenizer the migration is skipped (available() stays False and lookups
+    fall back to ilike scans) so the migrations after it still run, and it
+    is retried at the next startup.
+    """
+    try:
+        conn.execute(SCHEMA_STATEMENTS[0])
+    except sqlite3.OperationalError as e:
+        raise db_migrate.MigrationSkipped(f"SQLite lacks FTS5 trigram support: {e}")
+    for statement in SCHEMA_STATEMENTS[1:]:
+        conn.execute(statement)
+
+# Candidates fetched from the index before re-scoring in Python
+CANDIDATE_LIMIT = 200
+
+# Minimum similarity (0-1) for a fuzzy name match to be returned
+MIN_NAME_SCORE = 0.6
+
+
+def _clean(text):
+    return ' '.join(re.sub(r'[^a-z0-9 ]', ' ', (text or '').lower()).split())
+
+
+def _trigrams(word):
+    grams = []
+    for i in range(len(word) - 2):
+        gram = word[i:i + 3]
+        if gram not in grams:
+            grams.append(gram)
+    return grams
+
+
+def _any_trigram(words):
+    """MATCH expression: each word must share at least one trigram"""
+    groups = ['(' + ' OR '.join(f'"{gram}"' for gram in _trigrams(word)) + ')' for word in words if len(word) >= 3]
+    return ' AND '.join(groups)
+
+
+def _similarity(query, name):
+    words = name.split()
+    whole = SequenceMatcher(None, query, name).ratio()
+    per_word = [max(SequenceMatcher(None, part, word).ratio() for word in words) for part in query.split()]
+    return max(whole, sum(per_word) / len(per_word))
+
+
+def name_similarity(query, name):
+    """
+    Score how well a spoken name matches a stored one (0-1)
+
+    Spelling and sound-alike similarity are averaged, each taking the better of
+    the whole-name ratio and the per-word ratio so that a single last name
+    matches the full name it belongs to.
+    """
+    query, name = _clean(query), _clean(name)
+    if not query or not name:
+        return 0.0
+    if query in name:
+        return 1.0
+    query_key, name_key = _clean(phonetic_key(query)), _clean(phonetic_key(name))
+    if not query_key or not name_key:
+        return _similarity(query, name)
+    return (_similarity(query, name) + _similarity(query_key, name_key)) / 2
+
+
+class ReservationSearch:
+    """Ranked name and phone lookups against the reservations FTS5 index"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._available = False
+
+    def _connect(self):
+        return db_pool.connect(self.db_path)
+
+    def available(self):
+        """True once the FTS index exists (migration 4); cached after the first hit"""
+        if not self._available:
+            conn = self._connect()
+            try:
+                self._available = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+                ).fetchone() is not None
+            finally:
+                conn.close()
+        return self._available
+
+    def _match(self, expression, limit):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT rowid, name FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY rank LIMIT ?",
+                (expression, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [(row[0], row[1]) for row in rows]
+
+    def search_name(self, name, limit=20, min_score=MIN_NAME_SCORE):
+        """
+        Find reservations by a possibly misspelled name
+
+        Args:
+            name: Name as heard from the caller (full, first or last)
+            limit: Maximum number of matches
+            min_score: Minimum similarity for fuzzy matches
+
+        Returns:
+            list: (reservation_id, score) tuples, best match first
+        """
+        query = _clean(name)
+        if len(query) < 3:
+            return []
+        key_words = _clean(phonetic_key(query)).split()
+
+        # Exact substring hits first, then reservations whose sound-alike key shares a
+        # trigram with every spoken word, then with any word while short of the limit
+        candidates = {}
+        for rowid, stored in self._match(f'name : "{query}"', CANDIDATE_LIMIT):
+            candidates[rowid] = stored
+        fuzzy = [_any_trigram(key_words)]
+        if len(key_words) > 1:
+            fuzzy.append(' OR '.join(_any_trigram([word]) for word in key_words if len(word) >= 3))
+        for expression in fuzzy:
+            if len(candidates) >= limit or not expression:
+                break
+            for rowid, stored in self._match(f'name_key : ({expression})', CANDIDATE_LIMIT):
+                candidates.setdefault(rowid, stored)
+
+        scored = [(rowid, name_similarity(query, stored)) for rowid, stored in candidates.items()]
+        scored = [match for match in scored if match[1] >= min_score]
+        scored.sort(key=lambda match: match[1], reverse=True)
+        return scored[:limit]
+
+    def search_phone(self, phone, limit=20):
+        """
+        Find reservations whose phone number contains the given digits
+
+        Formatting and a leading country code are ignored, so "+1 (555) 123-4567",
+        "5551234567" and "15551234567" all match the same reservations.
+
+        Returns:
+            list: Matching reservation ids
+        """
+        digits = re.sub(r'\D', '', phone or '')
+        if len(digits) > 10:
+            digits = digits[-10:]
+        if len(digits) < 3:
+            return []
+        return [rowid for rowid, _ in self._match(f'phone_digits : "{digits}"', limit)]
+
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_reservation_search():
+    """Return the process-wide reservation search index"""
+    global _search
+    if _search is None:
+        with _search_lock:
+            if _search is None:
+                _search = ReservationSearch()
+    return _search
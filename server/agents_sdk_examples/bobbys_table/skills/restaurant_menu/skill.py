@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from signalwire_agents.core.skill_base import SkillBase
 from signalwire_agents.core.function_result import SwaigFunctionResult
 
+from skills.runtime import get_skill_runtime
+
 class RestaurantMenuSkill(SkillBase):
     """Restaurant menu skill with data validation"""
     
@@ -22,23 +24,28 @@ class RestaurantMenuSkill(SkillBase):
         super().__init__(agent)
         self.skill_params = skill_params or {}
         self.description = "Restaurant menu system with data validation"
+        self._runtime = self.skill_params.get('runtime')
 
     def setup(self):
-        """Setup method required by SkillBase"""
+        """Setup method required by SkillBase; resolves the runtime context"""
+        try:
+            self.runtime
+        except Exception as e:
+            print(f"Menu skill runtime not available yet, will retry on first use: {e}")
         return True
 
+    @property
+    def runtime(self):
+        """App, database and models shared by the handlers (see skills.runtime)"""
+        if self._runtime is None:
+            self._runtime = get_skill_runtime()
+        return self._runtime
+
     def _ensure_menu_cached(self, raw_data):
         """Cache menu with validation"""
         try:
-            import sys
-            import os
-            
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import MenuItem
+            app = self.runtime.app
+            MenuItem = self.runtime.MenuItem
             
             with app.app_context():
                 meta_data = raw_data.get('meta_data', {}) if raw_data else {}
@@ -522,17 +529,10 @@ class RestaurantMenuSkill(SkillBase):
     def _create_order_handler(self, args, raw_data):
         """Create a standalone food order with data validation"""
         try:
-            import sys
-            import os
             from datetime import datetime
             
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import Order, OrderItem, MenuItem, db
+            app = self.runtime.app
+            Order, OrderItem, MenuItem, db = self.runtime.Order, self.runtime.OrderItem, self.runtime.MenuItem, self.runtime.db
             
             with app.app_context():
                 # Ensure menu is cached for item validation
@@ -1003,17 +1003,10 @@ class RestaurantMenuSkill(SkillBase):
     def _check_order_status_handler(self, args, raw_data):
         """Handle checking order status"""
         try:
-            import sys
-            import os
             from datetime import datetime, timedelta
             
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import Order, OrderItem, MenuItem, db
+            app = self.runtime.app
+            Order, OrderItem, MenuItem, db = self.runtime.Order, self.runtime.OrderItem, self.runtime.MenuItem, self.runtime.db
             
             order_number = args.get('order_number', '').strip()
             customer_phone = args.get('customer_phone', '').strip()
@@ -1038,16 +1031,13 @@ class RestaurantMenuSkill(SkillBase):
                     query = query.filter(Order.order_number == order_number_clean)
                 
                 if customer_phone:
-                    # Clean up phone number
-                    phone_clean = ''.join(filter(str.isdigit, customer_phone))
-                    if len(phone_clean) == 10:
-                        phone_clean = f"+1{phone_clean}"
-                    elif len(phone_clean) == 11 and phone_clean.startswith('1'):
-                        phone_clean = f"+{phone_clean}"
-                    elif not phone_clean.startswith('+'):
-                        phone_clean = f"+{phone_clean}"
-                    
-                    query = query.filter(Order.customer_phone == phone_clean)
+                    customer_phone_e164 = self.runtime.to_e164(customer_phone)
+                    if customer_phone_e164:
+                        # Match on the canonical E.164 column (indexed)
+                        query = query.filter(Order.customer_phone_e164 == customer_phone_e164)
+                    elif not order_number:
+                        # Comparing with None would match every order stored without a phone
+                        return SwaigFunctionResult(f"❌ No orders found for phone number {customer_phone}. Please check your phone number and try again.")
                 
                 # Get orders, prioritizing recent ones
                 orders = query.order_by(Order.created_at.desc()).limit(5).all()
@@ -13,6 +13,16 @@ from signalwire_agents.core.skill_base import SkillBase
 from signalwire_agents.core.function_result import SwaigFunctionResult
 from signalwire_agents.core.swaig_function import SWAIGFunction
 
+from skills.runtime import get_skill_runtime
+
+# Confirmation numbers as callers say them ("CONF-AB12CD34", "confirmation number AB12CD34", ...)
+CONFIRMATION_NUMBER_PATTERNS = [
+    re.compile(r'CONF[-\s]*([A-Z0-9]{8})', re.IGNORECASE),
+    re.compile(r'confirmation\s+(?:number\s+)?CONF[-\s]*([A-Z0-9]{8})', re.IGNORECASE),
+    re.compile(r'confirmation\s+(?:number\s+)?([A-Z0-9]{8})', re.IGNORECASE),
+    re.compile(r'conf\s+([A-Z0-9]{8})', re.IGNORECASE)
+]
+
 class RestaurantReservationSkill(SkillBase):
     """Provides restaurant reservation management capabilities"""
     
@@ -37,10 +47,22 @@ class RestaurantReservationSkill(SkillBase):
         super().__init__(agent, params)
         # SignalWire configuration for SMS
         self.signalwire_from_number = os.getenv('SIGNALWIRE_FROM_NUMBER', '+15551234567')
+        self._runtime = (params or {}).get('runtime')
     
     def setup(self) -> bool:
-        """Setup the reservation skill"""
+        """Setup the reservation skill and resolve its runtime context"""
+        try:
+            self.runtime
+        except Exception as e:
+            print(f"⚠️ Reservation skill runtime not available yet, will retry on first use: {e}")
         return True
+    
+    @property
+    def runtime(self):
+        """App, database and models shared by the handlers (see skills.runtime)"""
+        if self._runtime is None:
+            self._runtime = get_skill_runtime()
+        return self._runtime
 
     def _find_menu_item_exact(self, item_name):
         """
@@ -52,7 +74,7 @@ class RestaurantReservationSkill(SkillBase):
         Returns:
             MenuItem object if found, None otherwise
         """
-        from models import MenuItem
+        MenuItem = self.runtime.MenuItem
         
         if not item_name:
             return None
@@ -92,15 +114,8 @@ class RestaurantReservationSkill(SkillBase):
     def _cache_menu_in_metadata(self, raw_data):
         """Enhanced menu caching with robust fallback mechanisms"""
         try:
-            import sys
-            import os
-            
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import MenuItem
+            app = self.runtime.app
+            MenuItem = self.runtime.MenuItem
             
             with app.app_context():
                 # Get current meta_data
@@ -179,7 +194,7 @@ class RestaurantReservationSkill(SkillBase):
 
     def _load_menu_with_retry(self, max_attempts=3):
         """Load menu from database with retry logic"""
-        from models import MenuItem
+        MenuItem = self.runtime.MenuItem
         
         for attempt in range(max_attempts):
             try:
@@ -300,43 +315,8 @@ class RestaurantReservationSkill(SkillBase):
         Returns:
             Normalized phone number in E.164 format
         """
-        import re
-        
-        # If no phone number provided, use caller ID
-        if not phone_number and caller_id:
-            phone_number = caller_id
-            print(f"🔄 Using caller ID as phone number: {caller_id}")
-        
-        if not phone_number:
-            return None
-        
-        # If already in E.164 format, return as-is
-        if phone_number.startswith('+1') and len(phone_number) == 12:
-            return phone_number
-        
-        # Extract only digits
-        digits = re.sub(r'\D', '', phone_number)
-        
-        # Handle different digit lengths
-        if len(digits) == 10:
-            # 10 digits: add +1 prefix
-            normalized = f"+1{digits}"
-            print(f"🔄 Normalized 10-digit number {digits} to {normalized}")
-            return normalized
-        elif len(digits) == 11 and digits.startswith('1'):
-            # 11 digits starting with 1: add + prefix
-            normalized = f"+{digits}"
-            print(f"🔄 Normalized 11-digit number {digits} to {normalized}")
-            return normalized
-        elif len(digits) == 7:
-            # 7 digits: assume local number, add area code 555 and +1
-            normalized = f"+1555{digits}"
-            print(f"🔄 Normalized 7-digit number {digits} to {normalized} (added 555 area code)")
-            return normalized
-        else:
-            # Return original if we can't normalize
-            print(f"⚠️  Could not normalize phone number: {phone_number} (digits: {digits})")
-            return phone_number
+        from skills.utils import normalize_phone_number
+        return normalize_phone_number(phone_number, caller_id)
 
     def _extract_phone_from_conversation(self, call_log):
         """
@@ -389,15 +369,8 @@ class RestaurantReservationSkill(SkillBase):
     def _generate_order_number(self):
         """Generate a unique 5-digit order number"""
         import random
-        import sys
-        import os
-        
-        # Add the parent directory to sys.path to import app
-        parent_dir = os.path.dirname(os.path.dirname(__file__))
-        if parent_dir not in sys.path:
-            sys.path.insert(0, parent_dir)
         
-        from models import Order
+        Order = self.runtime.Order
         
         while True:
             # Generate a 5-digit number (10000 to 99999)
@@ -570,6 +543,24 @@ class RestaurantReservationSkill(SkillBase):
             **self.swaig_fields
         )
         
+        # Availability tool
+        self.agent.define_tool(
+            name="check_availability",
+            description="Check whether a table is free for a party at a given date and time. If it isn't, returns the next available times in the same call so you can offer alternatives right away.",
+            parameters={
+                "type": "object",
+                "properties": {
+                    "date": {"type": "string", "description": "Requested date (YYYY-MM-DD)"},
+                    "time": {"type": "string", "description": "Requested time (HH:MM, 24-hour)"},
+                    "party_size": {"type": "integer", "description": "Number of people"},
+                    "count": {"type": "integer", "description": "How many alternative times to return", "default": 3}
+                },
+                "required": ["date", "time", "party_size"]
+            },
+            handler=self._check_availability_handler,
+            **self.swaig_fields
+        )
+        
         # Calendar management tools
         self.agent.define_tool(
             name="get_calendar_events",
@@ -746,7 +737,6 @@ class RestaurantReservationSkill(SkillBase):
         
         try:
             from signalwire_agents.core.function_result import SwaigFunctionResult
-            import os
             import re
             print("✅ Imports successful")
             
@@ -896,16 +886,8 @@ class RestaurantReservationSkill(SkillBase):
                     return result
             
             # Look up reservation and calculate total
-            import sys
-            import os
-            
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import Reservation, Order
+            app = self.runtime.app
+            Reservation, Order = self.runtime.Reservation, self.runtime.Order
             
             with app.app_context():
                 reservation = Reservation.query.filter_by(reservation_number=reservation_number).first()
@@ -935,6 +917,28 @@ class RestaurantReservationSkill(SkillBase):
                 # Round total amount to 2 decimal places
                 total_amount = round(total_amount, 2)
                 
+                # Record the payment start so callbacks for this call resolve to this reservation
+                if call_id:
+                    from payment_state import get_payment_state_machine, EVENT_START, STATE_COMPLETING
+                    transition = get_payment_state_machine().transition(
+                        call_id, EVENT_START,
+                        reservation_number=reservation_number,
+                        payment_type='reservation',
+                        amount=total_amount,
+                        customer_name=cardholder_name,
+                        phone_number=phone_number
+                    )
+                    if not transition['accepted'] and transition['state'] == STATE_COMPLETING:
+                        result = SwaigFunctionResult(
+                            "Your payment is being finalized right now. "
+                            "You'll hear your confirmation number in just a moment."
+                        )
+                        result.set_metadata({
+                            "payment_step": "completing",
+                            "reservation_number": reservation_number
+                        })
+                        return result
+                
                 # Create the parameters array
                 parameters_array = [
                     {"name": "reservation_number", "value": reservation_number},
@@ -1054,16 +1058,20 @@ class RestaurantReservationSkill(SkillBase):
             meta_data = raw_data.get('meta_data', {}) if raw_data else {}
             call_id = raw_data.get('call_id') if raw_data else None
             
-            # Get payment session data to understand what failed
-            payment_session = None
-            if call_id:
-                payment_sessions = getattr(app, 'payment_sessions', {})
-                payment_session = payment_sessions.get(call_id)
+            # Get payment state to understand what failed
+            from payment_state import get_payment_state_machine, EVENT_RETRY, STATE_FAILED
+            payment_machine = get_payment_state_machine()
+            payment_session = payment_machine.get(call_id)
+            payment_failed = bool(payment_session and payment_session['state'] == STATE_FAILED)
+            
+            # Check if user wants to retry
+            call_log = raw_data.get('call_log', []) if raw_data else []
+            user_wants_retry = self._detect_affirmative_response(call_log, "payment retry")
                 
-            if payment_session and payment_session.get('payment_status') == 'failed':
-                error_type = payment_session.get('error_type', 'unknown')
-                failure_reason = payment_session.get('failure_reason', 'payment-failed')
-                attempt = payment_session.get('attempt', '1')
+            if payment_failed and not user_wants_retry:
+                error_type = payment_session.get('error_type') or 'unknown'
+                failure_reason = payment_session.get('failure_reason') or 'payment-failed'
+                attempt = payment_session.get('attempt') or '1'
                 
                 print(f"🔍 Previous payment failed: {error_type} ({failure_reason}) - attempt {attempt}")
                 
@@ -1092,26 +1100,21 @@ class RestaurantReservationSkill(SkillBase):
                 return SwaigFunctionResult(response_text)
             
             # If no failed payment session, treat as a general retry request
-            reservation_number = args.get('reservation_number') or meta_data.get('reservation_number')
+            reservation_number = (args.get('reservation_number') or meta_data.get('reservation_number') or
+                                  (payment_session or {}).get('reservation_number'))
             if not reservation_number:
                 return SwaigFunctionResult(
                     "I'd be happy to help you retry your payment. Could you please provide your reservation number?"
                 )
             
-            # Check if user wants to retry
-            call_log = raw_data.get('call_log', []) if raw_data else []
-            user_wants_retry = self._detect_affirmative_response(call_log, "payment retry")
-            
             if user_wants_retry:
                 # Clear the failed payment status and retry
-                if call_id and payment_session:
-                    payment_session.pop('payment_status', None)
-                    payment_session.pop('error_type', None)
-                    payment_session.pop('failure_reason', None)
+                if payment_failed:
+                    payment_machine.transition(call_id, EVENT_RETRY)
                     print(f"🔄 Cleared failed payment status for retry")
                 
                 # Call the main payment handler
-                return self._pay_reservation_handler(args, raw_data)
+                return self._pay_reservation_handler(dict(args, reservation_number=reservation_number), raw_data)
             else:
                 return SwaigFunctionResult(
                     "No problem! You can also pay when you arrive at the restaurant. "
@@ -1150,12 +1153,7 @@ class RestaurantReservationSkill(SkillBase):
             confirmation_number = None
             
             # Import app to access payment sessions
-            import sys
-            import os
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            from app import app
+            app = self.runtime.app
             
             if call_id:
                 # Check active payment sessions
@@ -1178,7 +1176,7 @@ class RestaurantReservationSkill(SkillBase):
                         print(f"✅ Found payment confirmation for reservation {reservation_number}")
             
             # Check database for payment status
-            from models import Reservation, Order
+            Reservation, Order = self.runtime.Reservation, self.runtime.Order
             
             with app.app_context():
                 reservation = Reservation.query.filter_by(reservation_number=reservation_number).first()
@@ -1245,17 +1243,8 @@ class RestaurantReservationSkill(SkillBase):
     def _show_order_summary_and_confirm(self, args, raw_data):
         """Enhanced order summary with comprehensive validation and confirmation"""
         try:
-            # Import Flask app and models locally to avoid circular import
-            import sys
-            import os
-            
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import MenuItem
+            app = self.runtime.app
+            MenuItem = self.runtime.MenuItem
             
             with app.app_context():
                 # Enhanced menu cache validation
@@ -1472,18 +1461,11 @@ class RestaurantReservationSkill(SkillBase):
             print(f"✅ Menu cached for reservation processing")
 
             # Import Flask app and models locally to avoid circular import
-            import sys
-            import os
             import random
             import re
             
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app, get_receptionist_agent
-            from models import db, Reservation
+            app, get_receptionist_agent = self.runtime.app, self.runtime.get_receptionist_agent
+            db, Reservation = self.runtime.db, self.runtime.Reservation
             
             with app.app_context():
                 # Cache menu in meta_data for performance
@@ -1978,6 +1960,11 @@ class RestaurantReservationSkill(SkillBase):
                 
                 # No duplicate prevention - allow all reservation requests
                 # Customers should be free to make multiple reservations as needed
+
+                # Make sure a table is actually free, offering alternatives if not
+                unavailable = self._unavailable_message(args['date'], args['time'], int(args['party_size']))
+                if unavailable:
+                    return SwaigFunctionResult(unavailable)
                 
                 # Generate a unique 6-digit reservation number (matching Flask route logic)
                 while True:
@@ -2012,7 +1999,7 @@ class RestaurantReservationSkill(SkillBase):
                 # Convert order_items format to party_orders format if needed
                 if order_items and not party_orders and not pre_order:
                     print(f"🔄 Converting order_items format to party_orders format")
-                    from models import MenuItem
+                    MenuItem = self.runtime.MenuItem
                     
                     # Convert order_items to party_orders format using exact matching only
                     converted_items = []
@@ -2080,7 +2067,7 @@ class RestaurantReservationSkill(SkillBase):
                     print(f"   ⚠️ WARNING: Using fallback pre_order format instead of preferred party_orders")
                     print(f"   📋 Raw pre_order data: {pre_order}")
                     
-                    from models import MenuItem
+                    MenuItem = self.runtime.MenuItem
                     
                     # Convert pre_order items to party_orders format using enhanced matching
                     converted_items = []
@@ -2154,7 +2141,7 @@ class RestaurantReservationSkill(SkillBase):
                 
                 # Only process orders if not an old school reservation
                 if not args.get('old_school', False) and party_orders:
-                    from models import Order, OrderItem, MenuItem
+                    Order, OrderItem, MenuItem = self.runtime.Order, self.runtime.OrderItem, self.runtime.MenuItem
                     print(f"✅ Processing {len(party_orders)} party orders")
                     
                     # SIMPLIFIED PROCESSING: Trust the provided menu IDs and use cached menu data
@@ -2271,7 +2258,7 @@ class RestaurantReservationSkill(SkillBase):
                             print(f"   ✅ Found {len(conversation_items)} items via fallback conversation extraction")
                             
                             # Create a single order with all conversation items
-                            from models import Order, OrderItem, MenuItem
+                            Order, OrderItem, MenuItem = self.runtime.Order, self.runtime.OrderItem, self.runtime.MenuItem
                             
                             order = Order(
                                 order_number=self._generate_order_number(),
@@ -2384,7 +2371,7 @@ class RestaurantReservationSkill(SkillBase):
                     message += f"\n🍽️ Pre-Order Details:\n"
                     
                     # Show detailed pre-order breakdown by person
-                    from models import Order, OrderItem, MenuItem
+                    Order, OrderItem, MenuItem = self.runtime.Order, self.runtime.OrderItem, self.runtime.MenuItem
                     orders = Order.query.filter_by(reservation_id=reservation.id).all()
                     
                     for order in orders:
@@ -2404,7 +2391,7 @@ class RestaurantReservationSkill(SkillBase):
                     message += f"You can browse our menu and order when you arrive.\n"
                 
                 # Add SMS confirmation status to the message
-                if 'sms_result' in locals() and sms_result.get('sms_sent'):
+                if 'sms_result' in locals() and (sms_result.get('sms_sent') or sms_result.get('sms_queued')):
                     message += f"\n📱 A confirmation SMS has been sent to your phone. "
                 
                 message += f"\n🎯 IMPORTANT: Your reservation number is {reservation.reservation_number}\n"
@@ -2773,16 +2760,8 @@ class RestaurantReservationSkill(SkillBase):
     def _extract_food_items_from_conversation(self, conversation_text, meta_data=None):
         """Enhanced food item extraction with comprehensive error handling and improved patterns"""
         try:
-            # Import Flask app and models locally
-            import sys
-            import os
-            
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import MenuItem
+            app = self.runtime.app
+            MenuItem = self.runtime.MenuItem
             
             with app.app_context():
                 extracted_items = []
@@ -2855,7 +2834,7 @@ class RestaurantReservationSkill(SkillBase):
             
             # Fallback to database
             print("📊 Loading menu from database for extraction")
-            from models import MenuItem
+            MenuItem = self.runtime.MenuItem
             menu_items = MenuItem.query.filter_by(is_available=True).all()
             
             for item in menu_items:
@@ -3097,24 +3076,144 @@ class RestaurantReservationSkill(SkillBase):
         
         return validated_items
     
+    def _format_slot_times(self, slots, requested_date=None):
+        """Format (date, time) availability slots for voice, naming the day only when it changes"""
+        spoken = []
+        for slot_date, slot_time in slots:
+            time_12hr = datetime.strptime(slot_time, '%H:%M').strftime('%I:%M %p').lstrip('0')
+            if slot_date != requested_date:
+                day_name = datetime.strptime(slot_date, '%Y-%m-%d').strftime('%A, %B %d')
+                time_12hr = f"{time_12hr} on {day_name}"
+            spoken.append(time_12hr)
+        if len(spoken) > 1:
+            return ', '.join(spoken[:-1]) + f" or {spoken[-1]}"
+        return spoken[0] if spoken else ''
+
+    def _unavailable_message(self, date, time, party_size, ignore_id=None):
+        """
+        Check table availability for a booking
+
+        Returns:
+            str: Message offering alternative times if the party can't be seated, else None
+        """
+        try:
+            availability = self.runtime.get_table_availability()
+            if not availability.available() or availability.can_seat(date, time, party_size, ignore_id=ignore_id):
+                return None
+            alternatives = availability.next_available(date, time, party_size, count=3, ignore_id=ignore_id)
+        except Exception as e:
+            # Never block a booking because the availability index failed
+            print(f"⚠️ Availability check failed, allowing booking: {e}")
+            return None
+
+        party_text = "person" if int(party_size) == 1 else "people"
+        print(f"🪑 No table for {party_size} on {date} at {time}; alternatives: {alternatives}")
+        if alternatives:
+            return (f"I'm sorry, we don't have a table for {party_size} {party_text} at that time. "
+                    f"The closest available times are {self._format_slot_times(alternatives, date)}. "
+                    f"Would any of those work?")
+        return (f"I'm sorry, we don't have a table for {party_size} {party_text} at that time or in the following week. "
+                f"Please call the restaurant directly and we'll do our best to accommodate you.")
+
+    def _check_availability_handler(self, args, raw_data):
+        """Handler for check_availability tool"""
+        try:
+            date, time, party_size = args.get('date'), args.get('time'), args.get('party_size')
+            if not date or not time or not party_size:
+                return SwaigFunctionResult("I need the date, time and party size to check availability.")
+
+            count = max(1, min(int(args.get('count', 3)), 10))
+            availability = self.runtime.get_table_availability()
+            if not availability.available():
+                return SwaigFunctionResult("We should be able to seat you then. Would you like me to make the reservation?")
+
+            party_text = "person" if int(party_size) == 1 else "people"
+            if availability.can_seat(date, time, party_size):
+                time_12hr = self._format_slot_times([(date, time)], date)
+                return SwaigFunctionResult(f"Good news! We have a table for {party_size} {party_text} at {time_12hr}. Would you like me to book it?")
+
+            alternatives = availability.next_available(date, time, party_size, count=count)
+            if alternatives:
+                return SwaigFunctionResult(
+                    f"We're fully booked for {party_size} {party_text} at that time. "
+                    f"The next available times are {self._format_slot_times(alternatives, date)}. Would any of those work?"
+                )
+            return SwaigFunctionResult(f"I'm sorry, we don't have a table for {party_size} {party_text} in the next week.")
+
+        except Exception as e:
+            print(f"❌ Error checking availability: {e}")
+            return SwaigFunctionResult(f"Sorry, I couldn't check availability right now: {str(e)}")
+
+    def _search_reservation_ids(self, name=None, phone=None):
+        """Ranked reservation ids from the search index, or None when the index isn't available"""
+        try:
+            search = self.runtime.get_reservation_search()
+            if not search.available():
+                return None
+            if name:
+                return [reservation_id for reservation_id, _ in search.search_name(name)]
+            return search.search_phone(phone)
+        except Exception as e:
+            print(f"⚠️ Reservation search index unavailable: {e}")
+            return None
+
+    def _phone_number_filter(self, Reservation, search_phone):
+        """Filter matching a phone number in any format through an indexed lookup when possible"""
+        phone_e164 = self.runtime.to_e164(search_phone)
+        if phone_e164:
+            return Reservation.phone_e164 == phone_e164
+        
+        # Partial numbers (e.g. last four digits) go through the search index
+        ranked_ids = self._search_reservation_ids(phone=search_phone)
+        if ranked_ids is not None:
+            return Reservation.id.in_(ranked_ids)
+        
+        # Try exact match first
+        phone_query = Reservation.phone_number == search_phone
+        
+        # Also try partial matches for different formats
+        if search_phone.startswith('+1'):
+            # If search phone has +1, also try without it
+            phone_without_plus = search_phone[2:]  # Remove +1
+            phone_query = phone_query | (Reservation.phone_number.like(f"%{phone_without_plus}%"))
+        elif search_phone.startswith('1') and len(search_phone) == 11:
+            # If search phone starts with 1, try with +1 prefix
+            phone_with_plus = f"+{search_phone}"
+            phone_query = phone_query | (Reservation.phone_number == phone_with_plus)
+        elif len(search_phone) == 10:
+            # If 10-digit number, try with +1 prefix
+            phone_with_plus = f"+1{search_phone}"
+            phone_query = phone_query | (Reservation.phone_number == phone_with_plus)
+        return phone_query
+
+    def _detect_payment_context(self, raw_data, call_log):
+        """Check whether the caller is in the middle of a payment (active session or payment talk)"""
+        if raw_data and raw_data.get('call_id'):
+            try:
+                if self.runtime.is_payment_in_progress(raw_data['call_id']):
+                    print(f"🔍 Payment context detected for call {raw_data['call_id']} - being cautious with number extraction")
+                    return True
+            except Exception as e:
+                print(f"⚠️ Could not check payment context: {e}")
+        
+        # Also check conversation context for payment keywords
+        payment_keywords = ['card', 'payment', 'pay', 'credit', 'billing', 'charge']
+        for msg in call_log[-3:]:
+            if msg.get('role') == 'assistant' and msg.get('content'):
+                assistant_content = msg['content'].lower()
+                if any(keyword in assistant_content for keyword in payment_keywords):
+                    print(f"🔍 Payment context detected from conversation: {assistant_content[:100]}...")
+                    return True
+        return False
+
     def _get_reservation_handler(self, args, raw_data):
         """Handler for get_reservation tool"""
         try:
             # Extract meta_data for session management
             meta_data = raw_data.get('meta_data', {}) if raw_data else {}
             print(f"🔍 Current meta_data: {meta_data}")
-            
-            # Import Flask app and models locally to avoid circular import
-            import sys
-            import os
-            
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import Reservation
+            app = self.runtime.app
+            Reservation = self.runtime.Reservation
             
             with app.app_context():
                 # Detect if this is a SignalWire call and default to text format for voice
@@ -3135,21 +3234,19 @@ class RestaurantReservationSkill(SkillBase):
                     confirmation_number = None
                     customer_name = None
                     
+                    # Payment context does not depend on the entry being scanned, so it is
+                    # resolved at most once per call (on the first entry that needs it)
+                    extract_reservation_number_from_text = self.runtime.extract_reservation_number_from_text
+                    payment_context = None
+                    
                     # Process call log in reverse order to prioritize recent messages
                     for entry in reversed(call_log):
                         if entry.get('role') == 'user' and entry.get('content'):
                             content = entry['content'].lower()
                             
                             # Look for confirmation numbers first (highest priority)
-                            import re
-                            conf_patterns = [
-                                r'CONF[-\s]*([A-Z0-9]{8})',
-                                r'confirmation\s+(?:number\s+)?CONF[-\s]*([A-Z0-9]{8})',
-                                r'confirmation\s+(?:number\s+)?([A-Z0-9]{8})',
-                                r'conf\s+([A-Z0-9]{8})'
-                            ]
-                            for pattern in conf_patterns:
-                                match = re.search(pattern, entry['content'], re.IGNORECASE)
+                            for pattern in CONFIRMATION_NUMBER_PATTERNS:
+                                match = pattern.search(entry['content'])
                                 if match:
                                     confirmation_number = f"CONF-{match.group(1)}"
                                     print(f"🔄 Extracted confirmation number from conversation: {confirmation_number}")
@@ -3158,41 +3255,10 @@ class RestaurantReservationSkill(SkillBase):
                             if confirmation_number:
                                 break
                             
-                            # Look for reservation numbers using improved extraction
-                            try:
-                                from number_utils import extract_reservation_number_from_text
-                            except ImportError:
-                                # Add parent directory to path if import fails
-                                import sys
-                                import os
-                                parent_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-                                if parent_dir not in sys.path:
-                                    sys.path.insert(0, parent_dir)
-                                from number_utils import extract_reservation_number_from_text
-                            
-                            # Check if we're in a payment context by looking at recent conversation
-                            payment_context = False
-                            if raw_data and raw_data.get('call_id'):
-                                try:
-                                    from app import is_payment_in_progress
-                                    payment_context = is_payment_in_progress(raw_data['call_id'])
-                                    if payment_context:
-                                        print(f"🔍 Payment context detected for call {raw_data['call_id']} - being cautious with number extraction")
-                                except Exception as e:
-                                    print(f"⚠️ Could not check payment context: {e}")
-                            
-                            # Also check conversation context for payment keywords
-                            if not payment_context:
-                                recent_messages = call_log[-3:] if len(call_log) >= 3 else call_log
-                                for msg in recent_messages:
-                                    if msg.get('role') == 'assistant' and msg.get('content'):
-                                        assistant_content = msg['content'].lower()
-                                        payment_keywords = ['card', 'payment', 'pay', 'credit', 'billing', 'charge']
-                                        if any(keyword in assistant_content for keyword in payment_keywords):
-                                            payment_context = True
-                                            print(f"🔍 Payment context detected from conversation: {assistant_content[:100]}...")
-                                            break
+                            if payment_context is None:
+                                payment_context = self._detect_payment_context(raw_data, call_log)
                             
+                            # Look for reservation numbers using improved extraction
                             extracted_number = extract_reservation_number_from_text(content, payment_context=payment_context)
                             if extracted_number:
                                 reservation_number = extracted_number
@@ -3219,6 +3285,7 @@ class RestaurantReservationSkill(SkillBase):
                 # Build search criteria - prioritize confirmation number, then reservation ID/number
                 search_criteria = []
                 query = Reservation.query
+                ranked_ids = None
                 
                 # Priority 1: Confirmation Number (most specific for paid reservations)
                 if args.get('confirmation_number'):
@@ -3238,21 +3305,29 @@ class RestaurantReservationSkill(SkillBase):
                     print(f"🔍 Searching by reservation number: {args['reservation_number']}")
                 
                 # Priority 2: Name-based search (if no reservation ID/number)
-                elif args.get('name'):
-                    # Search in full name
-                    query = query.filter(Reservation.name.ilike(f"%{args['name']}%"))
-                    search_criteria.append(f"name {args['name']}")
-                    print(f"🔍 Searching by name: {args['name']}")
-                elif args.get('first_name') or args.get('last_name'):
-                    # Search by first/last name
-                    if args.get('first_name'):
-                        query = query.filter(Reservation.name.ilike(f"{args['first_name']}%"))
-                        search_criteria.append(f"first name {args['first_name']}")
-                        print(f"🔍 Searching by first name: {args['first_name']}")
-                    if args.get('last_name'):
-                        query = query.filter(Reservation.name.ilike(f"%{args['last_name']}"))
-                        search_criteria.append(f"last name {args['last_name']}")
-                        print(f"🔍 Searching by last name: {args['last_name']}")
+                elif args.get('name') or args.get('first_name') or args.get('last_name'):
+                    spoken_name = args.get('name') or f"{args.get('first_name') or ''} {args.get('last_name') or ''}".strip()
+                    ranked_ids = self._search_reservation_ids(name=spoken_name)
+                    if ranked_ids is not None:
+                        # Fuzzy match through the search index, best match first
+                        query = query.filter(Reservation.id.in_(ranked_ids))
+                        search_criteria.append(f"name {spoken_name}")
+                        print(f"🔍 Searching by name (indexed, {len(ranked_ids)} matches): {spoken_name}")
+                    elif args.get('name'):
+                        # Search in full name
+                        query = query.filter(Reservation.name.ilike(f"%{args['name']}%"))
+                        search_criteria.append(f"name {args['name']}")
+                        print(f"🔍 Searching by name: {args['name']}")
+                    else:
+                        # Search by first/last name
+                        if args.get('first_name'):
+                            query = query.filter(Reservation.name.ilike(f"{args['first_name']}%"))
+                            search_criteria.append(f"first name {args['first_name']}")
+                            print(f"🔍 Searching by first name: {args['first_name']}")
+                        if args.get('last_name'):
+                            query = query.filter(Reservation.name.ilike(f"%{args['last_name']}"))
+                            search_criteria.append(f"last name {args['last_name']}")
+                            print(f"🔍 Searching by last name: {args['last_name']}")
                 
                 # Additional filters (can be combined with above)
                 if args.get('date'):
@@ -3273,28 +3348,9 @@ class RestaurantReservationSkill(SkillBase):
                 
                 # Phone number search only as fallback (not primary method)
                 if args.get('phone_number') and not any(args.get(key) for key in ['reservation_id', 'reservation_number', 'name', 'first_name', 'last_name']):
-                    # Normalize the search phone number and try multiple formats
+                    # Match the phone number regardless of formatting
                     search_phone = args['phone_number']
-                    
-                    # Try exact match first
-                    phone_query = Reservation.phone_number == search_phone
-                    
-                    # Also try partial matches for different formats
-                    if search_phone.startswith('+1'):
-                        # If search phone has +1, also try without it
-                        phone_without_plus = search_phone[2:]  # Remove +1
-                        phone_query = phone_query | (Reservation.phone_number.like(f"%{phone_without_plus}%"))
-                    elif search_phone.startswith('1') and len(search_phone) == 11:
-                        # If search phone starts with 1, try with +1 prefix
-                        phone_with_plus = f"+{search_phone}"
-                        phone_query = phone_query | (Reservation.phone_number == phone_with_plus)
-                    elif len(search_phone) == 10:
-                        # If 10-digit number, try with +1 prefix
-                        phone_with_plus = f"+1{search_phone}"
-                        phone_query = phone_query | (Reservation.phone_number == phone_with_plus)
-                    
-                    # Apply the phone query with OR conditions
-                    query = query.filter(phone_query)
+                    query = query.filter(self._phone_number_filter(Reservation, search_phone))
                     search_criteria.append(f"phone number {search_phone}")
                     print(f"🔍 Fallback search by phone number: {search_phone} (with format variations)")
                 
@@ -3341,6 +3397,9 @@ class RestaurantReservationSkill(SkillBase):
                 print(f"🔍 Query filters applied: {len(search_criteria)} filters")
                 
                 reservations = query.all()
+                if ranked_ids:
+                    rank = {reservation_id: position for position, reservation_id in enumerate(ranked_ids)}
+                    reservations.sort(key=lambda res: rank.get(res.id, len(rank)))
                 print(f"🔍 Database query returned {len(reservations)} reservations")
                 
                 # Debug: Show what we're actually searching for
@@ -3426,28 +3485,11 @@ class RestaurantReservationSkill(SkillBase):
                         backup_search_attempted = True
                         
                         for backup_phone in backup_phones:
-                            # Normalize the search phone number and try multiple formats
+                            # Match the phone number regardless of formatting
                             search_phone = backup_phone
                             
-                            # Try exact match first
-                            phone_query = Reservation.phone_number == search_phone
-                            
-                            # Also try partial matches for different formats
-                            if search_phone.startswith('+1'):
-                                # If search phone has +1, also try without it
-                                phone_without_plus = search_phone[2:]  # Remove +1
-                                phone_query = phone_query | (Reservation.phone_number.like(f"%{phone_without_plus}%"))
-                            elif search_phone.startswith('1') and len(search_phone) == 11:
-                                # If search phone starts with 1, try with +1 prefix
-                                phone_with_plus = f"+{search_phone}"
-                                phone_query = phone_query | (Reservation.phone_number == phone_with_plus)
-                            elif len(search_phone) == 10:
-                                # If 10-digit number, try with +1 prefix
-                                phone_with_plus = f"+1{search_phone}"
-                                phone_query = phone_query | (Reservation.phone_number == phone_with_plus)
-                            
                             # Execute backup search
-                            backup_query = Reservation.query.filter(phone_query)
+                            backup_query = Reservation.query.filter(self._phone_number_filter(Reservation, search_phone))
                             phone_reservations = backup_query.all()
                             
                             if phone_reservations:
@@ -3561,7 +3603,7 @@ class RestaurantReservationSkill(SkillBase):
                     recent_payment_info = None
                     try:
                         # Check if there's recent payment confirmation data for this reservation
-                        from app import app
+                        app = self.runtime.app
                         if hasattr(app, 'payment_confirmations') and reservation.reservation_number in app.payment_confirmations:
                             recent_payment_info = app.payment_confirmations[reservation.reservation_number]
                             print(f"✅ Found recent payment confirmation for reservation {reservation.reservation_number}: {recent_payment_info['confirmation_number']}")
@@ -3627,7 +3669,7 @@ class RestaurantReservationSkill(SkillBase):
                             message += f" Special requests: {reservation.special_requests}"
                         
                         # Convert numbers to words for better TTS pronunciation
-                        from number_utils import numbers_to_words
+                        numbers_to_words = self.runtime.numbers_to_words
                         message = numbers_to_words(message)
                         
                         return SwaigFunctionResult(message)
@@ -3675,17 +3717,10 @@ class RestaurantReservationSkill(SkillBase):
         """Handler for update_reservation tool"""
         try:
             # Import Flask app and models locally to avoid circular import
-            import sys
-            import os
             import re
             
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import db, Reservation, Order, OrderItem, MenuItem
+            app = self.runtime.app
+            db, Reservation, Order, OrderItem, MenuItem = self.runtime.db, self.runtime.Reservation, self.runtime.Order, self.runtime.OrderItem, self.runtime.MenuItem
             
             with app.app_context():
                 # Cache menu in meta_data for performance
@@ -3727,12 +3762,12 @@ class RestaurantReservationSkill(SkillBase):
                                 )
                         
                         # Look for reservation number mentioned in conversation (prioritize recent messages)
+                        extract_reservation_number_from_text = self.runtime.extract_reservation_number_from_text
                         for entry in reversed(call_log):
                             if entry.get('role') == 'user' and entry.get('content'):
                                 content = entry['content'].lower()
                                 
                                 # Look for reservation numbers using improved extraction
-                                from number_utils import extract_reservation_number_from_text
                                 extracted_number = extract_reservation_number_from_text(content)
                                 if extracted_number:
                                     reservation_number = extracted_number
@@ -3752,10 +3787,11 @@ class RestaurantReservationSkill(SkillBase):
                         else:
                             # Fallback to phone/name search
                             reservation = None
-                            # Try by name and phone
-                            if caller_phone:
+                            # Try by name and phone (an unparseable number would match rows with no phone)
+                            caller_phone_e164 = self.runtime.to_e164(caller_phone)
+                            if caller_phone_e164:
                                 reservation = Reservation.query.filter_by(
-                                    phone_number=caller_phone
+                                    phone_e164=caller_phone_e164
                                 ).order_by(Reservation.date.desc()).first()
                                 if reservation:
                                     print(f"🔄 Found reservation by phone {caller_phone}: {reservation.name}")
@@ -4037,6 +4073,14 @@ class RestaurantReservationSkill(SkillBase):
                     
                     reservation.date = new_date
                     reservation.time = new_time
+
+                if any(key in args for key in ('party_size', 'date', 'time')) and reservation.status != 'cancelled':
+                    unavailable = self._unavailable_message(
+                        str(reservation.date), str(reservation.time), reservation.party_size, ignore_id=reservation.id
+                    )
+                    if unavailable:
+                        db.session.rollback()
+                        return SwaigFunctionResult(unavailable)
                 
                 # Process party orders if provided
                 party_orders_processed = False
@@ -4253,7 +4297,7 @@ class RestaurantReservationSkill(SkillBase):
                             message += f"\nTotal bill: ${total_bill:.2f}"
                             message += f"\nYour food will be ready when you arrive!"
                 
-                if sms_result.get('sms_sent'):
+                if sms_result.get('sms_sent') or sms_result.get('sms_queued'):
                     message += "\n\nAn updated confirmation SMS has been sent to your phone."
                 
                 return SwaigFunctionResult(message)
@@ -4264,15 +4308,8 @@ class RestaurantReservationSkill(SkillBase):
     def _generate_order_number(self):
         """Generate a unique 5-digit order number"""
         import random
-        import sys
-        import os
-        
-        # Add the parent directory to sys.path to import app
-        parent_dir = os.path.dirname(os.path.dirname(__file__))
-        if parent_dir not in sys.path:
-            sys.path.insert(0, parent_dir)
         
-        from models import Order
+        Order = self.runtime.Order
         
         while True:
             # Generate a 5-digit number (10000 to 99999)
@@ -4286,17 +4323,8 @@ class RestaurantReservationSkill(SkillBase):
     def _cancel_reservation_handler(self, args, raw_data):
         """Handler for cancel_reservation tool"""
         try:
-            # Import Flask app and models locally to avoid circular import
-            import sys
-            import os
-            
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import db, Reservation
+            app = self.runtime.app
+            db, Reservation = self.runtime.db, self.runtime.Reservation
             
             print(f"🔍 Received args: {args}")
             
@@ -4338,12 +4366,12 @@ class RestaurantReservationSkill(SkillBase):
                         reservation_number = None
                         
                         # Look for reservation number mentioned in conversation (prioritize recent messages)
+                        extract_reservation_number_from_text = self.runtime.extract_reservation_number_from_text
                         for entry in reversed(call_log):
                             if entry.get('role') == 'user' and entry.get('content'):
                                 content = entry['content'].lower()
                                 
                                 # Look for reservation numbers using improved extraction
-                                from number_utils import extract_reservation_number_from_text
                                 extracted_number = extract_reservation_number_from_text(content)
                                 if extracted_number:
                                     reservation_number = extracted_number
@@ -4362,10 +4390,12 @@ class RestaurantReservationSkill(SkillBase):
                             else:
                                 return SwaigFunctionResult(f"Reservation number {reservation_number} not found or already cancelled.")
                         else:
-                            # Fallback to phone number search (most recent reservation)
-                            if caller_phone:
+                            # Fallback to phone number search (most recent reservation);
+                            # an unparseable number would match rows with no phone, so skip it
+                            caller_phone_e164 = self.runtime.to_e164(caller_phone)
+                            if caller_phone_e164:
                                 reservation = Reservation.query.filter_by(
-                                    phone_number=caller_phone
+                                    phone_e164=caller_phone_e164
                                 ).filter(
                                     Reservation.status != 'cancelled'
                                 ).order_by(Reservation.created_at.desc()).first()
@@ -4378,11 +4408,11 @@ class RestaurantReservationSkill(SkillBase):
                                 print("🔍 Trying to extract reservation info from conversation...")
                                 try:
                                     extracted_info = self._extract_reservation_info_from_conversation(call_log, caller_phone)
-                                    if 'name' in extracted_info:
+                                    if 'name' in extracted_info and caller_phone_e164:
                                         # Try to find by name and phone
                                         reservation = Reservation.query.filter_by(
                                             name=extracted_info['name'],
-                                            phone_number=caller_phone
+                                            phone_e164=caller_phone_e164
                                         ).filter(
                                             Reservation.status != 'cancelled'
                                         ).order_by(Reservation.created_at.desc()).first()
@@ -4467,7 +4497,7 @@ class RestaurantReservationSkill(SkillBase):
                     print(f"⚠️ Calendar refresh notification error for cancellation (non-critical): {refresh_error}")
                 
                 # Convert numbers to words for better TTS pronunciation
-                from number_utils import numbers_to_words
+                numbers_to_words = self.runtime.numbers_to_words
                 message = numbers_to_words(message)
                 
                 return SwaigFunctionResult(message)
@@ -4479,17 +4509,10 @@ class RestaurantReservationSkill(SkillBase):
         """Handler for get_calendar_events tool"""
         try:
             # Import Flask app and models locally to avoid circular import
-            import sys
-            import os
             from datetime import timedelta
             
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import db, Reservation
+            app = self.runtime.app
+            db, Reservation = self.runtime.db, self.runtime.Reservation
             
             with app.app_context():
                 # Set default date range
@@ -4579,17 +4602,8 @@ class RestaurantReservationSkill(SkillBase):
     def _get_todays_reservations_handler(self, args, raw_data):
         """Handler for get_todays_reservations tool"""
         try:
-            # Import Flask app and models locally to avoid circular import
-            import sys
-            import os
-            
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import db, Reservation
+            app = self.runtime.app
+            db, Reservation = self.runtime.db, self.runtime.Reservation
             
             with app.app_context():
                 # Get target date (default to today)
@@ -4649,18 +4663,11 @@ class RestaurantReservationSkill(SkillBase):
         """Handler for get_reservation_summary tool"""
         try:
             # Import Flask app and models locally to avoid circular import
-            import sys
-            import os
             from datetime import timedelta
             from collections import defaultdict
             
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import db, Reservation
+            app = self.runtime.app
+            db, Reservation = self.runtime.db, self.runtime.Reservation
             
             with app.app_context():
                 # Determine date range
@@ -4768,13 +4775,8 @@ class RestaurantReservationSkill(SkillBase):
         
         # Import menu items for analysis
         try:
-            import sys
-            import os
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            from app import app
-            from models import MenuItem
+            app = self.runtime.app
+            MenuItem = self.runtime.MenuItem
             
             with app.app_context():
                 menu_items = {item.id: item.name for item in MenuItem.query.all()}
@@ -5153,13 +5155,8 @@ class RestaurantReservationSkill(SkillBase):
         
         # Import menu items for analysis
         try:
-            import sys
-            import os
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            from app import app
-            from models import MenuItem
+            app = self.runtime.app
+            MenuItem = self.runtime.MenuItem
             
             with app.app_context():
                 menu_items = {item.id: item.name for item in MenuItem.query.all()}
@@ -5312,7 +5309,7 @@ class RestaurantReservationSkill(SkillBase):
     def _offer_sms_confirmation_handler(self, args, raw_data):
         """Handle SMS confirmation request with user consent"""
         try:
-            from models import Reservation, Order
+            Reservation, Order = self.runtime.Reservation, self.runtime.Order
             from signalwire_agents.core.function_result import SwaigFunctionResult
             
             reservation_number = args.get('reservation_number')
@@ -5325,7 +5322,7 @@ class RestaurantReservationSkill(SkillBase):
                 return SwaigFunctionResult("I need a reservation number to send SMS details.")
             
             # Get reservation from database
-            from app import app  # Import app for database context
+            app = self.runtime.app
             with app.app_context():
                 reservation = Reservation.query.filter_by(reservation_number=reservation_number).first()
                 
@@ -5395,17 +5392,8 @@ class RestaurantReservationSkill(SkillBase):
     def _add_to_reservation_handler(self, args, raw_data):
         """Handler for add_to_reservation tool"""
         try:
-            # Import Flask app and models locally to avoid circular import
-            import sys
-            import os
-            
-            # Add the parent directory to sys.path to import app
-            parent_dir = os.path.dirname(os.path.dirname(__file__))
-            if parent_dir not in sys.path:
-                sys.path.insert(0, parent_dir)
-            
-            from app import app
-            from models import db, Reservation, Order, OrderItem, MenuItem
+            app = self.runtime.app
+            db, Reservation, Order, OrderItem, MenuItem = self.runtime.db, self.runtime.Reservation, self.runtime.Order, self.runtime.OrderItem, self.runtime.MenuItem
             
             with app.app_context():
                 # Find the reservation
@@ -5440,26 +5428,27 @@ class RestaurantReservationSkill(SkillBase):
                             )
                     
                     # Look for reservation number in conversation
+                    extract_reservation_number_from_text = self.runtime.extract_reservation_number_from_text
                     for entry in reversed(call_log):
                         if entry.get('role') == 'user' and entry.get('content'):
                             content = entry['content'].lower()
                             
                             # Look for reservation numbers
-                            from number_utils import extract_reservation_number_from_text
                             extracted_number = extract_reservation_number_from_text(content)
                             if extracted_number:
                                 reservation_number = extracted_number
                                 break
                     
                     # Try to find by reservation number first
+                    caller_phone_e164 = self.runtime.to_e164(caller_phone)
                     if reservation_number:
                         reservation = Reservation.query.filter_by(
                             reservation_number=reservation_number
                         ).first()
-                    elif caller_phone:
-                        # Fallback to phone search
+                    elif caller_phone_e164:
+                        # Fallback to phone search (skipped for an unparseable number, which would match rows with no phone)
                         reservation = Reservation.query.filter_by(
-                            phone_number=caller_phone
+                            phone_e164=caller_phone_e164
                         ).order_by(Reservation.date.desc()).first()
                 
                 if not reservation:
@@ -5624,8 +5613,8 @@ class RestaurantReservationSkill(SkillBase):
     def _get_party_orders_for_sms(self, reservation_number):
         """Get detailed party orders for SMS display"""
         try:
-            from models import Reservation, Order, OrderItem
-            from app import app
+            Reservation, Order, OrderItem = self.runtime.Reservation, self.runtime.Order, self.runtime.OrderItem
+            app = self.runtime.app
             
             with app.app_context():
                 reservation = Reservation.query.filter_by(reservation_number=reservation_number).first()
@@ -5677,7 +5666,6 @@ class RestaurantReservationSkill(SkillBase):
                 time_12hr = str(reservation_data['time'])
             
             # Get base URL for calendar link
-            import os
             base_url = os.getenv('BASE_URL', 'https://localhost:8080')
             reservation_number = reservation_data.get('reservation_number', reservation_data.get('id'))
             
@@ -5722,18 +5710,31 @@ class RestaurantReservationSkill(SkillBase):
             sms_body += f"Bobby's Table Restaurant\n"
             sms_body += f"Reply STOP to stop."
             
-            # Send SMS using SignalWire Agents SDK
-            sms_function_result = SwaigFunctionResult().send_sms(
-                to_number=phone_number,
-                from_number=self.signalwire_from_number,
-                body=sms_body
+            # Queue the SMS; the dispatcher delivers it off the request thread with retries.
+            # Identical confirmations for the same reservation are only sent once.
+            from sms_dispatcher import enqueue_sms, body_digest
+            
+            queue_result = enqueue_sms(
+                phone_number,
+                sms_body,
+                kind='reservation_confirmation',
+                dedup_key=f"reservation_confirmation:{reservation_number}:{body_digest(sms_body)}",
+                from_number=self.signalwire_from_number
             )
+            if not queue_result.get('success'):
+                print(f"❌ Error queueing reservation SMS: {queue_result.get('error')}")
+                return {'success': False, 'sms_sent': False, 'error': queue_result.get('error')}
             
-            print(f"✅ Reservation SMS sent successfully to {phone_number}")
+            print(f"✅ Reservation SMS queued for {phone_number}")
             print(f"   Reservation: #{reservation_number}")
             print(f"   Calendar Link: {calendar_link}")
-            print(f"   SMS result type: {type(sms_function_result)}")
-            return {'success': True, 'sms_sent': True, 'calendar_link': calendar_link}
+            return {
+                'success': True,
+                'sms_sent': False,
+                'sms_queued': True,
+                'message_id': queue_result.get('message_id'),
+                'calendar_link': calendar_link
+            }
             
         except Exception as e:
             print(f"❌ Error sending reservation SMS: {str(e)}")
@@ -5742,8 +5743,6 @@ class RestaurantReservationSkill(SkillBase):
     def _send_payment_confirmation_sms(self, reservation_data, payment_data, phone_number):
         """Send SMS confirmation for payment"""
         try:
-            import os
-            import requests
             from datetime import datetime
             
             # Convert time to 12-hour format for SMS
@@ -5787,45 +5786,30 @@ class RestaurantReservationSkill(SkillBase):
             sms_body += f"Thank you!\nBobby's Table Restaurant"
             sms_body += f"\nReply STOP to stop."
             
-            # Get SignalWire credentials
-            project_id = os.getenv('SIGNALWIRE_PROJECT_ID')
-            auth_token = os.getenv('SIGNALWIRE_AUTH_TOKEN') or os.getenv('SIGNALWIRE_TOKEN')
-            space = os.getenv('SIGNALWIRE_SPACE')
-            from_number = os.getenv('SIGNALWIRE_FROM_NUMBER')
+            # Queue the SMS; one confirmation per payment confirmation number
+            from sms_dispatcher import enqueue_sms
             
-            if not all([project_id, auth_token, space, from_number]):
-                print("⚠️ Missing SignalWire credentials for payment SMS")
-                return {
-                    'success': False,
-                    'error': 'Missing SignalWire credentials'
-                }
-            
-            # Send SMS via SignalWire REST API
-            space_url = f"https://{space}.signalwire.com"
-            url = f"{space_url}/api/laml/2010-04-01/Accounts/{project_id}/Messages.json"
-            
-            response = requests.post(
-                url,
-                data={
-                    'From': from_number,
-                    'To': phone_number,
-                    'Body': sms_body
-                },
-                auth=(project_id, auth_token)
+            queue_result = enqueue_sms(
+                phone_number,
+                sms_body,
+                kind='payment_confirmation',
+                dedup_key=f"payment_confirmation:{reservation_data['reservation_number']}:{payment_data['confirmation_number']}",
+                from_number=os.getenv('SIGNALWIRE_FROM_NUMBER')
             )
             
-            if response.status_code == 201:
-                print(f"✅ Payment confirmation SMS sent successfully to {phone_number}")
+            if queue_result.get('success'):
+                print(f"✅ Payment confirmation SMS queued for {phone_number}")
                 return {
                     'success': True,
-                    'message': 'Payment confirmation SMS sent successfully',
-                    'sms_sid': response.json().get('sid')
+                    'sms_queued': True,
+                    'message': 'Payment confirmation SMS queued for delivery',
+                    'message_id': queue_result.get('message_id')
                 }
             else:
-                print(f"❌ Payment SMS failed: {response.status_code} - {response.text}")
+                print(f"❌ Payment SMS could not be queued: {queue_result.get('error')}")
                 return {
                     'success': False,
-                    'error': f'Payment SMS failed: {response.status_code} - {response.text}'
+                    'error': f"Payment SMS could not be queued: {queue_result.get('error')}"
                 }
                 
         except Exception as e:
@@ -5954,7 +5938,7 @@ class RestaurantReservationSkill(SkillBase):
 
     def _enhanced_database_transaction(self, reservation, party_orders, args):
         """Enhanced database transaction with comprehensive error handling"""
-        from models import db, Order, OrderItem, MenuItem
+        db, Order, OrderItem, MenuItem = self.runtime.db, self.runtime.Order, self.runtime.OrderItem, self.runtime.MenuItem
         
         transaction_success = False
         created_orders = []
@@ -6072,7 +6056,7 @@ class RestaurantReservationSkill(SkillBase):
         Returns:
             MenuItem object or dict if found, None otherwise
         """
-        from models import MenuItem
+        MenuItem = self.runtime.MenuItem
         import re
         
         if not item_name:
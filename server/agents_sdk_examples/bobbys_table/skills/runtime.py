@@ -0,0 +1,92 @@
+"""
+Runtime context for restaurant skills
+Resolves the Flask app, database session, models and shared helpers once so
+skill handlers don't repeat sys.path and import work on every tool call
+"""
+
+import os
+import sys
+import threading
+
+MODEL_NAMES = ('Reservation', 'Table', 'MenuItem', 'Order', 'OrderItem')
+
+
+class SkillRuntime:
+    """
+    Application objects the restaurant skills depend on
+
+    Models are exposed as attributes (runtime.Reservation, runtime.Order, ...)
+    and so are the helpers (runtime.numbers_to_words, ...). Tests can build a
+    SkillRuntime from their own app, db and models and pass it to a skill via
+    its params as 'runtime'.
+    """
+
+    def __init__(self, app, db, models, helpers=None):
+        self.app = app
+        self.db = db
+        self.models = dict(models)
+        self.helpers = dict(helpers or {})
+        for name, value in self.models.items():
+            setattr(self, name, value)
+        for name, value in self.helpers.items():
+            setattr(self, name, value)
+
+    @property
+    def session(self):
+        """SQLAlchemy session bound to the app's database"""
+        return self.db.session
+
+    def app_context(self):
+        """Return an application context for database access"""
+        return self.app.app_context()
+
+    @classmethod
+    def from_app(cls):
+        """Build the runtime from the running Bobby's Table application"""
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        if app_dir not in sys.path:
+            sys.path.insert(0, app_dir)
+
+        import app as app_module
+        import models
+        import number_utils
+        import phone_util
+        import reservation_search
+        import table_availability
+
+        helpers = {
+            'get_receptionist_agent': app_module.get_receptionist_agent,
+            'is_payment_in_progress': app_module.is_payment_in_progress,
+            'extract_reservation_number_from_text': number_utils.extract_reservation_number_from_text,
+            'numbers_to_words': number_utils.numbers_to_words,
+            'get_reservation_search': reservation_search.get_reservation_search,
+            'to_e164': phone_util.to_e164,
+            'get_table_availability': table_availability.get_table_availability,
+        }
+        return cls(
+            app=app_module.app,
+            db=models.db,
+            models={name: getattr(models, name) for name in MODEL_NAMES},
+            helpers=helpers
+        )
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_skill_runtime():
+    """Return the process-wide skill runtime, resolving it on first use"""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = SkillRuntime.from_app()
+    return _runtime
+
+
+def set_skill_runtime(runtime):
+    """Install the runtime returned by get_skill_runtime() (used by tests and embedders)"""
+    global _runtime
+    with _runtime_lock:
+        _runtime = runtime
@@ -7,6 +7,8 @@ from typing import Optional, List, Dict, Any
 import logging
 from datetime import datetime
 
+from phone_util import to_e164
+
 def normalize_phone_number(phone_number: Optional[str], caller_id: Optional[str] = None) -> Optional[str]:
     """
     Normalize phone number to E.164 format (+1XXXXXXXXXX)
@@ -26,33 +28,20 @@ def normalize_phone_number(phone_number: Optional[str], caller_id: Optional[str]
     if not phone_number:
         return None
     
-    # If already in E.164 format, return as-is
-    if phone_number.startswith('+1') and len(phone_number) == 12:
-        return phone_number
+    normalized = to_e164(phone_number)
+    if normalized:
+        return normalized
     
-    # Extract only digits
     digits = re.sub(r'\D', '', phone_number)
-    
-    # Handle different digit lengths
-    if len(digits) == 10:
-        # 10 digits: add +1 prefix
-        normalized = f"+1{digits}"
-        print(f"🔄 Normalized 10-digit number {digits} to {normalized}")
-        return normalized
-    elif len(digits) == 11 and digits.startswith('1'):
-        # 11 digits starting with 1: add + prefix
-        normalized = f"+{digits}"
-        print(f"🔄 Normalized 11-digit number {digits} to {normalized}")
-        return normalized
-    elif len(digits) == 7:
+    if len(digits) == 7:
         # 7 digits: assume local number, add area code 555 and +1
-        normalized = f"+1555{digits}"
+        normalized = to_e164(f"555{digits}")
         print(f"🔄 Normalized 7-digit number {digits} to {normalized} (added 555 area code)")
         return normalized
-    else:
-        # Return original if we can't normalize
-        print(f"⚠️  Could not normalize phone number: {phone_number} (digits: {digits})")
-        return phone_number
+    
+    # Return original if we can't normalize
+    print(f"⚠️  Could not normalize phone number: {phone_number} (digits: {digits})")
+    return phone_number
 
 def extract_phone_from_conversation(call_log: List[Dict[str, Any]]) -> Optional[str]:
     """
@@ -319,38 +308,6 @@ def log_function_call(function_name: str, args: Dict[str, Any], call_context: Di
     
     print(f"   Timestamp: {datetime.now()}")
 
-def normalize_phone_number(phone_number: str, default_country_code: str = "+1") -> Optional[str]:
-    """
-    Normalize phone number to E.164 format
-    
-    Args:
-        phone_number: Phone number to normalize
-        default_country_code: Default country code to add
-        
-    Returns:
-        Normalized phone number or None if invalid
-    """
-    if not phone_number:
-        return None
-    
-    import re
-    
-    # Remove all non-digit characters
-    digits = re.sub(r'\D', '', phone_number)
-    
-    # Handle different formats
-    if len(digits) == 10:
-        # US number without country code
-        return f"{default_country_code}{digits}"
-    elif len(digits) == 11 and digits.startswith('1'):
-        # US number with country code
-        return f"+{digits}"
-    elif len(digits) >= 10:
-        # International number
-        return f"+{digits}"
-    
-    return None
-
 def safe_get_from_dict(data: Dict[str, Any], path: str, default: Any = None) -> Any:
     """
     Safely get value from nested dictionary using dot notation
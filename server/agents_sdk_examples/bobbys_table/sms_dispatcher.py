@@ -0,0 +1,375 @@
+"""
+Asynchronous outbound SMS dispatcher for Bobby's Table Restaurant
+Queues messages in a persistent outbox table and sends them from a worker pool
+"""
+
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+
+import db_pool
+
+DEFAULT_DB_PATH = os.path.join(os.getcwd(), 'instance', 'restaurant.db')
+
+# Outbox message states
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sms_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key VARCHAR(200) UNIQUE,
+    kind VARCHAR(50) NOT NULL,
+    to_number VARCHAR(20) NOT NULL,
+    from_number VARCHAR(20),
+    body TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    provider_sid VARCHAR(100),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME
+);
+CREATE INDEX IF NOT EXISTS idx_sms_outbox_due ON sms_outbox (status, next_attempt_at);
+"""
+
+
+class PermanentSendError(Exception):
+    """Raised by a sender when retrying the message cannot succeed"""
+
+
+def body_digest(body):
+    """Short stable digest of a message body, used to build dedup keys"""
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+
+
+def get_signalwire_credentials():
+    """
+    Resolve SignalWire REST credentials from the environment
+
+    Returns:
+        tuple: (project_id, auth_token, space_url) - any of them may be None
+    """
+    project_id = os.getenv('SIGNALWIRE_PROJECT_ID')
+    auth_token = os.getenv('SIGNALWIRE_AUTH_TOKEN') or os.getenv('SIGNALWIRE_TOKEN')
+    space_url = os.getenv('SIGNALWIRE_SPACE_URL')
+
+    # If SIGNALWIRE_SPACE_URL is not set, construct it from SIGNALWIRE_SPACE
+    if not space_url:
+        signalwire_space = os.getenv('SIGNALWIRE_SPACE')
+        if signalwire_space:
+            space_url = f"{signalwire_space}.signalwire.com"
+
+    if space_url:
+        space_url = space_url.replace('https://', '').replace('http://', '').rstrip('/')
+
+    return project_id, auth_token, space_url
+
+
+def send_via_signalwire(to_number, from_number, body):
+    """
+    Send a single SMS through the SignalWire LaML Messages REST API
+
+    Returns:
+        str: Message SID reported by SignalWire
+
+    Raises:
+        PermanentSendError: Credentials are missing or the request was rejected (4xx)
+        Exception: Transient failures (network errors, 5xx, 429) that should be retried
+    """
+    import http_client
+
+    project_id, auth_token, space_url = get_signalwire_credentials()
+    if not all([project_id, auth_token, space_url]):
+        raise PermanentSendError('Missing SignalWire credentials')
+
+    url = f"https://{space_url}/api/laml/2010-04-01/Accounts/{project_id}/Messages.json"
+    response = http_client.post(
+        url,
+        auth=(project_id, auth_token),
+        data={'From': from_number, 'To': to_number, 'Body': body},
+        timeout=(3.05, 10)
+    )
+
+    if response.status_code == 201:
+        try:
+            return response.json().get('sid')
+        except ValueError:
+            return None
+
+    error = f"SignalWire API error: {response.status_code} - {response.text[:200]}"
+    if 400 <= response.status_code < 500 and response.status_code != 429:
+        raise PermanentSendError(error)
+    raise RuntimeError(error)
+
+
+class SMSDispatcher:
+    """
+    Persistent SMS outbox with a pool of sender threads
+
+    Handlers call enqueue() and return immediately; worker threads claim due
+    messages in batches, send them, and reschedule failures with exponential
+    backoff until max_attempts is reached. Messages sharing a dedup_key are
+    only ever queued once.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, sender=None, workers=2, batch_size=10,
+                 max_attempts=5, base_delay=2.0, max_delay=300.0, poll_interval=5.0):
+        self.db_path = db_path
+        self.sender = sender or send_via_signalwire
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._lock = threading.Lock()
+
+        self._ensure_schema()
+
+    def _connect(self):
+        # Pooled WAL connection (sqlite3.Row rows); close() returns it to the pool
+        return db_pool.connect(self.db_path)
+
+    def _ensure_schema(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(OUTBOX_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def start(self):
+        """Start the worker pool (idempotent) and recover messages left mid-send"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+
+            # Messages claimed by a previous process that died mid-send go back to the queue
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "UPDATE sms_outbox SET status = ?, next_attempt_at = ? WHERE status = ?",
+                    (STATUS_PENDING, time.time(), STATUS_SENDING)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"sms-dispatcher-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            print(f"SMS: Started SMS dispatcher with {self.workers} workers")
+
+    def stop(self, timeout=5.0):
+        """Stop the worker pool; pending messages stay in the outbox"""
+        with self._lock:
+            self._stopping = True
+            with self._wakeup:
+                self._wakeup.notify_all()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def enqueue(self, to_number, body, kind='sms', dedup_key=None, from_number=None):
+        """
+        Queue a message for delivery
+
+        Args:
+            to_number: Destination phone number
+            body: Message text
+            kind: Message category, e.g. 'reservation_confirmation' or 'payment_receipt'
+            dedup_key: Messages with an already-queued dedup_key are ignored
+            from_number: Sender number (defaults to SIGNALWIRE_FROM_NUMBER)
+
+        Returns:
+            dict: {'success', 'queued', 'duplicate', 'message_id'} or {'success': False, 'error'}
+        """
+        if not to_number:
+            return {'success': False, 'queued': False, 'error': 'Destination phone number is required'}
+        if not body:
+            return {'success': False, 'queued': False, 'error': 'Message body is required'}
+
+        from_number = from_number or os.getenv('SIGNALWIRE_FROM_NUMBER', '+15551234567')
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                """INSERT OR IGNORE INTO sms_outbox
+                   (dedup_key, kind, to_number, from_number, body, status, next_attempt_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (dedup_key, kind, to_number, from_number, body, STATUS_PENDING, time.time())
+            )
+            conn.commit()
+            duplicate = cursor.rowcount == 0
+            if duplicate:
+                row = conn.execute("SELECT id FROM sms_outbox WHERE dedup_key = ?", (dedup_key,)).fetchone()
+                message_id = row['id'] if row else None
+            else:
+                message_id = cursor.lastrowid
+        except Exception as e:
+            print(f"ERROR: Failed to queue {kind} SMS to {to_number}: {e}")
+            return {'success': False, 'queued': False, 'error': str(e)}
+        finally:
+            conn.close()
+
+        if duplicate:
+            print(f"SMS: Skipped duplicate {kind} SMS (dedup key {dedup_key})")
+        else:
+            print(f"SMS: Queued {kind} SMS #{message_id} to {to_number}")
+            self.start()
+            with self._wakeup:
+                self._wakeup.notify()
+
+        return {'success': True, 'queued': not duplicate, 'duplicate': duplicate, 'message_id': message_id}
+
+    def _claim_batch(self):
+        """Atomically mark a batch of due messages as being sent"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """SELECT id, kind, to_number, from_number, body, attempts FROM sms_outbox
+                   WHERE status = ? AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at LIMIT ?""",
+                (STATUS_PENDING, time.time(), self.batch_size)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE sms_outbox SET status = ? WHERE id = ?",
+                    [(STATUS_SENDING, row['id']) for row in rows]
+                )
+            conn.commit()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def _seconds_until_next_due(self):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) AS next_due FROM sms_outbox WHERE status = ?",
+                (STATUS_PENDING,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row or row['next_due'] is None:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, row['next_due'] - time.time()))
+
+    def _backoff(self, attempts):
+        return min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+
+    def _deliver(self, message):
+        attempts = message['attempts'] + 1
+        try:
+            sid = self.sender(message['to_number'], message['from_number'], message['body'])
+            update = ("UPDATE sms_outbox SET status = ?, attempts = ?, provider_sid = ?, sent_at = ?, last_error = NULL WHERE id = ?",
+                      (STATUS_SENT, attempts, sid, datetime.utcnow().isoformat(), message['id']))
+            print(f"SUCCESS: Sent {message['kind']} SMS #{message['id']} to {message['to_number']}")
+        except Exception as e:
+            permanent = isinstance(e, PermanentSendError) or attempts >= self.max_attempts
+            if permanent:
+                update = ("UPDATE sms_outbox SET status = ?, attempts = ?, last_error = ? WHERE id = ?",
+                          (STATUS_FAILED, attempts, str(e), message['id']))
+                print(f"ERROR: Giving up on {message['kind']} SMS #{message['id']} after {attempts} attempt(s): {e}")
+            else:
+                delay = self._backoff(attempts)
+                update = ("UPDATE sms_outbox SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                          (STATUS_PENDING, attempts, str(e), time.time() + delay, message['id']))
+                print(f"WARNING: {message['kind']} SMS #{message['id']} failed (attempt {attempts}), retrying in {delay:.0f}s: {e}")
+
+        conn = self._connect()
+        try:
+            conn.execute(*update)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def process_due(self):
+        """Claim and send one batch of due messages; returns the number processed"""
+        batch = self._claim_batch()
+        for message in batch:
+            self._deliver(message)
+        return len(batch)
+
+    def _worker_loop(self):
+        while not self._stopping:
+            try:
+                if self.process_due():
+                    continue
+                wait = self._seconds_until_next_due()
+            except Exception as e:
+                print(f"ERROR: SMS dispatcher worker error: {e}")
+                wait = self.poll_interval
+            with self._wakeup:
+                if not self._stopping:
+                    self._wakeup.wait(wait)
+
+    def stats(self):
+        """Return message counts per status plus the oldest pending message age"""
+        conn = self._connect()
+        try:
+            counts = {row['status']: row['count'] for row in conn.execute(
+                "SELECT status, COUNT(*) AS count FROM sms_outbox GROUP BY status"
+            )}
+            oldest = conn.execute(
+                "SELECT MIN(next_attempt_at) AS oldest FROM sms_outbox WHERE status = ?",
+                (STATUS_PENDING,)
+            ).fetchone()['oldest']
+        finally:
+            conn.close()
+        return {
+            'counts': counts,
+            'oldest_pending_age_seconds': round(time.time() - oldest, 1) if oldest else 0,
+            'workers': len(self._threads)
+        }
+
+    def recent(self, limit=50):
+        """Return the most recent outbox entries, newest first"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                """SELECT id, dedup_key, kind, to_number, status, attempts, last_error, provider_sid, created_at, sent_at
+                   FROM sms_outbox ORDER BY id DESC LIMIT ?""",
+                (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_sms_dispatcher():
+    """Return the process-wide SMS dispatcher, creating it on first use"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = SMSDispatcher(
+                    workers=int(os.getenv('SMS_DISPATCHER_WORKERS', '2')),
+                    max_attempts=int(os.getenv('SMS_MAX_ATTEMPTS', '5'))
+                )
+    return _dispatcher
+
+
+def enqueue_sms(to_number, body, kind='sms', dedup_key=None, from_number=None):
+    """Queue an SMS on the process-wide dispatcher and return immediately"""
+    return get_sms_dispatcher().enqueue(to_number, body, kind=kind, dedup_key=dedup_key, from_number=from_number)
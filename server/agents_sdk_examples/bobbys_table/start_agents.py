@@ -19,7 +19,7 @@ def main():
 
     try:
         # Import and run the Flask app with integrated SWAIG agents
-        from app import app, cleanup_payment_sessions_on_startup, start_payment_session_cleanup_scheduler
+        from app import app, cleanup_payment_sessions_on_startup, start_payment_session_cleanup_scheduler, get_stripe_event_queue
         
         # Clean up any orphaned payment sessions from previous runs
         cleanup_payment_sessions_on_startup()
@@ -27,6 +27,13 @@ def main():
         # Start automatic cleanup scheduler
         start_payment_session_cleanup_scheduler()
         
+        # Start the outbound SMS workers (resumes messages queued before a restart)
+        from sms_dispatcher import get_sms_dispatcher
+        get_sms_dispatcher().start()
+        
+        # Start the Stripe webhook event worker (resumes events recorded before a restart)
+        get_stripe_event_queue().start()
+        
         app.run(host="0.0.0.0", port=8080, debug=True)
 
     except KeyboardInterrupt:
@@ -0,0 +1,253 @@
+"""
+Idempotent Stripe webhook ingestion for Bobby's Table Restaurant
+Records each verified event once, acknowledges Stripe immediately and
+processes the event on a background worker
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import db_pool
+
+DEFAULT_DB_PATH = os.path.join(os.getcwd(), 'instance', 'restaurant.db')
+
+# Event processing states
+STATUS_PENDING = 'pending'
+STATUS_PROCESSING = 'processing'
+STATUS_PROCESSED = 'processed'
+STATUS_FAILED = 'failed'
+
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stripe_events (
+    event_id VARCHAR(100) PRIMARY KEY,
+    event_type VARCHAR(100) NOT NULL,
+    payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    received_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    processed_at DATETIME
+);
+CREATE INDEX IF NOT EXISTS idx_stripe_events_due ON stripe_events (status, next_attempt_at);
+"""
+
+
+class StripeEventQueue:
+    """
+    Persistent, de-duplicating queue of Stripe webhook events
+
+    record() stores the event keyed by its Stripe event id and returns at
+    once; a redelivered event with a known id is reported as a duplicate and
+    never processed twice. Worker threads hand each pending event to the
+    handler and retry failures with exponential backoff.
+    """
+
+    def __init__(self, handler, db_path=DEFAULT_DB_PATH, workers=1, max_attempts=5,
+                 base_delay=5.0, max_delay=600.0, poll_interval=5.0):
+        self.handler = handler
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._lock = threading.Lock()
+
+        self._ensure_schema()
+
+    def _connect(self):
+        # Pooled WAL connection (sqlite3.Row rows); close() returns it to the pool
+        return db_pool.connect(self.db_path)
+
+    def _ensure_schema(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(EVENTS_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def start(self):
+        """Start the worker threads (idempotent) and requeue events left mid-processing"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping = False
+
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "UPDATE stripe_events SET status = ?, next_attempt_at = ? WHERE status = ?",
+                    (STATUS_PENDING, time.time(), STATUS_PROCESSING)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"stripe-events-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            print(f"PAYMENT: Started Stripe event worker ({self.workers} thread(s))")
+
+    def stop(self, timeout=5.0):
+        """Stop the worker threads; unprocessed events stay queued"""
+        with self._lock:
+            self._stopping = True
+            with self._wakeup:
+                self._wakeup.notify_all()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def record(self, event):
+        """
+        Store a verified Stripe event for background processing
+
+        Args:
+            event: Parsed Stripe event (dict-like with 'id' and 'type')
+
+        Returns:
+            dict: {'event_id', 'duplicate'}
+        """
+        event_id = event.get('id')
+        event_type = event.get('type', 'unknown')
+        if not event_id:
+            raise ValueError('Stripe event has no id')
+
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                """INSERT OR IGNORE INTO stripe_events (event_id, event_type, payload, status, next_attempt_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (event_id, event_type, json.dumps(event, default=str), STATUS_PENDING, time.time())
+            )
+            conn.commit()
+            duplicate = cursor.rowcount == 0
+        finally:
+            conn.close()
+
+        if duplicate:
+            print(f"PAYMENT: Ignoring duplicate Stripe event {event_id} ({event_type})")
+        else:
+            self.start()
+            with self._wakeup:
+                self._wakeup.notify()
+
+        return {'event_id': event_id, 'duplicate': duplicate}
+
+    def _claim_next(self):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """SELECT event_id, event_type, payload, attempts FROM stripe_events
+                   WHERE status = ? AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at LIMIT 1""",
+                (STATUS_PENDING, time.time())
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE stripe_events SET status = ? WHERE event_id = ?",
+                    (STATUS_PROCESSING, row['event_id'])
+                )
+            conn.commit()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def _finish(self, event_id, attempts, error=None):
+        if error is None:
+            update = ("UPDATE stripe_events SET status = ?, attempts = ?, processed_at = ?, last_error = NULL WHERE event_id = ?",
+                      (STATUS_PROCESSED, attempts, datetime.utcnow().isoformat(), event_id))
+        elif attempts >= self.max_attempts:
+            update = ("UPDATE stripe_events SET status = ?, attempts = ?, last_error = ? WHERE event_id = ?",
+                      (STATUS_FAILED, attempts, error, event_id))
+            print(f"ERROR: Giving up on Stripe event {event_id} after {attempts} attempt(s): {error}")
+        else:
+            delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+            update = ("UPDATE stripe_events SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ? WHERE event_id = ?",
+                      (STATUS_PENDING, attempts, error, time.time() + delay, event_id))
+            print(f"WARNING: Stripe event {event_id} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+
+        conn = self._connect()
+        try:
+            conn.execute(*update)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def process_next(self):
+        """Process one due event; returns True if an event was handled"""
+        claimed = self._claim_next()
+        if not claimed:
+            return False
+
+        attempts = claimed['attempts'] + 1
+        try:
+            self.handler(json.loads(claimed['payload']))
+            self._finish(claimed['event_id'], attempts)
+        except Exception as e:
+            self._finish(claimed['event_id'], attempts, error=str(e))
+        return True
+
+    def _seconds_until_next_due(self):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) AS next_due FROM stripe_events WHERE status = ?",
+                (STATUS_PENDING,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row or row['next_due'] is None:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, row['next_due'] - time.time()))
+
+    def _worker_loop(self):
+        while not self._stopping:
+            try:
+                if self.process_next():
+                    continue
+                wait = self._seconds_until_next_due()
+            except Exception as e:
+                print(f"ERROR: Stripe event worker error: {e}")
+                wait = self.poll_interval
+            with self._wakeup:
+                if not self._stopping:
+                    self._wakeup.wait(wait)
+
+    def stats(self):
+        """Return event counts per status"""
+        conn = self._connect()
+        try:
+            counts = {row['status']: row['count'] for row in conn.execute(
+                "SELECT status, COUNT(*) AS count FROM stripe_events GROUP BY status"
+            )}
+        finally:
+            conn.close()
+        return {'counts': counts, 'workers': len(self._threads)}
+
+    def recent(self, limit=50):
+        """Return the most recently received events, newest first (without payloads)"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                """SELECT event_id, event_type, status, attempts, last_error, received_at, processed_at
+                   FROM stripe_events ORDER BY received_at DESC, rowid DESC LIMIT ?""",
+                (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
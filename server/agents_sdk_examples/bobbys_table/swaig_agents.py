@@ -9,7 +9,7 @@ from datetime import datetime, timedelta
 import os
 import json
 from dotenv import load_dotenv
-import requests
+import http_client
 
 load_dotenv()
 
@@ -585,7 +585,7 @@ def send_swml_to_signalwire(swml_payload, signalwire_endpoint, signalwire_projec
         'Content-Type': 'application/json',
     }
     auth = (signalwire_project, signalwire_token)
-    response = requests.post(signalwire_endpoint, json=swml_payload, headers=headers, auth=auth)
+    response = http_client.post(signalwire_endpoint, json=swml_payload, headers=headers, auth=auth)
     try:
         return response.json()
     except Exception:
@@ -0,0 +1,393 @@
+"""
+Replay benchmark for the /receptionist SWAIG endpoint
+
+Sends SWAIG POST payloads (signature fetches, create_reservation,
+get_reservation and pay_reservation calls with realistic call_log lengths)
+either through the Flask test client, in this process, or to a running server,
+at a fixed concurrency, and reports latency percentiles and database
+statements per function.
+
+Runs are repeatable: synthetic payloads come from a seeded generator and are
+sent in the same order every time, warm-up requests are excluded, and results
+can be saved as JSON and compared against an earlier run. Because
+create_reservation and pay_reservation write to the database, benchmark
+against a scratch copy loaded the same way each time, e.g.
+
+    python init_test_data.py --reservations 50000 --orders 20000 --seed 1
+    python swaig_bench.py --requests 2000 --concurrency 8 --json baseline.json
+    ... change something, reload the data ...
+    python swaig_bench.py --requests 2000 --concurrency 8 --compare baseline.json
+
+Payloads recorded from real calls can be replayed with --replay FILE, one
+SWAIG request body (JSON) per line. Statement counts are taken from
+SQLAlchemy in-process, and from an X-DB-Queries response header when
+benchmarking a live server (--url) that sends one.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bulk_data import BulkRandom
+
+DEFAULT_DB_PATH = os.path.join('instance', 'restaurant.db')
+
+# Relative share of each kind of request in a synthetic run
+FUNCTION_MIX = {
+    'get_signature': 10,
+    'get_reservation': 40,
+    'create_reservation': 30,
+    'pay_reservation': 20,
+}
+
+# (min, max) call_log entries when each function is typically called; payment
+# comes late in a call, lookups early
+CALL_LOG_LENGTHS = {
+    'get_reservation': (4, 16),
+    'create_reservation': (12, 40),
+    'pay_reservation': (30, 80),
+}
+
+SIGNATURE_FUNCTIONS = ['create_reservation', 'get_reservation', 'update_reservation', 'cancel_reservation',
+                       'pay_reservation', 'create_order', 'get_order_status']
+
+# Relative slowdown of a percentile, versus the baseline, reported as a regression
+DEFAULT_THRESHOLD_PCT = 10.0
+
+_USER_LINES = (
+    "Hi, I'd like to make a reservation", "Can you check my booking?", "It's for {party} people",
+    "Around {time} would be great", "My name is {name}", "My reservation number is {number}",
+    "Yes, that's right", "Can I pay for it now?", "Do you have anything later?", "Thanks so much",
+)
+_ASSISTANT_LINES = (
+    "Thank you for calling Bobby's Table, how can I help you today?", "Of course. What name is the booking under?",
+    "Let me check availability for that time.", "I found your reservation for {party} at {time}.",
+    "Would you like to pre-order from our menu?", "Your reservation is confirmed. Anything else I can help with?",
+    "I can take a card payment over the phone. Shall we go ahead?",
+)
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class PayloadFactory:
+    """Seeded synthetic SWAIG request bodies"""
+
+    def __init__(self, seed=42, reservations=None, menu_item_ids=None, system_prompt=''):
+        self.rng = BulkRandom(seed)
+        self.reservations = reservations or []  # [(reservation_number, name, phone_number)]
+        self.menu_item_ids = menu_item_ids or []
+        self.system_prompt = system_prompt
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def call_log(self, function_name, name, number):
+        low, high = CALL_LOG_LENGTHS[function_name]
+        fill = {'party': self.rng.randint(2, 6), 'time': f"{self.rng.randint(5, 8)}:{self.rng.choice(('00', '30'))} PM",
+                'name': name, 'number': number}
+        log = [{'role': 'system', 'content': self.system_prompt}]
+        for turn in range(self.rng.randint(low, high)):
+            lines = _ASSISTANT_LINES if turn % 2 == 0 else _USER_LINES
+            log.append({'role': 'assistant' if turn % 2 == 0 else 'user',
+                        'content': self.rng.choice(lines).format(**fill)})
+        return log
+
+    def _arguments(self, function_name, name, phone, number):
+        rng = self.rng
+        if function_name == 'get_reservation':
+            return {'reservation_number': number} if rng.random() < 0.8 else {'name': name}
+        if function_name == 'pay_reservation':
+            return {'reservation_number': number, 'cardholder_name': name, 'phone_number': phone}
+        party_size = rng.choices((1, 2, 3, 4, 5, 6), (5, 40, 12, 25, 8, 10))[0]
+        args = {
+            'name': name,
+            'party_size': party_size,
+            'date': time.strftime('%Y-%m-%d', time.localtime(time.time() + 86400 * rng.randint(1, 30))),
+            'time': f"{rng.randint(17, 20):02d}:{rng.choice(('00', '30'))}",
+            'phone_number': phone,
+            'old_school': True,
+        }
+        if self.menu_item_ids and rng.random() < 0.3:
+            args['old_school'] = False
+            args['party_orders'] = [
+                {'person_name': f"Person {n + 1}",
+                 'items': [{'menu_item_id': rng.skewed(self.menu_item_ids), 'quantity': 1}]}
+                for n in range(party_size)
+            ]
+        return args
+
+    def make(self, function_name):
+        """One request body for function_name ('get_signature' for a signature fetch)"""
+        if function_name == 'get_signature':
+            functions = [] if self.rng.random() < 0.5 else list(SIGNATURE_FUNCTIONS)
+            return {'action': 'get_signature', 'version': '2.0', 'functions': functions}
+        if self.reservations and function_name != 'create_reservation':
+            number, name, phone = self.rng.choice(self.reservations)
+        else:
+            number = str(self.rng.randint(100000, 999999))
+            name, phone = f"{self.rng.first_name()} {self.rng.last_name()}", self.rng.phone()
+        args = self._arguments(function_name, name, phone, number)
+        return {
+            'app_name': 'bobbys_table',
+            'function': function_name,
+            'version': '2.0',
+            'content_type': 'text/swaig',
+            'content_disposition': 'function call',
+            'call_id': self._uuid(),
+            'ai_session_id': self._uuid(),
+            'caller_id_name': name,
+            'caller_id_num': phone,
+            'argument': {'parsed': [args], 'raw': json.dumps(args), 'substituted': ''},
+            'call_log': self.call_log(function_name, name, number),
+            'meta_data': {},
+            'meta_data_token': self._uuid(),
+        }
+
+    def batch(self, count, mix=None):
+        """count (label, body) pairs drawn from mix ({label: weight})"""
+        mix = mix or FUNCTION_MIX
+        labels = self.rng.choices(list(mix), list(mix.values()), k=count)
+        return [(label, self.make(label)) for label in labels]
+
+
+def load_replay(path):
+    """(label, body) pairs from a file of SWAIG request bodies, one JSON object per line"""
+    payloads = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                body = json.loads(line)
+                payloads.append((body.get('function') or body.get('action') or 'unknown', body))
+    return payloads
+
+
+def load_fixtures(db_path):
+    """Confirmed reservations and menu item ids to build realistic lookups from"""
+    if not os.path.exists(db_path):
+        return [], []
+    conn = sqlite3.connect(db_path)
+    try:
+        reservations = conn.execute(
+            "SELECT reservation_number, name, phone_number FROM reservations "
+            "WHERE status = 'confirmed' ORDER BY id LIMIT 5000"
+        ).fetchall()
+        menu_item_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM menu_items WHERE is_available = 1 ORDER BY id")]
+    except sqlite3.Error:
+        return [], []
+    finally:
+        conn.close()
+    return reservations, menu_item_ids
+
+
+class InProcessTarget:
+    """Posts through the Flask test client and counts SQLAlchemy statements per request"""
+
+    def __init__(self, path='/receptionist'):
+        from sqlalchemy import event
+        from app import app, db
+
+        self.path = path
+        self.app = app
+        self._local = threading.local()
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args, **kwargs):
+        self._local.queries = getattr(self._local, 'queries', 0) + 1
+
+    def send(self, body):
+        """Returns (status code, statements executed)"""
+        self._local.queries = 0
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.post(self.path, json=body)
+        return response.status_code, self._local.queries
+
+
+class HttpTarget:
+    """Posts to a running server over keep-alive connections"""
+
+    def __init__(self, url, concurrency):
+        from http_client import PooledHTTPClient
+
+        self.url = url
+        # No retries: a retried request would hide its failure inside a longer latency
+        self.client = PooledHTTPClient(retries=0, pool_maxsize=max(concurrency, 1))
+
+    def send(self, body):
+        response = self.client.post(self.url, json=body)
+        queries = response.headers.get('X-DB-Queries')
+        return response.status_code, int(queries) if queries and queries.isdigit() else None
+
+
+def run(target, payloads, concurrency=1, warmup=0):
+    """
+    Send payloads in order on `concurrency` threads
+
+    The first `warmup` payloads are sent (one at a time) but not measured.
+
+    Returns:
+        tuple: ([(label, ms, status, queries), ...], wall-clock seconds)
+    """
+    for _, body in payloads[:warmup]:
+        _send(target, body)
+    measured = payloads[warmup:]
+
+    def timed(item):
+        label, body = item
+        start = time.perf_counter()
+        status, queries = _send(target, body)
+        return label, (time.perf_counter() - start) * 1000, status, queries
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        results = list(executor.map(timed, measured))
+    return results, time.perf_counter() - start
+
+
+def _send(target, body):
+    try:
+        return target.send(body)
+    except Exception:
+        return None, None
+
+
+def summarize(results, elapsed):
+    """Per-label and overall latency percentiles, error counts and mean statements per request"""
+    groups = {}
+    for label, ms, status, queries in results:
+        groups.setdefault(label, []).append((ms, status, queries))
+    groups['overall'] = [(ms, status, queries) for _, ms, status, queries in results]
+
+    summary = {}
+    for label, rows in groups.items():
+        ordered = sorted(ms for ms, _, _ in rows)
+        counted = [queries for _, _, queries in rows if queries is not None]
+        summary[label] = {
+            'requests': len(rows),
+            'errors': sum(1 for _, status, _ in rows if status is None or status >= 400),
+            'avg_ms': round(sum(ordered) / len(ordered), 2) if ordered else 0.0,
+            'p50_ms': round(percentile(ordered, 50), 2),
+            'p90_ms': round(percentile(ordered, 90), 2),
+            'p99_ms': round(percentile(ordered, 99), 2),
+            'max_ms': round(ordered[-1], 2) if ordered else 0.0,
+            'avg_queries': round(sum(counted) / len(counted), 1) if counted else None,
+        }
+    summary['overall']['throughput_rps'] = round(len(results) / elapsed, 1) if elapsed else 0.0
+    return summary
+
+
+def compare(current, baseline, threshold_pct=DEFAULT_THRESHOLD_PCT):
+    """
+    Percentile and statement-count changes against a baseline summary
+
+    Returns:
+        list: (label, metric, baseline, current, change %, regressed) for
+            every label present in both runs
+    """
+    rows = []
+    for label, stats in current.items():
+        before = baseline.get(label)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p90_ms', 'p99_ms', 'avg_queries'):
+            old, new = before.get(metric), stats.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100.0 if old else 0.0
+            # Statement counts are exact, so any increase is a regression
+            regressed = new > old if metric == 'avg_queries' else change > threshold_pct
+            rows.append((label, metric, old, new, round(change, 1), regressed))
+    return rows
+
+
+def print_summary(summary):
+    print(f"{'function':<22} {'reqs':>6} {'errs':>5} {'avg':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'queries':>8}")
+    for label in sorted(summary, key=lambda name: (name == 'overall', name)):
+        stats = summary[label]
+        queries = '-' if stats['avg_queries'] is None else stats['avg_queries']
+        print(f"{label:<22} {stats['requests']:>6} {stats['errors']:>5} {stats['avg_ms']:>8} {stats['p50_ms']:>8} "
+              f"{stats['p90_ms']:>8} {stats['p99_ms']:>8} {stats['max_ms']:>8} {queries:>8}")
+    print(f"throughput: {summary['overall']['throughput_rps']} requests/s (latencies in ms)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the /receptionist SWAIG endpoint')
+    parser.add_argument('--url', help='Benchmark a running server (e.g. http://localhost:8080/receptionist) '
+                                      'instead of the Flask test client')
+    parser.add_argument('--replay', help='File of recorded SWAIG request bodies, one JSON object per line')
+    parser.add_argument('--requests', type=int, default=500, help='Synthetic requests to send')
+    parser.add_argument('--concurrency', type=int, default=4, help='Requests in flight at once')
+    parser.add_argument('--warmup', type=int, default=20, help='Leading requests excluded from the results')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for synthetic payloads')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='Database to draw reservation numbers and menu items from')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD_PCT,
+                        help='Percentile slowdown (%%) reported as a regression')
+    parser.add_argument('--verbose', action='store_true', help="Keep the app's console output (in-process only)")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        payloads = load_replay(args.replay)
+    else:
+        reservations, menu_item_ids = load_fixtures(args.db)
+        system_prompt = ''
+        if os.path.exists('prompt.md'):
+            with open('prompt.md') as f:
+                system_prompt = f.read()
+        factory = PayloadFactory(args.seed, reservations, menu_item_ids, system_prompt)
+        payloads = factory.batch(args.requests + args.warmup)
+
+    target = HttpTarget(args.url, args.concurrency) if args.url else InProcessTarget()
+    # The SWAIG route logs every request to stdout; keep that out of the report
+    keep_output = args.url or args.verbose
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.nullcontext() if keep_output else contextlib.redirect_stdout(devnull):
+            results, elapsed = run(target, payloads, args.concurrency, args.warmup)
+
+    summary = summarize(results, elapsed)
+    print_summary(summary)
+    meta = {
+        'target': args.url or 'flask-test-client',
+        'source': args.replay or f"synthetic seed {args.seed}",
+        'requests': len(results),
+        'concurrency': args.concurrency,
+        'python': platform.python_version(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'meta': meta, 'summary': summary}, f, indent=2)
+
+    regressed = False
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('concurrency') != args.concurrency:
+            print("note: baseline used a different concurrency; latencies are not directly comparable")
+        print(f"\ncompared with {args.compare}:")
+        for label, metric, old, new, change, worse in compare(summary, baseline['summary'], args.threshold):
+            regressed = regressed or worse
+            print(f"  {label:<22} {metric:<12} {old:>9} -> {new:<9} {change:+6.1f}%{'  REGRESSION' if worse else ''}")
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
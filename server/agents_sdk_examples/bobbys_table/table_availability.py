@@ -0,0 +1,296 @@
+"""
+Table availability engine for Bobby's Table Restaurant
+Keeps, per day, an interval index of table occupancy so "can we seat N at T"
+and "what are the next open times" are answered from memory with a binary
+search per table instead of a query per candidate time. Days are loaded from
+the database on first use and then kept in sync incrementally as reservations
+are created, moved and cancelled (see the session listeners in models.py).
+"""
+
+import os
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import db_pool
+
+DEFAULT_DB_PATH = os.path.join(os.getcwd(), 'instance', 'restaurant.db')
+
+# Every reservation holds its table for the same 2 hours get_calendar_events shows
+RESERVATION_MINUTES = 120
+SLOT_MINUTES = 30
+OPENING_TIME = '09:00'
+LAST_SEATING = '21:00'
+INACTIVE_STATUSES = ('cancelled',)
+
+# Days kept in memory; older entries are dropped and reloaded on demand
+MAX_CACHED_DAYS = 120
+
+
+def to_minutes(time_str):
+    """Convert 'HH:MM' to minutes after midnight, or None if it can't be parsed"""
+    try:
+        hours, minutes = str(time_str).strip().split(':')[:2]
+        value = int(hours) * 60 + int(minutes)
+    except (ValueError, AttributeError):
+        return None
+    return value if 0 <= value < 24 * 60 else None
+
+
+def to_time(minutes):
+    """Convert minutes after midnight to 'HH:MM'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class TableSchedule:
+    """Sorted start times of the reservations seated at one table on one day"""
+
+    __slots__ = ('starts', 'ids')
+
+    def __init__(self):
+        self.starts = []
+        self.ids = []
+
+    def is_free(self, start, ignore_id=None):
+        """True if no reservation overlaps [start, start + RESERVATION_MINUTES)"""
+        # All intervals have the same length, so only starts within one duration
+        # either side can overlap, and at most two of them fit in that window
+        index = bisect_left(self.starts, start - RESERVATION_MINUTES + 1)
+        while index < len(self.starts) and self.starts[index] < start + RESERVATION_MINUTES:
+            if self.ids[index] != ignore_id:
+                return False
+            index += 1
+        return True
+
+    def add(self, start, reservation_id):
+        index = bisect_left(self.starts, start)
+        self.starts.insert(index, start)
+        self.ids.insert(index, reservation_id)
+
+    def remove(self, start, reservation_id):
+        index = bisect_left(self.starts, start)
+        while index < len(self.starts) and self.starts[index] == start:
+            if self.ids[index] == reservation_id:
+                del self.starts[index]
+                del self.ids[index]
+                return
+            index += 1
+
+
+class DaySchedule:
+    """Table occupancy for one day"""
+
+    def __init__(self, tables):
+        # tables: list of (table_id, capacity), smallest first
+        self.tables = tables
+        self.schedules = {table_id: TableSchedule() for table_id, _ in tables}
+        self.placements = {}  # reservation id -> (start, table ids)
+        self.unseated = set()  # reservations no free table could hold (e.g. overbooked legacy data)
+
+    def find_tables(self, start, party_size, ignore_id=None):
+        """
+        Pick tables for a party: the smallest single table that fits, otherwise
+        the largest free tables pushed together until they seat everyone
+
+        Returns:
+            tuple: Table ids, or None if the party can't be seated
+        """
+        free = [(table_id, capacity) for table_id, capacity in self.tables
+                if self.schedules[table_id].is_free(start, ignore_id)]
+        for table_id, capacity in free:
+            if capacity >= party_size:
+                return (table_id,)
+        chosen, seats = [], 0
+        for table_id, capacity in reversed(free):
+            chosen.append(table_id)
+            seats += capacity
+            if seats >= party_size:
+                return tuple(chosen)
+        return None
+
+    def place(self, reservation_id, start, party_size):
+        """Seat a reservation; returns the table ids used or None"""
+        table_ids = self.find_tables(start, party_size)
+        if table_ids is None:
+            self.unseated.add(reservation_id)
+            return None
+        for table_id in table_ids:
+            self.schedules[table_id].add(start, reservation_id)
+        self.placements[reservation_id] = (start, table_ids)
+        return table_ids
+
+    def remove(self, reservation_id):
+        self.unseated.discard(reservation_id)
+        placement = self.placements.pop(reservation_id, None)
+        if placement:
+            start, table_ids = placement
+            for table_id in table_ids:
+                self.schedules[table_id].remove(start, reservation_id)
+
+
+class TableAvailability:
+    """Answers seating questions from per-day interval indexes of table occupancy"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._tables = None
+        self._days = OrderedDict()  # date -> DaySchedule, least recently used first
+        self._reservation_days = {}  # reservation id -> date it is indexed under
+
+    def _connect(self):
+        return db_pool.connect(self.db_path)
+
+    def _load_tables(self):
+        if self._tables is None:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT id, capacity FROM tables WHERE capacity > 0 ORDER BY capacity, table_number"
+                ).fetchall()
+            finally:
+                conn.close()
+            self._tables = [(row[0], row[1]) for row in rows]
+        return self._tables
+
+    def _day(self, date):
+        day = self._days.get(date)
+        if day is not None:
+            self._days.move_to_end(date)
+            return day
+        day = DaySchedule(self._load_tables())
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, time, party_size FROM reservations WHERE date = ? "
+                f"AND COALESCE(status, 'confirmed') NOT IN ({', '.join('?' * len(INACTIVE_STATUSES))}) "
+                "ORDER BY time, id",
+                (date,) + INACTIVE_STATUSES
+            ).fetchall()
+        finally:
+            conn.close()
+        for reservation_id, time_str, party_size in rows:
+            start = to_minutes(time_str)
+            if start is not None:
+                day.place(reservation_id, start, party_size or 1)
+                self._reservation_days[reservation_id] = date
+        self._days[date] = day
+        while len(self._days) > MAX_CACHED_DAYS:
+            old_date, old_day = self._days.popitem(last=False)
+            for reservation_id in list(old_day.placements) + list(old_day.unseated):
+                if self._reservation_days.get(reservation_id) == old_date:
+                    del self._reservation_days[reservation_id]
+        return day
+
+    def available(self):
+        """True if the restaurant has tables to check availability against"""
+        try:
+            with self._lock:
+                return bool(self._load_tables())
+        except Exception as e:
+            print(f"⚠️ Table availability unavailable: {e}")
+            return False
+
+    def find_tables(self, date, time, party_size, ignore_id=None):
+        """
+        Return the table ids that would seat a party at date/time, or None
+
+        Args:
+            date: 'YYYY-MM-DD'
+            time: 'HH:MM'
+            party_size: Number of guests
+            ignore_id: Reservation to leave out (the one being rescheduled)
+        """
+        start = to_minutes(time)
+        if start is None:
+            return None
+        with self._lock:
+            return self._day(date).find_tables(start, int(party_size), ignore_id)
+
+    def can_seat(self, date, time, party_size, ignore_id=None):
+        """True if a party of party_size can be seated at date/time"""
+        return self.find_tables(date, time, party_size, ignore_id) is not None
+
+    def next_available(self, date, time, party_size, count=3, ignore_id=None, max_days=7, not_before=None):
+        """
+        Return the next open times for a party, starting at the requested time
+
+        Walks the SLOT_MINUTES grid through opening hours, rolling over to the
+        following days, until count slots are found or max_days are exhausted.
+
+        Args:
+            not_before: Optional datetime; earlier slots are skipped
+
+        Returns:
+            list: (date, time) pairs in chronological order
+        """
+        start = to_minutes(time)
+        opening, last_seating = to_minutes(OPENING_TIME), to_minutes(LAST_SEATING)
+        try:
+            current = datetime.strptime(date, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return []
+        if start is None:
+            start = opening
+        slots = []
+        with self._lock:
+            for _ in range(max_days):
+                date_str = current.strftime('%Y-%m-%d')
+                day = self._day(date_str)
+                minute = max(start, opening)
+                while minute <= last_seating and len(slots) < count:
+                    too_early = not_before and datetime.combine(current, datetime.min.time()) + timedelta(minutes=minute) < not_before
+                    if not too_early and day.find_tables(minute, int(party_size), ignore_id) is not None:
+                        slots.append((date_str, to_time(minute)))
+                    # Snap to the slot grid after the requested (possibly off-grid) time
+                    minute = (minute // SLOT_MINUTES + 1) * SLOT_MINUTES
+                if len(slots) >= count:
+                    break
+                current += timedelta(days=1)
+                start = opening
+        return slots
+
+    def apply_changes(self, changes):
+        """
+        Update the index after committed reservation changes
+
+        Args:
+            changes: dict of reservation id -> (date, time, party_size, status),
+                or None for deleted reservations
+        """
+        with self._lock:
+            for reservation_id, state in changes.items():
+                old_date = self._reservation_days.pop(reservation_id, None)
+                if old_date in self._days:
+                    self._days[old_date].remove(reservation_id)
+                if state is None:
+                    continue
+                date, time_str, party_size, status = state
+                start = to_minutes(time_str)
+                if status in INACTIVE_STATUSES or start is None or date not in self._days:
+                    # Days not in memory are read fresh from the database when needed
+                    continue
+                self._days[date].place(reservation_id, start, party_size or 1)
+                self._reservation_days[reservation_id] = date
+
+    def invalidate(self):
+        """Drop everything; the next query reloads tables and reservations"""
+        with self._lock:
+            self._tables = None
+            self._days.clear()
+            self._reservation_days.clear()
+
+
+_availability = None
+_availability_lock = threading.Lock()
+
+
+def get_table_availability():
+    """Return the process-wide table availability engine"""
+    global _availability
+    if _availability is None:
+        with _availability_lock:
+            if _availability is None:
+                _availability = TableAvailability()
+    return _availability
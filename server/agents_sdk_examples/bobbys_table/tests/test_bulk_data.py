@@ -0,0 +1,47 @@
+import os
+import re
+import sqlite3
+import sys
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from bulk_data import BulkRandom, insert_many
+
+
+def test_same_seed_gives_same_records():
+    first, second = BulkRandom(7), BulkRandom(7)
+    draw = lambda rng: [(rng.first_name(), rng.last_name(), rng.phone(), rng.address()) for _ in range(50)]
+    assert draw(first) == draw(second)
+    assert draw(BulkRandom(8)) != draw(BulkRandom(7))
+
+
+def test_phones_are_e164_on_the_555_exchange():
+    rng = BulkRandom(1)
+    for _ in range(200):
+        assert re.fullmatch(r'\+1\d{3}555\d{4}', rng.phone())
+
+
+def test_skewed_favours_the_first_items():
+    rng = BulkRandom(3)
+    picks = [rng.skewed(['a', 'b', 'c', 'd', 'e']) for _ in range(5000)]
+    assert picks.count('a') > picks.count('c') > picks.count('e')
+
+
+def test_unique_numbers_are_distinct_and_bounded():
+    numbers = BulkRandom(5).unique_numbers(900, 3)
+    assert len(set(numbers)) == 900
+    assert all(len(number) == 3 and not number.startswith('0') for number in numbers)
+    with pytest.raises(ValueError):
+        BulkRandom(5).unique_numbers(901, 3)
+
+
+def test_insert_many_streams_in_batches():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE items (n INTEGER)')
+    rows = ((n,) for n in range(25))
+    assert insert_many(conn, 'INSERT INTO items VALUES (?)', rows, batch_size=10) == 25
+    conn.commit()
+    assert conn.execute('SELECT COUNT(*), SUM(n) FROM items').fetchone() == (25, 300)
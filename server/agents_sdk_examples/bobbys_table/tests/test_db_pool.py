@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import sys
+import threading
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+def make_pool(tmp_path, **kwargs):
+    return ConnectionPool(str(tmp_path / 'pool.db'), **kwargs)
+
+
+def test_connections_use_wal_and_busy_timeout(tmp_path):
+    pool = make_pool(tmp_path)
+    conn = pool.acquire()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] > 0
+    assert isinstance(conn.execute('SELECT 1 AS one').fetchone(), sqlite3.Row)
+    conn.close()
+
+
+def test_size_and_busy_timeout_are_read_when_the_pool_is_created(tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLITE_POOL_SIZE', '3')
+    monkeypatch.setenv('SQLITE_BUSY_TIMEOUT_MS', '1234')
+    pool = make_pool(tmp_path)
+    conn = pool.acquire()
+    assert pool.max_size == 3
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 1234
+    conn.close()
+
+
+def test_close_returns_connection_and_discards_uncommitted_work(tmp_path):
+    pool = make_pool(tmp_path)
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE items (name TEXT)')
+    conn.commit()
+    conn.execute("INSERT INTO items VALUES ('uncommitted')")
+    conn.close()
+    conn.close()  # idempotent
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+
+    again = pool.acquire()
+    assert again.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+    again.close()
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['reused_same_thread'] == 1
+
+
+def acquire_in_thread(pool, timeout):
+    result = []
+
+    def borrow():
+        try:
+            result.append(pool.acquire(timeout=timeout))
+        except PoolTimeout as e:
+            result.append(e)
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    return thread, result
+
+
+def test_pool_is_bounded(tmp_path):
+    pool = make_pool(tmp_path, max_size=2)
+    first = pool.acquire()
+    thread, second = acquire_in_thread(pool, 5)
+    thread.join()
+
+    thread, refused = acquire_in_thread(pool, 0.05)
+    thread.join()
+    assert isinstance(refused[0], PoolTimeout)
+
+    thread, acquired = acquire_in_thread(pool, 5)
+    first.close()
+    thread.join()
+
+    assert not isinstance(acquired[0], PoolTimeout)
+    assert pool.stats()['size'] == 2
+    second[0].close()
+    acquired[0].close()
+
+
+def test_a_thread_holding_a_connection_gets_it_again(tmp_path):
+    pool = make_pool(tmp_path, max_size=1)
+    outer = pool.acquire(timeout=0.05)
+    outer.execute('CREATE TABLE items (name TEXT)')
+    outer.commit()
+    outer.execute("INSERT INTO items VALUES ('pending')")
+
+    # A helper opening its own connection mid-request shares the held one instead of waiting
+    inner = pool.acquire(timeout=0.05)
+    assert inner.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 1
+    inner.close()
+
+    # Closing the inner handle neither returns the connection nor discards outer's work
+    assert outer.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 1
+    thread, other = acquire_in_thread(pool, 0.05)
+    thread.join()
+    assert isinstance(other[0], PoolTimeout)
+
+    outer.close()
+    thread, other = acquire_in_thread(pool, 1)
+    thread.join()
+    assert other[0].execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+    other[0].close()
+    assert pool.stats()['shared_same_thread'] == 1
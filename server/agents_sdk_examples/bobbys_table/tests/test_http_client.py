@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('requests')
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from http_client import PooledHTTPClient, StandinAdapter, standin_url
+
+STANDIN = 'http://127.0.0.1:8099'
+
+
+def test_standin_url_rewrites_only_emulated_hosts():
+    assert standin_url('https://acme.signalwire.com/api/laml/2010-04-01/Accounts/p/Messages.json?x=1',
+                       STANDIN) == f"{STANDIN}/api/laml/2010-04-01/Accounts/p/Messages.json?x=1"
+    assert standin_url('https://api.stripe.com/v1/payment_intents', STANDIN) == f"{STANDIN}/v1/payment_intents"
+    assert standin_url('https://api.themoviedb.org/3/movie/1', STANDIN) == 'https://api.themoviedb.org/3/movie/1'
+    assert standin_url('https://notsignalwire.com/api', STANDIN) == 'https://notsignalwire.com/api'
+
+
+def test_standin_url_is_a_no_op_without_a_standin():
+    assert standin_url('https://api.stripe.com/v1/refunds', '') == 'https://api.stripe.com/v1/refunds'
+
+
+def test_standin_url_reads_the_environment_on_each_call(monkeypatch):
+    monkeypatch.delenv('SERVICE_STANDIN_URL', raising=False)
+    assert standin_url('https://api.stripe.com/v1/refunds') == 'https://api.stripe.com/v1/refunds'
+
+    monkeypatch.setenv('SERVICE_STANDIN_URL', STANDIN)
+    assert standin_url('https://api.stripe.com/v1/refunds') == f"{STANDIN}/v1/refunds"
+
+
+def test_sessions_use_the_standin_adapter_only_when_configured(monkeypatch):
+    monkeypatch.delenv('SERVICE_STANDIN_URL', raising=False)
+    assert not isinstance(PooledHTTPClient().session_for('https://api.stripe.com').get_adapter('https://x'),
+                          StandinAdapter)
+
+    monkeypatch.setenv('SERVICE_STANDIN_URL', STANDIN + '/')
+    session = PooledHTTPClient().session_for('https://api.stripe.com')
+    adapter = session.get_adapter('https://api.stripe.com/v1/payment_intents')
+    assert isinstance(adapter, StandinAdapter)
+    assert adapter.max_retries.total == 2
+    assert adapter.standin == STANDIN
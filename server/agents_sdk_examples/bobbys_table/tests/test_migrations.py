@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import sys
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import db_migrate
+import migrations
+import reservation_search
+
+SCHEMA = """
+CREATE TABLE reservations (
+    id INTEGER PRIMARY KEY, reservation_number VARCHAR(6) UNIQUE NOT NULL, name VARCHAR(80),
+    party_size INTEGER, date VARCHAR(10), time VARCHAR(5), phone_number VARCHAR(20),
+    status VARCHAR(20), confirmation_number VARCHAR(20), created_at DATETIME
+);
+CREATE TABLE orders (
+    id INTEGER PRIMARY KEY, order_number VARCHAR(5) UNIQUE NOT NULL, reservation_id INTEGER,
+    status VARCHAR(20), target_date VARCHAR(10), target_time VARCHAR(5), customer_phone VARCHAR(20),
+    created_at DATETIME
+);
+CREATE TABLE order_items (id INTEGER PRIMARY KEY, order_id INTEGER, menu_item_id INTEGER);
+CREATE TABLE menu_items (id INTEGER PRIMARY KEY, name VARCHAR(100), category VARCHAR(50), is_available BOOLEAN);
+"""
+
+
+def make_db(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'restaurant.db'))
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def flagged(conn):
+    return {result['name'] for result in db_migrate.audit_queries(conn, migrations.HOT_QUERIES)
+            if result['full_scans'] or result['error']}
+
+
+def test_audit_flags_unindexed_lookups(tmp_path):
+    conn = make_db(tmp_path)
+
+    scans = flagged(conn)
+
+    assert 'reservation by phone' in scans
+    assert 'items for an order' in scans
+    assert 'reservation by number' not in scans
+
+
+def test_migrations_remove_full_scans_and_apply_once(tmp_path):
+    conn = make_db(tmp_path)
+
+    assert migrations.migrate(conn) == [1, 2, 3, 4, 5]
+    assert migrations.migrate(conn) == []
+    assert db_migrate.applied_versions(conn) == {1, 2, 3, 4, 5}
+    assert flagged(conn) == set()
+
+
+def test_missing_fts_support_does_not_block_later_migrations(tmp_path, monkeypatch):
+    conn = make_db(tmp_path)
+    statements = list(reservation_search.SCHEMA_STATEMENTS)
+    statements[0] = statements[0].replace("tokenize='trigram'", "tokenize='no_such_tokenizer'")
+    monkeypatch.setattr(reservation_search, 'SCHEMA_STATEMENTS', statements)
+
+    assert migrations.migrate(conn) == [1, 2, 3, 5]
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(reservations)")}
+    assert 'phone_e164' in columns
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    assert reservation_search.FTS_TABLE not in tables
+
+    # The skipped index is retried once SQLite supports it
+    monkeypatch.undo()
+    assert migrations.migrate(conn) == [4]
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    assert reservation_search.FTS_TABLE in tables
+
+
+def test_failed_migration_is_rolled_back(tmp_path):
+    conn = make_db(tmp_path)
+    broken = [(1, 'good', ["CREATE INDEX idx_a ON orders (status)"]),
+              (2, 'bad', ["CREATE INDEX idx_b ON orders (status)", "CREATE INDEX idx_c ON missing (x)"])]
+
+    try:
+        db_migrate.apply_migrations(conn, broken)
+    except sqlite3.Error:
+        pass
+
+    assert db_migrate.applied_versions(conn) == {1}
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert 'idx_a' in indexes and 'idx_b' not in indexes
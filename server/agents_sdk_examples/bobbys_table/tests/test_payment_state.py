@@ -0,0 +1,72 @@
+import os
+import sys
+import threading
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from payment_state import (PaymentStateMachine, EVENT_START, EVENT_CARD_NUMBER, EVENT_SUCCEEDED,
+                           EVENT_CONFIRMED, EVENT_FAILED, EVENT_RETRY, STATE_COMPLETING, STATE_COMPLETED,
+                           STATE_FAILED, STATE_STARTED)
+
+
+def make_machine(tmp_path):
+    return PaymentStateMachine(db_path=str(tmp_path / 'payments.db'))
+
+
+def test_payment_flow_persists_details(tmp_path):
+    machine = make_machine(tmp_path)
+    machine.transition('call-1', EVENT_START, reservation_number='123456', amount=42.5)
+    machine.transition('call-1', EVENT_CARD_NUMBER)
+    machine.transition('call-1', EVENT_SUCCEEDED)
+    result = machine.transition('call-1', EVENT_CONFIRMED, confirmation_number='ABCD1234')
+
+    assert result['accepted'] and result['previous_state'] == STATE_COMPLETING
+    record = machine.get('call-1')
+    assert record['state'] == STATE_COMPLETED
+    assert record['reservation_number'] == '123456'
+    assert record['confirmation_number'] == 'ABCD1234'
+    assert machine.find_by_reservation('123456')['call_id'] == 'call-1'
+
+
+def test_duplicate_success_callback_is_rejected(tmp_path):
+    machine = make_machine(tmp_path)
+    machine.transition('call-2', EVENT_START, reservation_number='654321')
+
+    first = machine.transition('call-2', EVENT_SUCCEEDED)
+    second = machine.transition('call-2', EVENT_SUCCEEDED)
+
+    assert first['accepted'] is True
+    assert second['accepted'] is False
+    assert second['state'] == STATE_COMPLETING
+
+
+def test_concurrent_success_callbacks_claim_completion_once(tmp_path):
+    machine = make_machine(tmp_path)
+    machine.transition('call-3', EVENT_START, reservation_number='111111')
+    results = []
+
+    def deliver():
+        results.append(machine.transition('call-3', EVENT_SUCCEEDED)['accepted'])
+
+    threads = [threading.Thread(target=deliver) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 1
+
+
+def test_retry_clears_failure_details(tmp_path):
+    machine = make_machine(tmp_path)
+    machine.transition('call-4', EVENT_START, reservation_number='222222')
+    machine.transition('call-4', EVENT_FAILED, error_type='card-declined', failure_reason='payment-failed')
+    assert machine.get('call-4')['state'] == STATE_FAILED
+
+    machine.transition('call-4', EVENT_RETRY)
+    record = machine.get('call-4')
+    assert record['state'] == STATE_STARTED
+    assert record['error_type'] is None
+    assert record['reservation_number'] == '222222'
+    assert machine.transition('call-4', EVENT_CONFIRMED)['accepted'] is False
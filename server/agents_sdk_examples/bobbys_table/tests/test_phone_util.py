@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import sys
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from phone_util import backfill, normalize_many, to_e164
+
+
+def test_common_formats_normalize_to_e164():
+    assert to_e164('(555) 123-4567') == '+15551234567'
+    assert to_e164('1-555-123-4567') == '+15551234567'
+    assert to_e164('+1 555.123.4567') == '+15551234567'
+    assert to_e164('+44 20 7946 0958') == '+442079460958'
+    assert to_e164('0044 20 7946 0958') == '+442079460958'
+
+
+def test_invalid_numbers_return_none():
+    assert to_e164(None) is None
+    assert to_e164('') is None
+    assert to_e164('12345') is None
+    assert to_e164('+0123456789') is None
+
+
+def test_normalize_many_keeps_order():
+    assert normalize_many(['5551234567', None, '15559876543']) == ['+15551234567', None, '+15559876543']
+
+
+def test_backfill_fills_only_missing_values(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'phones.db'))
+    conn.execute("CREATE TABLE customers (id INTEGER PRIMARY KEY, phone TEXT, phone_e164 TEXT)")
+    conn.executemany("INSERT INTO customers (phone, phone_e164) VALUES (?, ?)", [
+        ('(555) 123-4567', None),
+        ('555-000-1111', '+15550001111'),
+        ('not a phone', None),
+    ] + [(f'555-222-{i:04d}', None) for i in range(5)])
+
+    assert backfill(conn, 'customers', batch_size=2) == 6
+    assert backfill(conn, 'customers', batch_size=2) == 0
+    rows = dict(conn.execute("SELECT phone, phone_e164 FROM customers").fetchall())
+    assert rows['(555) 123-4567'] == '+15551234567'
+    assert rows['555-222-0004'] == '+15552220004'
+    assert rows['not a phone'] is None
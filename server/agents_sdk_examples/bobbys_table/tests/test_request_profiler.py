@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import sys
+import time
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import sql_trace
+import request_profiler
+from request_profiler import PROFILE_ID_HEADER, ProfilerMiddleware, ProfileStore, download
+
+TOKEN = 's3cret'
+
+
+def make_app():
+    conn = sqlite3.connect(':memory:', factory=sql_trace.TracedConnection, check_same_thread=False)
+
+    def app(environ, start_response):
+        for n in range(3):
+            conn.execute('SELECT ?', (n,))
+        time.sleep(0.02)
+        start_response('201 Created', [('Content-Type', 'text/plain')])
+        return [b'done']
+    return app
+
+
+def call(middleware, path='/receptionist', **headers):
+    environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': path}
+    environ.update({'HTTP_' + name.upper(): value for name, value in headers.items()})
+    captured = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        captured.update(response_headers)
+
+    # Iterate and close the response the way a WSGI server does
+    response = middleware(environ, start_response)
+    try:
+        body = b''.join(response)
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return body, captured
+
+
+def test_requests_without_the_header_are_not_profiled():
+    store = ProfileStore()
+    body, headers = call(ProfilerMiddleware(make_app(), store=store))
+    assert body == b'done'
+    assert PROFILE_ID_HEADER not in headers
+    assert store.list() == []
+
+
+def test_header_needs_the_token():
+    store = ProfileStore()
+    middleware = ProfilerMiddleware(make_app(), store=store, token=TOKEN)
+    assert PROFILE_ID_HEADER not in call(middleware, X_PROFILE='guess')[1]
+    assert PROFILE_ID_HEADER in call(middleware, X_PROFILE=TOKEN)[1]
+
+    # Without a token the header never triggers a profile
+    untokened = ProfilerMiddleware(make_app(), store=store)
+    assert PROFILE_ID_HEADER not in call(untokened, X_PROFILE='')[1]
+
+
+def test_install_and_reading_profiles_need_a_token(monkeypatch):
+    app = type('App', (), {'wsgi_app': make_app()})()
+    monkeypatch.setattr(request_profiler, '_middleware', None)
+    monkeypatch.setenv('REQUEST_PROFILING', 'true')
+    monkeypatch.delenv('PROFILE_TOKEN', raising=False)
+    request_profiler.install(app)
+    assert not isinstance(app.wsgi_app, ProfilerMiddleware)
+    assert not request_profiler.authorized({})
+
+    monkeypatch.setenv('PROFILE_TOKEN', TOKEN)
+    request_profiler.install(app)
+    assert isinstance(app.wsgi_app, ProfilerMiddleware)
+    assert request_profiler.authorized({'X-Profile': TOKEN})
+    assert not request_profiler.authorized({'X-Profile': 'guess'})
+    assert not request_profiler.authorized({})
+
+
+def test_cprofile_capture_includes_sql_and_raw_stats():
+    store = ProfileStore()
+    _, headers = call(ProfilerMiddleware(make_app(), store=store, token=TOKEN), X_PROFILE=TOKEN)
+    profile = store.get(headers[PROFILE_ID_HEADER])
+
+    assert (profile['status'], profile['trigger'], profile['mode']) == (201, 'header', 'cprofile')
+    assert profile['duration_ms'] >= 20
+    assert profile['sql']['count'] == 3
+    assert any('sleep' in row['function'] for row in profile['functions'])
+    body, mimetype, filename = download(profile)
+    assert filename.endswith('.prof') and body
+
+
+def test_stack_sampling_yields_collapsed_stacks():
+    store = ProfileStore()
+    middleware = ProfilerMiddleware(make_app(), store=store, mode='sample', sample_interval_ms=1, token=TOKEN)
+    _, headers = call(middleware, X_PROFILE=TOKEN)
+    profile = store.get(headers[PROFILE_ID_HEADER])
+
+    assert profile['mode'] == 'sample' and profile['samples'] > 0
+    body, mimetype, _ = download(profile)
+    assert mimetype == 'text/plain'
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in body.decode().splitlines())
+
+
+def test_store_keeps_only_the_newest_profiles_and_skips_its_own_routes():
+    store = ProfileStore(keep=2)
+    middleware = ProfilerMiddleware(make_app(), store=store, sample_rate=1.0)
+    for _ in range(3):
+        call(middleware)
+    call(middleware, path='/debug/profiles')
+    assert len(store.list()) == 2
+    assert all(summary['trigger'] == 'sample' for summary in store.list())
+
+
+def test_streamed_bodies_are_profiled_until_closed():
+    conn = sqlite3.connect(':memory:', factory=sql_trace.TracedConnection, check_same_thread=False)
+
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+
+        def lines():
+            for n in range(4):
+                conn.execute('SELECT ?', (n,))
+                yield b'{}\n'
+        return lines()
+
+    store = ProfileStore()
+    middleware = ProfilerMiddleware(app, store=store, token=TOKEN)
+    body, headers = call(middleware, X_PROFILE=TOKEN)
+    profile = store.get(headers[PROFILE_ID_HEADER])
+
+    assert body == b'{}\n' * 4
+    assert profile['status'] == 200
+    assert profile['sql']['count'] == 4
+
+
+def test_profile_is_stored_when_the_app_raises():
+    def app(environ, start_response):
+        raise RuntimeError('boom')
+
+    store = ProfileStore()
+    middleware = ProfilerMiddleware(app, store=store, sample_rate=1.0)
+    with pytest.raises(RuntimeError):
+        call(middleware)
+
+    assert len(store.list()) == 1
+    assert not request_profiler._cprofile_lock.locked()
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import sys
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from reservation_search import ReservationSearch, SCHEMA_STATEMENTS, name_similarity
+
+
+def make_search(tmp_path, rows):
+    db_path = str(tmp_path / 'restaurant.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE reservations (id INTEGER PRIMARY KEY, reservation_number TEXT, "
+                 "name TEXT, phone_number TEXT)")
+    conn.executemany("INSERT INTO reservations (reservation_number, name, phone_number) VALUES (?, ?, ?)", rows)
+    for statement in SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    conn.commit()
+    return conn, ReservationSearch(db_path=db_path)
+
+
+ROWS = [
+    ('111111', 'John Smith', '+15551234567'),
+    ('222222', 'Jane Johnson', '(555) 987-6543'),
+    ('333333', 'Rob Zombie', '555.222.3333'),
+]
+
+
+def test_misspelled_names_are_ranked(tmp_path):
+    conn, search = make_search(tmp_path, ROWS)
+
+    assert search.available()
+    assert search.search_name('Jon Smyth')[0][0] == 1
+    assert search.search_name('jonson')[0][0] == 2
+    assert search.search_name('zombie')[0] == (3, 1.0)
+    assert search.search_name('Xavier Quill') == []
+
+
+def test_phone_lookup_ignores_formatting(tmp_path):
+    conn, search = make_search(tmp_path, ROWS)
+
+    assert search.search_phone('5551234567') == [1]
+    assert search.search_phone('+1 (555) 987-6543') == [2]
+    assert search.search_phone('15552223333') == [3]
+
+
+def test_triggers_keep_index_in_sync(tmp_path):
+    conn, search = make_search(tmp_path, ROWS)
+
+    conn.execute("INSERT INTO reservations (reservation_number, name, phone_number) "
+                 "VALUES ('444444', 'Alice Walker', '555-444-0000')")
+    conn.execute("UPDATE reservations SET name = 'Janet Jackson' WHERE id = 2")
+    conn.execute("DELETE FROM reservations WHERE id = 3")
+    conn.commit()
+
+    assert search.search_name('alice walker')[0][0] == 4
+    assert search.search_name('janet jackson')[0][0] == 2
+    assert search.search_name('zombie') == []
+    assert search.search_phone('5554440000') == [4]
+
+
+def test_name_similarity():
+    assert name_similarity('smith', 'John Smith') == 1.0
+    assert name_similarity('Jon Smyth', 'John Smith') > 0.6
+    assert name_similarity('Rob', 'Alice Walker') < 0.6
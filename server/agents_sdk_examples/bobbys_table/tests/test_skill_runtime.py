@@ -0,0 +1,54 @@
+import os
+import sys
+from contextlib import nullcontext
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from skills import runtime as skill_runtime
+from skills.runtime import SkillRuntime
+
+
+class FakeApp:
+    def __init__(self):
+        self.contexts = 0
+
+    def app_context(self):
+        self.contexts += 1
+        return nullcontext()
+
+
+class FakeDB:
+    session = object()
+
+
+def make_runtime():
+    return SkillRuntime(
+        app=FakeApp(),
+        db=FakeDB(),
+        models={'Reservation': 'ReservationModel', 'Order': 'OrderModel'},
+        helpers={'numbers_to_words': str.upper}
+    )
+
+
+def test_models_and_helpers_are_attributes():
+    runtime = make_runtime()
+
+    assert runtime.Reservation == 'ReservationModel'
+    assert runtime.Order == 'OrderModel'
+    assert runtime.numbers_to_words('table 5') == 'TABLE 5'
+    assert runtime.session is FakeDB.session
+
+    with runtime.app_context():
+        pass
+    assert runtime.app.contexts == 1
+
+
+def test_installed_runtime_is_returned_without_resolving_app():
+    runtime = make_runtime()
+    previous = skill_runtime._runtime
+    try:
+        skill_runtime.set_skill_runtime(runtime)
+        assert skill_runtime.get_skill_runtime() is runtime
+    finally:
+        skill_runtime.set_skill_runtime(previous)
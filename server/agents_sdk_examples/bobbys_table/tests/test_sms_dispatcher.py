@@ -0,0 +1,77 @@
+import os
+import sys
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from sms_dispatcher import SMSDispatcher, PermanentSendError
+
+
+class RecordingSender:
+    def __init__(self, failures=0, permanent=False):
+        self.failures = failures
+        self.permanent = permanent
+        self.sent = []
+
+    def __call__(self, to_number, from_number, body):
+        if self.failures:
+            self.failures -= 1
+            if self.permanent:
+                raise PermanentSendError('rejected')
+            raise RuntimeError('temporary outage')
+        self.sent.append((to_number, from_number, body))
+        return f"SM{len(self.sent)}"
+
+
+def make_dispatcher(tmp_path, sender, **kwargs):
+    return SMSDispatcher(db_path=str(tmp_path / 'outbox.db'), sender=sender, base_delay=0, **kwargs)
+
+
+def test_enqueue_deduplicates_and_sends_once(tmp_path):
+    sender = RecordingSender()
+    dispatcher = make_dispatcher(tmp_path, sender)
+    dispatcher.start = lambda: None  # drive the queue manually
+
+    first = dispatcher.enqueue('+15551234567', 'Receipt', kind='payment_receipt', dedup_key='payment:ABC')
+    second = dispatcher.enqueue('+15551234567', 'Receipt', kind='payment_receipt', dedup_key='payment:ABC')
+
+    assert first['queued'] and not first['duplicate']
+    assert second['duplicate'] and second['message_id'] == first['message_id']
+
+    assert dispatcher.process_due() == 1
+    assert dispatcher.process_due() == 0
+    assert len(sender.sent) == 1
+    assert dispatcher.stats()['counts'] == {'sent': 1}
+
+
+def test_transient_failures_are_retried_until_max_attempts(tmp_path):
+    sender = RecordingSender(failures=5)
+    dispatcher = make_dispatcher(tmp_path, sender, max_attempts=3)
+    dispatcher.start = lambda: None
+
+    dispatcher.enqueue('+15551234567', 'Hello', dedup_key='x')
+    for _ in range(3):
+        dispatcher.process_due()
+
+    message = dispatcher.recent()[0]
+    assert message['status'] == 'failed'
+    assert message['attempts'] == 3
+    assert sender.sent == []
+
+
+def test_permanent_failure_is_not_retried(tmp_path):
+    sender = RecordingSender(failures=1, permanent=True)
+    dispatcher = make_dispatcher(tmp_path, sender)
+    dispatcher.start = lambda: None
+
+    dispatcher.enqueue('+15551234567', 'Hello')
+    dispatcher.process_due()
+
+    message = dispatcher.recent()[0]
+    assert message['status'] == 'failed'
+    assert message['attempts'] == 1
+
+
+def test_enqueue_requires_destination(tmp_path):
+    dispatcher = make_dispatcher(tmp_path, RecordingSender())
+    assert dispatcher.enqueue('', 'Hello')['success'] is False
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import sql_trace
+
+
+def make_connection():
+    conn = sqlite3.connect(':memory:', factory=sql_trace.TracedConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE items (n INTEGER)')
+    return conn
+
+
+def test_nothing_is_recorded_without_an_active_trace():
+    conn = make_connection()
+    conn.execute('INSERT INTO items VALUES (1)')
+    assert sql_trace.current() is None
+    assert sql_trace.stop() is None
+
+
+def test_statements_are_recorded_with_params_while_tracing():
+    conn = make_connection()
+    sql_trace.start()
+    try:
+        conn.executemany('INSERT INTO items VALUES (?)', [(1,), (2,)])
+        for n in (1, 3, 2):
+            row = conn.execute('SELECT n FROM items WHERE n = ?', (n,)).fetchone()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM items')
+    finally:
+        trace = sql_trace.stop()
+
+    assert isinstance(row, sqlite3.Row) and row['n'] == 2
+    assert isinstance(cursor, sql_trace.TracedCursor)
+    assert trace.count == 5
+    assert trace.statements[1] == dict(trace.statements[1], sql='SELECT n FROM items WHERE n = ?', params='(1,)')
+    counts = {entry['sql']: entry['count'] for entry in trace.to_dict()['by_statement']}
+    assert counts['SELECT n FROM items WHERE n = ?'] == 3
+
+
+def test_trace_keeps_counting_past_max_statements():
+    conn = make_connection()
+    sql_trace.start(max_statements=2)
+    for _ in range(5):
+        conn.execute('SELECT 1')
+    trace = sql_trace.stop().to_dict()
+    assert trace['count'] == 5
+    assert len(trace['statements']) == 2
+    assert trace['truncated']
+
+
+def test_counting_only_trace_keeps_no_statements():
+    conn = make_connection()
+    sql_trace.start(max_statements=0, label='GET /api/tables')
+    conn.execute('SELECT 1')
+    trace = sql_trace.stop()
+    assert (trace.count, trace.statements, trace.label) == (1, [], 'GET /api/tables')
+
+
+def run_slow_statement(conn):
+    log = sql_trace.get_slow_log()
+    log.clear()
+    sql_trace.enable(slow_ms=0)
+    try:
+        sql_trace.start(max_statements=0, label='GET /api/tables')
+        conn.execute('SELECT n FROM items WHERE n = ?', (7,))
+        sql_trace.stop()
+    finally:
+        sql_trace._slow_seconds = None
+    entry = log.entries()[0]
+    log.clear()
+    return entry
+
+
+def test_slow_statements_are_logged_with_plan_and_redacted_params(caplog):
+    conn = make_connection()
+
+    entry = run_slow_statement(conn)
+
+    assert entry['sql'] == 'SELECT n FROM items WHERE n = ?'
+    assert (entry['params'], entry['request']) == (sql_trace.REDACTED, 'GET /api/tables')
+    assert any('items' in step for step in entry['plan'])
+    assert '(7,)' not in caplog.text
+
+
+def test_slow_statement_params_are_kept_with_sql_log_params(monkeypatch):
+    conn = make_connection()
+    monkeypatch.setattr(sql_trace, '_log_params', True)
+
+    assert run_slow_statement(conn)['params'] == '(7,)'
+
+
+def test_slow_query_list_needs_sql_debug_and_the_token(monkeypatch):
+    headers = {sql_trace.DEBUG_TOKEN_HEADER: 's3cret'}
+    monkeypatch.setattr(sql_trace, '_debug', True)
+    monkeypatch.setattr(sql_trace, '_debug_token', '')
+    assert not sql_trace.authorized(headers)
+
+    monkeypatch.setattr(sql_trace, '_debug_token', 's3cret')
+    assert sql_trace.authorized(headers)
+    assert not sql_trace.authorized({sql_trace.DEBUG_TOKEN_HEADER: 'guess'})
+    assert not sql_trace.authorized({})
+
+    monkeypatch.setattr(sql_trace, '_debug', False)
+    assert not sql_trace.authorized(headers)
+
+
+def test_install_reports_counts_in_debug_headers(monkeypatch):
+    flask = pytest.importorskip('flask')
+    app = flask.Flask(__name__)
+    conn = make_connection()
+
+    @app.route('/items')
+    def items():
+        for n in range(3):
+            conn.execute('SELECT n FROM items WHERE n = ?', (n,))
+        return 'ok'
+
+    monkeypatch.setenv('SQL_DEBUG', 'true')
+    monkeypatch.setenv('SQL_SLOW_MS', '60000')
+    monkeypatch.setattr(sql_trace, '_enabled', False)
+    monkeypatch.setattr(sql_trace, '_debug', False)
+    monkeypatch.setattr(sql_trace, '_debug_token', '')
+    monkeypatch.setattr(sql_trace, '_log_params', False)
+    monkeypatch.setattr(sql_trace, '_slow_seconds', None)
+    sql_trace.install(app)
+
+    response = app.test_client().get('/items')
+    assert response.headers[sql_trace.DB_QUERIES_HEADER] == '3'
+    assert float(response.headers[sql_trace.DB_TIME_HEADER]) >= 0
+    assert sql_trace.current() is None
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from stripe_events import StripeEventQueue
+
+
+def make_queue(tmp_path, handler, **kwargs):
+    event_queue = StripeEventQueue(handler=handler, db_path=str(tmp_path / 'events.db'), base_delay=0, **kwargs)
+    event_queue.start = lambda: None  # drive the queue manually
+    return event_queue
+
+
+def test_duplicate_events_are_processed_once(tmp_path):
+    handled = []
+    event_queue = make_queue(tmp_path, handled.append)
+    event = {'id': 'evt_1', 'type': 'payment_intent.succeeded', 'data': {'object': {'id': 'pi_1'}}}
+
+    assert event_queue.record(event)['duplicate'] is False
+    assert event_queue.record(event)['duplicate'] is True
+
+    assert event_queue.process_next() is True
+    assert event_queue.process_next() is False
+    assert [e['id'] for e in handled] == ['evt_1']
+    assert event_queue.stats()['counts'] == {'processed': 1}
+
+
+def test_failing_handler_is_retried_then_marked_failed(tmp_path):
+    calls = []
+
+    def handler(event):
+        calls.append(event['id'])
+        raise RuntimeError('database unavailable')
+
+    event_queue = make_queue(tmp_path, handler, max_attempts=2)
+    event_queue.record({'id': 'evt_2', 'type': 'payment_intent.succeeded'})
+
+    event_queue.process_next()
+    event_queue.process_next()
+
+    assert calls == ['evt_2', 'evt_2']
+    event = event_queue.recent()[0]
+    assert event['status'] == 'failed'
+    assert event['last_error'] == 'database unavailable'
+
+
+def test_event_without_id_is_rejected(tmp_path):
+    event_queue = make_queue(tmp_path, lambda event: None)
+    with pytest.raises(ValueError):
+        event_queue.record({'type': 'payment_intent.succeeded'})
@@ -0,0 +1,71 @@
+import os
+import sys
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from swaig_bench import CALL_LOG_LENGTHS, PayloadFactory, compare, percentile, run, summarize
+
+
+class FakeTarget:
+    """Answers instantly, failing every request for one function"""
+
+    def __init__(self, failing=None):
+        self.failing = failing
+        self.sent = []
+
+    def send(self, body):
+        self.sent.append(body)
+        if body.get('function') == self.failing:
+            return 500, 7
+        return 200, 3
+
+
+def test_same_seed_gives_same_payloads():
+    first = PayloadFactory(seed=5, reservations=[('123456', 'Jane Doe', '+15551234567')]).batch(40)
+    second = PayloadFactory(seed=5, reservations=[('123456', 'Jane Doe', '+15551234567')]).batch(40)
+    assert first == second
+    assert PayloadFactory(seed=6).batch(40) != PayloadFactory(seed=5).batch(40)
+
+
+def test_payloads_look_like_swaig_requests():
+    factory = PayloadFactory(seed=1, reservations=[('654321', 'Jim Smith', '+15557654321')], system_prompt='prompt')
+    for label, body in factory.batch(200):
+        if label == 'get_signature':
+            assert body['action'] == 'get_signature'
+            continue
+        assert body['function'] == label
+        assert body['argument']['parsed'][0]
+        assert body['call_log'][0] == {'role': 'system', 'content': 'prompt'}
+        low, high = CALL_LOG_LENGTHS[label]
+        assert low <= len(body['call_log']) - 1 <= high
+        if label == 'pay_reservation':
+            assert body['argument']['parsed'][0]['reservation_number'] == '654321'
+
+
+def test_run_excludes_warmup_and_summarizes_per_function():
+    payloads = PayloadFactory(seed=2).batch(60)
+    target = FakeTarget(failing='pay_reservation')
+    results, elapsed = run(target, payloads, concurrency=4, warmup=10)
+
+    assert len(target.sent) == 60
+    assert len(results) == 50
+    summary = summarize(results, elapsed)
+    assert summary['overall']['requests'] == 50
+    assert summary['pay_reservation']['errors'] == summary['pay_reservation']['requests']
+    assert summary['get_reservation']['errors'] == 0
+    assert summary['get_reservation']['avg_queries'] == 3
+
+
+def test_percentile_is_nearest_rank():
+    ordered = list(range(1, 101))
+    assert percentile(ordered, 50) == 51
+    assert percentile(ordered, 99) == 99
+    assert percentile([], 90) == 0.0
+
+
+def test_compare_flags_slowdowns_and_extra_queries():
+    baseline = {'get_reservation': {'p50_ms': 10.0, 'p90_ms': 20.0, 'p99_ms': 30.0, 'avg_queries': 4.0}}
+    current = {'get_reservation': {'p50_ms': 10.5, 'p90_ms': 25.0, 'p99_ms': 30.0, 'avg_queries': 5.0}}
+    regressed = {metric for _, metric, _, _, _, worse in compare(current, baseline, threshold_pct=10) if worse}
+    assert regressed == {'p90_ms', 'avg_queries'}
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import sys
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from table_availability import TableAvailability
+
+DATE = '2030-06-01'
+
+
+def make_availability(tmp_path, reservations=()):
+    db_path = str(tmp_path / 'restaurant.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE tables (id INTEGER PRIMARY KEY, table_number INTEGER, capacity INTEGER, status TEXT)")
+    conn.execute("CREATE TABLE reservations (id INTEGER PRIMARY KEY, date TEXT, time TEXT, party_size INTEGER, status TEXT)")
+    conn.executemany("INSERT INTO tables (table_number, capacity, status) VALUES (?, ?, 'available')",
+                     [(1, 2), (2, 4)])
+    conn.executemany("INSERT INTO reservations (id, date, time, party_size, status) VALUES (?, ?, ?, ?, ?)",
+                     reservations)
+    conn.commit()
+    return conn, TableAvailability(db_path=db_path)
+
+
+def test_two_hour_occupancy_blocks_overlapping_times(tmp_path):
+    conn, availability = make_availability(tmp_path, [(1, DATE, '18:00', 4, 'confirmed')])
+
+    assert availability.available()
+    assert not availability.can_seat(DATE, '19:30', 3)
+    assert availability.can_seat(DATE, '20:00', 3)
+    assert availability.can_seat(DATE, '16:00', 3)
+    # The two-top is still free, and a party of 6 can push both tables together later
+    assert availability.find_tables(DATE, '19:00', 2) == (1,)
+    assert availability.find_tables(DATE, '20:00', 6) == (2, 1)
+    assert not availability.can_seat(DATE, '20:00', 7)
+
+
+def test_cancelled_reservations_and_rescheduled_self_do_not_block(tmp_path):
+    conn, availability = make_availability(tmp_path, [(1, DATE, '18:00', 4, 'confirmed'),
+                                                      (2, DATE, '18:00', 2, 'cancelled')])
+
+    assert availability.can_seat(DATE, '18:30', 2)
+    assert availability.can_seat(DATE, '18:30', 4, ignore_id=1)
+
+
+def test_next_available_skips_full_slots_and_rolls_over_days(tmp_path):
+    conn, availability = make_availability(tmp_path, [(1, DATE, '19:00', 4, 'confirmed'),
+                                                      (2, DATE, '21:00', 4, 'confirmed')])
+
+    assert availability.next_available(DATE, '19:15', 4, count=2) == [('2030-06-02', '09:00'), ('2030-06-02', '09:30')]
+    assert availability.next_available(DATE, '16:00', 3, count=3) == [
+        (DATE, '16:00'), (DATE, '16:30'), (DATE, '17:00')
+    ]
+
+
+def test_changes_update_loaded_days_incrementally(tmp_path):
+    conn, availability = make_availability(tmp_path)
+    assert availability.can_seat(DATE, '12:00', 4)
+
+    availability.apply_changes({10: (DATE, '11:00', 4, 'confirmed')})
+    assert not availability.can_seat(DATE, '12:00', 4)
+
+    # Moving the reservation frees its old slot and blocks the new one
+    availability.apply_changes({10: (DATE, '15:00', 4, 'confirmed')})
+    assert availability.can_seat(DATE, '12:00', 4)
+    assert not availability.can_seat(DATE, '16:00', 3)
+
+    availability.apply_changes({10: (DATE, '15:00', 4, 'cancelled')})
+    assert availability.can_seat(DATE, '16:00', 3)
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for, flash, Response, g, send_from_directory, abort, send_file
+from flask import Flask, render_template, jsonify, request, session, redirect, url_for, flash, Response, g, send_from_directory, abort, send_file, stream_with_context
 import sqlite3
 from datetime import datetime, timedelta
 import os
@@ -13,6 +13,16 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from signalwire_swaig.swaig import SWAIG, SWAIGArgument, SWAIGFunctionProperties
 from signalwire_swaig.response import SWAIGResponse
 from mfa_util import SignalWireMFA
+import http_client
+import db_pool
+import request_profiler
+import sql_trace
+from phone_util import to_e164
+from challenge_tokens import get_token_store, token_hint
+from slot_cache import get_slot_cache, to_minutes, SLOT_MINUTES, TIME_SLOT_WINDOWS
+from dentist_schedule import iter_dentist_schedule, iter_schedule_ndjson
+from billing_ledger import bill_balance, patient_balance, is_overdue
+from bill_render_cache import get_render_cache, bill_render_fields
 import time
 import traceback
 import random
@@ -61,6 +71,11 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
 app.secret_key = app.config['SECRET_KEY']  # Set Flask's secret_key to the same persistent value
 app.config['ENABLE_CSRF'] = os.getenv('ENABLE_CSRF', 'false').lower() == 'true'
 
+# Opt-in per-request profiling (REQUEST_PROFILING=true); profiles are served from /debug/profiles
+request_profiler.install(app)
+# Per-request SQL counters and X-DB-* headers (SQL_DEBUG=true), slow-query log (SQL_SLOW_MS)
+sql_trace.install(app)
+
 # Configure MIME types
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 app.config['MIME_TYPES'] = {
@@ -111,9 +126,9 @@ def setup_logging():
     app.logger.info(f'CSRF Configuration: ENABLE_CSRF={csrf_enabled}')
 
 def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect('dental_office.db')
-        g.db.row_factory = sqlite3.Row
+    # Pooled WAL connection; close() hands it back to the pool
+    if 'db' not in g or g.db.closed:
+        g.db = db_pool.connect('dental_office.db')
     return g.db
 
 @app.teardown_appcontext
@@ -123,13 +138,17 @@ def close_db(error):
         db.close()
 
 def init_db_if_needed():
-    if not os.path.exists('dental_office.db'):
-        with app.app_context():
-            db = get_db()
+    fresh = not os.path.exists('dental_office.db')
+    with app.app_context():
+        db = get_db()
+        if fresh:
             with app.open_resource('schema.sql') as f:
                 db.executescript(f.read().decode('utf8'))
             db.commit()
             app.logger.info('Database initialized')
+        # Versioned index migrations (see migrations.py)
+        import migrations
+        migrations.migrate(db)
 
 def login_required(f):
     @wraps(f)
@@ -466,11 +485,15 @@ def patient_billing():
                    ELSE 'Dr. ' || d.first_name || ' ' || d.last_name
                END as dentist_name,
                th.diagnosis, th.treatment_notes, th.treatment_date,
-               (b.amount - COALESCE(b.insurance_coverage, 0)) as calculated_patient_portion
+               COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as calculated_patient_portion,
+               COALESCE(bl.amount_paid, 0) as total_paid,
+               COALESCE(bl.outstanding, b.patient_portion) as outstanding,
+               COALESCE(bl.payment_count, 0) as payment_count
         FROM billing b
         JOIN dental_services s ON b.service_id = s.id
         LEFT JOIN dentists d ON b.dentist_id = d.id
         LEFT JOIN treatment_history th ON b.reference_number = th.reference_number
+        LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
         WHERE b.patient_id = ?
         ORDER BY b.due_date DESC
     ''', (session['user_id'],)).fetchall()
@@ -820,6 +843,7 @@ def create_appointment():
         db.commit()
         
         appointment_id = cursor.lastrowid
+        get_slot_cache().record(dentist_id, appointment_id, data['start_time'], data['end_time'])
         appointment = db.execute('''
             SELECT a.*, d.first_name as dentist_first_name, d.last_name as dentist_last_name,
                    s.name as service_name
@@ -885,6 +909,8 @@ def update_appointment(appointment_id):
         query = f'UPDATE appointments SET {set_clause} WHERE id = ?'
         db.execute(query, list(updates.values()) + [appointment_id])
         db.commit()
+        get_slot_cache().record(appointment['dentist_id'], appointment_id, appointment['start_time'],
+                                appointment['end_time'], updates.get('status', appointment['status']))
         
         updated_appointment = db.execute('''
             SELECT a.*, d.first_name as dentist_first_name, d.last_name as dentist_last_name,
@@ -942,6 +968,7 @@ def delete_appointment(appointment_id):
     try:
         db.execute('DELETE FROM appointments WHERE id = ?', (appointment_id,))
         db.commit()
+        get_slot_cache().forget(appointment_id)
         return '', 204
     except sqlite3.Error as e:
         db.rollback()
@@ -965,6 +992,7 @@ def cancel_appointment_api(appointment_id):
         # Update appointment status to cancelled instead of deleting
         db.execute('UPDATE appointments SET status = ? WHERE id = ?', ('cancelled', appointment_id))
         db.commit()
+        get_slot_cache().forget(appointment_id)
         
         # Get updated appointment details for response
         updated_appointment = db.execute('''
@@ -1073,6 +1101,7 @@ def reschedule_appointment(appointment_id):
             WHERE id = ?
         ''', (start_time, end_time, notes, appointment_id))
         db.commit()
+        get_slot_cache().record(appointment['dentist_id'], appointment_id, start_time, end_time, appointment['status'])
         
         # Get the updated appointment
         updated_appointment = db.execute('''
@@ -1191,99 +1220,85 @@ def get_available_slots():
     
     db = get_db()
     
-    # Get dentist's working hours
-    dentist = db.execute('SELECT working_hours FROM dentists WHERE id = ?', (dentist_id,)).fetchone()
+    dentist = db.execute('SELECT id FROM dentists WHERE id = ?', (dentist_id,)).fetchone()
     if not dentist:
         return jsonify({'error': 'Dentist not found'}), 404
     
-    working_hours = json.loads(dentist['working_hours'])
-    day_of_week = date_obj.strftime('%A').lower()
-    
-    if day_of_week not in working_hours:
+    # Free 30-minute slots from the cached bitmap for this dentist and day
+    available_slots = get_slot_cache().available_slots(db, dentist_id, date_obj.strftime('%Y-%m-%d'))
+    if available_slots is None:
         return jsonify({'error': 'Dentist not available on this day'}), 400
     
-    # Get booked appointments for the day
-    booked_slots = db.execute('''
-        SELECT start_time
-        FROM appointments
-        WHERE dentist_id = ? AND date(start_time) = ? AND status != 'cancelled'
-    ''', (dentist_id, date)).fetchall()
-    booked_times = [datetime.fromisoformat(slot['start_time']).strftime('%H:%M') for slot in booked_slots]
-    
-    # Generate available slots
-    available_slots = []
-    start_time = datetime.strptime(working_hours[day_of_week]['start'], '%H:%M')
-    end_time = datetime.strptime(working_hours[day_of_week]['end'], '%H:%M')
-    slot_duration = timedelta(minutes=30)  # 30-minute slots
-    
-    current_time = start_time
-    while current_time + slot_duration <= end_time:
-        slot_time = current_time.strftime('%H:%M')
-        if slot_time not in booked_times:
-            available_slots.append(slot_time)
-        current_time += slot_duration
-    
     return jsonify(available_slots)
 
+@app.route('/api/calendar/first-available', methods=['GET'])
+@login_required
+def get_first_available():
+    """Earliest free slots across one or more dentists over several days"""
+    dentist_ids = [value for value in request.args.get('dentist_ids', '').split(',') if value.strip().isdigit()]
+    start_date = request.args.get('start_date') or datetime.now().strftime('%Y-%m-%d')
+    time_slot = request.args.get('time_slot')
+    
+    try:
+        datetime.strptime(start_date, '%Y-%m-%d')
+        days = min(int(request.args.get('days', 7)), 60)
+        limit = min(int(request.args.get('limit', 5)), 50)
+    except ValueError:
+        return jsonify({'error': 'Invalid parameters. Use YYYY-MM-DD for start_date and integers for days and limit'}), 400
+    
+    if time_slot and time_slot not in TIME_SLOT_WINDOWS:
+        return jsonify({'error': 'Invalid time slot'}), 400
+    
+    db = get_db()
+    if not dentist_ids:
+        dentist_ids = [row['id'] for row in db.execute('SELECT id FROM dentists ORDER BY id').fetchall()]
+    
+    window = None
+    if time_slot:
+        window = tuple(to_minutes(value) for value in TIME_SLOT_WINDOWS[time_slot])
+    
+    slots = get_slot_cache().first_available(
+        db, dentist_ids, start_date, days=days, window=window, limit=limit, not_before=datetime.now()
+    )
+    return jsonify(slots)
+
 @app.route('/api/calendar/dentist-schedule', methods=['GET'])
 @login_required
 def get_dentist_schedule():
-    dentist_id = request.args.get('dentist_id')
+    # dentist_id may be a single ID or a comma-separated list (dentist_ids is accepted too)
+    raw_ids = request.args.get('dentist_ids') or request.args.get('dentist_id') or ''
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    if not all([dentist_id, start_date, end_date]):
+    dentist_ids = [value.strip() for value in raw_ids.split(',') if value.strip()]
+    if not all([dentist_ids, start_date, end_date]):
         return jsonify({'error': 'Missing required parameters'}), 400
     
     try:
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+        dentist_ids = [int(value) for value in dentist_ids]
     except ValueError:
-        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        return jsonify({'error': 'Invalid parameters. Use YYYY-MM-DD dates and numeric dentist IDs'}), 400
     
     db = get_db()
     
-    # Get dentist's working hours
-    dentist = db.execute('SELECT working_hours FROM dentists WHERE id = ?', (dentist_id,)).fetchone()
-    if not dentist:
-        return jsonify({'error': 'Dentist not found'}), 404
-    
-    working_hours = json.loads(dentist['working_hours'])
+    # Get each dentist's working hours
+    placeholders = ', '.join('?' * len(dentist_ids))
+    found = {row['id']: row for row in db.execute(
+        f'SELECT id, working_hours FROM dentists WHERE id IN ({placeholders})', dentist_ids
+    ).fetchall()}
+    missing = [dentist_id for dentist_id in dentist_ids if dentist_id not in found]
+    if missing:
+        return jsonify({'error': 'Dentist not found', 'dentist_ids': missing}), 404
+    dentists = list(found.values())
     
-    # Get appointments for the date range
-    appointments = db.execute('''
-        SELECT a.*, p.first_name as patient_first_name, p.last_name as patient_last_name,
-               s.name as service_name
-        FROM appointments a
-        JOIN patients p ON a.patient_id = p.id
-        JOIN dental_services s ON a.service_id = s.id
-        WHERE a.dentist_id = ? AND a.appointment_date BETWEEN ? AND ?
-        ORDER BY a.appointment_date, a.appointment_time
-    ''', (dentist_id, start_date, end_date)).fetchall()
-    
-    schedule = []
-    current_date = start_date_obj
-    while current_date <= end_date_obj:
-        day_of_week = current_date.strftime('%A').lower()
-        date_str = current_date.strftime('%Y-%m-%d')
-        
-        if day_of_week in working_hours:
-            day_schedule = {
-                'date': date_str,
-                'working_hours': working_hours[day_of_week],
-                'appointments': []
-            }
-            
-            # Add appointments for this day
-            for appointment in appointments:
-                if appointment['appointment_date'] == date_str:
-                    day_schedule['appointments'].append(dict(appointment))
-            
-            schedule.append(day_schedule)
-        
-        current_date += timedelta(days=1)
+    # Large (e.g. month, multi-dentist) ranges can be streamed one day per line
+    if request.args.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', ''):
+        lines = iter_schedule_ndjson(db, dentists, start_date_obj, end_date_obj)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
     
-    return jsonify(schedule)
+    return jsonify(list(iter_dentist_schedule(db, dentists, start_date_obj, end_date_obj)))
 
 @app.route('/forgot_password', methods=['GET', 'POST'])
 def forgot_password():
@@ -1771,6 +1786,7 @@ def update_dentist_profile():
             WHERE id=?
         ''', (first_name, last_name, email, phone, specialization, working_hours, user_id))
         db.commit()
+        get_slot_cache().invalidate_dentist(user_id)
         session['name'] = f"{first_name} {last_name}"
         return jsonify({'success': True, 'message': 'Profile updated successfully'})
     except Exception as e:
@@ -1824,9 +1840,8 @@ def make_payment():
             INSERT INTO payments (billing_id, patient_id, amount, payment_date, payment_method_id, payment_method_type, status, transaction_id, notes)
             VALUES (?, ?, ?, datetime('now'), ?, ?, 'completed', ?, ?)
         ''', (billing_id, session['user_id'], amount, payment_method_id, payment_method_type, secrets.token_hex(8), notes))
-        db.commit()
 
-        # Update billing record
+        # Update billing record in the same transaction (the billing ledger follows both)
         db.execute('UPDATE billing SET patient_portion = ?, status = ? WHERE id = ?', (new_portion, new_status, billing_id))
         db.commit()
 
@@ -2021,11 +2036,11 @@ def get_bill_details(bill_id):
                    d.last_name as dentist_last_name,
                    p.first_name as patient_first_name, p.last_name as patient_last_name,
                    p.email as patient_email, p.phone as patient_phone,
-                   COALESCE(
-                       (SELECT SUM(amount) FROM payments WHERE billing_id = b.id), 
-                       0
-                   ) as amount_paid
+                   COALESCE(bl.amount_paid, 0) as amount_paid,
+                   COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share,
+                   COALESCE(bl.outstanding, b.patient_portion) as outstanding
             FROM billing b
+            LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
             LEFT JOIN treatment_history t ON b.reference_number = t.reference_number
             JOIN dental_services s ON b.service_id = s.id
             LEFT JOIN dentists d ON b.dentist_id = d.id
@@ -2039,11 +2054,11 @@ def get_bill_details(bill_id):
                    d.last_name as dentist_last_name,
                    p.first_name as patient_first_name, p.last_name as patient_last_name,
                    p.email as patient_email, p.phone as patient_phone,
-                   COALESCE(
-                       (SELECT SUM(amount) FROM payments WHERE billing_id = b.id), 
-                       0
-                   ) as amount_paid
+                   COALESCE(bl.amount_paid, 0) as amount_paid,
+                   COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share,
+                   COALESCE(bl.outstanding, b.patient_portion) as outstanding
             FROM billing b
+            LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
             LEFT JOIN treatment_history t ON b.reference_number = t.reference_number
             JOIN dental_services s ON b.service_id = s.id
             LEFT JOIN dentists d ON b.dentist_id = d.id
@@ -2063,20 +2078,15 @@ def get_bill_details(bill_id):
     else:
         bill_dict['dentist_name'] = 'Not assigned'
     
+    # The next click is usually "download PDF" or "send to my phone"; render both in the background
+    get_render_cache().prerender(bill_render_fields(bill))
+    
     return jsonify(bill_dict)
 
 @app.route('/api/bill-pdf/<int:bill_id>', methods=['GET'])
 @login_required
 def download_bill_pdf(bill_id):
     """Generate and download a PDF for a specific bill"""
-    from reportlab.lib.pagesizes import letter
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from io import BytesIO
-    import os
-    
     db = get_db()
     
     # Get bill details (same query as above)
@@ -2085,12 +2095,12 @@ def download_bill_pdf(bill_id):
             SELECT b.*, t.diagnosis, t.treatment_notes, t.treatment_date, 
                    s.name as service_name, d.first_name as dentist_first_name, 
                    d.last_name as dentist_last_name, p.first_name as patient_first_name,
-                   p.last_name as patient_last_name, p.phone, p.email,
-                   COALESCE(
-                       (SELECT SUM(amount) FROM payments WHERE billing_id = b.id), 
-                       0
-                   ) as amount_paid
+                   p.last_name as patient_last_name, p.phone as patient_phone, p.email as patient_email,
+                   COALESCE(bl.amount_paid, 0) as amount_paid,
+                   COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share,
+                   COALESCE(bl.outstanding, b.patient_portion) as outstanding
             FROM billing b
+            LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
             LEFT JOIN treatment_history t ON b.reference_number = t.reference_number
             JOIN dental_services s ON b.service_id = s.id
             LEFT JOIN dentists d ON b.dentist_id = d.id
@@ -2102,12 +2112,12 @@ def download_bill_pdf(bill_id):
             SELECT b.*, t.diagnosis, t.treatment_notes, t.treatment_date, 
                    s.name as service_name, d.first_name as dentist_first_name, 
                    d.last_name as dentist_last_name, p.first_name as patient_first_name,
-                   p.last_name as patient_last_name, p.phone, p.email,
-                   COALESCE(
-                       (SELECT SUM(amount) FROM payments WHERE billing_id = b.id), 
-                       0
-                   ) as amount_paid
+                   p.last_name as patient_last_name, p.phone as patient_phone, p.email as patient_email,
+                   COALESCE(bl.amount_paid, 0) as amount_paid,
+                   COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share,
+                   COALESCE(bl.outstanding, b.patient_portion) as outstanding
             FROM billing b
+            LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
             LEFT JOIN treatment_history t ON b.reference_number = t.reference_number
             JOIN dental_services s ON b.service_id = s.id
             LEFT JOIN dentists d ON b.dentist_id = d.id
@@ -2118,133 +2128,15 @@ def download_bill_pdf(bill_id):
     if not bill:
         return jsonify({'error': 'Bill not found'}), 404
     
-    # Create PDF in memory
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
-    
-    # Container for the PDF content
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        textColor=colors.HexColor('#2563eb')
-    )
-    
-    # Title
-    story.append(Paragraph("DENTAL OFFICE BILL", title_style))
-    story.append(Spacer(1, 12))
-    
-    # Bill Information Table
-    bill_data = [
-        ['Bill #:', str(bill['bill_number'])],
-        ['Reference Number:', bill['reference_number'] or 'N/A'],
-        ['Bill Date:', bill['created_at'][:10] if bill['created_at'] else 'N/A'],
-        ['Due Date:', bill['due_date'][:10] if bill['due_date'] else 'N/A'],
-        ['Status:', bill['status'].title() if bill['status'] else 'N/A']
-    ]
-    
-    bill_table = Table(bill_data, colWidths=[2*inch, 3*inch])
-    bill_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(bill_table)
-    story.append(Spacer(1, 20))
-    
-    # Patient Information
-    story.append(Paragraph("Patient Information", styles['Heading2']))
-    patient_data = [
-        ['Name:', f"{bill['patient_first_name']} {bill['patient_last_name']}"],
-        ['Phone:', bill['phone'] or 'N/A'],
-        ['Email:', bill['email'] or 'N/A']
-    ]
-    
-    patient_table = Table(patient_data, colWidths=[2*inch, 3*inch])
-    patient_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(patient_table)
-    story.append(Spacer(1, 20))
-    
-    # Service Information
-    story.append(Paragraph("Service Details", styles['Heading2']))
-    service_data = [
-        ['Service:', bill['service_name'] or 'N/A'],
-        ['Treatment Date:', bill['treatment_date'][:10] if bill['treatment_date'] else 'N/A'],
-        ['Dentist:', f"{bill['dentist_first_name']} {bill['dentist_last_name']}" if bill['dentist_first_name'] else 'N/A'],
-        ['Diagnosis:', bill['diagnosis'] or 'N/A']
-    ]
-    
-    service_table = Table(service_data, colWidths=[2*inch, 3*inch])
-    service_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(service_table)
-    story.append(Spacer(1, 20))
-    
-    # Amount Breakdown
-    story.append(Paragraph("Amount Breakdown", styles['Heading2']))
-    total_amount = float(bill['amount']) if bill['amount'] else 0
-    patient_portion = float(bill['patient_portion']) if bill['patient_portion'] else 0
-    insurance_portion = total_amount - patient_portion
-    amount_paid = float(bill['amount_paid']) if bill['amount_paid'] else 0
-    remaining_balance = patient_portion - amount_paid
-    
-    amount_data = [
-        ['Total Amount:', f"${total_amount:.2f}"],
-        ['Insurance Portion:', f"${insurance_portion:.2f}"],
-        ['Patient Portion:', f"${patient_portion:.2f}"],
-        ['Amount Paid:', f"${amount_paid:.2f}"],
-        ['Remaining Balance:', f"${remaining_balance:.2f}"]
-    ]
-    
-    amount_table = Table(amount_data, colWidths=[2*inch, 3*inch])
-    amount_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(amount_table)
-    
-    # Build PDF
-    doc.build(story)
-    
-    # Return PDF
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'bill_{bill_id}.pdf',
-        mimetype='application/pdf'
-    )
+    # Rendered once per bill content and reused until the bill changes; checked out so
+    # eviction cannot remove it before send_file opens it
+    with get_render_cache().checkout('pdf', bill_render_fields(bill)) as pdf_path:
+        return send_file(
+            pdf_path,
+            as_attachment=True,
+            download_name=f'bill_{bill_id}.pdf',
+            mimetype='application/pdf'
+        )
 
 @app.route('/patient/profile/update', methods=['POST'])
 @login_required
@@ -2262,9 +2154,9 @@ def update_patient_profile():
     address = request.form.get('address')
     try:
         db.execute('''
-            UPDATE patients SET first_name=?, last_name=?, email=?, phone=?, date_of_birth=?, address=?
+            UPDATE patients SET first_name=?, last_name=?, email=?, phone=?, phone_e164=?, date_of_birth=?, address=?
             WHERE id=?
-        ''', (first_name, last_name, email, phone, date_of_birth, address, user_id))
+        ''', (first_name, last_name, email, phone, to_e164(phone), date_of_birth, address, user_id))
         db.commit()
         session['name'] = f"{first_name} {last_name}"
         return jsonify({'success': True, 'message': 'Profile updated successfully'})
@@ -2292,7 +2184,6 @@ def call_popup():
 VERIFIED_PATIENTS = {}
 VERIFIED_PATIENT_DATA = {}  # Maintain backward compatibility
 ACTIVE_MFA_SESSIONS = {}
-CHALLENGE_TOKENS = {}  # New: Store challenge token -> patient data mappings
 LAST_MFA_ID = None
 
 def clear_mfa_session(mfa_id):
@@ -2343,35 +2234,7 @@ def validate_phone(phone):
 
 def format_to_e164(phone, default_country_code='1'):
     """Format phone number to E.164 format"""
-    if not phone:
-        return None
-    
-    # Clean the phone number - remove all non-digit characters except +
-    cleaned = ''.join(char for char in str(phone) if char.isdigit() or char == '+')
-    
-    # If already starts with +, validate and return if valid
-    if cleaned.startswith('+'):
-        if validate_phone(cleaned):
-            return cleaned
-        else:
-            return None
-    
-    # If it's a 10-digit number (US format), add +1
-    if len(cleaned) == 10 and cleaned.isdigit():
-        formatted = f'+{default_country_code}{cleaned}'
-        return formatted if validate_phone(formatted) else None
-    
-    # If it's an 11-digit number starting with 1 (US format with country code)
-    if len(cleaned) == 11 and cleaned.startswith('1'):
-        formatted = f'+{cleaned}'
-        return formatted if validate_phone(formatted) else None
-    
-    # If it's just digits and reasonable length, try adding default country code
-    if cleaned.isdigit() and 7 <= len(cleaned) <= 14:
-        formatted = f'+{default_country_code}{cleaned}'
-        return formatted if validate_phone(formatted) else None
-    
-    return None
+    return to_e164(phone, default_country_code)
 
 def is_valid_uuid(val):
     import uuid
@@ -2382,23 +2245,58 @@ def is_valid_uuid(val):
         return False
 
 def store_challenge_token(challenge_token, patient_data):
-    """Store challenge token with associated patient data"""
-    global CHALLENGE_TOKENS
-    CHALLENGE_TOKENS[challenge_token] = patient_data
-    print(f"[SWAIG][CONSOLE] Stored challenge token {challenge_token[:20]}... for patient {patient_data.get('patient_id', 'Unknown')}")
-    logging.info(f"[SWAIG] Stored challenge token {challenge_token[:20]}... for patient {patient_data.get('patient_id', 'Unknown')}")
+    """Store challenge token with associated patient data (expires after CHALLENGE_TOKEN_TTL seconds)"""
+    get_token_store().issue(challenge_token, patient_data)
+    print(f"[SWAIG][CONSOLE] Stored challenge token {token_hint(challenge_token)} for patient {patient_data.get('patient_id', 'Unknown')}")
+    logging.info(f"[SWAIG] Stored challenge token {token_hint(challenge_token)} for patient {patient_data.get('patient_id', 'Unknown')}")
 
 def get_patient_by_challenge_token(challenge_token):
-    """Get patient data by challenge token"""
-    return CHALLENGE_TOKENS.get(challenge_token)
+    """
+    Get the verified patient data for a challenge token, or None if it is missing, unknown or expired
 
-def is_challenge_token_valid(challenge_token):
-    """Check if challenge token is valid and has associated patient data"""
-    is_valid = challenge_token and challenge_token in CHALLENGE_TOKENS
-    print(f"[SWAIG][CONSOLE] is_challenge_token_valid({challenge_token}): {is_valid}")
-    print(f"[SWAIG][CONSOLE] CHALLENGE_TOKENS keys: {list(CHALLENGE_TOKENS.keys())}")
-    logging.info(f"[SWAIG] is_challenge_token_valid({challenge_token}): {is_valid}")
-    return is_valid
+    Validation and the patient data come from one lookup, so the token cannot expire in between.
+    """
+    patient_data = get_token_store().get(challenge_token)
+    logging.info(f"[SWAIG] get_patient_by_challenge_token({token_hint(challenge_token)}): {patient_data is not None}")
+    return patient_data
+
+@app.route('/debug/challenge-tokens', methods=['GET'])
+@login_required
+def debug_challenge_tokens():
+    """Challenge token counters (issued, validated, expired, ...) and active count; never the tokens themselves"""
+    return jsonify({'success': True, 'stats': get_token_store().stats()})
+
+@app.route('/debug/profiles', methods=['GET'])
+def debug_profiles():
+    """Debug endpoint listing captured request profiles, newest first"""
+    if not request_profiler.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({'success': True, 'profiles': request_profiler.get_profile_store().list()})
+
+@app.route('/debug/profiles/<profile_id>', methods=['GET'])
+def debug_profile(profile_id):
+    """Debug endpoint with one profile's hottest functions and SQL statements"""
+    profile = request_profiler.get_profile_store().get(profile_id)
+    if profile is None or not request_profiler.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({'success': True, 'profile': request_profiler.public(profile)})
+
+@app.route('/debug/profiles/<profile_id>/download', methods=['GET'])
+def debug_profile_download(profile_id):
+    """Debug endpoint returning a profile's raw data (.prof for cProfile, collapsed stacks for sampling)"""
+    profile = request_profiler.get_profile_store().get(profile_id)
+    if profile is None or not request_profiler.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    body, mimetype, filename = request_profiler.download(profile)
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/debug/slow-queries', methods=['GET'])
+def debug_slow_queries():
+    """Debug endpoint listing recent slow SQL statements with their query plans (SQL_DEBUG=true, SQL_DEBUG_TOKEN)"""
+    if not sql_trace.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({'success': True, 'threshold_ms': sql_trace.slow_threshold_ms(),
+                    'queries': sql_trace.get_slow_log().entries()})
 
 @swaig.endpoint(
     "Check Balance",
@@ -2409,17 +2307,16 @@ def is_challenge_token_valid(challenge_token):
     )
 )
 def swaig_check_balance(challenge_token=None, meta_data_token=None, **kwargs):
-    print(f"[SWAIG][CONSOLE] swaig_check_balance called with challenge_token={challenge_token}")
-    logging.info(f"[SWAIG] swaig_check_balance called with challenge_token={challenge_token}")
+    print(f"[SWAIG][CONSOLE] swaig_check_balance called with challenge_token={token_hint(challenge_token)}")
+    logging.info(f"[SWAIG] swaig_check_balance called with challenge_token={token_hint(challenge_token)}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     patient_id = patient_data.get('patient_id')
     
     if not patient_id:
@@ -2434,10 +2331,20 @@ def swaig_check_balance(challenge_token=None, meta_data_token=None, **kwargs):
         logging.warning(f"[SWAIG] Patient not found: {patient_id}")
         return "Patient account not found", {}
     
-    balance = db.execute('SELECT COALESCE(SUM(patient_portion), 0) as total FROM billing WHERE patient_id = ? AND status != "paid"', (patient['id'],)).fetchone()
-    print(f"[SWAIG][CONSOLE] Returning balance for patient {patient_id}: ${balance['total']}")
-    logging.info(f"[SWAIG] Returning balance for patient {patient_id}: ${balance['total']}")
-    return f"Your current outstanding balance is ${balance['total']:.2f}", {'balance': balance['total'], 'patient_id': patient_id}
+    balance = patient_balance(db, patient['id'])
+    print(f"[SWAIG][CONSOLE] Returning balance for patient {patient_id}: ${balance['outstanding']}")
+    logging.info(f"[SWAIG] Returning balance for patient {patient_id}: ${balance['outstanding']}")
+    message = f"Your current outstanding balance is ${balance['outstanding']:.2f}"
+    if balance['overdue']:
+        message += f", of which ${balance['overdue_amount']:.2f} is past due"
+    return message, {
+        'balance': balance['outstanding'],
+        'patient_id': patient_id,
+        'open_bills': balance['open_bills'],
+        'next_due_date': balance['next_due_date'],
+        'overdue': balance['overdue'],
+        'overdue_amount': balance['overdue_amount']
+    }
 
 @swaig.endpoint(
     "Get Bills",
@@ -2490,13 +2397,12 @@ def swaig_get_bills(challenge_token=None, service_name=None, status=None, amount
     logging.info(f"[SWAIG] swaig_get_bills called{filter_text}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     print(f"[SWAIG][CONSOLE] Retrieved patient_data: {patient_data}")
     patient_id = patient_data.get('patient_id')
     
@@ -2524,11 +2430,15 @@ def swaig_get_bills(challenge_token=None, service_name=None, status=None, amount
                    ELSE 'Dr. ' || d.first_name || ' ' || d.last_name
                END as dentist_name,
                th.diagnosis, th.treatment_notes, th.treatment_date,
-               (b.amount - COALESCE(b.insurance_coverage, 0)) as calculated_patient_portion
+               COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as calculated_patient_portion,
+               COALESCE(bl.amount_paid, 0) as total_paid,
+               COALESCE(bl.outstanding, b.patient_portion) as outstanding,
+               COALESCE(bl.payment_count, 0) as payment_count
         FROM billing b
         JOIN dental_services s ON b.service_id = s.id
         LEFT JOIN dentists d ON b.dentist_id = d.id
         LEFT JOIN treatment_history th ON b.reference_number = th.reference_number
+        LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
         WHERE b.patient_id = ?
     '''
     
@@ -2548,7 +2458,7 @@ def swaig_get_bills(challenge_token=None, service_name=None, status=None, amount
             if status_lower == 'paid':
                 conditions.append("b.status = 'paid'")
             elif status_lower == 'overdue':
-                conditions.append("b.due_date < date('now') AND b.status != 'paid'")
+                conditions.append("b.due_date < date('now') AND bl.outstanding > 0")
             elif status_lower == 'pending':
                 conditions.append("(b.status = 'pending' OR (b.status != 'paid' AND b.status != 'partial' AND b.due_date >= date('now')))")
             elif status_lower == 'partial':
@@ -2594,32 +2504,33 @@ def swaig_get_bills(challenge_token=None, service_name=None, status=None, amount
         print(f"[SWAIG][DEBUG] Bill ID: {bill['id']}, Patient ID: {bill['patient_id']}, Bill #: {bill['bill_number']}")
     logging.info(f"[SWAIG][DEBUG] Raw bills returned: {len(bills)}")
     
-    # Get payment history for each bill
+    # Totals come from the billing ledger; payment history for all bills in one query
+    history = {}
+    if bills:
+        placeholders = ', '.join('?' * len(bills))
+        for payment in db.execute(f'''
+            SELECT billing_id, payment_date, amount, payment_method_type, transaction_id
+            FROM payments
+            WHERE billing_id IN ({placeholders}) AND status = 'completed'
+            ORDER BY payment_date DESC
+        ''', [bill['id'] for bill in bills]).fetchall():
+            payment = dict(payment)
+            history.setdefault(payment.pop('billing_id'), []).append(payment)
+    
     enhanced_bills = []
     for bill in bills:
         bill_dict = dict(bill)
-        
-        # Get payment history for this bill
-        payments = db.execute('''
-            SELECT payment_date, amount, payment_method_type, transaction_id
-            FROM payments
-            WHERE billing_id = ?
-            ORDER BY payment_date DESC
-        ''', (bill['id'],)).fetchall()
-        
-        # Calculate payment totals and remaining balance
-        total_paid = sum(float(p['amount']) for p in payments) if payments else 0
-        patient_portion = float(bill['patient_portion']) if bill['patient_portion'] else float(bill['calculated_patient_portion'])
-        remaining_balance = max(0, patient_portion - total_paid)
+        total_paid = float(bill['total_paid'])
+        remaining_balance = max(0, float(bill['outstanding'] or 0))
         
         # Add enhanced information to bill
         bill_dict.update({
-            'payment_history': [dict(p) for p in payments],
+            'payment_history': history.get(bill['id'], []),
             'total_paid': total_paid,
             'remaining_balance': remaining_balance,
-            'payment_count': len(payments),
             'is_fully_paid': remaining_balance == 0,
-            'patient_portion_calculated': patient_portion
+            'overdue': is_overdue(bill['due_date'], remaining_balance),
+            'patient_portion_calculated': float(bill['calculated_patient_portion'] or 0)
         })
         
         enhanced_bills.append(bill_dict)
@@ -2707,6 +2618,45 @@ def swaig_get_bills(challenge_token=None, service_name=None, status=None, amount
             
         return no_results_msg, {'bills': [], 'patient_id': patient_id, 'filters_applied': filter_desc}
 
+def find_swaig_slot(db, dentist_id, date, time_slot, exclude_id=None):
+    """
+    Pick the first free 30-minute slot for a dentist inside a voice time_slot window
+
+    Returns:
+        tuple: ((start_time, end_time), None) on success, or (None, message) where
+            the message offers the earliest openings with any dentist that week
+    """
+    try:
+        datetime.strptime(date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None, "Invalid date. Please use the format YYYY-MM-DD."
+    
+    cache = get_slot_cache()
+    window = tuple(to_minutes(value) for value in TIME_SLOT_WINDOWS[time_slot])
+    free = cache.available_slots(db, dentist_id, date, window, exclude_id) or []
+    now = datetime.now()
+    free = [slot for slot in free if datetime.strptime(f"{date} {slot}", '%Y-%m-%d %H:%M') >= now]
+    if free:
+        start = datetime.strptime(f"{date} {free[0]}", '%Y-%m-%d %H:%M')
+        end = start + timedelta(minutes=SLOT_MINUTES)
+        return (start.strftime('%Y-%m-%dT%H:%M:%S'), end.strftime('%Y-%m-%dT%H:%M:%S')), None
+    
+    # Nothing free in that window: offer the earliest openings with any dentist over the next week
+    dentists = db.execute('SELECT id, first_name, last_name FROM dentists ORDER BY id').fetchall()
+    names = {row['id']: f"Dr. {row['first_name']} {row['last_name']}" for row in dentists}
+    openings = cache.first_available(db, list(names), date, days=7, window=window, limit=3,
+                                     not_before=now, exclude_id=exclude_id)
+    print(f"[SWAIG][CONSOLE] No {time_slot} opening for dentist {dentist_id} on {date}; alternatives: {openings}")
+    logging.info(f"[SWAIG] No {time_slot} opening for dentist {dentist_id} on {date}; alternatives: {openings}")
+    if not openings:
+        return None, f"There are no {time_slot.replace('_', ' ')} openings on {date} or in the following week. Please try a different time slot."
+    offers = [
+        f"{datetime.strptime(opening['date'], '%Y-%m-%d').strftime('%A, %B %d')} at "
+        f"{datetime.strptime(opening['time'], '%H:%M').strftime('%I:%M %p').lstrip('0')} with {names[opening['dentist_id']]}"
+        for opening in openings
+    ]
+    return None, f"That time slot is fully booked on {date}. The earliest openings are: {'; '.join(offers)}."
+
 @swaig.endpoint(
     "Schedule Appointment",
     dentist_id=SWAIGArgument(
@@ -2741,13 +2691,12 @@ def swaig_schedule_appointment(dentist_id=None, service_id=None, date=None, time
     logging.info(f"[SWAIG] swaig_schedule_appointment called with dentist_id={dentist_id}, service_id={service_id}, date={date}, time_slot={time_slot}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     patient_id = patient_data.get('patient_id')
     
     if not patient_id:
@@ -2829,30 +2778,24 @@ def swaig_schedule_appointment(dentist_id=None, service_id=None, date=None, time
     dentist_id = resolved_dentist_id
     service_id = resolved_service_id
     
-    # Convert time slot to actual times
-    if time_slot == 'morning':
-        start_time = f"{date}T08:00:00"
-        end_time = f"{date}T11:00:00"
-    elif time_slot == 'afternoon':
-        start_time = f"{date}T14:00:00"
-        end_time = f"{date}T16:00:00"
-    elif time_slot == 'evening':
-        start_time = f"{date}T18:00:00"
-        end_time = f"{date}T20:00:00"
-    elif time_slot == 'all_day':
-        start_time = f"{date}T08:00:00"
-        end_time = f"{date}T20:00:00"
-    else:
+    if time_slot not in TIME_SLOT_WINDOWS:
         print(f"[SWAIG][CONSOLE] Invalid time slot: {time_slot}")
         logging.warning(f"[SWAIG] Invalid time slot: {time_slot}")
         return "Invalid time slot", {}
     
+    # Book the first free 30-minute slot in the requested window
+    slot, unavailable_message = find_swaig_slot(db, dentist_id, date, time_slot)
+    if not slot:
+        return unavailable_message, {}
+    start_time, end_time = slot
+    
     try:
-        db.execute('''
+        cursor = db.execute('''
             INSERT INTO appointments (patient_id, dentist_id, service_id, type, status, start_time, end_time, notes, sms_reminder)
             VALUES (?, ?, ?, ?, 'scheduled', ?, ?, '', 1)
         ''', (patient['id'], dentist_id, service_id, 'checkup', start_time, end_time))
         db.commit()
+        get_slot_cache().record(dentist_id, cursor.lastrowid, start_time, end_time)
         
         # Send SMS confirmation
         try:
@@ -2888,7 +2831,8 @@ def swaig_schedule_appointment(dentist_id=None, service_id=None, date=None, time
         
         print(f"[SWAIG][CONSOLE] Appointment scheduled for patient {patient_id} with dentist {dentist_id} on {date} ({time_slot})")
         logging.info(f"[SWAIG] Appointment scheduled for patient {patient_id} with dentist {dentist_id} on {date} ({time_slot})")
-        return f"Appointment scheduled successfully for {date} in the {time_slot} time slot", {'patient_id': patient_id, 'date': date, 'time_slot': time_slot}
+        appt_time = datetime.fromisoformat(start_time).strftime('%I:%M %p').lstrip('0')
+        return f"Appointment scheduled successfully for {date} at {appt_time} in the {time_slot} time slot", {'patient_id': patient_id, 'date': date, 'time_slot': time_slot, 'start_time': start_time}
     except Exception as e:
         print(f"[SWAIG][CONSOLE] Failed to schedule appointment: {e}")
         logging.error(f"[SWAIG] Failed to schedule appointment: {e}")
@@ -2924,13 +2868,12 @@ def swaig_reschedule_appointment(appointment_id=None, date=None, time_slot=None,
     logging.info(f"[SWAIG] swaig_reschedule_appointment called with appointment_id={appointment_id}, date={date}, time_slot={time_slot}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     patient_id = patient_data.get('patient_id')
     
     if not patient_id:
@@ -2965,27 +2908,21 @@ def swaig_reschedule_appointment(appointment_id=None, date=None, time_slot=None,
         logging.warning(f"[SWAIG] Cannot reschedule cancelled appointment: {appointment_id}")
         return "Cannot reschedule a cancelled appointment. Please schedule a new appointment instead.", {}
     
-    # Convert time slot to actual times
-    if time_slot == 'morning':
-        start_time = f"{date}T08:00:00"
-        end_time = f"{date}T11:00:00"
-    elif time_slot == 'afternoon':
-        start_time = f"{date}T14:00:00"
-        end_time = f"{date}T16:00:00"
-    elif time_slot == 'evening':
-        start_time = f"{date}T18:00:00"
-        end_time = f"{date}T20:00:00"
-    elif time_slot == 'all_day':
-        start_time = f"{date}T08:00:00"
-        end_time = f"{date}T20:00:00"
-    else:
+    if time_slot not in TIME_SLOT_WINDOWS:
         print(f"[SWAIG][CONSOLE] Invalid time slot: {time_slot}")
         logging.warning(f"[SWAIG] Invalid time slot: {time_slot}")
         return "Invalid time slot", {}
     
+    # Move to the first free 30-minute slot in the requested window (the appointment's own slot counts as free)
+    slot, unavailable_message = find_swaig_slot(db, appt['dentist_id'], date, time_slot, exclude_id=appt['id'])
+    if not slot:
+        return unavailable_message, {}
+    start_time, end_time = slot
+    
     try:
         db.execute('UPDATE appointments SET start_time = ?, end_time = ? WHERE id = ?', (start_time, end_time, appointment_id))
         db.commit()
+        get_slot_cache().record(appt['dentist_id'], appt['id'], start_time, end_time, appt['status'])
         
         # Send SMS confirmation for rescheduled appointment
         try:
@@ -3027,7 +2964,8 @@ def swaig_reschedule_appointment(appointment_id=None, date=None, time_slot=None,
         
         print(f"[SWAIG][CONSOLE] Appointment {appointment_id} rescheduled to {date} ({time_slot}) for patient {patient_id}")
         logging.info(f"[SWAIG] Appointment {appointment_id} rescheduled to {date} ({time_slot}) for patient {patient_id}")
-        return f"Appointment rescheduled successfully to {date} in the {time_slot} time slot", {'patient_id': patient_id, 'appointment_id': appointment_id, 'date': date, 'time_slot': time_slot}
+        appt_time = datetime.fromisoformat(start_time).strftime('%I:%M %p').lstrip('0')
+        return f"Appointment rescheduled successfully to {date} at {appt_time} in the {time_slot} time slot", {'patient_id': patient_id, 'appointment_id': appointment_id, 'date': date, 'time_slot': time_slot}
     except Exception as e:
         print(f"[SWAIG][CONSOLE] Failed to reschedule appointment: {e}")
         logging.error(f"[SWAIG] Failed to reschedule appointment: {e}")
@@ -3052,13 +2990,12 @@ def swaig_cancel_appointment(appointment_id=None, challenge_token=None, meta_dat
     logging.info(f"[SWAIG] swaig_cancel_appointment called with appointment_id={appointment_id}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     patient_id = patient_data.get('patient_id')
     
     if not patient_id:
@@ -3096,6 +3033,7 @@ def swaig_cancel_appointment(appointment_id=None, challenge_token=None, meta_dat
     try:
         db.execute('UPDATE appointments SET status = ? WHERE id = ?', ('cancelled', appointment_id))
         db.commit()
+        get_slot_cache().forget(appointment_id)
         
         # Send SMS confirmation for cancelled appointment
         try:
@@ -3144,6 +3082,81 @@ def swaig_cancel_appointment(appointment_id=None, challenge_token=None, meta_dat
         db.rollback()
         return f"Failed to cancel appointment: {str(e)}", {}
 
+@swaig.endpoint(
+    "Find First Available Appointment",
+    dentist_id=SWAIGArgument(
+        type="string",
+        description="Dentist ID (leave empty to search all dentists)",
+        required=False
+    ),
+    date=SWAIGArgument(
+        type="string",
+        description="First date to search (YYYY-MM-DD), defaults to today",
+        required=False
+    ),
+    days=SWAIGArgument(
+        type="integer",
+        description="Number of days to search, defaults to 7",
+        required=False
+    ),
+    time_slot=SWAIGArgument(
+        type="string",
+        description="Time slot",
+        enum=["morning", "afternoon", "evening", "all_day"],
+        required=False
+    ),
+    challenge_token=SWAIGArgument(
+        type="string",
+        description="Challenge token",
+        required=True
+    )
+)
+def swaig_find_first_available(dentist_id=None, date=None, days=None, time_slot=None, challenge_token=None, meta_data_token=None, **kwargs):
+    print(f"[SWAIG][CONSOLE] swaig_find_first_available called with dentist_id={dentist_id}, date={date}, days={days}, time_slot={time_slot}")
+    logging.info(f"[SWAIG] swaig_find_first_available called with dentist_id={dentist_id}, date={date}, days={days}, time_slot={time_slot}")
+    
+    # Check if user is authenticated via challenge token
+    if get_patient_by_challenge_token(challenge_token) is None:
+        print("[SWAIG][CONSOLE] Invalid or missing challenge token")
+        logging.warning("[SWAIG] Invalid or missing challenge token")
+        return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
+    
+    time_slot = time_slot or 'all_day'
+    if time_slot not in TIME_SLOT_WINDOWS:
+        return "Invalid time slot", {}
+    date = date or datetime.now().strftime('%Y-%m-%d')
+    try:
+        datetime.strptime(date, '%Y-%m-%d')
+        days = max(1, min(int(days or 7), 30))
+    except (TypeError, ValueError):
+        return "Invalid date. Please use the format YYYY-MM-DD.", {}
+    
+    db = get_db()
+    dentists = db.execute('SELECT id, first_name, last_name FROM dentists ORDER BY id').fetchall()
+    names = {row['id']: f"Dr. {row['first_name']} {row['last_name']}" for row in dentists}
+    dentist_ids = list(names)
+    if dentist_id and str(dentist_id).isdigit():
+        if int(dentist_id) not in names:
+            return f"Dentist ID {dentist_id} not found", {}
+        dentist_ids = [int(dentist_id)]
+    
+    window = tuple(to_minutes(value) for value in TIME_SLOT_WINDOWS[time_slot])
+    openings = get_slot_cache().first_available(db, dentist_ids, date, days=days, window=window, limit=5,
+                                                not_before=datetime.now())
+    if not openings:
+        return f"There are no {time_slot.replace('_', ' ')} openings in the {days} days starting {date}.", {'openings': []}
+    
+    lines = []
+    for opening in openings:
+        opening['dentist_name'] = names[opening['dentist_id']]
+        day_name = datetime.strptime(opening['date'], '%Y-%m-%d').strftime('%A, %B %d')
+        slot_time = datetime.strptime(opening['time'], '%H:%M').strftime('%I:%M %p').lstrip('0')
+        lines.append(f"- {day_name} at {slot_time} with {opening['dentist_name']} (Dentist ID: {opening['dentist_id']})")
+    
+    print(f"[SWAIG][CONSOLE] Found {len(openings)} openings starting {date}")
+    logging.info(f"[SWAIG] Found {len(openings)} openings starting {date}")
+    return "The earliest available appointments are:\n" + "\n".join(lines), {'openings': openings}
+
 @swaig.endpoint(
     "Make Payment (Full or Partial)",
     bill_id=SWAIGArgument(
@@ -3172,7 +3185,8 @@ def swaig_make_payment(bill_id=None, amount=None, payment_method_id=None, challe
     logging.info(f"[SWAIG] swaig_make_payment called with bill_id={bill_id}, amount={amount}, payment_method_id={payment_method_id}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
@@ -3189,8 +3203,6 @@ def swaig_make_payment(bill_id=None, amount=None, payment_method_id=None, challe
         logging.warning(f"[SWAIG] Invalid payment amount: {amount}")
         return "Invalid payment amount. Please enter a valid dollar amount.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     patient_id = patient_data.get('patient_id')
     
     if not patient_id:
@@ -3288,9 +3300,8 @@ def swaig_make_payment(bill_id=None, amount=None, payment_method_id=None, challe
             INSERT INTO payments (billing_id, patient_id, amount, payment_date, payment_method_id, payment_method_type, status, transaction_id, notes)
             VALUES (?, ?, ?, datetime('now'), ?, ?, 'completed', ?, ?)
         ''', (actual_bill_id, patient['patient_id'], amount, payment_method_id, payment_method_type, payment_reference, ''))
-        db.commit()
-        
-        # Update billing record
+
+        # Update billing record in the same transaction (the billing ledger follows both)
         db.execute('UPDATE billing SET patient_portion = ?, status = ? WHERE id = ?', (new_portion, new_status, actual_bill_id))
         db.commit()
         
@@ -3460,7 +3471,7 @@ def send_mfa_code(to_number=None, patient_id=None, first_name=None, last_name=No
             if not found_patient_data:
                 caller_phone = format_to_e164(caller_id)
                 if caller_phone:
-                    caller_patient = db.execute('SELECT * FROM patients WHERE phone = ?', (caller_phone,)).fetchone()
+                    caller_patient = db.execute('SELECT * FROM patients WHERE phone_e164 = ?', (caller_phone,)).fetchone()
                     if caller_patient:
                         found_patient_data = dict(caller_patient)
                         print(f"[SWAIG][CONSOLE] Found patient by caller ID: {found_patient_data.get('first_name')} {found_patient_data.get('last_name')}")
@@ -3585,7 +3596,7 @@ def verify_mfa_code(token=None, meta_data=None, **kwargs):
                         caller_phone = format_to_e164(meta_data['caller_id'])
                         if caller_phone:
                             db = get_db()
-                            patient_record = db.execute('SELECT * FROM patients WHERE phone = ?', (caller_phone,)).fetchone()
+                            patient_record = db.execute('SELECT * FROM patients WHERE phone_e164 = ?', (caller_phone,)).fetchone()
                             if patient_record:
                                 patient_data = dict(patient_record)
                                 print(f"[SWAIG][CONSOLE] Found patient by caller_id from meta_data: {patient_data.get('patient_id')}")
@@ -3612,10 +3623,8 @@ def verify_mfa_code(token=None, meta_data=None, **kwargs):
                 # Store the challenge token with patient data for protected functions
                 store_challenge_token(challenge_token, patient_data)
                 
-                print(f"[SWAIG][CONSOLE] Generated challenge token: {challenge_token}")
-                print(f"[SWAIG][CONSOLE] AI should use this challenge token for subsequent calls: {challenge_token}")
-                logging.info(f"[SWAIG] Generated challenge token for patient {patient_data.get('patient_id')}")
-                logging.info(f"[SWAIG] AI should use challenge token {challenge_token} for subsequent calls")
+                print(f"[SWAIG][CONSOLE] Generated challenge token {token_hint(challenge_token)}")
+                logging.info(f"[SWAIG] Generated challenge token {token_hint(challenge_token)} for patient {patient_data.get('patient_id')}")
                 
                 return f"MFA verified successfully for patient {patient_data.get('patient_id', 'Unknown')} ({patient_data.get('first_name', '')} {patient_data.get('last_name', '')}). You can now access your account. Use challenge token {challenge_token} for subsequent requests.", {
                     "mfa_id": LAST_MFA_ID, 
@@ -3758,6 +3767,9 @@ def api_get_patient(patient_id):
                 if field in data:
                     update_fields.append(f"{field} = ?")
                     params.append(data[field])
+            if 'phone' in data:
+                update_fields.append("phone_e164 = ?")
+                params.append(to_e164(data['phone']))
             
             if not update_fields:
                 return jsonify({'success': False, 'message': 'No valid fields to update'}), 400
@@ -3902,17 +3914,16 @@ def api_create_treatment():
     )
 )
 def swaig_get_appointments(challenge_token=None, service_type=None, meta_data_token=None, **kwargs):
-    print(f"[SWAIG][CONSOLE] swaig_get_appointments called with challenge_token={challenge_token}, service_type={service_type}")
-    logging.info(f"[SWAIG] swaig_get_appointments called with challenge_token={challenge_token}, service_type={service_type}")
+    print(f"[SWAIG][CONSOLE] swaig_get_appointments called with challenge_token={token_hint(challenge_token)}, service_type={service_type}")
+    logging.info(f"[SWAIG] swaig_get_appointments called with challenge_token={token_hint(challenge_token)}, service_type={service_type}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     patient_id = patient_data.get('patient_id')
     
     if not patient_id:
@@ -4130,17 +4141,16 @@ def swaig_get_appointments(challenge_token=None, service_type=None, meta_data_to
     )
 )
 def swaig_get_payment_methods(challenge_token=None, meta_data_token=None, **kwargs):
-    print(f"[SWAIG][CONSOLE] swaig_get_payment_methods called with challenge_token={challenge_token}")
-    logging.info(f"[SWAIG] swaig_get_payment_methods called with challenge_token={challenge_token}")
+    print(f"[SWAIG][CONSOLE] swaig_get_payment_methods called with challenge_token={token_hint(challenge_token)}")
+    logging.info(f"[SWAIG] swaig_get_payment_methods called with challenge_token={token_hint(challenge_token)}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     patient_id = patient_data.get('patient_id')
     
     if not patient_id:
@@ -4206,13 +4216,12 @@ def swaig_get_appointment_details(appointment_id=None, challenge_token=None, met
     logging.info(f"[SWAIG] swaig_get_appointment_details called with appointment_id={appointment_id}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     patient_id = patient_data.get('patient_id')
     
     if not patient_id:
@@ -4329,13 +4338,12 @@ def swaig_get_bill_details(bill_id=None, challenge_token=None, meta_data_token=N
     logging.info(f"[SWAIG] swaig_get_bill_details called with bill_id={bill_id}")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     print(f"[SWAIG][CONSOLE] Retrieved patient_data: {patient_data}")
     patient_id = patient_data.get('patient_id')
     
@@ -4450,20 +4458,20 @@ def swaig_get_bill_details(bill_id=None, challenge_token=None, meta_data_token=N
         except:
             created_date_str = bill['created_at']
     
-    # Calculate patient portion (amount minus insurance coverage)
-    patient_portion = float(bill['amount']) - float(bill['insurance_coverage'] or 0)
+    # Patient portion (amount minus insurance coverage), amount paid and balance from the billing ledger
+    ledger = bill_balance(db, bill['id']) or {}
+    patient_portion = ledger.get('patient_share', float(bill['amount']) - float(bill['insurance_coverage'] or 0))
+    total_paid = ledger.get('amount_paid', 0.0)
+    remaining_balance = max(0, ledger.get('outstanding', float(bill['patient_portion'] or 0)))
     
     # Get payment history for this bill
     payments = db.execute('''
         SELECT payment_date, amount, payment_method_type
         FROM payments
-        WHERE billing_id = ?
+        WHERE billing_id = ? AND status = 'completed'
         ORDER BY payment_date DESC
     ''', (bill['id'],)).fetchall()
     
-    total_paid = sum(float(p['amount']) for p in payments)
-    remaining_balance = max(0, patient_portion - total_paid)
-    
     # Create detailed response
     details = f"Bill Verified - Reference #{bill['reference_number']}:\n"
     details += f"Bill #: {bill['bill_number'] if 'bill_number' in bill else bill['id']}\n"
@@ -4476,6 +4484,8 @@ def swaig_get_bill_details(bill_id=None, challenge_token=None, meta_data_token=N
     details += f"\nRemaining Balance: ${remaining_balance:.2f}"
     details += f"\nStatus: {bill['status'].title()}"
     details += f"\nDue Date: {due_date_str}"
+    if ledger.get('overdue'):
+        details += " (past due)"
     details += f"\nBill Date: {created_date_str}"
     
     if bill['dentist_name']:
@@ -4498,6 +4508,7 @@ def swaig_get_bill_details(bill_id=None, challenge_token=None, meta_data_token=N
         'formatted_created_date': created_date_str,
         'total_paid': total_paid,
         'remaining_balance': remaining_balance,
+        'overdue': ledger.get('overdue', False),
         'payments': [dict(p) for p in payments]
     }
 
@@ -4554,13 +4565,12 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
     logging.info(f"[SWAIG] swaig_verify_bill_reference called with multiple search criteria")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    patient_data = get_patient_by_challenge_token(challenge_token)
+    if patient_data is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
     
-    # Get verified patient data using challenge token
-    patient_data = get_patient_by_challenge_token(challenge_token)
     patient_id = patient_data.get('patient_id')
     
     if not patient_id:
@@ -4590,15 +4600,18 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
                    WHEN d.first_name LIKE 'Dr.%' THEN d.first_name || ' ' || d.last_name
                    ELSE 'Dr. ' || d.first_name || ' ' || d.last_name
                END as dentist_name,
-               (b.amount - COALESCE(b.insurance_coverage, 0)) as patient_portion,
+               COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share,
+               COALESCE(bl.amount_paid, 0) as amount_paid,
+               COALESCE(bl.outstanding, b.patient_portion) as outstanding,
                CASE 
-                   WHEN b.status = 'paid' THEN 'Paid'
-                   WHEN b.due_date < date('now') AND b.status != 'paid' THEN 'Overdue'
+                   WHEN b.status = 'paid' OR COALESCE(bl.outstanding, b.patient_portion) <= 0 THEN 'Paid'
+                   WHEN b.due_date < date('now') THEN 'Overdue'
                    ELSE 'Pending'
                END as display_status
         FROM billing b
         JOIN dental_services s ON b.service_id = s.id
         LEFT JOIN dentists d ON b.dentist_id = d.id
+        LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
         WHERE b.patient_id = ?
     '''
     
@@ -4630,7 +4643,7 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
                 conditions.append("b.status = 'paid'")
             elif status_lower == 'overdue':
                 # Overdue: past due date AND not paid
-                conditions.append("b.due_date < date('now') AND b.status != 'paid'")
+                conditions.append("b.due_date < date('now') AND COALESCE(bl.outstanding, b.patient_portion) > 0")
             elif status_lower == 'pending':
                 # Pending: specifically pending status OR (not paid and not overdue)
                 conditions.append("(b.status = 'pending' OR (b.status != 'paid' AND b.status != 'partial' AND b.due_date >= date('now')))")
@@ -4647,17 +4660,18 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
         conditions.append("b.due_date = ?")
         params.append(due_date)
     
-    # Amount search (exact amount or range) - use calculated patient_portion
+    # Amount search (exact amount or range) - bill total or the patient's share from the ledger
+    patient_share_sql = "COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0))"
     if amount is not None:
-        conditions.append("(b.amount = ? OR (b.amount - COALESCE(b.insurance_coverage, 0)) = ?)")
+        conditions.append(f"(b.amount = ? OR {patient_share_sql} = ?)")
         params.extend([amount, amount])
     
     if amount_min is not None:
-        conditions.append("(b.amount >= ? OR (b.amount - COALESCE(b.insurance_coverage, 0)) >= ?)")
+        conditions.append(f"(b.amount >= ? OR {patient_share_sql} >= ?)")
         params.extend([amount_min, amount_min])
     
     if amount_max is not None:
-        conditions.append("(b.amount <= ? OR (b.amount - COALESCE(b.insurance_coverage, 0)) <= ?)")
+        conditions.append(f"(b.amount <= ? OR {patient_share_sql} <= ?)")
         params.extend([amount_max, amount_max])
     
     # Add conditions to query
@@ -4689,10 +4703,11 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
         # Get all bills for suggestions if no matches found
         all_bills = db.execute('''
             SELECT b.reference_number, s.name as service_name, b.amount, 
-                   (b.amount - COALESCE(b.insurance_coverage, 0)) as patient_portion, 
+                   COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share, 
                    b.status, b.due_date
             FROM billing b
             JOIN dental_services s ON b.service_id = s.id
+            LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
             WHERE b.patient_id = ?
             ORDER BY b.created_at DESC
         ''', (patient_internal_id,)).fetchall()
@@ -4702,8 +4717,8 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
             suggestion_text += f"Your available bills are:\n"
             for bill in all_bills[:5]:  # Show up to 5 bills
                 due_date_display = bill['due_date'] or "N/A"
-                patient_portion = float(bill['patient_portion'])
-                suggestion_text += f"- {bill['service_name']}: ${patient_portion:.2f} ({bill['status']}, due {due_date_display}) - Ref: {bill['reference_number']}\n"
+                patient_share = float(bill['patient_share'])
+                suggestion_text += f"- {bill['service_name']}: ${patient_share:.2f} ({bill['status']}, due {due_date_display}) - Ref: {bill['reference_number']}\n"
             if len(all_bills) > 5:
                 suggestion_text += f"... and {len(all_bills) - 5} more bills\n"
         else:
@@ -4743,10 +4758,9 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
                 except:
                     due_date_display = bill['due_date']
             
-            amount = float(bill['patient_portion'])
+            amount = float(bill['patient_share'])
             total_amount += amount
-            if bill['display_status'] != 'Paid':
-                pending_amount += amount
+            pending_amount += max(0, float(bill['outstanding']))
             
             bills_summary += f"\n{i}. Bill #{bill['id']} - {bill['service_name']}\n"
             bills_summary += f"   Date: {created_date} | Due: {due_date_display}"
@@ -4808,7 +4822,7 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
         except:
             created_date_str = bill['created_at']
     
-    # Get payment history for this bill
+    # Get payment history for this bill (totals come from the ledger, which counts completed payments)
     payments = db.execute('''
         SELECT payment_date, amount, payment_method_type
         FROM payments
@@ -4816,8 +4830,8 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
         ORDER BY payment_date DESC
     ''', (bill['id'],)).fetchall()
     
-    total_paid = sum(float(p['amount']) for p in payments)
-    remaining_balance = max(0, float(bill['patient_portion']))
+    total_paid = float(bill['amount_paid'])
+    remaining_balance = max(0, float(bill['outstanding']))
     
     # Create detailed response
     details = f"Bill Verified - Reference #{bill['reference_number']}:\n"
@@ -4826,7 +4840,7 @@ def swaig_verify_bill_reference(reference_number=None, service_name=None, status
     if bill['service_description']:
         details += f" - {bill['service_description']}"
     details += f"\nTotal Amount: ${float(bill['amount']):.2f}"
-    details += f"\nPatient Portion: ${float(bill['patient_portion']):.2f}"
+    details += f"\nPatient Portion: ${float(bill['patient_share']):.2f}"
     details += f"\nRemaining Balance: ${remaining_balance:.2f}"
     details += f"\nStatus: {bill['display_status']}"
     details += f"\nDue Date: {due_date_str}"
@@ -4881,11 +4895,11 @@ def send_bill_sms():
         bill = db.execute('''
             SELECT b.*, s.name as service_name, p.phone,
                    p.first_name as patient_first_name, p.last_name as patient_last_name,
-                   COALESCE(
-                       (SELECT SUM(amount) FROM payments WHERE billing_id = b.id), 
-                       0
-                   ) as amount_paid
+                   COALESCE(bl.amount_paid, 0) as amount_paid,
+                   COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share,
+                   COALESCE(bl.outstanding, b.patient_portion) as outstanding
             FROM billing b
+            LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
             JOIN dental_services s ON b.service_id = s.id
             JOIN patients p ON b.patient_id = p.id
             WHERE b.id = ? AND b.patient_id = ?
@@ -4894,11 +4908,11 @@ def send_bill_sms():
         bill = db.execute('''
             SELECT b.*, s.name as service_name, p.phone,
                    p.first_name as patient_first_name, p.last_name as patient_last_name,
-                   COALESCE(
-                       (SELECT SUM(amount) FROM payments WHERE billing_id = b.id), 
-                       0
-                   ) as amount_paid
+                   COALESCE(bl.amount_paid, 0) as amount_paid,
+                   COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share,
+                   COALESCE(bl.outstanding, b.patient_portion) as outstanding
             FROM billing b
+            LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
             JOIN dental_services s ON b.service_id = s.id
             JOIN patients p ON b.patient_id = p.id
             WHERE b.id = ? AND b.dentist_id = ?
@@ -4917,14 +4931,14 @@ def send_bill_sms():
     
     # Calculate amounts
     total_amount = float(bill['amount']) if bill['amount'] else 0
-    patient_portion = float(bill['patient_portion']) if bill['patient_portion'] else 0
+    patient_portion = float(bill['patient_share']) if bill['patient_share'] else 0
     amount_paid = float(bill['amount_paid']) if bill['amount_paid'] else 0
-    remaining_balance = patient_portion - amount_paid
+    remaining_balance = float(bill['outstanding']) if bill['outstanding'] else 0
     
     # Create concise SMS message (SMS has 160 char limit, so keep it brief)
     sms_message = f"""🏥 DENTAL OFFICE BILL #{bill['bill_number']}
 📋 Service: {bill['service_name']}
-💰 Amount Due: ${bill['patient_portion']:.2f}
+💰 Amount Due: ${remaining_balance:.2f}
 📅 Due Date: {bill['due_date'][:10] if bill['due_date'] else 'N/A'}
 🏥 Reference: {bill['reference_number'] or 'N/A'}
 
@@ -4932,11 +4946,8 @@ def send_bill_sms():
 Thank you for choosing our dental practice!"""
     
     try:
-        # Use existing SMS infrastructure
-        import requests
-        
-        # Use SignalWire SMS API
-        response = requests.post(
+        # Use SignalWire SMS API through the pooled client
+        response = http_client.post(
             f"{SIGNALWIRE_SPACE}/api/laml/2010-04-01/Accounts/{SIGNALWIRE_PROJECT_ID}/Messages",
             auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_AUTH_TOKEN),
             data={
@@ -4975,15 +4986,15 @@ def send_bill_mms():
     # Get bill details and patient phone
     if session['user_type'] == 'patient':
         bill = db.execute('''
-            SELECT b.*, s.name as service_name, p.phone,
+            SELECT b.*, s.name as service_name, p.phone as patient_phone,
                    p.first_name as patient_first_name, p.last_name as patient_last_name,
                    d.first_name as dentist_first_name, d.last_name as dentist_last_name,
                    t.diagnosis, t.treatment_notes, t.treatment_date,
-                   COALESCE(
-                       (SELECT SUM(amount) FROM payments WHERE billing_id = b.id), 
-                       0
-                   ) as amount_paid
+                   COALESCE(bl.amount_paid, 0) as amount_paid,
+                   COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share,
+                   COALESCE(bl.outstanding, b.patient_portion) as outstanding
         FROM billing b
+        LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
         JOIN dental_services s ON b.service_id = s.id
             JOIN patients p ON b.patient_id = p.id
         LEFT JOIN dentists d ON b.dentist_id = d.id
@@ -4992,15 +5003,15 @@ def send_bill_mms():
         ''', (bill_id, session['user_id'])).fetchone()
     else:
         bill = db.execute('''
-            SELECT b.*, s.name as service_name, p.phone,
+            SELECT b.*, s.name as service_name, p.phone as patient_phone,
                    p.first_name as patient_first_name, p.last_name as patient_last_name,
                    d.first_name as dentist_first_name, d.last_name as dentist_last_name,
                    t.diagnosis, t.treatment_notes, t.treatment_date,
-                   COALESCE(
-                       (SELECT SUM(amount) FROM payments WHERE billing_id = b.id), 
-                       0
-                   ) as amount_paid
+                   COALESCE(bl.amount_paid, 0) as amount_paid,
+                   COALESCE(bl.patient_share, b.amount - COALESCE(b.insurance_coverage, 0)) as patient_share,
+                   COALESCE(bl.outstanding, b.patient_portion) as outstanding
             FROM billing b
+            LEFT JOIN bill_ledger bl ON bl.billing_id = b.id
             JOIN dental_services s ON b.service_id = s.id
             JOIN patients p ON b.patient_id = p.id
             LEFT JOIN dentists d ON b.dentist_id = d.id
@@ -5011,138 +5022,40 @@ def send_bill_mms():
     if not bill:
         return jsonify({'error': 'Bill not found'}), 404
     
-    if not bill['phone']:
+    if not bill['patient_phone']:
         return jsonify({'error': 'No phone number found for patient'}), 400
     
     # Format phone number to E.164 format
-    patient_phone = format_to_e164(bill['phone'])
+    patient_phone = format_to_e164(bill['patient_phone'])
     if not patient_phone:
         return jsonify({'error': 'Invalid phone number format'}), 400
     
     try:
-        # Generate JPG image of the bill
-        from PIL import Image, ImageDraw, ImageFont
-        from io import BytesIO
-        import base64
-        import tempfile
-        import os
-        
-        # Create image (portrait orientation, good for mobile viewing)
-        img_width = 600
-        img_height = 800
-        img = Image.new('RGB', (img_width, img_height), color='white')
-        draw = ImageDraw.Draw(img)
-        
-        # Try to use better fonts, fallback to default
-        try:
-            title_font = ImageFont.truetype("arial.ttf", 24)
-            header_font = ImageFont.truetype("arial.ttf", 18)
-            normal_font = ImageFont.truetype("arial.ttf", 14)
-            small_font = ImageFont.truetype("arial.ttf", 12)
-        except:
-            # Fallback to default font
-            title_font = ImageFont.load_default()
-            header_font = ImageFont.load_default()
-            normal_font = ImageFont.load_default()
-            small_font = ImageFont.load_default()
-        
-        # Calculate amounts
-        total_amount = float(bill['amount']) if bill['amount'] else 0
-        patient_portion = float(bill['patient_portion']) if bill['patient_portion'] else 0
-        insurance_portion = total_amount - patient_portion
-        amount_paid = float(bill['amount_paid']) if bill['amount_paid'] else 0
-        remaining_balance = patient_portion - amount_paid
-        
-        # Drawing helper function
-        y_pos = 20
-        def draw_text(text, font, color='black', y_offset=0):
-            nonlocal y_pos
-            y_pos += y_offset
-            draw.text((20, y_pos), text, fill=color, font=font)
-            y_pos += 25
-            return y_pos
-        
-        def draw_section_header(text):
-            nonlocal y_pos
-            y_pos += 10
-            draw.rectangle([(10, y_pos), (img_width-10, y_pos+30)], fill='#f3f4f6')
-            draw.text((20, y_pos+5), text, fill='#2563eb', font=header_font)
-            y_pos += 40
-        
-        # Title with Bill Number prominently displayed
-        draw_text(f"DENTAL OFFICE BILL #{bill['bill_number']}", title_font, '#2563eb', 10)
-        y_pos += 10
-        
-        # Bill Information
-        draw_section_header("Bill Information")
-        draw_text(f"Reference: {bill['reference_number'] or 'N/A'}", normal_font)
-        draw_text(f"Date: {bill['created_at'][:10] if bill['created_at'] else 'N/A'}", normal_font)
-        draw_text(f"Due Date: {bill['due_date'][:10] if bill['due_date'] else 'N/A'}", normal_font)
-        draw_text(f"Status: {bill['status'].upper() if bill['status'] else 'N/A'}", normal_font)
-        
-        # Patient Information
-        draw_section_header("Patient Information")
-        draw_text(f"Name: {bill['patient_first_name']} {bill['patient_last_name']}", normal_font)
-        draw_text(f"Phone: {bill['phone'] or 'N/A'}", normal_font)
-        
-        # Service Details
-        draw_section_header("Service Details")
-        draw_text(f"Service: {bill['service_name'] or 'N/A'}", normal_font)
-        draw_text(f"Treatment Date: {bill['treatment_date'][:10] if bill['treatment_date'] else 'N/A'}", normal_font)
-        if bill['dentist_first_name']:
-            draw_text(f"Dentist: {bill['dentist_first_name']} {bill['dentist_last_name']}", normal_font)
-        
-        # Amount Breakdown
-        draw_section_header("Amount Breakdown")
-        draw_text(f"Total Amount: ${total_amount:.2f}", normal_font)
-        draw_text(f"Insurance Portion: ${insurance_portion:.2f}", normal_font)
-        draw_text(f"Patient Portion: ${patient_portion:.2f}", normal_font, '#2563eb')
-        draw_text(f"Amount Paid: ${amount_paid:.2f}", normal_font)
-        
-        # Remaining Balance (highlighted)
-        balance_color = '#059669' if remaining_balance <= 0 else '#dc2626'
-        draw_text(f"Remaining Balance: ${remaining_balance:.2f}", normal_font, balance_color)
-        
-        # Footer
-        y_pos = img_height - 60
-        draw_text("Questions? Call our office", small_font, '#6b7280')
-        draw_text("Thank you for choosing our dental practice!", small_font, '#6b7280')
-        
-        # Save image to static directory for public access
-        import uuid
+        import shutil
+        
+        # Publish a short-lived copy under static/temp; the cached render itself stays private
         image_filename = f"{uuid.uuid4()}.jpg"
         static_path = os.path.join('static', 'temp')
-        
-        # Create temp directory if it doesn't exist
         os.makedirs(static_path, exist_ok=True)
-        
         image_path = os.path.join(static_path, image_filename)
-        
-        # Save optimized image
-        img.save(image_path, 'JPEG', quality=85, optimize=True)
+        # Rendered once per bill content (often already pre-rendered when the bill was opened);
+        # checked out so eviction cannot remove it before it is linked or copied
+        with get_render_cache().checkout('jpg', bill_render_fields(bill)) as cached_path:
+            try:
+                os.link(cached_path, image_path)
+            except OSError:
+                shutil.copyfile(cached_path, image_path)
         file_size = os.path.getsize(image_path)
         
-        # If file is too large, reduce quality
-        if file_size > 300000:  # 300KB limit
-            img.save(image_path, 'JPEG', quality=60, optimize=True)
-            file_size = os.path.getsize(image_path)
-        
-        # If still too large, reduce image dimensions
-        if file_size > 300000:
-            img_resized = img.resize((400, 533), Image.Resampling.LANCZOS)
-            img_resized.save(image_path, 'JPEG', quality=70, optimize=True)
-            file_size = os.path.getsize(image_path)
-        
         # Create public URL for the image
         # Uses PROJECT_URL environment variable for deployment flexibility
         public_image_url = f"{PROJECT_URL}/static/temp/{image_filename}"
         
         # Send MMS via SignalWire
-        import requests
         import threading
         import time
         
-        response = requests.post(
+        response = http_client.post(
             f"{SIGNALWIRE_SPACE}/api/laml/2010-04-01/Accounts/{SIGNALWIRE_PROJECT_ID}/Messages",
             auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_AUTH_TOKEN),
             data={
@@ -5219,6 +5132,9 @@ def api_patient_by_patient_id(patient_id):
                 if field in data:
                     update_fields.append(f"{field} = ?")
                     params.append(data[field])
+            if 'phone' in data:
+                update_fields.append("phone_e164 = ?")
+                params.append(to_e164(data['phone']))
             
             if not update_fields:
                 return jsonify({'success': False, 'message': 'No valid fields to update'}), 400
@@ -5333,7 +5249,7 @@ def swaig_get_services_and_dentists(challenge_token=None, meta_data_token=None,
     logging.info(f"[SWAIG] swaig_get_services_and_dentists called")
     
     # Check if user is authenticated via challenge token
-    if not is_challenge_token_valid(challenge_token):
+    if get_patient_by_challenge_token(challenge_token) is None:
         print("[SWAIG][CONSOLE] Invalid or missing challenge token")
         logging.warning("[SWAIG] Invalid or missing challenge token")
         return "Please verify your identity first by providing the 6-digit code sent to your phone.", {}
@@ -0,0 +1,407 @@
+"""
+Rendered bill cache for the MMS image and PDF download
+
+Drawing a bill with PIL (and shrinking it with LANCZOS when it's too large
+for MMS) or laying it out with reportlab costs hundreds of milliseconds of
+CPU. Each artifact is stored on disk under a SHA-256 of exactly the bill
+fields it shows, so it is reused until the bill changes (a payment, a status
+change) and a changed bill simply gets a new key. The directory is bounded by
+size with least-recently-used eviction, and bills can be pre-rendered on a
+background thread when a patient opens them so sending or downloading one is
+a file copy. checkout() pins an artifact while it is being handed out so
+eviction cannot remove it first. The size limit is BILL_RENDER_CACHE_MB,
+read by get_render_cache() (so after load_dotenv()).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from io import BytesIO
+
+DEFAULT_DIRECTORY = 'bill_cache'
+DEFAULT_MAX_MB = 50
+DEFAULT_MAX_BYTES = DEFAULT_MAX_MB * 1024 * 1024
+
+# Bump when the layout changes so old artifacts stop matching
+RENDER_VERSION = 1
+
+# MMS carriers reject large attachments
+MAX_IMAGE_BYTES = 300000
+
+# Bill fields each artifact shows; only these feed the content hash
+IMAGE_FIELDS = (
+    'bill_number', 'reference_number', 'created_at', 'due_date', 'status',
+    'patient_first_name', 'patient_last_name', 'patient_phone',
+    'service_name', 'treatment_date', 'dentist_first_name', 'dentist_last_name',
+    'amount', 'patient_share', 'amount_paid', 'outstanding',
+)
+PDF_FIELDS = IMAGE_FIELDS + ('patient_email', 'diagnosis')
+
+
+def bill_render_fields(row):
+    """The renderers' input from a bill query row: its id and the PDF_FIELDS it has (others are None)"""
+    row = dict(row)
+    return {field: row.get(field) for field in ('id',) + PDF_FIELDS}
+
+
+def _amounts(bill):
+    total_amount = float(bill['amount']) if bill['amount'] else 0
+    patient_portion = float(bill['patient_share']) if bill['patient_share'] else 0
+    amount_paid = float(bill['amount_paid']) if bill['amount_paid'] else 0
+    remaining_balance = float(bill['outstanding']) if bill['outstanding'] else 0
+    return total_amount, total_amount - patient_portion, patient_portion, amount_paid, remaining_balance
+
+
+@lru_cache(maxsize=1)
+def _image_fonts():
+    from PIL import ImageFont
+    try:
+        return (ImageFont.truetype("arial.ttf", 24), ImageFont.truetype("arial.ttf", 18),
+                ImageFont.truetype("arial.ttf", 14), ImageFont.truetype("arial.ttf", 12))
+    except OSError:
+        default = ImageFont.load_default()
+        return default, default, default, default
+
+
+def render_bill_image(bill):
+    """Draw a bill as a portrait JPEG small enough for MMS; returns the bytes"""
+    from PIL import Image, ImageDraw
+
+    # Portrait orientation, good for mobile viewing
+    img_width = 600
+    img_height = 800
+    img = Image.new('RGB', (img_width, img_height), color='white')
+    draw = ImageDraw.Draw(img)
+    title_font, header_font, normal_font, small_font = _image_fonts()
+    total_amount, insurance_portion, patient_portion, amount_paid, remaining_balance = _amounts(bill)
+
+    y_pos = 20
+
+    def draw_text(text, font, color='black', y_offset=0):
+        nonlocal y_pos
+        y_pos += y_offset
+        draw.text((20, y_pos), text, fill=color, font=font)
+        y_pos += 25
+
+    def draw_section_header(text):
+        nonlocal y_pos
+        y_pos += 10
+        draw.rectangle([(10, y_pos), (img_width-10, y_pos+30)], fill='#f3f4f6')
+        draw.text((20, y_pos+5), text, fill='#2563eb', font=header_font)
+        y_pos += 40
+
+    # Title with Bill Number prominently displayed
+    draw_text(f"DENTAL OFFICE BILL #{bill['bill_number']}", title_font, '#2563eb', 10)
+    y_pos += 10
+
+    draw_section_header("Bill Information")
+    draw_text(f"Reference: {bill['reference_number'] or 'N/A'}", normal_font)
+    draw_text(f"Date: {bill['created_at'][:10] if bill['created_at'] else 'N/A'}", normal_font)
+    draw_text(f"Due Date: {bill['due_date'][:10] if bill['due_date'] else 'N/A'}", normal_font)
+    draw_text(f"Status: {bill['status'].upper() if bill['status'] else 'N/A'}", normal_font)
+
+    draw_section_header("Patient Information")
+    draw_text(f"Name: {bill['patient_first_name']} {bill['patient_last_name']}", normal_font)
+    draw_text(f"Phone: {bill['patient_phone'] or 'N/A'}", normal_font)
+
+    draw_section_header("Service Details")
+    draw_text(f"Service: {bill['service_name'] or 'N/A'}", normal_font)
+    draw_text(f"Treatment Date: {bill['treatment_date'][:10] if bill['treatment_date'] else 'N/A'}", normal_font)
+    if bill['dentist_first_name']:
+        draw_text(f"Dentist: {bill['dentist_first_name']} {bill['dentist_last_name']}", normal_font)
+
+    draw_section_header("Amount Breakdown")
+    draw_text(f"Total Amount: ${total_amount:.2f}", normal_font)
+    draw_text(f"Insurance Portion: ${insurance_portion:.2f}", normal_font)
+    draw_text(f"Patient Portion: ${patient_portion:.2f}", normal_font, '#2563eb')
+    draw_text(f"Amount Paid: ${amount_paid:.2f}", normal_font)
+
+    # Remaining Balance (highlighted)
+    balance_color = '#059669' if remaining_balance <= 0 else '#dc2626'
+    draw_text(f"Remaining Balance: ${remaining_balance:.2f}", normal_font, balance_color)
+
+    y_pos = img_height - 60
+    draw_text("Questions? Call our office", small_font, '#6b7280')
+    draw_text("Thank you for choosing our dental practice!", small_font, '#6b7280')
+
+    buffer = BytesIO()
+    img.save(buffer, 'JPEG', quality=85, optimize=True)
+    # If the file is too large, reduce quality, then dimensions
+    if buffer.tell() > MAX_IMAGE_BYTES:
+        buffer = BytesIO()
+        img.save(buffer, 'JPEG', quality=60, optimize=True)
+    if buffer.tell() > MAX_IMAGE_BYTES:
+        buffer = BytesIO()
+        img.resize((400, 533), Image.Resampling.LANCZOS).save(buffer, 'JPEG', quality=70, optimize=True)
+    return buffer.getvalue()
+
+
+def render_bill_pdf(bill):
+    """Lay out a bill as a letter-size PDF; returns the bytes"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib import colors
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+    story = []
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        textColor=colors.HexColor('#2563eb')
+    )
+    table_style = [
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f3f4f6')),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]
+
+    def add_table(rows, extra_style=()):
+        table = Table(rows, colWidths=[2*inch, 3*inch])
+        table.setStyle(TableStyle(table_style + list(extra_style)))
+        story.append(table)
+
+    story.append(Paragraph("DENTAL OFFICE BILL", title_style))
+    story.append(Spacer(1, 12))
+    add_table([
+        ['Bill #:', str(bill['bill_number'])],
+        ['Reference Number:', bill['reference_number'] or 'N/A'],
+        ['Bill Date:', bill['created_at'][:10] if bill['created_at'] else 'N/A'],
+        ['Due Date:', bill['due_date'][:10] if bill['due_date'] else 'N/A'],
+        ['Status:', bill['status'].title() if bill['status'] else 'N/A']
+    ])
+    story.append(Spacer(1, 20))
+
+    story.append(Paragraph("Patient Information", styles['Heading2']))
+    add_table([
+        ['Name:', f"{bill['patient_first_name']} {bill['patient_last_name']}"],
+        ['Phone:', bill['patient_phone'] or 'N/A'],
+        ['Email:', bill['patient_email'] or 'N/A']
+    ])
+    story.append(Spacer(1, 20))
+
+    story.append(Paragraph("Service Details", styles['Heading2']))
+    add_table([
+        ['Service:', bill['service_name'] or 'N/A'],
+        ['Treatment Date:', bill['treatment_date'][:10] if bill['treatment_date'] else 'N/A'],
+        ['Dentist:', f"{bill['dentist_first_name']} {bill['dentist_last_name']}" if bill['dentist_first_name'] else 'N/A'],
+        ['Diagnosis:', bill['diagnosis'] or 'N/A']
+    ])
+    story.append(Spacer(1, 20))
+
+    story.append(Paragraph("Amount Breakdown", styles['Heading2']))
+    total_amount, insurance_portion, patient_portion, amount_paid, remaining_balance = _amounts(bill)
+    add_table([
+        ['Total Amount:', f"${total_amount:.2f}"],
+        ['Insurance Portion:', f"${insurance_portion:.2f}"],
+        ['Patient Portion:', f"${patient_portion:.2f}"],
+        ['Amount Paid:', f"${amount_paid:.2f}"],
+        ['Remaining Balance:', f"${remaining_balance:.2f}"]
+    ], [
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ])
+
+    doc.build(story)
+    return buffer.getvalue()
+
+
+# kind (also the file extension) -> (renderer, fields it shows)
+RENDERERS = {
+    'jpg': (render_bill_image, IMAGE_FIELDS),
+    'pdf': (render_bill_pdf, PDF_FIELDS),
+}
+
+
+def content_key(kind, bill):
+    """SHA-256 of the fields an artifact shows, so any visible change gives a new key"""
+    _, fields = RENDERERS[kind]
+    payload = json.dumps([RENDER_VERSION, kind, [bill[field] for field in fields]], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class BillRenderCache:
+    """Size-bounded LRU directory of rendered bills keyed by content hash"""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # file name -> size, least recently used first
+        self._bytes = 0
+        self._pending = {}  # file name -> Future for renders in progress
+        self._pins = {}  # file name -> checkouts in progress; pinned files are not evicted
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bill-render')
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        """Adopt artifacts left by a previous run, oldest access first"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                os.unlink(path)
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        # Called with the lock held; the newest entry and pinned entries always stay
+        for name in list(self._entries)[:-1]:
+            if self._bytes <= self.max_bytes:
+                break
+            if self._pins.get(name):
+                continue
+            self._bytes -= self._entries.pop(name)
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _fill(self, kind, bill, name, future):
+        try:
+            renderer, _ = RENDERERS[kind]
+            data = renderer(bill)
+            path = os.path.join(self.directory, name)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._entries[name] = len(data)
+                self._bytes += len(data)
+                self._evict()
+            future.set_result(path)
+        except Exception as e:
+            logging.warning(f"Bill render failed for bill {bill.get('id')} ({kind}): {e}")
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._pending.pop(name, None)
+
+    def _unpin(self, name):
+        # Called with the lock held
+        if self._pins.get(name, 0) > 1:
+            self._pins[name] -= 1
+        else:
+            self._pins.pop(name, None)
+
+    def _path(self, kind, bill, pin):
+        bill = dict(bill)
+        name = f"{content_key(kind, bill)}.{kind}"
+        path = os.path.join(self.directory, name)
+        rendered = False
+        while True:
+            with self._lock:
+                future, owner = None, False
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+                    if not rendered:
+                        self.hits += 1
+                    if pin:
+                        self._pins[name] = self._pins.get(name, 0) + 1
+                else:
+                    future = self._pending.get(name)
+                    owner = future is None
+                    if owner:
+                        future = self._pending[name] = Future()
+                        self.misses += 1
+            if future is None:
+                try:
+                    # Keep the on-disk access order for the next run's _load
+                    os.utime(path)
+                    return name, path
+                except FileNotFoundError:
+                    # Removed behind our back; forget it and render again
+                    with self._lock:
+                        if pin:
+                            self._unpin(name)
+                        size = self._entries.pop(name, None)
+                        if size is not None:
+                            self._bytes -= size
+                    continue
+            if owner:
+                self._fill(kind, bill, name, future)
+            # Renders already in flight (e.g. a pre-render) are waited for, not repeated; the
+            # next pass picks up (and pins) the new entry, rendering again if it was evicted
+            future.result()
+            rendered = True
+
+    def path(self, kind, bill):
+        """
+        Path of the rendered artifact for a bill, rendering it on this thread if needed
+
+        The file may be evicted by another thread at any time; use checkout()
+        to hand it out.
+
+        Args:
+            kind: 'jpg' (MMS image) or 'pdf'
+            bill: Mapping with the fields in IMAGE_FIELDS / PDF_FIELDS (see bill_render_fields)
+
+        Returns:
+            str: Absolute path inside the cache directory
+        """
+        return self._path(kind, bill, pin=False)[1]
+
+    @contextmanager
+    def checkout(self, kind, bill):
+        """Like path(), but the file is not evicted until the with block exits"""
+        name, path = self._path(kind, bill, pin=True)
+        try:
+            yield path
+        finally:
+            with self._lock:
+                self._unpin(name)
+                self._evict()
+
+    def prerender(self, bill, kinds=tuple(RENDERERS)):
+        """Queue background renders of a bill's artifacts that aren't cached yet"""
+        bill = dict(bill)
+        for kind in kinds:
+            name = f"{content_key(kind, bill)}.{kind}"
+            with self._lock:
+                if name in self._entries or name in self._pending:
+                    continue
+                future = self._pending[name] = Future()
+            self._executor.submit(self._fill, kind, bill, name, future)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'pending': len(self._pending), 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """Return the process-wide bill render cache (BILL_RENDER_CACHE_MB, default 50)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = BillRenderCache(max_bytes=int(os.getenv('BILL_RENDER_CACHE_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+    return _cache
@@ -0,0 +1,246 @@
+"""
+Per-bill and per-patient billing ledger
+
+bill_ledger holds one row per bill (patient share, amount paid, outstanding
+balance, due date) and patient_ledger one row per patient with the totals
+over their bills. Both are maintained by triggers on billing and payments, so
+every write path (the portal, the SWAIG functions, init_test_data) updates
+them inside the same transaction as the bill or payment itself. Balance
+lookups are then primary-key reads instead of joins with correlated
+SUM(amount) subqueries over payments.
+
+outstanding follows billing.patient_portion, which the payment paths
+decrement as payments are made; amount_paid counts completed payments only.
+Overdue is derived on read from due_date, since it changes with the calendar
+rather than with any write.
+"""
+
+from datetime import date
+
+# Recompute one patient's totals from their bill_ledger rows (a handful per patient,
+# read through idx_bill_ledger_patient_due). Trigger statements inherit the outer
+# statement's conflict policy (init_test_data uses INSERT OR IGNORE), so rows are
+# created and then updated rather than relying on INSERT OR REPLACE.
+_REFRESH_PATIENT = """
+    INSERT OR IGNORE INTO patient_ledger (patient_id) VALUES ({patient});
+    UPDATE patient_ledger
+    SET (total_billed, total_paid, outstanding, open_bills, next_due_date, updated_at) = (
+        SELECT COALESCE(SUM(patient_share), 0), COALESCE(SUM(amount_paid), 0),
+               COALESCE(SUM(outstanding), 0), COUNT(CASE WHEN outstanding > 0 THEN 1 END),
+               MIN(CASE WHEN outstanding > 0 THEN due_date END), CURRENT_TIMESTAMP
+        FROM bill_ledger WHERE patient_id = {patient})
+    WHERE patient_id = {patient};
+"""
+
+_BILL_VALUES = """
+    {bill}.patient_id,
+    {bill}.amount - COALESCE({bill}.insurance_coverage, 0),
+    CASE WHEN {bill}.status IN ('paid', 'cancelled') THEN 0 ELSE MAX(COALESCE({bill}.patient_portion, 0), 0) END,
+    {bill}.due_date,
+    {bill}.status
+"""
+
+LEDGER_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS bill_ledger (
+        billing_id INTEGER PRIMARY KEY,
+        patient_id INTEGER NOT NULL,
+        patient_share DECIMAL(10,2) NOT NULL DEFAULT 0,
+        outstanding DECIMAL(10,2) NOT NULL DEFAULT 0,
+        due_date TIMESTAMP,
+        status TEXT,
+        amount_paid DECIMAL(10,2) NOT NULL DEFAULT 0,
+        payment_count INTEGER NOT NULL DEFAULT 0,
+        last_payment_date TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_bill_ledger_patient_due ON bill_ledger (patient_id, due_date)",
+    """
+    CREATE TABLE IF NOT EXISTS patient_ledger (
+        patient_id INTEGER PRIMARY KEY,
+        total_billed DECIMAL(10,2) NOT NULL DEFAULT 0,
+        total_paid DECIMAL(10,2) NOT NULL DEFAULT 0,
+        outstanding DECIMAL(10,2) NOT NULL DEFAULT 0,
+        open_bills INTEGER NOT NULL DEFAULT 0,
+        next_due_date TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+
+    # billing -> bill_ledger
+    f"""
+    CREATE TRIGGER IF NOT EXISTS billing_ledger_insert AFTER INSERT ON billing
+    BEGIN
+        DELETE FROM bill_ledger WHERE billing_id = NEW.id;
+        INSERT INTO bill_ledger
+            (billing_id, patient_id, patient_share, outstanding, due_date, status, amount_paid, payment_count, last_payment_date)
+        SELECT NEW.id, {_BILL_VALUES.format(bill='NEW')},
+               COALESCE(SUM(amount), 0), COUNT(*), MAX(payment_date)
+        FROM payments WHERE billing_id = NEW.id AND status = 'completed';
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS billing_ledger_update AFTER UPDATE ON billing
+    BEGIN
+        UPDATE bill_ledger SET (patient_id, patient_share, outstanding, due_date, status) = ({_BILL_VALUES.format(bill='NEW')})
+        WHERE billing_id = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS billing_ledger_delete AFTER DELETE ON billing
+    BEGIN
+        DELETE FROM bill_ledger WHERE billing_id = OLD.id;
+    END
+    """,
+
+    # payments -> bill_ledger (completed payments only)
+    """
+    CREATE TRIGGER IF NOT EXISTS payments_ledger_insert AFTER INSERT ON payments
+    WHEN NEW.status = 'completed'
+    BEGIN
+        UPDATE bill_ledger
+        SET amount_paid = amount_paid + NEW.amount, payment_count = payment_count + 1,
+            last_payment_date = MAX(COALESCE(last_payment_date, ''), NEW.payment_date)
+        WHERE billing_id = NEW.billing_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS payments_ledger_update AFTER UPDATE OF billing_id, amount, status, payment_date ON payments
+    WHEN OLD.status = 'completed' OR NEW.status = 'completed'
+    BEGIN
+        UPDATE bill_ledger
+        SET (amount_paid, payment_count, last_payment_date) = (
+            SELECT COALESCE(SUM(amount), 0), COUNT(*), MAX(payment_date)
+            FROM payments WHERE billing_id = bill_ledger.billing_id AND status = 'completed')
+        WHERE billing_id IN (OLD.billing_id, NEW.billing_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS payments_ledger_delete AFTER DELETE ON payments
+    WHEN OLD.status = 'completed'
+    BEGIN
+        UPDATE bill_ledger
+        SET (amount_paid, payment_count, last_payment_date) = (
+            SELECT COALESCE(SUM(amount), 0), COUNT(*), MAX(payment_date)
+            FROM payments WHERE billing_id = OLD.billing_id AND status = 'completed')
+        WHERE billing_id = OLD.billing_id;
+    END
+    """,
+
+    # bill_ledger -> patient_ledger
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bill_ledger_patient_insert AFTER INSERT ON bill_ledger
+    BEGIN
+        {_REFRESH_PATIENT.format(patient='NEW.patient_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bill_ledger_patient_update AFTER UPDATE ON bill_ledger
+    BEGIN
+        {_REFRESH_PATIENT.format(patient='NEW.patient_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bill_ledger_patient_move AFTER UPDATE OF patient_id ON bill_ledger
+    WHEN OLD.patient_id != NEW.patient_id
+    BEGIN
+        {_REFRESH_PATIENT.format(patient='OLD.patient_id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bill_ledger_patient_delete AFTER DELETE ON bill_ledger
+    BEGIN
+        {_REFRESH_PATIENT.format(patient='OLD.patient_id')}
+    END
+    """,
+]
+
+
+def rebuild(conn):
+    """
+    Rebuild both ledgers from billing and payments (migration backfill and repair)
+
+    Runs inside the caller's transaction; the bill_ledger triggers fill
+    patient_ledger as the rows are inserted.
+    """
+    conn.execute("DELETE FROM bill_ledger")
+    conn.execute("DELETE FROM patient_ledger")
+    conn.execute(f"""
+        INSERT INTO bill_ledger
+            (billing_id, patient_id, patient_share, outstanding, due_date, status, amount_paid, payment_count, last_payment_date)
+        SELECT b.id, {_BILL_VALUES.format(bill='b')},
+               COALESCE(p.amount_paid, 0), COALESCE(p.payment_count, 0), p.last_payment_date
+        FROM billing b
+        LEFT JOIN (
+            SELECT billing_id, SUM(amount) AS amount_paid, COUNT(*) AS payment_count, MAX(payment_date) AS last_payment_date
+            FROM payments WHERE status = 'completed' GROUP BY billing_id
+        ) p ON p.billing_id = b.id
+    """)
+
+
+def is_overdue(due_date, outstanding, today=None):
+    """True if a balance is still owed after its due date"""
+    if not due_date or not outstanding or float(outstanding) <= 0:
+        return False
+    today = today or date.today().isoformat()
+    return str(due_date)[:10] < today
+
+
+def _bill_entry(row, today):
+    entry = dict(row)
+    for field in ('patient_share', 'outstanding', 'amount_paid'):
+        entry[field] = round(float(entry[field] or 0), 2)
+    entry['overdue'] = is_overdue(entry['due_date'], entry['outstanding'], today)
+    return entry
+
+
+def bill_balance(db, billing_id):
+    """
+    Ledger entry for one bill
+
+    Returns:
+        dict: patient_share, amount_paid, outstanding, payment_count,
+            last_payment_date, due_date, status and overdue; or None
+    """
+    row = db.execute("SELECT * FROM bill_ledger WHERE billing_id = ?", (billing_id,)).fetchone()
+    return _bill_entry(row, date.today().isoformat()) if row else None
+
+
+def bill_balances(db, billing_ids):
+    """Ledger entries for several bills in one query: billing_id -> dict (see bill_balance)"""
+    billing_ids = list(billing_ids)
+    if not billing_ids:
+        return {}
+    today = date.today().isoformat()
+    rows = db.execute(
+        f"SELECT * FROM bill_ledger WHERE billing_id IN ({', '.join('?' * len(billing_ids))})", billing_ids
+    ).fetchall()
+    return {row['billing_id']: _bill_entry(row, today) for row in rows}
+
+
+def patient_balance(db, patient_id):
+    """
+    Ledger totals for one patient (internal patients.id)
+
+    Returns:
+        dict: total_billed, total_paid, outstanding, open_bills, next_due_date,
+            overdue and overdue_amount (all zero for a patient with no bills)
+    """
+    row = db.execute("SELECT * FROM patient_ledger WHERE patient_id = ?", (patient_id,)).fetchone()
+    if not row:
+        return {'patient_id': patient_id, 'total_billed': 0.0, 'total_paid': 0.0, 'outstanding': 0.0,
+                'open_bills': 0, 'next_due_date': None, 'overdue': False, 'overdue_amount': 0.0}
+    balance = dict(row)
+    for field in ('total_billed', 'total_paid', 'outstanding'):
+        balance[field] = round(float(balance[field] or 0), 2)
+    today = date.today().isoformat()
+    balance['overdue'] = is_overdue(balance['next_due_date'], balance['outstanding'], today)
+    balance['overdue_amount'] = 0.0
+    if balance['overdue']:
+        # Only patients with an overdue bill pay for this range read
+        overdue = db.execute(
+            "SELECT COALESCE(SUM(outstanding), 0) FROM bill_ledger WHERE patient_id = ? AND due_date < ? AND outstanding > 0",
+            (patient_id, today)
+        ).fetchone()[0]
+        balance['overdue_amount'] = round(float(overdue), 2)
+    return balance
@@ -0,0 +1,246 @@
+"""
+Challenge token store for SWAIG patient sessions
+
+After MFA succeeds the agent receives a challenge token that every
+patient-facing SWAIG function validates first. Tokens expire after a TTL and
+validation is a single dict lookup (memory) or primary-key lookup (SQLite).
+The SQLite backend lets several worker processes share tokens; choose it with
+CHALLENGE_TOKEN_STORE=sqlite and the TTL with CHALLENGE_TOKEN_TTL (seconds);
+both are read by get_token_store(), so after load_dotenv(). Tokens are never
+logged, and the SQLite table stores only their SHA-256 digest.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import db_pool
+
+DEFAULT_TTL_SECONDS = 1800
+DEFAULT_DB_PATH = 'dental_office.db'
+
+# Expired rows are swept at most this often (seconds)
+PURGE_INTERVAL = 60
+
+TOKENS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS challenge_tokens (
+    token_hash TEXT PRIMARY KEY,
+    patient_data TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_challenge_tokens_expires ON challenge_tokens (expires_at);
+"""
+
+
+def token_hint(token):
+    """Short, non-reversible label for a token, safe to log"""
+    return hashlib.sha256(str(token).encode()).hexdigest()[:8] if token else 'none'
+
+
+class TokenMetrics:
+    """Counters for token activity"""
+
+    FIELDS = ('issued', 'validated', 'missing', 'unknown', 'expired', 'revoked', 'purged')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def to_dict(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+class MemoryTokenStore:
+    """
+    In-process store for a single worker
+
+    Tokens are kept in insertion order; every token gets the store's TTL, so
+    that is also expiry order and expired tokens are dropped from the front
+    without a scan.
+    """
+
+    backend = 'memory'
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS):
+        self.ttl = ttl
+        self.metrics = TokenMetrics()
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()  # token -> (expires_at, patient_data)
+
+    def _purge(self, now):
+        purged = 0
+        while self._tokens:
+            token, (expires_at, _) = next(iter(self._tokens.items()))
+            if expires_at > now:
+                break
+            del self._tokens[token]
+            purged += 1
+        if purged:
+            self.metrics.incr('purged', purged)
+
+    def issue(self, token, patient_data):
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._tokens.pop(token, None)
+            self._tokens[token] = (now + self.ttl, dict(patient_data))
+        self.metrics.incr('issued')
+
+    def lookup(self, token):
+        """Return (status, patient_data) where status is 'valid', 'missing', 'unknown' or 'expired'"""
+        if not token:
+            return 'missing', None
+        now = time.time()
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return 'unknown', None
+            expires_at, patient_data = entry
+            if expires_at <= now:
+                del self._tokens[token]
+                return 'expired', None
+            return 'valid', patient_data
+
+    def revoke(self, token):
+        with self._lock:
+            return self._tokens.pop(token, None) is not None
+
+    def size(self):
+        with self._lock:
+            self._purge(time.time())
+            return len(self._tokens)
+
+
+class SQLiteTokenStore:
+    """Store shared by every worker process using the same database file"""
+
+    backend = 'sqlite'
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, ttl=DEFAULT_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.metrics = TokenMetrics()
+        self._last_purge = 0.0
+        conn = self._connect()
+        try:
+            conn.executescript(TOKENS_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return db_pool.connect(self.db_path)
+
+    @staticmethod
+    def _hash(token):
+        return hashlib.sha256(str(token).encode()).hexdigest()
+
+    def _maybe_purge(self, conn, now):
+        if now - self._last_purge < PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        purged = conn.execute("DELETE FROM challenge_tokens WHERE expires_at <= ?", (now,)).rowcount
+        if purged:
+            self.metrics.incr('purged', purged)
+
+    def issue(self, token, patient_data):
+        now = time.time()
+        conn = self._connect()
+        try:
+            self._maybe_purge(conn, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO challenge_tokens (token_hash, patient_data, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (self._hash(token), json.dumps(patient_data, default=str), now + self.ttl, now)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        self.metrics.incr('issued')
+
+    def lookup(self, token):
+        """Return (status, patient_data) where status is 'valid', 'missing', 'unknown' or 'expired'"""
+        if not token:
+            return 'missing', None
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT patient_data, expires_at FROM challenge_tokens WHERE token_hash = ?", (self._hash(token),)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return 'unknown', None
+        if row[1] <= time.time():
+            return 'expired', None
+        return 'valid', json.loads(row[0])
+
+    def revoke(self, token):
+        conn = self._connect()
+        try:
+            revoked = conn.execute("DELETE FROM challenge_tokens WHERE token_hash = ?", (self._hash(token),)).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return bool(revoked)
+
+    def size(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM challenge_tokens WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        finally:
+            conn.close()
+
+
+class ChallengeTokenStore:
+    """Facade used by app.py; records metrics around the chosen backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def issue(self, token, patient_data):
+        self.backend.issue(token, patient_data)
+
+    def get(self, token):
+        """Return the patient data for a valid token, or None (validation and data in one lookup)"""
+        status, patient_data = self.backend.lookup(token)
+        self.backend.metrics.incr('validated' if status == 'valid' else status)
+        return patient_data
+
+    def revoke(self, token):
+        if self.backend.revoke(token):
+            self.backend.metrics.incr('revoked')
+            return True
+        return False
+
+    def stats(self):
+        stats = self.backend.metrics.to_dict()
+        stats.update({'backend': self.backend.backend, 'ttl_seconds': self.backend.ttl, 'active': self.backend.size()})
+        return stats
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_token_store():
+    """Return the process-wide challenge token store (CHALLENGE_TOKEN_STORE=memory|sqlite, CHALLENGE_TOKEN_TTL)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                ttl = int(os.getenv('CHALLENGE_TOKEN_TTL', DEFAULT_TTL_SECONDS))
+                if os.getenv('CHALLENGE_TOKEN_STORE', 'memory').lower() == 'sqlite':
+                    backend = SQLiteTokenStore(ttl=ttl)
+                else:
+                    backend = MemoryTokenStore(ttl=ttl)
+                _store = ChallengeTokenStore(backend)
+    return _store
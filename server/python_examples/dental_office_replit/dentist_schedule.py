@@ -0,0 +1,69 @@
+"""
+Dentist schedules built in one pass over the appointments
+iter_dentist_schedule() walks each dentist's calendar in step with a single
+appointments query ordered by dentist and start time, so month-long,
+multi-dentist schedules can be streamed one day at a time (NDJSON) without
+re-querying per day or holding the whole range in memory.
+"""
+
+import json
+from datetime import timedelta
+
+
+def iter_dentist_schedule(db, dentists, start_date, end_date):
+    """
+    Yield one schedule entry per dentist working day in [start_date, end_date]
+
+    Appointments come from a single query ordered by dentist and start time
+    and are consumed in step with the calendar walk, so each row is visited
+    once and nothing beyond the current day is held in memory.
+
+    Args:
+        dentists: Rows with id and working_hours
+        start_date, end_date: date objects (inclusive)
+
+    Entries are ordered by dentist ID, then date.
+    """
+    dentists = sorted(dentists, key=lambda dentist: dentist['id'])
+    dentist_ids = [dentist['id'] for dentist in dentists]
+    placeholders = ', '.join('?' * len(dentist_ids))
+    # Range on start_time so idx_appointments_dentist_start serves each dentist
+    rows = db.execute(f'''
+        SELECT a.*, date(a.start_time) as appointment_date,
+               p.first_name as patient_first_name, p.last_name as patient_last_name,
+               s.name as service_name
+        FROM appointments a
+        JOIN patients p ON a.patient_id = p.id
+        JOIN dental_services s ON a.service_id = s.id
+        WHERE a.dentist_id IN ({placeholders}) AND a.start_time >= ? AND a.start_time < ?
+        ORDER BY a.dentist_id, a.start_time
+    ''', dentist_ids + [start_date.isoformat(), (end_date + timedelta(days=1)).isoformat()])
+
+    pending = next(rows, None)
+    for dentist in dentists:
+        working_hours = json.loads(dentist['working_hours'] or '{}')
+        current = start_date
+        while current <= end_date:
+            date_str = current.isoformat()
+            appointments = []
+            while pending is not None and pending['dentist_id'] == dentist['id'] and \
+                    (pending['appointment_date'] or '') <= date_str:
+                if pending['appointment_date'] == date_str:
+                    appointments.append(dict(pending))
+                pending = next(rows, None)
+
+            day_of_week = current.strftime('%A').lower()
+            if day_of_week in working_hours:
+                yield {
+                    'dentist_id': dentist['id'],
+                    'date': date_str,
+                    'working_hours': working_hours[day_of_week],
+                    'appointments': appointments
+                }
+            current += timedelta(days=1)
+
+
+def iter_schedule_ndjson(db, dentists, start_date, end_date):
+    """Yield iter_dentist_schedule() entries as NDJSON lines"""
+    for entry in iter_dentist_schedule(db, dentists, start_date, end_date):
+        yield json.dumps(entry, default=str) + '\n'
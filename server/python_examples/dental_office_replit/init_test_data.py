@@ -1,11 +1,14 @@
 import sqlite3
 from datetime import datetime, timedelta
+import argparse
 import hashlib
 import secrets
 import random
 import os
 import json
+from itertools import accumulate
 from werkzeug.security import generate_password_hash
+from bulk_data import BulkRandom, Progress, insert_many, tune_for_bulk_load
 
 def hash_password(password):
     """Hash password with salt for secure storage"""
@@ -554,5 +557,226 @@ def init_test_data():
     print("IMPORTANT: Only Jane Doe should have Deep Cleaning bills for SWAIG testing")
     print("=============================================================================")
 
-if __name__ == '__main__':
+
+# Bulk load-test data (python init_test_data.py --patients 100000 --appointments 1000000 --days 730)
+
+# Relative popularity of each service, by name; unlisted services get weight 1
+SERVICE_WEIGHTS = {
+    'Regular Cleaning': 30, 'Dental Checkup': 25, 'Cavity Filling': 12, 'Deep Cleaning': 6,
+    'Emergency Visit': 5, 'Tooth Extraction': 4, 'Teeth Whitening': 4, 'Root Canal': 3,
+    'Braces Consultation': 3, 'Crown Installation': 2, 'Wisdom Tooth Removal': 2,
+}
+APPOINTMENT_MINUTES = {'root_canal': 120, 'orthodontics': 60, 'whitening': 90, 'other': 90}
+MEDICAL_HISTORY = {'No known allergies': 70, 'Penicillin allergy': 8, 'Latex allergy': 4, 'Diabetes': 6,
+                   'High blood pressure, takes medication': 9, 'Asthma': 3}
+INSURERS = ('DentalCare Plus', 'HealthFirst', 'MediCare Dental', 'SmileSure', 'BrightBite Mutual')
+# Appointments extend this many days past today; the rest of --days lies in the past
+FUTURE_DAYS = 60
+
+
+def _bulk_patients(rng, ids, password_hash, password_salt):
+    for patient_id in ids:
+        first, last = rng.first_name(), rng.last_name()
+        phone = rng.phone()
+        insured = rng.random() < 0.75
+        born = datetime(1940, 1, 1) + timedelta(days=rng.randrange(75 * 365))
+        yield (
+            patient_id, first, last, rng.email(first, last, patient_id), phone, phone, rng.address(),
+            born.strftime('%Y-%m-%d'), rng.weighted(MEDICAL_HISTORY),
+            f"Insurance Provider: {rng.choice(INSURERS)}, Policy: {rng.randint(100000, 999999)}" if insured else 'No insurance',
+            password_hash, password_salt, str(patient_id),
+        )
+
+
+def _bulk_payment_methods(rng, ids):
+    """One default method per patient; one in ten pays by bank transfer"""
+    for patient_id in ids:
+        if rng.random() < 0.1:
+            yield (patient_id, 'banking', None, None, None, 'Test Bank',
+                   str(rng.randint(10 ** 9, 10 ** 10 - 1)), '021000021')
+        else:
+            yield (patient_id, 'credit_card', '4242424242424242', f"{rng.randint(1, 12):02d}/{rng.randint(27, 31)}",
+                   'Test Cardholder', None, None, None)
+
+
+def _bulk_appointments(rng, count, patients, dentists, services, days, now):
+    start = (now - timedelta(days=max(days - FUTURE_DAYS, 0))).replace(hour=0, minute=0, second=0, microsecond=0)
+    service_ids = list(services)
+    service_weights = list(accumulate(services[service_id][2] for service_id in service_ids))
+    for _ in range(count):
+        day = start + timedelta(days=rng.randrange(days))
+        # The office is closed at weekends
+        while day.weekday() >= 5 and days > 2:
+            day = start + timedelta(days=rng.randrange(days))
+        begins = day + timedelta(hours=8, minutes=30 * rng.randrange(18))
+        service_id = rng.choices(service_ids, cum_weights=service_weights)[0]
+        service_type = services[service_id][0]
+        ends = begins + timedelta(minutes=APPOINTMENT_MINUTES.get(service_type, 60))
+        if begins < now:
+            status = 'completed' if rng.random() < 0.86 else 'cancelled'
+        else:
+            status = 'scheduled' if rng.random() < 0.94 else 'cancelled'
+        yield (
+            rng.choice(patients), rng.choice(dentists), service_id, service_type, status,
+            begins.strftime('%Y-%m-%d %H:%M:%S'), ends.strftime('%Y-%m-%d %H:%M:%S'), None,
+            int(rng.random() < 0.9),
+        )
+
+
+def _bulk_bills(rng, visits, first_id, numbers, services, insured, now):
+    """Yield (bill row, paid amount) for each completed visit"""
+    for n, (appointment_id, patient_id, dentist_id, service_id, visited) in enumerate(visits):
+        visited = datetime.strptime(visited, '%Y-%m-%d %H:%M:%S')
+        amount = float(services[service_id][1])
+        coverage = round(amount * rng.choice((0.5, 0.6, 0.8)), 2) if patient_id in insured else 0.0
+        owed = round(amount - coverage, 2)
+        due = visited + timedelta(days=30)
+        # Most bills are settled eventually; recent ones are more often still open
+        roll = rng.random() * (0.75 if due < now - timedelta(days=90) else 1.0)
+        if roll < 0.7:
+            paid, status = owed, 'paid'
+        elif roll < 0.82:
+            paid, status = round(owed * rng.choice((0.25, 0.5)), 2), 'partial'
+        else:
+            paid, status = 0.0, 'pending' if due >= now else 'overdue'
+        if owed == 0:
+            paid, status = 0.0, 'paid'
+        yield (
+            first_id + n, patient_id, dentist_id, appointment_id, service_id, amount, coverage, round(owed - paid, 2), status,
+            due.strftime('%Y-%m-%d'), f"BULK-{appointment_id}", visited.strftime('%Y-%m-%d %H:%M:%S'), numbers[n],
+        ), paid
+
+
+def generate_bulk_data(patients=0, appointments=0, days=365, seed=42, db_path='dental_office.db'):
+    """
+    Add production-sized patient, appointment, billing and payment volumes
+
+    Every completed generated appointment is billed, and paid or partially
+    paid bills get a payment (a few of them failed). Rows are generated from
+    a seeded BulkRandom and written with executemany in one transaction, so
+    the same arguments always produce the same database. Patient IDs are 7
+    digits and bill numbers 6, which caps how many of each can exist.
+    """
+    rng = BulkRandom(seed)
+    now = datetime.now().replace(microsecond=0)
+    days = max(int(days), 1)
+    progress = Progress()
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    try:
+        tune_for_bulk_load(conn)
+        taken = {row[0] for row in cursor.execute("SELECT id FROM patients")}
+        ids = [int(number) for number in rng.unique_numbers(min(patients + len(taken), 9000000), 7)
+               if int(number) not in taken]
+        if len(ids) < patients:
+            raise ValueError(f"Only {len(ids)} unused 7-digit patient IDs remain")
+        password_hash, password_salt = hash_password('patient123')
+        count = insert_many(cursor, '''
+            INSERT INTO patients (id, first_name, last_name, email, phone, phone_e164, address, date_of_birth,
+                                  medical_history, insurance_info, password_hash, password_salt, patient_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _bulk_patients(rng, ids, password_hash, password_salt))
+        progress.step('patients', count)
+
+        count = insert_many(cursor, '''
+            INSERT INTO payment_methods (patient_id, method_type, card_number, expiry_date, card_holder,
+                                         bank_name, account_number, routing_number, is_default)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+        ''', _bulk_payment_methods(rng, ids))
+        progress.step('payment methods', count)
+
+        if appointments:
+            patient_ids = [row[0] for row in cursor.execute("SELECT id FROM patients ORDER BY id")]
+            dentists = [row[0] for row in cursor.execute("SELECT id FROM dentists ORDER BY id")]
+            services = {}
+            for service_id, name, service_type, price in cursor.execute(
+                    "SELECT id, name, type, price FROM dental_services ORDER BY id"):
+                services[service_id] = (service_type, price, SERVICE_WEIGHTS.get(name, 1))
+            if not patient_ids or not dentists or not services:
+                raise ValueError("Patients, dentists and dental services are required before generating appointments")
+            first_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM appointments").fetchone()[0] + 1
+            count = insert_many(cursor, '''
+                INSERT INTO appointments (patient_id, dentist_id, service_id, type, status, start_time, end_time,
+                                          notes, sms_reminder)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', _bulk_appointments(rng, appointments, patient_ids, dentists, services, days, now))
+            progress.step('appointments', count)
+
+            visits = cursor.execute(
+                "SELECT id, patient_id, dentist_id, service_id, start_time FROM appointments "
+                "WHERE id >= ? AND status = 'completed' ORDER BY id", (first_id,)
+            ).fetchall()
+            taken = {row[0] for row in cursor.execute("SELECT bill_number FROM billing WHERE bill_number IS NOT NULL")}
+            numbers = [number for number in rng.unique_numbers(min(len(visits) + len(taken), 900000), 6)
+                       if number not in taken]
+            if len(numbers) < len(visits):
+                raise ValueError(f"{len(visits)} completed appointments need bills but only {len(numbers)} "
+                                 "unused 6-digit bill numbers remain")
+            insured = {row[0] for row in cursor.execute(
+                "SELECT id FROM patients WHERE insurance_info IS NOT NULL AND insurance_info != 'No insurance'")}
+            first_bill = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM billing").fetchone()[0] + 1
+            paid_amounts = []
+
+            def bill_rows():
+                for bill, paid in _bulk_bills(rng, visits, first_bill, numbers, services, insured, now):
+                    paid_amounts.append(paid)
+                    yield bill
+
+            count = insert_many(cursor, '''
+                INSERT INTO billing (id, patient_id, dentist_id, appointment_id, service_id, amount, insurance_coverage,
+                                     patient_portion, status, due_date, reference_number, created_at, bill_number)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', bill_rows())
+            progress.step('bills', count)
+
+            default_methods = dict(cursor.execute(
+                "SELECT patient_id, id FROM payment_methods WHERE is_default = 1 ORDER BY id"))
+            method_types = dict(cursor.execute("SELECT id, method_type FROM payment_methods"))
+
+            def payment_rows():
+                for n, (_, patient_id, _, _, visited) in enumerate(visits):
+                    bill_id = first_bill + n
+                    method_id = default_methods.get(patient_id)
+                    if method_id is None:
+                        continue
+                    paid_on = datetime.strptime(visited, '%Y-%m-%d %H:%M:%S') + timedelta(days=rng.randint(0, 28))
+                    paid_on = paid_on.strftime('%Y-%m-%d %H:%M:%S')
+                    method_type = method_types[method_id]
+                    # A declined attempt before some payments
+                    if rng.random() < 0.03:
+                        yield (bill_id, patient_id, paid_amounts[n] or 50.0, paid_on, method_id, method_type,
+                               'failed', f"BULKF{bill_id}", 'Payment failed - card declined', paid_on)
+                    if paid_amounts[n]:
+                        yield (bill_id, patient_id, paid_amounts[n], paid_on, method_id, method_type,
+                               'completed', f"BULK{bill_id}", None, paid_on)
+
+            count = insert_many(cursor, '''
+                INSERT INTO payments (billing_id, patient_id, amount, payment_date, payment_method_id,
+                                      payment_method_type, status, transaction_id, notes, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', payment_rows())
+            progress.step('payments', count)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load demo data, optionally with bulk load-test volumes')
+    parser.add_argument('--patients', type=int, default=0, help='Extra generated patients')
+    parser.add_argument('--appointments', type=int, default=0,
+                        help='Extra generated appointments; completed ones are billed and paid')
+    parser.add_argument('--days', type=int, default=365, help='Days of history the generated data spans')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+    args = parser.parse_args(argv)
     init_test_data()
+    if args.patients or args.appointments:
+        print(f"Generating bulk data (seed {args.seed})...")
+        generate_bulk_data(args.patients, args.appointments, args.days, args.seed)
+
+
+if __name__ == '__main__':
+    main()
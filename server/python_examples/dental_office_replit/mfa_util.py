@@ -1,6 +1,7 @@
 import logging
 import requests
 import re
+import http_client
 from signalwire.rest import Client as SignalWireClient
 
 class SignalWireMFA:
@@ -21,6 +22,7 @@ class SignalWireMFA:
             
             # Initialize client with proper space URL format
             self.client = SignalWireClient(project_id, token, signalwire_space_url=f"{space_subdomain}.signalwire.com")
+            http_client.route_sdk_client(self.client)
             self.project_id = project_id
             self.token = token
             self.space = space_subdomain
@@ -45,7 +47,7 @@ class SignalWireMFA:
             }
             headers = {"Content-Type": "application/json"}
             logging.debug(f"Sending MFA from {self.from_number} to {to_number}")
-            response = requests.post(url, json=payload, auth=(self.project_id, self.token), headers=headers)
+            response = http_client.post(url, json=payload, auth=(self.project_id, self.token), headers=headers)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -58,7 +60,7 @@ class SignalWireMFA:
             payload = {"token": token}
             headers = {"Content-Type": "application/json"}
             logging.debug(f"Verifying MFA with ID {mfa_id} using token {token}")
-            response = requests.post(verify_url, json=payload, auth=(self.project_id, self.token), headers=headers)
+            response = http_client.post(verify_url, json=payload, auth=(self.project_id, self.token), headers=headers)
             response.raise_for_status()
             return response.json()
         except requests.HTTPError as e:
@@ -0,0 +1,124 @@
+"""
+Schema migrations and hot-query registry for the dental office
+
+Run `python migrations.py` to EXPLAIN every registered query against
+dental_office.db, or `python migrations.py --migrate` to apply pending
+migrations first. The app applies pending migrations at startup. schema.sql
+already has the resulting tables and indexes, except indexes on columns that
+older databases lack (they would break schema.sql re-runs in init_test_data).
+"""
+
+import billing_ledger
+import db_migrate
+import phone_util
+
+DB_PATH = 'dental_office.db'
+
+# (version, name, statements)
+MIGRATIONS = [
+    (1, 'index appointments by dentist, patient and day', [
+        "CREATE INDEX IF NOT EXISTS idx_appointments_dentist_start ON appointments (dentist_id, start_time)",
+        # Matches the WHERE dentist_id = ? AND date(start_time) = ? availability checks
+        "CREATE INDEX IF NOT EXISTS idx_appointments_dentist_day ON appointments (dentist_id, date(start_time))",
+        "CREATE INDEX IF NOT EXISTS idx_appointments_patient_start ON appointments (patient_id, start_time)",
+        # Superseded by the composite indexes above
+        "DROP INDEX IF EXISTS idx_appointments_dentist",
+        "DROP INDEX IF EXISTS idx_appointments_patient",
+    ]),
+    (2, 'index billing and payments by patient and dentist', [
+        "CREATE INDEX IF NOT EXISTS idx_billing_patient_due ON billing (patient_id, due_date)",
+        "CREATE INDEX IF NOT EXISTS idx_billing_dentist_due ON billing (dentist_id, due_date)",
+        "CREATE INDEX IF NOT EXISTS idx_payments_patient_date ON payments (patient_id, payment_date)",
+        "CREATE INDEX IF NOT EXISTS idx_payment_methods_patient ON payment_methods (patient_id, is_default, created_at)",
+        "DROP INDEX IF EXISTS idx_billing_patient",
+    ]),
+    (3, 'index treatment history and case-insensitive email lookups', [
+        "CREATE INDEX IF NOT EXISTS idx_treatment_history_patient_date ON treatment_history (patient_id, treatment_date)",
+        "CREATE INDEX IF NOT EXISTS idx_treatment_history_dentist_date ON treatment_history (dentist_id, treatment_date)",
+        "CREATE INDEX IF NOT EXISTS idx_treatment_history_reference ON treatment_history (reference_number)",
+        "CREATE INDEX IF NOT EXISTS idx_patients_email_lower ON patients (LOWER(email))",
+        "CREATE INDEX IF NOT EXISTS idx_dentists_email_lower ON dentists (LOWER(email))",
+    ]),
+    (4, 'canonical E.164 patient phone', [
+        db_migrate.add_column('patients', 'phone_e164', 'TEXT'),
+        "CREATE INDEX IF NOT EXISTS idx_patients_phone_e164 ON patients (phone_e164)",
+    ]),
+    (5, 'per-bill and per-patient billing ledger', billing_ledger.LEDGER_STATEMENTS + [
+        billing_ledger.rebuild,
+    ]),
+    (6, 'bill numbers', [
+        db_migrate.add_column('billing', 'bill_number', 'TEXT'),
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_billing_bill_number ON billing (bill_number)",
+    ]),
+]
+
+# Queries issued by the portal and SWAIG functions on every call: name -> (sql, params)
+HOT_QUERIES = {
+    'patient by patient_id': (
+        "SELECT * FROM patients WHERE patient_id = ?", ('1234567',)),
+    'patient by caller ID': (
+        "SELECT * FROM patients WHERE phone_e164 = ?", ('+15551234567',)),
+    'patient login': (
+        "SELECT * FROM patients WHERE LOWER(email) = ?", ('test@example.com',)),
+    'dentist login': (
+        "SELECT * FROM dentists WHERE LOWER(email) = ?", ('dr@example.com',)),
+    'booked slots for dentist day': (
+        "SELECT id, start_time, end_time FROM appointments WHERE dentist_id = ? AND date(start_time) = ? "
+        "AND status != 'cancelled'", (1, '2025-01-01')),
+    'dentist schedule': (
+        "SELECT * FROM appointments a WHERE a.dentist_id = ? ORDER BY a.start_time DESC", (1,)),
+    'dentist schedule range': (
+        "SELECT * FROM appointments a WHERE a.dentist_id IN (?, ?) AND a.start_time >= ? AND a.start_time < ? "
+        "ORDER BY a.dentist_id, a.start_time", (1, 2, '2025-01-01', '2025-02-01')),
+    'patient upcoming appointments': (
+        "SELECT * FROM appointments a WHERE a.patient_id = ? AND date(a.start_time) >= date('now') "
+        "ORDER BY a.start_time", (1,)),
+    'patient bills': (
+        "SELECT b.*, th.diagnosis FROM billing b "
+        "LEFT JOIN treatment_history th ON b.reference_number = th.reference_number "
+        "WHERE b.patient_id = ? ORDER BY b.due_date DESC", (1,)),
+    'next unpaid bill': (
+        "SELECT due_date FROM billing WHERE patient_id = ? AND status != 'paid' "
+        "ORDER BY due_date ASC LIMIT 1", (1,)),
+    'dentist receivables': (
+        "SELECT * FROM billing b WHERE b.dentist_id = ? ORDER BY b.due_date DESC", (1,)),
+    'bill by number': (
+        "SELECT * FROM billing WHERE bill_number = ? AND patient_id = ?", ('123456', 1)),
+    'payments for bill': (
+        "SELECT COALESCE(SUM(amount), 0) FROM payments WHERE billing_id = ?", (1,)),
+    'bill ledger entries': (
+        "SELECT * FROM bill_ledger WHERE billing_id IN (?, ?)", (1, 2)),
+    'patient ledger': (
+        "SELECT * FROM patient_ledger WHERE patient_id = ?", (1,)),
+    'patient overdue amount': (
+        "SELECT COALESCE(SUM(outstanding), 0) FROM bill_ledger WHERE patient_id = ? AND due_date < ? "
+        "AND outstanding > 0", (1, '2025-01-01')),
+    'patient payment history': (
+        "SELECT * FROM payments p WHERE p.patient_id = ? ORDER BY p.payment_date DESC", (1,)),
+    'patient payment methods': (
+        "SELECT * FROM payment_methods WHERE patient_id = ? ORDER BY is_default DESC, created_at DESC", (1,)),
+    'patient treatment history': (
+        "SELECT * FROM treatment_history th WHERE th.patient_id = ? ORDER BY th.treatment_date DESC", (1,)),
+}
+
+
+# (table, phone column, canonical column) filled by the startup backfill
+PHONE_COLUMNS = [
+    ('patients', 'phone', 'phone_e164'),
+]
+
+
+def backfill_phones(conn):
+    """Fill canonical phone columns for rows written without one; returns rows updated"""
+    return sum(phone_util.backfill(conn, table, source, target) for table, source, target in PHONE_COLUMNS)
+
+
+def migrate(conn):
+    """Apply pending migrations and the phone backfill; returns the versions applied"""
+    applied = db_migrate.apply_migrations(conn, MIGRATIONS)
+    backfill_phones(conn)
+    return applied
+
+
+if __name__ == '__main__':
+    raise SystemExit(db_migrate.run_cli(DB_PATH, MIGRATIONS, HOT_QUERIES))
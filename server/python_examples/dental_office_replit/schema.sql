@@ -5,6 +5,7 @@ CREATE TABLE IF NOT EXISTS patients (
     last_name TEXT NOT NULL,
     email TEXT UNIQUE NOT NULL,
     phone TEXT NOT NULL,
+    phone_e164 TEXT, -- Canonical E.164 form of phone, used for caller ID lookups
     address TEXT NOT NULL,
     date_of_birth DATE NOT NULL,
     medical_history TEXT,
@@ -83,6 +84,7 @@ CREATE TABLE IF NOT EXISTS billing (
     reference_number TEXT UNIQUE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     payment_id INTEGER, -- Link to last payment if needed
+    bill_number TEXT, -- Six-digit number printed on bills and read out by the phone agent
     FOREIGN KEY (patient_id) REFERENCES patients(id),
     FOREIGN KEY (dentist_id) REFERENCES dentists(id),
     FOREIGN KEY (appointment_id) REFERENCES appointments(id),
@@ -159,10 +161,19 @@ CREATE INDEX IF NOT EXISTS idx_patients_email ON patients(email);
 CREATE INDEX IF NOT EXISTS idx_patients_phone ON patients(phone);
 CREATE INDEX IF NOT EXISTS idx_dentists_name ON dentists(first_name, last_name);
 CREATE INDEX IF NOT EXISTS idx_dentists_email ON dentists(email);
-CREATE INDEX IF NOT EXISTS idx_appointments_patient ON appointments(patient_id);
-CREATE INDEX IF NOT EXISTS idx_appointments_dentist ON appointments(dentist_id);
+CREATE INDEX IF NOT EXISTS idx_patients_email_lower ON patients(LOWER(email));
+CREATE INDEX IF NOT EXISTS idx_dentists_email_lower ON dentists(LOWER(email));
+CREATE INDEX IF NOT EXISTS idx_appointments_dentist_start ON appointments(dentist_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_appointments_dentist_day ON appointments(dentist_id, date(start_time));
+CREATE INDEX IF NOT EXISTS idx_appointments_patient_start ON appointments(patient_id, start_time);
 CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(start_time);
-CREATE INDEX IF NOT EXISTS idx_billing_patient ON billing(patient_id);
+CREATE INDEX IF NOT EXISTS idx_billing_patient_due ON billing(patient_id, due_date);
+CREATE INDEX IF NOT EXISTS idx_billing_dentist_due ON billing(dentist_id, due_date);
 CREATE INDEX IF NOT EXISTS idx_billing_status ON billing(status);
 CREATE INDEX IF NOT EXISTS idx_payments_billing ON payments(billing_id);
+CREATE INDEX IF NOT EXISTS idx_payments_patient_date ON payments(patient_id, payment_date);
+CREATE INDEX IF NOT EXISTS idx_payment_methods_patient ON payment_methods(patient_id, is_default, created_at);
+CREATE INDEX IF NOT EXISTS idx_treatment_history_patient_date ON treatment_history(patient_id, treatment_date);
+CREATE INDEX IF NOT EXISTS idx_treatment_history_dentist_date ON treatment_history(dentist_id, treatment_date);
+CREATE INDEX IF NOT EXISTS idx_treatment_history_reference ON treatment_history(reference_number);
 CREATE INDEX IF NOT EXISTS idx_insurance_claims_billing ON insurance_claims(billing_id); 
\ No newline at end of file
@@ -0,0 +1,272 @@
+"""
+Per-dentist, per-day appointment slot bitmaps
+Each working day is split into 30-minute slots and kept as an integer bitmap
+(bit i set = slot i taken), built once from the dentist's working hours and
+that day's appointments. Availability checks and "first available" searches
+across several dentists and days are then bit operations instead of parsing
+working_hours and walking strftime strings on every request. The app calls
+record()/forget() after every appointment write so cached days stay current.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+SLOT_MINUTES = 30
+
+# Cached days and working hours are reloaded after this many seconds so writes
+# made by other worker processes show up without cross-process invalidation
+MAX_AGE_SECONDS = 60
+MAX_CACHED_DAYS = 4096
+
+# Windows offered by the voice agent's time_slot argument
+TIME_SLOT_WINDOWS = {
+    'morning': ('08:00', '11:00'),
+    'afternoon': ('14:00', '16:00'),
+    'evening': ('18:00', '20:00'),
+    'all_day': ('08:00', '20:00'),
+}
+
+
+def to_minutes(hhmm):
+    hours, minutes = hhmm.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def to_hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _parse(timestamp):
+    return datetime.fromisoformat(str(timestamp).replace(' ', 'T'))
+
+
+class DaySlots:
+    """Slot bitmap for one dentist on one day"""
+
+    __slots__ = ('first_minute', 'count', 'booked', 'masks', 'loaded_at')
+
+    def __init__(self, first_minute, count):
+        self.first_minute = first_minute
+        self.count = count
+        self.booked = 0
+        self.masks = {}  # appointment id -> bits it occupies
+        self.loaded_at = time.monotonic()
+
+    def mask(self, start_minute, end_minute):
+        """Bits for the slots overlapping [start_minute, end_minute)"""
+        first = max(0, (start_minute - self.first_minute) // SLOT_MINUTES)
+        last = min(self.count, -(-(end_minute - self.first_minute) // SLOT_MINUTES))
+        if last <= first:
+            return 0
+        return ((1 << (last - first)) - 1) << first
+
+    def add(self, appointment_id, start_minute, end_minute):
+        bits = self.mask(start_minute, end_minute)
+        self.masks[appointment_id] = bits
+        self.booked |= bits
+
+    def remove(self, appointment_id):
+        if self.masks.pop(appointment_id, None) is not None:
+            # Appointments may overlap, so rebuild from the rest rather than clearing bits
+            booked = 0
+            for bits in self.masks.values():
+                booked |= bits
+            self.booked = booked
+
+    def booked_without(self, exclude_id=None):
+        if exclude_id is None or exclude_id not in self.masks:
+            return self.booked
+        booked = 0
+        for appointment_id, bits in self.masks.items():
+            if appointment_id != exclude_id:
+                booked |= bits
+        return booked
+
+    def free_times(self, window=None, exclude_id=None):
+        """Free slot start times ('HH:MM'), optionally limited to a (start, end) minute window"""
+        booked = self.booked_without(exclude_id)
+        times = []
+        for index in range(self.count):
+            if booked >> index & 1:
+                continue
+            start = self.first_minute + index * SLOT_MINUTES
+            if window and not (window[0] <= start and start + SLOT_MINUTES <= window[1]):
+                continue
+            times.append(to_hhmm(start))
+        return times
+
+    def is_free(self, start_minute, end_minute, exclude_id=None):
+        """True if [start_minute, end_minute) lies inside working hours and no slot in it is taken"""
+        if start_minute < self.first_minute or end_minute > self.first_minute + self.count * SLOT_MINUTES:
+            return False
+        bits = self.mask(start_minute, end_minute)
+        return bits != 0 and not (self.booked_without(exclude_id) & bits)
+
+
+class SlotCache:
+    """Process-wide cache of DaySlots keyed by (dentist_id, 'YYYY-MM-DD')"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._days = OrderedDict()
+        self._hours = {}  # dentist_id -> (parsed working_hours, loaded_at)
+        self._appointment_days = {}  # appointment id -> (dentist_id, date)
+
+    def _working_hours(self, db, dentist_id):
+        cached = self._hours.get(dentist_id)
+        if cached is not None and time.monotonic() - cached[1] < MAX_AGE_SECONDS:
+            return cached[0]
+        row = db.execute('SELECT working_hours FROM dentists WHERE id = ?', (dentist_id,)).fetchone()
+        if not row:
+            self._hours.pop(dentist_id, None)
+            return None
+        hours = json.loads(row['working_hours'] or '{}')
+        self._hours[dentist_id] = (hours, time.monotonic())
+        return hours
+
+    def _drop_day(self, key):
+        """Remove a cached day and its appointments' entries in _appointment_days"""
+        day = self._days.pop(key, None)
+        if day is None:
+            return
+        for appointment_id in day.masks:
+            if self._appointment_days.get(appointment_id) == key:
+                del self._appointment_days[appointment_id]
+
+    def day(self, db, dentist_id, date):
+        """
+        Return the DaySlots for a dentist and date, loading it if needed
+
+        Returns:
+            DaySlots, or None if the dentist doesn't exist or doesn't work that day
+        """
+        dentist_id = int(dentist_id)
+        key = (dentist_id, date)
+        with self._lock:
+            day = self._days.get(key)
+            if day is not None and time.monotonic() - day.loaded_at < MAX_AGE_SECONDS:
+                self._days.move_to_end(key)
+                return day
+            self._drop_day(key)
+
+            hours = self._working_hours(db, dentist_id)
+            if hours is None:
+                return None
+            day_of_week = datetime.strptime(date, '%Y-%m-%d').strftime('%A').lower()
+            if day_of_week not in hours:
+                return None
+            first = to_minutes(hours[day_of_week]['start'])
+            count = max(0, (to_minutes(hours[day_of_week]['end']) - first) // SLOT_MINUTES)
+            day = DaySlots(first, count)
+
+            # Served by idx_appointments_dentist_day (dentist_id, date(start_time))
+            rows = db.execute('''
+                SELECT id, start_time, end_time
+                FROM appointments
+                WHERE dentist_id = ? AND date(start_time) = ? AND status != 'cancelled'
+            ''', (dentist_id, date)).fetchall()
+            for row in rows:
+                start, end = _parse(row['start_time']), _parse(row['end_time'])
+                end_minute = end.hour * 60 + end.minute if end.date() == start.date() else 24 * 60
+                day.add(row['id'], start.hour * 60 + start.minute, end_minute)
+                self._appointment_days[row['id']] = key
+
+            self._days[key] = day
+            while len(self._days) > MAX_CACHED_DAYS:
+                self._drop_day(next(iter(self._days)))
+            return day
+
+    def available_slots(self, db, dentist_id, date, window=None, exclude_id=None):
+        """Free 'HH:MM' slot times, or None if the dentist doesn't work that day"""
+        day = self.day(db, dentist_id, date)
+        if day is None:
+            return None
+        return day.free_times(window, exclude_id)
+
+    def is_available(self, db, dentist_id, start_time, end_time, exclude_id=None):
+        """True if the dentist is working and free for the whole appointment"""
+        start, end = _parse(start_time), _parse(end_time)
+        day = self.day(db, dentist_id, start.strftime('%Y-%m-%d'))
+        if day is None:
+            return False
+        return day.is_free(start.hour * 60 + start.minute, end.hour * 60 + end.minute, exclude_id)
+
+    def first_available(self, db, dentist_ids, start_date, days=7, window=None, limit=1, not_before=None, exclude_id=None):
+        """
+        Earliest free slots across several dentists and days
+
+        Args:
+            dentist_ids: Dentists to consider
+            start_date: First date to search ('YYYY-MM-DD')
+            days: Number of days to search
+            window: Optional (start, end) minutes each slot must fall inside
+            limit: Maximum number of slots to return
+            not_before: Optional datetime; earlier slots are skipped
+
+        Returns:
+            list: dicts with dentist_id, date and time, earliest first
+        """
+        current = datetime.strptime(start_date, '%Y-%m-%d')
+        found = []
+        for _ in range(days):
+            date = current.strftime('%Y-%m-%d')
+            candidates = []
+            for dentist_id in dentist_ids:
+                for slot in self.available_slots(db, dentist_id, date, window, exclude_id) or []:
+                    if not_before and datetime.strptime(f"{date} {slot}", '%Y-%m-%d %H:%M') < not_before:
+                        continue
+                    candidates.append((slot, int(dentist_id)))
+            for slot, dentist_id in sorted(candidates):
+                found.append({'dentist_id': dentist_id, 'date': date, 'time': slot})
+                if len(found) >= limit:
+                    return found
+            current += timedelta(days=1)
+        return found
+
+    def record(self, dentist_id, appointment_id, start_time, end_time, status='scheduled'):
+        """Apply a created, moved or status-changed appointment to cached days"""
+        with self._lock:
+            self.forget(appointment_id)
+            if status == 'cancelled' or dentist_id is None:
+                return
+            start, end = _parse(start_time), _parse(end_time)
+            key = (int(dentist_id), start.strftime('%Y-%m-%d'))
+            day = self._days.get(key)
+            if day is None:
+                # Not cached; it will be read fresh from the database when asked for
+                return
+            end_minute = end.hour * 60 + end.minute if end.date() == start.date() else 24 * 60
+            day.add(appointment_id, start.hour * 60 + start.minute, end_minute)
+            self._appointment_days[appointment_id] = key
+
+    def forget(self, appointment_id):
+        """Remove a cancelled or deleted appointment from cached days"""
+        with self._lock:
+            key = self._appointment_days.pop(appointment_id, None)
+            if key in self._days:
+                self._days[key].remove(appointment_id)
+
+    def invalidate_dentist(self, dentist_id):
+        """Drop a dentist's cached days and working hours (e.g. after a profile change)"""
+        dentist_id = int(dentist_id)
+        with self._lock:
+            self._hours.pop(dentist_id, None)
+            for key in [key for key in self._days if key[0] == dentist_id]:
+                self._drop_day(key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_slot_cache():
+    """Return the process-wide slot cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SlotCache()
+    return _cache
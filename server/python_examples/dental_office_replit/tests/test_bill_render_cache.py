@@ -0,0 +1,136 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import bill_render_cache
+from bill_render_cache import BillRenderCache, bill_render_fields, content_key
+
+BILL = {
+    'id': 7, 'bill_number': '123456', 'reference_number': 'REF-1', 'created_at': '2025-01-06 09:00:00',
+    'due_date': '2025-02-06', 'status': 'pending', 'patient_first_name': 'Ada', 'patient_last_name': 'Lovelace',
+    'patient_phone': '555-123-4567', 'patient_email': 'ada@example.com', 'service_name': 'Cleaning',
+    'treatment_date': '2025-01-06', 'dentist_first_name': 'John', 'dentist_last_name': 'Smith',
+    'amount': 150.0, 'patient_share': 100.0, 'amount_paid': 0, 'outstanding': 100.0, 'diagnosis': None,
+}
+
+SIZE = 100
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Swap the PIL/reportlab renderers for a counting one writing SIZE bytes"""
+    calls = []
+
+    def render(bill):
+        calls.append(bill['bill_number'])
+        time.sleep(0.01)
+        return b'x' * SIZE
+
+    for kind, (_, fields) in list(bill_render_cache.RENDERERS.items()):
+        monkeypatch.setitem(bill_render_cache.RENDERERS, kind, (render, fields))
+    return calls
+
+
+def bill(number, **changes):
+    return dict(BILL, bill_number=number, **changes)
+
+
+def test_key_follows_the_fields_shown():
+    row = dict(BILL, treatment_notes='not printed', patient_id=3)
+    fields = bill_render_fields(row)
+
+    assert set(fields) == {'id'} | set(bill_render_cache.PDF_FIELDS)
+    assert content_key('pdf', fields) == content_key('pdf', bill_render_fields(BILL))
+    assert content_key('pdf', bill_render_fields(dict(BILL, outstanding=40.0))) != content_key('pdf', fields)
+    # The email is on the PDF only
+    changed_email = bill_render_fields(dict(BILL, patient_email='other@example.com'))
+    assert content_key('jpg', changed_email) == content_key('jpg', fields)
+    assert content_key('pdf', changed_email) != content_key('pdf', fields)
+    # Rows without a PDF-only column (the MMS query) still give the image key
+    assert content_key('jpg', bill_render_fields({k: v for k, v in BILL.items() if k != 'patient_email'})) == \
+        content_key('jpg', fields)
+
+
+def test_renders_once_and_rerenders_after_a_change(tmp_path, renders):
+    cache = BillRenderCache(str(tmp_path))
+
+    first = cache.path('jpg', BILL)
+    assert cache.path('jpg', BILL) == first
+    assert cache.path('jpg', dict(BILL, status='paid')) != first
+
+    assert len(renders) == 2
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 2)
+
+
+def test_least_recently_used_files_are_evicted_within_max_bytes(tmp_path, renders):
+    cache = BillRenderCache(str(tmp_path), max_bytes=2 * SIZE)
+    oldest = cache.path('jpg', bill('1'))
+    middle = cache.path('jpg', bill('2'))
+    cache.path('jpg', bill('1'))  # now more recent than bill 2
+
+    cache.path('jpg', bill('3'))
+
+    assert cache.stats()['bytes'] <= 2 * SIZE
+    assert os.path.exists(oldest) and not os.path.exists(middle)
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in cache._entries)
+
+
+def test_checked_out_files_are_not_evicted(tmp_path, renders):
+    cache = BillRenderCache(str(tmp_path), max_bytes=SIZE)
+
+    with cache.checkout('pdf', bill('1')) as path:
+        cache.path('pdf', bill('2'))
+        cache.path('pdf', bill('3'))
+        assert os.path.exists(path)
+
+    assert not os.path.exists(path)
+    assert cache.stats()['bytes'] <= SIZE
+
+
+def test_a_file_removed_behind_the_cache_is_rendered_again(tmp_path, renders):
+    cache = BillRenderCache(str(tmp_path))
+    path = cache.path('jpg', BILL)
+    os.unlink(path)
+
+    assert cache.path('jpg', BILL) == path
+    assert os.path.exists(path) and len(renders) == 2
+
+
+def test_concurrent_requests_render_once(tmp_path, renders):
+    cache = BillRenderCache(str(tmp_path))
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(cache.path('pdf', BILL))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(renders) == 1
+    assert len(set(paths)) == 1 and len(paths) == 8
+
+
+def test_startup_adopts_files_and_removes_partial_writes(tmp_path, renders):
+    for age, name in ((300, 'old.jpg'), (200, 'newer.pdf'), (100, 'newest.jpg')):
+        path = tmp_path / name
+        path.write_bytes(b'x' * SIZE)
+        os.utime(path, (time.time() - age, time.time() - age))
+    (tmp_path / 'partial.jpg.123.tmp').write_bytes(b'x')
+
+    cache = BillRenderCache(str(tmp_path), max_bytes=2 * SIZE)
+
+    assert list(cache._entries) == ['newer.pdf', 'newest.jpg']
+    assert sorted(os.listdir(tmp_path)) == ['newer.pdf', 'newest.jpg']
+
+
+def test_size_limit_is_read_when_the_cache_is_built(monkeypatch, tmp_path):
+    monkeypatch.setattr(bill_render_cache, '_cache', None)
+    monkeypatch.setenv('BILL_RENDER_CACHE_MB', '3')
+    monkeypatch.chdir(tmp_path)
+
+    assert bill_render_cache.get_render_cache().max_bytes == 3 * 1024 * 1024
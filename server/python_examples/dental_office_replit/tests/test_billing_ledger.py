@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import sys
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import billing_ledger
+
+SCHEMA = """
+CREATE TABLE billing (
+    id INTEGER PRIMARY KEY, patient_id INTEGER NOT NULL, amount DECIMAL(10,2) NOT NULL,
+    insurance_coverage DECIMAL(10,2) DEFAULT 0, patient_portion DECIMAL(10,2) NOT NULL,
+    status TEXT NOT NULL, due_date TIMESTAMP NOT NULL
+);
+CREATE TABLE payments (
+    id INTEGER PRIMARY KEY, billing_id INTEGER NOT NULL, patient_id INTEGER NOT NULL,
+    amount DECIMAL(10,2) NOT NULL, payment_date TIMESTAMP NOT NULL, status TEXT NOT NULL
+);
+"""
+
+
+def make_db():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    for statement in billing_ledger.LEDGER_STATEMENTS:
+        conn.execute(statement)
+    # Patient 1: a $100 bill with $20 insurance, and a $50 bill
+    conn.execute("INSERT INTO billing VALUES (1, 1, 100, 20, 80, 'pending', '2020-01-01')")
+    conn.execute("INSERT INTO billing VALUES (2, 1, 50, 0, 50, 'pending', '2999-01-01')")
+    return conn
+
+
+def pay(conn, payment_id, billing_id, amount, status='completed'):
+    # The payment paths record the payment and decrement patient_portion together
+    conn.execute("INSERT INTO payments VALUES (?, ?, 1, ?, '2024-05-01', ?)", (payment_id, billing_id, amount, status))
+    if status == 'completed':
+        conn.execute("UPDATE billing SET patient_portion = patient_portion - ?, status = 'partial' WHERE id = ?",
+                     (amount, billing_id))
+
+
+def test_new_bills_fill_both_ledgers():
+    conn = make_db()
+
+    assert billing_ledger.bill_balance(conn, 1) == dict(
+        billing_ledger.bill_balance(conn, 1), patient_share=80.0, outstanding=80.0, amount_paid=0.0, overdue=True)
+    balance = billing_ledger.patient_balance(conn, 1)
+    assert (balance['total_billed'], balance['outstanding'], balance['open_bills']) == (130.0, 130.0, 2)
+    assert (balance['next_due_date'], balance['overdue_amount']) == ('2020-01-01', 80.0)
+
+
+def test_completed_payments_reduce_the_balance():
+    conn = make_db()
+    pay(conn, 1, 1, 30)
+    pay(conn, 2, 1, 99, status='failed')
+
+    bill = billing_ledger.bill_balance(conn, 1)
+    assert (bill['amount_paid'], bill['outstanding'], bill['payment_count']) == (30.0, 50.0, 1)
+    assert billing_ledger.patient_balance(conn, 1)['total_paid'] == 30.0
+
+    # A payment later marked refunded no longer counts
+    conn.execute("UPDATE payments SET status = 'refunded' WHERE id = 1")
+    assert billing_ledger.bill_balance(conn, 1)['amount_paid'] == 0.0
+
+    conn.execute("UPDATE billing SET patient_portion = 0, status = 'paid' WHERE id = 1")
+    balance = billing_ledger.patient_balance(conn, 1)
+    assert (balance['outstanding'], balance['open_bills'], balance['overdue']) == (50.0, 1, False)
+
+
+def test_moving_a_bill_updates_both_patients():
+    conn = make_db()
+    conn.execute("UPDATE billing SET patient_id = 2 WHERE id = 2")
+
+    assert billing_ledger.patient_balance(conn, 1)['total_billed'] == 80.0
+    assert billing_ledger.patient_balance(conn, 2)['total_billed'] == 50.0
+
+
+def test_deleting_bills_and_payments_updates_the_ledgers():
+    conn = make_db()
+    pay(conn, 1, 2, 10)
+    conn.execute("DELETE FROM payments WHERE id = 1")
+    assert billing_ledger.bill_balance(conn, 2)['amount_paid'] == 0.0
+
+    conn.execute("DELETE FROM billing WHERE id = 1")
+    assert billing_ledger.bill_balance(conn, 1) is None
+    balance = billing_ledger.patient_balance(conn, 1)
+    assert (balance['total_billed'], balance['open_bills'], balance['overdue']) == (50.0, 1, False)
+
+
+def test_rebuild_matches_the_triggers():
+    conn = make_db()
+    pay(conn, 1, 1, 30)
+    before = [dict(row) for row in conn.execute("SELECT * FROM bill_ledger ORDER BY billing_id")]
+    patient_before = billing_ledger.patient_balance(conn, 1)
+
+    billing_ledger.rebuild(conn)
+
+    assert [dict(row) for row in conn.execute("SELECT * FROM bill_ledger ORDER BY billing_id")] == before
+    assert billing_ledger.patient_balance(conn, 1)['outstanding'] == patient_before['outstanding']
@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import challenge_tokens
+from challenge_tokens import ChallengeTokenStore, MemoryTokenStore, SQLiteTokenStore
+
+PATIENT = {'patient_id': 'P1234567', 'first_name': 'Ada'}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(challenge_tokens.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path, clock):
+    if request.param == 'sqlite':
+        return SQLiteTokenStore(str(tmp_path / 'tokens.db'), ttl=60)
+    return MemoryTokenStore(ttl=60)
+
+
+def test_statuses_and_ttl_expiry(backend, clock):
+    backend.issue('tok-1', PATIENT)
+
+    assert backend.lookup('tok-1') == ('valid', PATIENT)
+    assert backend.lookup('') == ('missing', None)
+    assert backend.lookup(None) == ('missing', None)
+    assert backend.lookup('tok-2') == ('unknown', None)
+
+    clock[0] += 59
+    assert backend.lookup('tok-1')[0] == 'valid'
+    clock[0] += 1
+    assert backend.lookup('tok-1') == ('expired', None)
+    assert backend.size() == 0
+
+
+def test_revoke(backend):
+    backend.issue('tok-1', PATIENT)
+
+    assert backend.revoke('tok-1')
+    assert not backend.revoke('tok-1')
+    assert backend.lookup('tok-1') == ('unknown', None)
+
+
+def test_memory_store_purges_expired_tokens_from_the_front(clock):
+    backend = MemoryTokenStore(ttl=60)
+    backend.issue('old', PATIENT)
+    clock[0] += 30
+    backend.issue('new', PATIENT)
+    clock[0] += 31
+
+    assert backend.size() == 1
+    assert backend.metrics.to_dict()['purged'] == 1
+    assert backend.lookup('new')[0] == 'valid'
+
+
+def test_sqlite_store_keeps_only_the_token_digest(tmp_path):
+    db_path = str(tmp_path / 'tokens.db')
+    SQLiteTokenStore(db_path).issue('secret-token', PATIENT)
+
+    # Another worker process reading the same file sees the token
+    assert SQLiteTokenStore(db_path).lookup('secret-token') == ('valid', PATIENT)
+    conn = sqlite3.connect(db_path)
+    (token_hash,) = conn.execute('SELECT token_hash FROM challenge_tokens').fetchone()
+    conn.close()
+    assert 'secret-token' not in token_hash
+    assert token_hash == challenge_tokens.hashlib.sha256(b'secret-token').hexdigest()
+
+
+def test_facade_counts_each_outcome(clock):
+    store = ChallengeTokenStore(MemoryTokenStore(ttl=60))
+    store.issue('tok-1', PATIENT)
+    store.issue('tok-2', PATIENT)
+
+    assert store.get('tok-1') == PATIENT
+    assert store.get(None) is None
+    assert store.get('nope') is None
+    assert store.revoke('tok-2')
+    clock[0] += 60
+    assert store.get('tok-1') is None
+
+    stats = store.stats()
+    assert {name: stats[name] for name in ('issued', 'validated', 'missing', 'unknown', 'expired', 'revoked')} == {
+        'issued': 2, 'validated': 1, 'missing': 1, 'unknown': 1, 'expired': 1, 'revoked': 1}
+    assert (stats['backend'], stats['ttl_seconds'], stats['active']) == ('memory', 60, 0)
+
+
+def test_settings_are_read_when_the_store_is_built(monkeypatch, tmp_path):
+    monkeypatch.setattr(challenge_tokens, '_store', None)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('CHALLENGE_TOKEN_TTL', '90')
+    monkeypatch.setenv('CHALLENGE_TOKEN_STORE', 'sqlite')
+
+    stats = challenge_tokens.get_token_store().stats()
+
+    assert (stats['backend'], stats['ttl_seconds']) == ('sqlite', 90)
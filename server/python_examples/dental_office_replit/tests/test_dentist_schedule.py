@@ -0,0 +1,99 @@
+import json
+import os
+import sqlite3
+import sys
+from datetime import date
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from dentist_schedule import iter_dentist_schedule, iter_schedule_ndjson
+
+WEEKDAYS = {'monday': {'start': '09:00', 'end': '17:00'}, 'wednesday': {'start': '09:00', 'end': '12:00'}}
+
+# 2025-01-06 is a Monday
+MONDAY, TUESDAY, WEDNESDAY = date(2025, 1, 6), date(2025, 1, 7), date(2025, 1, 8)
+
+
+def make_db():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE dentists (id INTEGER PRIMARY KEY, working_hours TEXT);
+        CREATE TABLE patients (id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT);
+        CREATE TABLE dental_services (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE appointments (id INTEGER PRIMARY KEY, patient_id INTEGER, dentist_id INTEGER,
+                                   service_id INTEGER, start_time TEXT, end_time TEXT, status TEXT);
+        INSERT INTO patients VALUES (1, 'Ada', 'Lovelace');
+        INSERT INTO dental_services VALUES (1, 'Cleaning');
+    """)
+    conn.execute("INSERT INTO dentists VALUES (1, ?)", (json.dumps(WEEKDAYS),))
+    conn.execute("INSERT INTO dentists VALUES (2, ?)", (json.dumps({'tuesday': {'start': '10:00', 'end': '14:00'}}),))
+    return conn
+
+
+def book(conn, appointment_id, dentist_id, start, end):
+    conn.execute("INSERT INTO appointments VALUES (?, 1, ?, 1, ?, ?, 'scheduled')",
+                 (appointment_id, dentist_id, start, end))
+
+
+def dentists(conn, *ids):
+    return conn.execute(f"SELECT id, working_hours FROM dentists WHERE id IN ({', '.join('?' * len(ids))})",
+                        ids).fetchall()
+
+
+def by_day(entries):
+    return {(entry['dentist_id'], entry['date']): [a['id'] for a in entry['appointments']] for entry in entries}
+
+
+def test_appointments_are_merged_into_working_days():
+    conn = make_db()
+    # Both timestamp separators, out of insertion order
+    book(conn, 2, 1, '2025-01-08T10:00:00', '2025-01-08T10:30:00')
+    book(conn, 1, 1, '2025-01-06 09:00:00', '2025-01-06 09:30:00')
+    book(conn, 3, 1, '2025-01-06T11:00:00', '2025-01-06T11:30:00')
+
+    entries = list(iter_dentist_schedule(conn, dentists(conn, 1), MONDAY, WEDNESDAY))
+
+    # Tuesday is not a working day; Wednesday keeps its own hours
+    assert [entry['date'] for entry in entries] == ['2025-01-06', '2025-01-08']
+    assert by_day(entries) == {(1, '2025-01-06'): [1, 3], (1, '2025-01-08'): [2]}
+    assert entries[1]['working_hours'] == WEEKDAYS['wednesday']
+    assert entries[0]['appointments'][0]['patient_first_name'] == 'Ada'
+    assert entries[0]['appointments'][0]['service_name'] == 'Cleaning'
+
+
+def test_days_without_appointments_and_off_days():
+    conn = make_db()
+    # Tuesday is a day off for dentist 1; its appointment is skipped without stalling the walk
+    book(conn, 1, 1, '2025-01-07 09:00:00', '2025-01-07 09:30:00')
+    book(conn, 2, 1, '2025-01-08 09:00:00', '2025-01-08 09:30:00')
+
+    entries = list(iter_dentist_schedule(conn, dentists(conn, 1), MONDAY, WEDNESDAY))
+
+    assert by_day(entries) == {(1, '2025-01-06'): [], (1, '2025-01-08'): [2]}
+
+
+def test_several_dentists_come_out_in_id_order():
+    conn = make_db()
+    book(conn, 1, 2, '2025-01-07T10:00:00', '2025-01-07T11:00:00')
+    book(conn, 2, 1, '2025-01-06 15:00:00', '2025-01-06 16:00:00')
+    book(conn, 3, 2, '2025-01-09 10:00:00', '2025-01-09 11:00:00')  # after the range
+
+    entries = list(iter_dentist_schedule(conn, dentists(conn, 2, 1), MONDAY, WEDNESDAY))
+
+    assert [(entry['dentist_id'], entry['date']) for entry in entries] == [
+        (1, '2025-01-06'), (1, '2025-01-08'), (2, '2025-01-07')]
+    assert by_day(entries) == {(1, '2025-01-06'): [2], (1, '2025-01-08'): [], (2, '2025-01-07'): [1]}
+
+
+def test_ndjson_streams_one_line_per_day():
+    conn = make_db()
+    book(conn, 1, 1, '2025-01-06 09:00:00', '2025-01-06 09:30:00')
+
+    lines = iter_schedule_ndjson(conn, dentists(conn, 1, 2), MONDAY, WEDNESDAY)
+    first = next(lines)
+
+    assert first.endswith('\n')
+    assert json.loads(first)['appointments'][0]['start_time'] == '2025-01-06 09:00:00'
+    assert [json.loads(line)['date'] for line in lines] == ['2025-01-08', '2025-01-07']
@@ -0,0 +1,90 @@
+import json
+import os
+import sqlite3
+import sys
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import slot_cache
+from slot_cache import SlotCache
+
+# 2025-01-06 is a Monday
+DAY = '2025-01-06'
+
+
+def make_db():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE dentists (id INTEGER PRIMARY KEY, working_hours TEXT);
+        CREATE TABLE appointments (id INTEGER PRIMARY KEY, dentist_id INTEGER, start_time TEXT,
+                                   end_time TEXT, status TEXT);
+    """)
+    conn.execute("INSERT INTO dentists (id, working_hours) VALUES (1, ?)",
+                 (json.dumps({'monday': {'start': '09:00', 'end': '11:00'}}),))
+    conn.execute("INSERT INTO appointments VALUES (1, 1, '2025-01-06 09:00:00', '2025-01-06 09:30:00', 'scheduled')")
+    return conn
+
+
+def book(conn, cache, appointment_id, start, end):
+    conn.execute("INSERT INTO appointments VALUES (?, 1, ?, ?, 'scheduled')",
+                 (appointment_id, f"{DAY} {start}:00", f"{DAY} {end}:00"))
+    cache.record(1, appointment_id, f"{DAY} {start}:00", f"{DAY} {end}:00")
+
+
+def test_day_is_built_from_hours_and_appointments():
+    cache = SlotCache()
+    conn = make_db()
+
+    assert cache.available_slots(conn, 1, DAY) == ['09:30', '10:00', '10:30']
+    assert cache.available_slots(conn, 1, '2025-01-07') is None
+    assert not cache.is_available(conn, 1, f"{DAY} 09:00:00", f"{DAY} 09:30:00")
+
+
+def test_booking_and_cancelling_update_a_cached_day():
+    cache = SlotCache()
+    conn = make_db()
+    cache.available_slots(conn, 1, DAY)
+
+    book(conn, cache, 2, '10:00', '11:00')
+    assert cache.available_slots(conn, 1, DAY) == ['09:30']
+
+    cache.forget(2)
+    assert cache.available_slots(conn, 1, DAY) == ['09:30', '10:00', '10:30']
+
+    # Cancelling through record() frees the slot too, and a reschedule moves it
+    book(conn, cache, 3, '09:30', '10:00')
+    cache.record(1, 3, f"{DAY} 10:30:00", f"{DAY} 11:00:00")
+    assert cache.available_slots(conn, 1, DAY) == ['09:30', '10:00']
+    cache.record(1, 3, f"{DAY} 10:30:00", f"{DAY} 11:00:00", status='cancelled')
+    assert cache.available_slots(conn, 1, DAY) == ['09:30', '10:00', '10:30']
+
+
+def test_hours_edited_elsewhere_show_up_after_max_age(monkeypatch):
+    cache = SlotCache()
+    conn = make_db()
+    now = [1000.0]
+    monkeypatch.setattr(slot_cache.time, 'monotonic', lambda: now[0])
+    assert cache.available_slots(conn, 1, DAY) == ['09:30', '10:00', '10:30']
+
+    conn.execute("UPDATE dentists SET working_hours = ? WHERE id = 1",
+                 (json.dumps({'monday': {'start': '09:00', 'end': '10:00'}}),))
+    now[0] += slot_cache.MAX_AGE_SECONDS - 1
+    assert cache.available_slots(conn, 1, DAY) == ['09:30', '10:00', '10:30']
+    now[0] += 2
+    assert cache.available_slots(conn, 1, DAY) == ['09:30']
+
+
+def test_evicted_days_release_their_appointments(monkeypatch):
+    monkeypatch.setattr(slot_cache, 'MAX_CACHED_DAYS', 1)
+    cache = SlotCache()
+    conn = make_db()
+    cache.available_slots(conn, 1, DAY)
+    assert 1 in cache._appointment_days
+
+    cache.available_slots(conn, 1, '2025-01-13')
+    assert 1 not in cache._appointment_days
+
+    cache.invalidate_dentist(1)
+    assert cache._days == {} and cache._appointment_days == {} and cache._hours == {}
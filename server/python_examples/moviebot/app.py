@@ -1,5 +1,5 @@
 from flask import Flask, request, jsonify, send_file
-import requests
+import http_client
 import os
 from signalwire_swaig.swaig import SWAIG, SWAIGArgument
 import logging
@@ -32,7 +32,7 @@ swaig = SWAIG(
 def call_tmdb_api(endpoint, params):
     url = f"{TMDB_BASE_URL}{endpoint}"
     params['api_key'] = TMDB_API_KEY
-    response = requests.get(url, params=params)
+    response = http_client.get(url, params=params)
     if response.status_code == 200:
         return response.json()
     else:
@@ -5,6 +5,7 @@ This module provides functions to interact with The Movie Database (TMDB) API.
 """
 
 import requests
+import http_client
 from typing import Dict, Any, Optional
 
 # TMDB API base URL
@@ -29,7 +30,7 @@ def tmdb_request(api_key: str, endpoint: str, params: Optional[Dict[str, Any]] =
     request_params["api_key"] = api_key
     
     try:
-        response = requests.get(url, params=request_params)
+        response = http_client.get(url, params=request_params)
         response.raise_for_status()  # Raise an exception for HTTP errors
         return response.json()
     except requests.exceptions.RequestException as e:
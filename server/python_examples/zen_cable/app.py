@@ -1,5 +1,4 @@
 from flask import Flask, render_template, jsonify, request, session, redirect, url_for, flash, Response, g
-import sqlite3
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
@@ -7,17 +6,24 @@ import json
 import hashlib
 import secrets
 from functools import wraps
-import threading
 import time
 import logging
 from logging.handlers import RotatingFileHandler
 from signalwire_swaig.swaig import SWAIG, SWAIGArgument, SWAIGFunctionProperties
 from signalwire.rest import Client as SignalWireClient
-import schedule
 from signalwire.voice_response import VoiceResponse
 import sys
 from mfa_util import SignalWireMFA, is_valid_uuid, validate_phone
-import requests
+import http_client
+import db_pool
+import request_profiler
+import sql_trace
+from phone_util import to_e164
+from pagination import cursor_scope, encode_cursor, decode_cursor, fetch_page, load_children, get_appointment_totals
+import reminders
+from jobs import get_job_runner, JobQueueFull
+from telemetry import get_telemetry_store
+import billing_ledger
 import random
 
 # Global SignalWire configuration variables
@@ -86,6 +92,7 @@ def initialize_signalwire():
                 signalwire_client = SignalWireClient(
                     SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN, signalwire_space_url=SIGNALWIRE_SPACE
                 )
+                http_client.route_sdk_client(signalwire_client)
                 swaig = SWAIG(app, auth=(HTTP_USERNAME, HTTP_PASSWORD))
                 mfa_util = SignalWireMFA(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN, SIGNALWIRE_SPACE, FROM_NUMBER)
                 app.logger.info("SignalWire client, SWAIG, and MFA utility initialized successfully")
@@ -153,15 +160,11 @@ def register_swaig_endpoints():
                 'verification_timestamp': datetime.now().isoformat()
             }
             
-            billing = db.execute('''
-                SELECT * FROM billing 
-                WHERE customer_id = ? 
-                ORDER BY due_date DESC LIMIT 1
-            ''', (final_customer_id,)).fetchone()
+            account = billing_ledger.balance(db, final_customer_id)
             db.close()
             
-            if billing:
-                return f"Your current balance is ${billing['amount']:.2f}, due on {billing['due_date']}.", [response_metadata]
+            if account:
+                return f"Your current balance is ${account['balance']:.2f}, due on {account['due_date']}.", [response_metadata]
             return "No billing information found for your account.", [response_metadata]
         except Exception as e:
             app.logger.error(f"Error in check_balance: {str(e)}")
@@ -250,10 +253,11 @@ def register_swaig_endpoints():
             }
         ),
         customer_id=SWAIGArgument(type="string", description="The customer's account ID", required=False),
+        hours=SWAIGArgument(type="integer", description="How many hours back to check for outages (default 24)", required=False),
         meta_data=SWAIGArgument(type="object", description="Additional metadata including verified customer data", required=False),
         meta_data_token=SWAIGArgument(type="string", description="Metadata token for session tracking", required=False)
     )
-    def check_modem_status(customer_id=None, meta_data=None, meta_data_token=None):
+    def check_modem_status(customer_id=None, hours=24, meta_data=None, meta_data_token=None):
         try:
             # Try to get customer_id from metadata first
             verified_customer_id = None
@@ -282,7 +286,13 @@ def register_swaig_endpoints():
             }
             
             if modem:
-                return f"Your modem is {modem['status']}. MAC: {modem['mac_address']}.", [response_metadata]
+                reboot = get_job_runner().latest('modem_reboot', final_customer_id)
+                if reboot and reboot.active:
+                    return (f"Your modem is rebooting and should be back online in about {reboot.eta_seconds()} seconds. "
+                            f"MAC: {modem['mac_address']}."), [response_metadata]
+                if reboot and reboot.status == 'failed':
+                    return f"Your modem is {modem['status']}. The last reboot did not complete. MAC: {modem['mac_address']}.", [response_metadata]
+                return f"Your modem is {modem['status']}. MAC: {modem['mac_address']}.{describe_modem_outages(final_customer_id, hours)}", [response_metadata]
             return "No modem information found for your account.", [response_metadata]
         except Exception as e:
             app.logger.error(f"Error in check_modem_status: {str(e)}")
@@ -327,17 +337,13 @@ def register_swaig_endpoints():
             if not modem:
                 return "No modem information found for your account.", []
 
-            # Update modem status to rebooting
-            db.execute('UPDATE modems SET status = "rebooting", last_seen = CURRENT_TIMESTAMP WHERE customer_id = ?', 
-                      (final_customer_id,))
-            db.commit()
-
-            # Start the reboot simulation in a background thread
-            thread = threading.Thread(target=simulate_modem_reboot, args=(final_customer_id,))
-            thread.daemon = True
-            thread.start()
-
             db.close()
+
+            # Queue the reboot; repeat requests join the one already running
+            try:
+                reboot = simulate_modem_reboot(final_customer_id)
+            except JobQueueFull:
+                return "We're handling a high volume of modem requests right now. Please try again in a few minutes.", []
             
             # Return metadata with verified customer info
             response_metadata = {
@@ -346,7 +352,7 @@ def register_swaig_endpoints():
                 'verification_timestamp': datetime.now().isoformat()
             }
             
-            return "Modem reboot initiated. This will take about 15 seconds.", [response_metadata]
+            return f"Modem reboot initiated. This will take about {reboot.eta_seconds()} seconds.", [response_metadata]
         except Exception as e:
             app.logger.error(f"Error in reboot_modem: {str(e)}")
             return "Error rebooting modem.", []
@@ -452,10 +458,10 @@ def register_swaig_endpoints():
                 LEFT JOIN technicians t ON a.technician_id = t.id
                 WHERE a.id = ?
             ''', (appointment_id,)).fetchone()
-            # Schedule reminders if enabled
-            if sms_reminder:
-                schedule_reminders(dict(appointment))
+            # Queue reminders (no-op when disabled)
+            reminders.schedule_for(db, appointment)
             db.commit()
+            get_appointment_totals().invalidate(customer_id)
             # Send SMS notification about new appointment
             customer = db.execute('SELECT * FROM customers WHERE id = ?', (customer_id,)).fetchone()
             if customer:
@@ -468,7 +474,7 @@ def register_swaig_endpoints():
                         "To": customer['phone'],
                         "Body": message
                     }
-                    response = requests.post(
+                    response = http_client.post(
                         compat_url,
                         data=payload,
                         auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -587,7 +593,10 @@ def register_swaig_endpoints():
                 'notes': notes or appt['notes'],
                 'job_number': appt['job_number']
             })))
+            # Move the queued reminders to the new time
+            reminders.schedule_for(db, {**dict(appt), 'start_time': f"{date} {start_time}"})
             db.commit()
+            get_appointment_totals().invalidate(customer_id)
             # Get updated appointment
             updated_appointment = db.execute('''
                 SELECT a.*, t.name as technician_name
@@ -607,7 +616,7 @@ def register_swaig_endpoints():
                         "To": customer['phone'],
                         "Body": message
                     }
-                    response = requests.post(
+                    response = http_client.post(
                         compat_url,
                         data=payload,
                         auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -675,7 +684,9 @@ def register_swaig_endpoints():
                 'job_number': appt['job_number'],
                 'reason': 'Customer requested cancellation'
             })))
+            reminders.cancel_for(db, appointment_id)
             db.commit()
+            get_appointment_totals().invalidate(customer_id)
             # Get updated appointment
             updated_appointment = db.execute('''
                 SELECT a.*, t.name as technician_name
@@ -695,7 +706,7 @@ def register_swaig_endpoints():
                         "To": customer['phone'],
                         "Body": message
                     }
-                    response = requests.post(
+                    response = http_client.post(
                         compat_url,
                         data=payload,
                         auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -815,7 +826,7 @@ def register_swaig_endpoints():
             # Additional verification with phone number if provided
             verification_passed = True
             if phone_last_four:
-                if not customer['phone'] or not customer['phone'].endswith(phone_last_four):
+                if not customer['phone_e164'] or not customer['phone_e164'].endswith(phone_last_four):
                     verification_passed = False
             
             if not verification_passed:
@@ -888,6 +899,11 @@ def status_color(status):
 # Initialize and register endpoints
 initialize_signalwire()
 
+# Opt-in per-request profiling (REQUEST_PROFILING=true, read after .env is loaded above)
+request_profiler.install(app)
+# Per-request SQL counters and X-DB-* headers (SQL_DEBUG=true), slow-query log (SQL_SLOW_MS)
+sql_trace.install(app)
+
 # Environment Configuration
 HOST = '0.0.0.0'
 PORT = 8080
@@ -927,9 +943,9 @@ def swaig_endpoint():
     return Response(resp_body, mimetype='application/json')
 
 def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect('zen_cable.db')
-        g.db.row_factory = sqlite3.Row
+    # Pooled WAL connection; close() hands it back to the pool
+    if 'db' not in g or g.db.closed:
+        g.db = db_pool.connect('zen_cable.db')
     return g.db
 
 @app.teardown_appcontext
@@ -938,6 +954,38 @@ def close_db(error):
     if db is not None:
         db.close()
 
+@app.route('/debug/profiles', methods=['GET'])
+def debug_profiles():
+    """Debug endpoint listing captured request profiles, newest first"""
+    if not request_profiler.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({'success': True, 'profiles': request_profiler.get_profile_store().list()})
+
+@app.route('/debug/profiles/<profile_id>', methods=['GET'])
+def debug_profile(profile_id):
+    """Debug endpoint with one profile's hottest functions and SQL statements"""
+    profile = request_profiler.get_profile_store().get(profile_id)
+    if profile is None or not request_profiler.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({'success': True, 'profile': request_profiler.public(profile)})
+
+@app.route('/debug/profiles/<profile_id>/download', methods=['GET'])
+def debug_profile_download(profile_id):
+    """Debug endpoint returning a profile's raw data (.prof for cProfile, collapsed stacks for sampling)"""
+    profile = request_profiler.get_profile_store().get(profile_id)
+    if profile is None or not request_profiler.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    body, mimetype, filename = request_profiler.download(profile)
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/debug/slow-queries', methods=['GET'])
+def debug_slow_queries():
+    """Debug endpoint listing recent slow SQL statements with their query plans (SQL_DEBUG=true, SQL_DEBUG_TOKEN)"""
+    if not sql_trace.authorized(request.headers):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({'success': True, 'threshold_ms': sql_trace.slow_threshold_ms(),
+                    'queries': sql_trace.get_slow_log().entries()})
+
 def init_db_if_needed():
     try:
         db = get_db()
@@ -948,6 +996,9 @@ def init_db_if_needed():
             init_db()
             init_test_data()
             print("Database initialized!")
+        # Versioned index migrations (see migrations.py)
+        import migrations
+        migrations.migrate(db)
         db.close()
     except Exception as e:
         print(f"Error initializing database: {e}")
@@ -1057,21 +1108,32 @@ def get_modem_status():
     modem = db.execute('SELECT status FROM modems WHERE customer_id = ?', (session['customer_id'],)).fetchone()
     db.close()
     if modem:
-        return jsonify({'status': modem['status']})
+        reboot = get_job_runner().latest('modem_reboot', session['customer_id'])
+        return jsonify({'status': modem['status'], 'reboot': reboot.to_dict() if reboot else None})
     return jsonify({'error': 'Modem not found'}), 404
 
+@app.route('/api/modem/telemetry', methods=['GET'])
+@login_required
+def get_modem_telemetry():
+    try:
+        hours = max(1, min(int(request.args.get('hours', 24)), 24 * 365))
+    except ValueError:
+        return jsonify({'error': 'hours must be an integer'}), 400
+    store = get_telemetry_store()
+    end = time.time()
+    start = end - hours * 3600
+    series = store.series(session['customer_id'], start, end)
+    series['availability'] = store.availability(session['customer_id'], start, end)
+    return jsonify(series)
+
 @app.route('/api/billing/balance', methods=['GET'])
 @login_required
 def get_balance():
     db = get_db()
-    billing = db.execute('''
-        SELECT amount FROM billing 
-        WHERE customer_id = ? 
-        ORDER BY due_date DESC LIMIT 1
-    ''', (session['customer_id'],)).fetchone()
+    account = billing_ledger.balance(db, session['customer_id'])
     db.close()
-    if billing:
-        return jsonify({'balance': billing['amount']})
+    if account:
+        return jsonify({'balance': account['balance'], 'due_date': account['due_date']})
     return jsonify({'error': 'No billing information found'}), 404
 
 @app.route('/api/appointments', methods=['GET'])
@@ -1079,7 +1141,7 @@ def get_balance():
 def get_appointments():
     start = request.args.get('start')
     end = request.args.get('end')
-    page = max(1, request.args.get('page', 1, type=int))
+    cursor = request.args.get('cursor')
     per_page = min(max(1, request.args.get('per_page', 10, type=int)), 100)
     status = request.args.get('status')
     type_filter = request.args.get('type')
@@ -1148,30 +1210,49 @@ def get_appointments():
     if priority:
         query += ' AND a.priority = ?'
         params.append(priority)
-    query += f' ORDER BY a.{sort_by} {sort_order}'
-    total = db.execute(f"SELECT COUNT(*) FROM ({query})", params).fetchone()[0]
-    query += ' LIMIT ? OFFSET ?'
-    params.extend([per_page, (page - 1) * per_page])
-    appointments = db.execute(query, params).fetchall()
-    result = [dict(appt) for appt in appointments]
+    # The total only depends on the filters, so it is counted once and cached until
+    # this customer's appointments change
+    filter_params = list(params)
+
+    # Keyset pagination on (sort column, id); nullable columns sort as ''. A cursor only
+    # continues the sort and filters it was issued for
+    scope = cursor_scope(sort_by, sort_order, filter_params)
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, scope)
+        if not after or len(after) != 2:
+            db.close()
+            return jsonify({'error': 'Invalid cursor, or it was issued for a different sort or filter'}), 400
+
+    total = get_appointment_totals().get(
+        session['customer_id'], (query,) + tuple(filter_params),
+        lambda: db.execute(f"SELECT COUNT(*) FROM ({query})", filter_params).fetchone()[0]
+    )
+    sort_key = f'COALESCE(a.{sort_by}, \'\')' if sort_by in ('status', 'priority') else f'a.{sort_by}'
+    result, last_key = fetch_page(db, query, params, sort_key, sort_by, sort_order == 'desc', per_page,
+                                  after=after, id_expr='a.id')
+    has_more = last_key is not None
+    next_cursor = encode_cursor(last_key, scope) if has_more else None
 
     # Debug logging
     app.logger.info(f"Found {len(result)} appointments for customer {session['customer_id']}")
     for appt in result:
         app.logger.info(f"Appointment: {appt['id']} - {appt['type']} on {appt['start_time']}")
 
+    appointment_ids = [appt['id'] for appt in result]
     if include_history:
+        history = load_children(db, 'appointment_history', 'appointment_id', appointment_ids, 'created_at', descending=True)
         for appt in result:
-            history = db.execute('SELECT * FROM appointment_history WHERE appointment_id = ? ORDER BY created_at DESC', (appt['id'],)).fetchall()
-            appt['history'] = [dict(h) for h in history]
+            appt['history'] = history[appt['id']]
     if include_reminders:
+        reminders = load_children(db, 'appointment_reminders', 'appointment_id', appointment_ids, 'sent_at', descending=True)
         for appt in result:
-            reminders = db.execute('SELECT * FROM appointment_reminders WHERE appointment_id = ? ORDER BY sent_at DESC', (appt['id'],)).fetchall()
-            appt['reminders'] = [dict(r) for r in reminders]
+            appt['reminders'] = reminders[appt['id']]
     db.close()
     return jsonify({
         'appointments': result,
-        'pagination': {'total': total, 'page': page, 'per_page': per_page, 'total_pages': (total + per_page - 1) // per_page}
+        'pagination': {'total': total, 'per_page': per_page, 'total_pages': (total + per_page - 1) // per_page,
+                       'has_more': has_more, 'next_cursor': next_cursor}
     })
 
 @app.route('/appointments')
@@ -1197,11 +1278,7 @@ def appointments():
 def billing():
     db = get_db()
     customer = db.execute('SELECT * FROM customers WHERE id = ?', (session['customer_id'],)).fetchone()
-    current_balance = db.execute('''
-        SELECT amount, due_date FROM billing 
-        WHERE customer_id = ? 
-        ORDER BY due_date DESC LIMIT 1
-    ''', (session['customer_id'],)).fetchone()
+    current_balance = billing_ledger.balance(db, session['customer_id'])
     payment_methods = db.execute('''
         SELECT * FROM payment_methods 
         WHERE customer_id = ?
@@ -1214,7 +1291,7 @@ def billing():
     db.close()
 
     # Handle case when current_balance is None
-    balance_amount = current_balance['amount'] if current_balance else 0
+    balance_amount = current_balance['balance'] if current_balance else 0
     due_date = current_balance['due_date'] if current_balance else datetime.now()
 
     return render_template('billing.html', 
@@ -1234,13 +1311,14 @@ def modem_status():
             return jsonify({'error': 'Invalid status'}), 400
         try:
             if status == 'rebooting':
-                thread = threading.Thread(target=simulate_modem_reboot, args=(session['customer_id'],))
-                thread.daemon = True
-                thread.start()
+                simulate_modem_reboot(session['customer_id'])
             else:
                 db.execute('UPDATE modems SET status = ?, last_seen = CURRENT_TIMESTAMP WHERE customer_id = ?', 
                           (status, session['customer_id']))
                 db.commit()
+                get_telemetry_store().record(session['customer_id'], status)
+        except JobQueueFull:
+            return jsonify({'error': 'Too many modem requests in progress; try again shortly'}), 503
         except Exception as e:
             app.logger.error(f"Error updating modem status: {str(e)}")
             return jsonify({'error': 'Failed to update modem status'}), 500
@@ -1304,56 +1382,68 @@ def swap_modem():
         app.logger.error(f"Error swapping modem: {str(e)}")
         return jsonify({'error': 'Failed to update modem information'}), 500
 
-def simulate_modem_reboot(customer_id):
-    with app.app_context():
-        db = get_db()
-        try:
-            db.execute('UPDATE modems SET status = "rebooting", last_seen = CURRENT_TIMESTAMP WHERE customer_id = ?', (customer_id,))
-            db.commit()
-            time.sleep(15)
-            db.execute('UPDATE modems SET status = "online", last_seen = CURRENT_TIMESTAMP WHERE customer_id = ?', (customer_id,))
-            db.commit()
-        except Exception as e:
-            app.logger.error(f"Error in modem reboot simulation: {str(e)}")
-        finally:
-            db.close()
+# Simulated time for a modem to come back online after a reboot (seconds)
+MODEM_REBOOT_SECONDS = 15
 
-def send_appointment_reminder(appointment, reminder_type='sms'):
-    if not signalwire_client or not FROM_NUMBER:
-        return False
-    db = get_db()
+def set_modem_status(customer_id, status):
+    # Short-lived connection: job steps run outside any request
+    db = db_pool.connect('zen_cable.db')
     try:
-        customer = db.execute('SELECT * FROM customers WHERE id = ?', (appointment['customer_id'],)).fetchone()
-        if not customer:
-            return False
-        appointment_time = datetime.strptime(appointment['start_time'], '%Y-%m-%d %H:%M:%S')
-        formatted_time = appointment_time.strftime('%B %d, %Y at %I:%M %p')
-        message = f"Reminder: Your {appointment['type']} appointment is on {formatted_time}. Call 1-800-ZEN-CABLE to reschedule."
-        if reminder_type == 'sms':
-            signalwire_client.messages.create(to=customer['phone'], from_=FROM_NUMBER, body=message)
-        else:
-            signalwire_client.calls.create(to=customer['phone'], from_=FROM_NUMBER, 
-                                         url=f"{request.host_url}reminder_call/{appointment['id']}")
-        db.execute('INSERT INTO appointment_reminders (appointment_id, reminder_type, sent_at, status) VALUES (?, ?, CURRENT_TIMESTAMP, "sent")', 
-                  (appointment['id'], reminder_type))
+        db.execute('UPDATE modems SET status = ?, last_seen = CURRENT_TIMESTAMP WHERE customer_id = ?', (status, customer_id))
         db.commit()
-        return True
-    except Exception as e:
-        app.logger.error(f"Error sending {reminder_type} reminder: {str(e)}")
-        return False
     finally:
         db.close()
+    get_telemetry_store().record(customer_id, status)
+
+def describe_modem_outages(customer_id, hours=24):
+    """Sentence about time offline in the last `hours`, or '' when there is nothing to report"""
+    try:
+        hours = max(1, min(int(hours or 24), 24 * 365))
+    except (TypeError, ValueError):
+        hours = 24
+    now = time.time()
+    summary = get_telemetry_store().availability(customer_id, now - hours * 3600, now)
+    if not summary['known_seconds']:
+        return ''
+    if not summary['outages']:
+        return f" It has not gone offline in the last {hours} hours."
+    offline_minutes = max(1, round(summary['offline_seconds'] / 60))
+    outages = 'one outage' if summary['outages'] == 1 else f"{summary['outages']} outages"
+    text = (f" Over the last {hours} hours it was online {summary['uptime_pct']}% of the time, "
+            f"offline for about {offline_minutes} minute{'s' if offline_minutes != 1 else ''} in {outages}")
+    fmt = '%B %d at %I:%M %p'
+    if summary['last_outage_end'] is None:
+        return text + f"; it has been offline since {datetime.fromtimestamp(summary['last_outage_start']).strftime(fmt)}."
+    return text + f"; the last outage ended on {datetime.fromtimestamp(summary['last_outage_end']).strftime(fmt)}."
 
-def schedule_reminders(appointment):
+def simulate_modem_reboot(customer_id):
+    """Queue a simulated reboot ('rebooting' now, 'online' after MODEM_REBOOT_SECONDS); returns the job"""
+    return get_job_runner().submit('modem_reboot', customer_id, [
+        ('rebooting', 0, lambda: set_modem_status(customer_id, 'rebooting')),
+        ('online', MODEM_REBOOT_SECONDS, lambda: set_modem_status(customer_id, 'online')),
+    ])
+
+def send_appointment_reminder(reminder):
+    """Deliver one queued reminder (called by the reminder worker; raises on failure)"""
+    appointment_time = datetime.strptime(reminder['start_time'], '%Y-%m-%d %H:%M:%S')
+    formatted_time = appointment_time.strftime('%B %d, %Y at %I:%M %p')
+    message = f"Reminder: Your {reminder['type']} appointment is on {formatted_time}. Call 1-800-ZEN-CABLE to reschedule."
+    if reminder['reminder_type'] == 'sms':
+        signalwire_client.messages.create(to=reminder['phone'], from_=FROM_NUMBER, body=message)
+    else:
+        # Inline TwiML: the worker runs outside any request, so there is no host URL to call back
+        response = VoiceResponse()
+        response.say(message)
+        signalwire_client.calls.create(to=reminder['phone'], from_=FROM_NUMBER, twiml=str(response))
+
+def start_reminder_worker():
+    """Start delivering queued reminders once SignalWire is configured"""
     if not signalwire_client or not FROM_NUMBER:
-        return
-    appointment_time = datetime.strptime(appointment['start_time'], '%Y-%m-%d %H:%M:%S')
-    sms_time = appointment_time - timedelta(hours=24)
-    if sms_time > datetime.now():
-        schedule.every().day.at(sms_time.strftime('%H:%M')).do(send_appointment_reminder, appointment, 'sms')
-    call_time = appointment_time - timedelta(hours=1)
-    if call_time > datetime.now():
-        schedule.every().day.at(call_time.strftime('%H:%M')).do(send_appointment_reminder, appointment, 'call')
+        app.logger.info("SignalWire not configured; reminders stay queued")
+        return None
+    scheduler = reminders.get_reminder_scheduler(send_appointment_reminder)
+    scheduler.start()
+    return scheduler
 
 def log_appointment_history(appointment_id, action, details):
     db = get_db()
@@ -1388,10 +1478,10 @@ def update_profile():
     try:
         db.execute('''
             UPDATE customers 
-            SET first_name = ?, last_name = ?, phone = ?, address = ?
+            SET first_name = ?, last_name = ?, phone = ?, phone_e164 = ?, address = ?
             WHERE id = ?
         ''', (request.json['first_name'], request.json['last_name'], 
-              request.json['phone'], request.json['address'], 
+              request.json['phone'], to_e164(request.json['phone']), request.json['address'], 
               session['customer_id']))
         db.commit()
         customer = db.execute('SELECT * FROM customers WHERE id = ?', (session['customer_id'],)).fetchone()
@@ -1444,12 +1534,13 @@ def initiate_password_reset():
     db.close()
     if not customer or not customer['phone']:
         return jsonify({'error': 'No valid phone number found for this account'}), 400
-    if not validate_phone(customer['phone']):
+    phone = customer['phone_e164']
+    if not phone or not validate_phone(phone):
         return jsonify({'error': 'Invalid phone number format for this account.'}), 400
     try:
         mfa_url = f"https://{SIGNALWIRE_SPACE}.signalwire.com/api/relay/rest/mfa/sms"
         payload = {
-            "to": customer['phone'],
+            "to": phone,
             "from": FROM_NUMBER,
             "message": "Your Zen Cable password reset code is: {{code}}. This code will expire in 5 minutes.",
             "token_length": 6,
@@ -1457,7 +1548,7 @@ def initiate_password_reset():
             "allow_alphas": False,
             "valid_for": 300
         }
-        response = requests.post(
+        response = http_client.post(
             mfa_url,
             json=payload,
             auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -1495,7 +1586,7 @@ def verify_mfa():
         verify_url = f"https://{SIGNALWIRE_SPACE}.signalwire.com/api/relay/rest/mfa/{mfa_id}/verify"
         payload = {"token": code}
         print(f"[MFA VERIFY] Sending POST to {verify_url} with payload: {payload}")
-        response = requests.post(
+        response = http_client.post(
             verify_url,
             json=payload,
             auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -1544,7 +1635,7 @@ def process_payment():
                                    (session['customer_id'],)).fetchone()
         if current_balance:
             new_balance = current_balance['amount'] - float(request.json['amount'])
-            db.execute('UPDATE billing SET amount = ? WHERE customer_id = ?', 
+            db.execute('UPDATE billing SET amount = ? WHERE id = (SELECT id FROM billing WHERE customer_id = ? ORDER BY due_date DESC LIMIT 1)', 
                       (new_balance, session['customer_id']))
 
         db.commit()
@@ -1716,11 +1807,11 @@ def create_appointment():
             WHERE a.id = ?
         ''', (appointment_id,)).fetchone()
 
-        db.commit()
+        # Queue reminders (no-op when disabled)
+        reminders.schedule_for(db, appointment)
 
-        # Schedule reminders if enabled
-        if request.json.get('sms_reminder', True):
-            schedule_reminders(dict(appointment))
+        db.commit()
+        get_appointment_totals().invalidate(session['customer_id'])
 
         # Send SMS notification about new appointment
         customer = db.execute('SELECT * FROM customers WHERE id = ?', (session['customer_id'],)).fetchone()
@@ -1734,7 +1825,7 @@ def create_appointment():
                     "To": customer['phone'],
                     "Body": message
                 }
-                response = requests.post(
+                response = http_client.post(
                     compat_url,
                     data=payload,
                     auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -1796,8 +1887,10 @@ def cancel_appointment(appointment_id):
             'job_number': appointment['job_number'],
             'reason': reason
         })))
+        reminders.cancel_for(db, appointment_id)
 
         db.commit()
+        get_appointment_totals().invalidate(session['customer_id'])
 
         # Get updated appointment
         updated_appointment = db.execute('''
@@ -1819,7 +1912,7 @@ def cancel_appointment(appointment_id):
                     "To": customer['phone'],
                     "Body": message
                 }
-                response = requests.post(
+                response = http_client.post(
                     compat_url,
                     data=payload,
                     auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -1867,6 +1960,7 @@ def update_sms_reminder(appointment_id):
             SET sms_reminder = ?, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (sms_reminder, appointment_id))
+        reminders.schedule_for(db, {**dict(appointment), 'sms_reminder': sms_reminder})
 
         db.commit()
 
@@ -1954,7 +2048,10 @@ def reschedule_appointment(appointment_id):
             'notes': request.json.get('notes', appointment['notes']),
             'job_number': appointment['job_number']
         })))
+        # Move the queued reminders to the new time
+        reminders.schedule_for(db, {**dict(appointment), 'start_time': f"{request.json['date']} {start_time}"})
         db.commit()
+        get_appointment_totals().invalidate(session['customer_id'])
         # Get updated appointment
         updated_appointment = db.execute('''
             SELECT a.*, t.name as technician_name
@@ -1974,7 +2071,7 @@ def reschedule_appointment(appointment_id):
                     "To": customer['phone'],
                     "Body": message
                 }
-                response = requests.post(
+                response = http_client.post(
                     compat_url,
                     data=payload,
                     auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -2000,8 +2097,7 @@ def test_sms():
         return jsonify({'error': 'SignalWire client not initialized'}), 503
     if 'customer_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
-    db = sqlite3.connect('zen_cable.db')
-    db.row_factory = sqlite3.Row
+    db = db_pool.connect('zen_cable.db')
     customer = db.execute('SELECT * FROM customers WHERE id = ?', (session['customer_id'],)).fetchone()
     if not customer:
         return jsonify({'error': 'Customer not found'}), 404
@@ -2014,7 +2110,7 @@ def test_sms():
             "Body": "This is a test SMS from Zen Cable. Your phone number is working correctly!"
         }
         print(f"[Compat SMS] POST to {compat_url} with payload: {payload}")
-        response = requests.post(
+        response = http_client.post(
             compat_url,
             data=payload,
             auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -2034,8 +2130,7 @@ def test_mfa():
         return jsonify({'error': 'SignalWire client not initialized'}), 503
     if 'customer_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
-    db = sqlite3.connect('zen_cable.db')
-    db.row_factory = sqlite3.Row
+    db = db_pool.connect('zen_cable.db')
     customer = db.execute('SELECT * FROM customers WHERE id = ?', (session['customer_id'],)).fetchone()
     if not customer:
         return jsonify({'error': 'Customer not found'}), 404
@@ -2050,7 +2145,7 @@ def test_mfa():
             "allow_alphas": False,
             "valid_for": 300
         }
-        response = requests.post(
+        response = http_client.post(
             mfa_url,
             json=payload,
             auth=(SIGNALWIRE_PROJECT_ID, SIGNALWIRE_TOKEN),
@@ -2083,4 +2178,6 @@ if __name__ == '__main__':
     with app.app_context():
         init_db_if_needed()
         initialize_signalwire()
+        start_reminder_worker()
+        billing_ledger.get_consistency_checker().start()
     app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
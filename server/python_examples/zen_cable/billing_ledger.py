@@ -0,0 +1,280 @@
+"""
+Append-only billing ledger with running balances
+
+Every bill and payment appends one billing_ledger row carrying the signed
+amount and the customer's balance after it, plus the latest due date among
+their bills. Rows are written by triggers on billing and payments, so every
+write path (the portal, the SWAIG functions, init_test_data) posts to the
+ledger in the same transaction, and the ledger itself rejects UPDATE and
+DELETE. A balance lookup is the customer's newest ledger row, read through
+idx_billing_ledger_customer.
+
+Existing accounts are opened with one 'opening' entry equal to the balance the
+app reported before the ledger existed (the latest bill's amount). Its
+billing_id and payment_id record the highest ids that balance already covers,
+so the consistency checker only expects entries for rows written afterwards.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import db_pool
+
+DEFAULT_DB_PATH = 'zen_cable.db'
+
+# How often the background checker verifies the ledger (seconds); overridden by
+# LEDGER_CHECK_INTERVAL when the checker is created
+CHECK_INTERVAL = 3600
+
+# Amounts are stored rounded to cents; anything closer than this is equal
+TOLERANCE = 0.005
+
+logger = logging.getLogger(__name__)
+
+_LATEST = "(SELECT {column} FROM billing_ledger WHERE customer_id = {customer} ORDER BY id DESC LIMIT 1)"
+
+# Append one entry; balance and (unless given) due date follow on from the customer's newest entry
+_POST = """
+    INSERT INTO billing_ledger (customer_id, entry_type, amount, balance, due_date, billing_id, payment_id)
+    VALUES ({customer}, '{entry_type}', ROUND({amount}, 2),
+            ROUND(COALESCE({latest_balance}, 0) + {amount}, 2),
+            {due_date}, {billing_id}, {payment_id});
+"""
+
+
+def _post(entry_type, customer, amount, due_date=None, billing_id='NULL', payment_id='NULL'):
+    return _POST.format(
+        customer=customer, entry_type=entry_type, amount=amount,
+        latest_balance=_LATEST.format(column='balance', customer=customer),
+        due_date=due_date or _LATEST.format(column='due_date', customer=customer),
+        billing_id=billing_id, payment_id=payment_id,
+    )
+
+
+LEDGER_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS billing_ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL,
+        entry_type TEXT NOT NULL,
+        amount DECIMAL(10,2) NOT NULL,
+        balance DECIMAL(10,2) NOT NULL,
+        due_date DATE,
+        billing_id INTEGER,
+        payment_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (customer_id) REFERENCES customers (id)
+    )
+    """,
+    # Newest entry per customer: ORDER BY id DESC LIMIT 1 walks this index backwards
+    "CREATE INDEX IF NOT EXISTS idx_billing_ledger_customer ON billing_ledger (customer_id)",
+
+    """
+    CREATE TRIGGER IF NOT EXISTS billing_ledger_no_update BEFORE UPDATE ON billing_ledger
+    BEGIN
+        SELECT RAISE(ABORT, 'billing_ledger is append-only');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS billing_ledger_no_delete BEFORE DELETE ON billing_ledger
+    BEGIN
+        SELECT RAISE(ABORT, 'billing_ledger is append-only');
+    END
+    """,
+
+    # billing -> charge (a back-dated bill does not move the due date backwards)
+    f"""
+    CREATE TRIGGER IF NOT EXISTS billing_ledger_charge AFTER INSERT ON billing
+    BEGIN
+        {_post('charge', 'NEW.customer_id', 'NEW.amount', billing_id='NEW.id',
+               due_date=f"MAX(NEW.due_date, COALESCE({_LATEST.format(column='due_date', customer='NEW.customer_id')}, NEW.due_date))")}
+    END
+    """,
+
+    # payments -> payment, and a reversal when a payment fails (or is reinstated)
+    f"""
+    CREATE TRIGGER IF NOT EXISTS billing_ledger_payment AFTER INSERT ON payments
+    WHEN NEW.status != 'failed'
+    BEGIN
+        {_post('payment', 'NEW.customer_id', '-NEW.amount', payment_id='NEW.id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS billing_ledger_payment_failed AFTER UPDATE OF status ON payments
+    WHEN NEW.status = 'failed' AND OLD.status != 'failed'
+    BEGIN
+        {_post('reversal', 'OLD.customer_id', 'OLD.amount', payment_id='OLD.id')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS billing_ledger_payment_reinstated AFTER UPDATE OF status ON payments
+    WHEN OLD.status = 'failed' AND NEW.status != 'failed'
+    BEGIN
+        {_post('payment', 'NEW.customer_id', '-NEW.amount', payment_id='NEW.id')}
+    END
+    """,
+]
+
+
+def backfill(conn):
+    """
+    Open the ledger for customers billed before it existed (migration step)
+
+    The opening balance is what the app reported until now: the amount of the
+    customer's latest bill, which the payment paths decrement in place.
+    """
+    conn.execute("""
+        INSERT INTO billing_ledger (customer_id, entry_type, amount, balance, due_date, billing_id, payment_id)
+        SELECT b.customer_id, 'opening', ROUND(b.amount, 2), ROUND(b.amount, 2), b.due_date,
+               (SELECT MAX(id) FROM billing), (SELECT MAX(id) FROM payments)
+        FROM billing b
+        WHERE b.id = (SELECT id FROM billing WHERE customer_id = b.customer_id ORDER BY due_date DESC, id DESC LIMIT 1)
+          AND NOT EXISTS (SELECT 1 FROM billing_ledger WHERE customer_id = b.customer_id)
+    """)
+
+
+def balance(db, customer_id):
+    """
+    Current balance from the customer's newest ledger entry
+
+    Returns:
+        dict: balance, due_date and updated_at; or None if the customer has
+            never been billed
+    """
+    row = db.execute(
+        "SELECT balance, due_date, created_at FROM billing_ledger WHERE customer_id = ? ORDER BY id DESC LIMIT 1",
+        (customer_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {'balance': round(float(row[0]), 2), 'due_date': row[1], 'updated_at': row[2]}
+
+
+def history(db, customer_id, limit=50):
+    """Newest ledger entries for a customer, as dicts"""
+    rows = db.execute(
+        "SELECT id, entry_type, amount, balance, due_date, billing_id, payment_id, created_at "
+        "FROM billing_ledger WHERE customer_id = ? ORDER BY id DESC LIMIT ?",
+        (customer_id, limit)
+    ).fetchall()
+    columns = ('id', 'entry_type', 'amount', 'balance', 'due_date', 'billing_id', 'payment_id', 'created_at')
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def check(conn):
+    """
+    Verify the ledger against itself and against billing and payments
+
+    Returns:
+        list: Problems found, each a dict with kind, customer_id and details:
+            'running_balance' (an entry's balance is not the sum of the
+            amounts so far), 'missing_charge' (a bill without a charge entry)
+            and 'payment_mismatch' (a payment whose entries do not net to
+            -amount, or to zero once failed)
+    """
+    problems = []
+    for entry_id, customer_id, stored, expected in conn.execute("""
+        SELECT id, customer_id, balance, expected FROM (
+            SELECT id, customer_id, balance,
+                   ROUND(SUM(amount) OVER (PARTITION BY customer_id ORDER BY id), 2) AS expected
+            FROM billing_ledger)
+        WHERE ABS(balance - expected) > ?
+    """, (TOLERANCE,)):
+        problems.append({'kind': 'running_balance', 'customer_id': customer_id,
+                         'details': {'entry_id': entry_id, 'balance': stored, 'expected': expected}})
+
+    for billing_id, customer_id in conn.execute("""
+        SELECT b.id, b.customer_id FROM billing b
+        LEFT JOIN billing_ledger o ON o.customer_id = b.customer_id AND o.entry_type = 'opening'
+        WHERE b.id > COALESCE(o.billing_id, 0)
+          AND b.id NOT IN (SELECT billing_id FROM billing_ledger WHERE entry_type = 'charge' AND billing_id IS NOT NULL)
+    """):
+        problems.append({'kind': 'missing_charge', 'customer_id': customer_id, 'details': {'billing_id': billing_id}})
+
+    for payment_id, customer_id, posted, expected in conn.execute("""
+        SELECT p.id, p.customer_id, COALESCE(l.posted, 0),
+               CASE WHEN p.status = 'failed' THEN 0 ELSE -ROUND(p.amount, 2) END AS expected
+        FROM payments p
+        LEFT JOIN billing_ledger o ON o.customer_id = p.customer_id AND o.entry_type = 'opening'
+        LEFT JOIN (
+            SELECT payment_id, ROUND(SUM(amount), 2) AS posted FROM billing_ledger
+            WHERE entry_type IN ('payment', 'reversal') GROUP BY payment_id
+        ) l ON l.payment_id = p.id
+        WHERE p.id > COALESCE(o.payment_id, 0) AND ABS(COALESCE(l.posted, 0) - expected) > ?
+    """, (TOLERANCE,)):
+        problems.append({'kind': 'payment_mismatch', 'customer_id': customer_id,
+                         'details': {'payment_id': payment_id, 'posted': posted, 'expected': expected}})
+    return problems
+
+
+class ConsistencyChecker:
+    """Background thread running check() every interval seconds and logging what it finds"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, interval=CHECK_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval
+        self.last_run = None
+        self.last_problems = []
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='ledger-checker', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run_once(self):
+        conn = db_pool.connect(self.db_path)
+        try:
+            problems = check(conn)
+        finally:
+            conn.close()
+        self.last_run, self.last_problems = datetime.now().isoformat(), problems
+        if problems:
+            logger.error(f"Billing ledger check found {len(problems)} problem(s), first: {problems[0]}")
+        return problems
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except sqlite3.Error as e:
+                logger.error(f"Billing ledger check failed: {str(e)}")
+
+
+_checker = None
+_checker_lock = threading.Lock()
+
+
+def get_consistency_checker():
+    """Return the process-wide ledger consistency checker"""
+    global _checker
+    if _checker is None:
+        with _checker_lock:
+            if _checker is None:
+                _checker = ConsistencyChecker(interval=int(os.getenv('LEDGER_CHECK_INTERVAL', str(CHECK_INTERVAL))))
+    return _checker
+
+
+if __name__ == '__main__':
+    import sys
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH
+    conn = db_pool.connect(db_path)
+    try:
+        found = check(conn)
+    finally:
+        conn.close()
+    for problem in found:
+        print(problem)
+    print(f"{len(found)} problem(s)")
+    raise SystemExit(1 if found else 0)
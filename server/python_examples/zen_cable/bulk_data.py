@@ -0,0 +1,128 @@
+"""
+Deterministic bulk test-data helpers for load-testing databases
+
+BulkRandom is a seeded random.Random with generators for realistic people,
+phone numbers, addresses and skewed choices, so the same seed always yields
+the same database. insert_many() streams rows into executemany() in chunks,
+letting callers generate millions of rows lazily inside a single transaction.
+Phone numbers use the 555 exchange so a generated database can never text or
+call a real subscriber.
+"""
+
+import random
+import time
+from functools import lru_cache
+from itertools import accumulate
+
+FIRST_NAMES = (
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Karen',
+    'Daniel', 'Lisa', 'Matthew', 'Nancy', 'Anthony', 'Sandra', 'Mark', 'Ashley', 'Jose', 'Emily',
+    'Wei', 'Priya', 'Ahmed', 'Fatima', 'Hiroshi', 'Yuki', 'Olga', 'Ivan', 'Aisha', 'Kwame',
+    'Sofia', 'Mateo', 'Chloe', 'Liam', 'Amara', 'Noah', 'Mei', 'Arjun', 'Lucia', 'Omar',
+)
+
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+    'Nguyen', 'Patel', 'Kim', 'Chen', 'Singh', 'Khan', 'Ali', 'Tanaka', 'Ivanova', 'Okafor',
+    'Rossi', 'Muller', 'Dubois', 'Silva', 'Costa', 'Novak', 'Cohen', 'Murphy', 'Kowalski', 'Haddad',
+)
+
+STREETS = ('Main St', 'Oak Ave', 'Maple Dr', 'Cedar Ln', 'Pine St', 'Elm St', 'Park Ave', 'Lake Rd',
+           'Hill St', 'Sunset Blvd', 'River Rd', 'Church St', 'Washington Ave', 'Spring St', 'Highland Ave')
+
+CITIES = (('Springfield', 'IL'), ('Riverside', 'CA'), ('Franklin', 'TN'), ('Greenville', 'SC'),
+          ('Madison', 'WI'), ('Georgetown', 'TX'), ('Salem', 'OR'), ('Fairview', 'NJ'),
+          ('Clinton', 'IA'), ('Arlington', 'VA'))
+
+AREA_CODES = ('212', '312', '415', '512', '617', '650', '702', '713', '786', '808', '904', '971')
+
+# Rows handed to each executemany() call
+BATCH_SIZE = 10000
+
+
+@lru_cache(maxsize=None)
+def _zipf_weights(count, skew):
+    # Cumulative, so choices() can bisect instead of re-summing per pick
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+class BulkRandom(random.Random):
+    """Seeded random source with generators for realistic test records"""
+
+    def first_name(self):
+        return self.choice(FIRST_NAMES)
+
+    def last_name(self):
+        return self.choice(LAST_NAMES)
+
+    def phone(self):
+        """E.164 number in a real area code on the fictional 555 exchange"""
+        return f"+1{self.choice(AREA_CODES)}555{self.randint(0, 9999):04d}"
+
+    def address(self):
+        city, state = self.choice(CITIES)
+        return f"{self.randint(1, 9999)} {self.choice(STREETS)}, {city}, {state} {self.randint(10000, 99999)}"
+
+    def email(self, first, last, n, domain='example.com'):
+        """Unique per n (the record's sequence number)"""
+        return f"{first}.{last}{n}@{domain}".lower()
+
+    def skewed(self, items, skew=1.2):
+        """Pick from items with Zipf-like weights, so the first entries are the most popular"""
+        return self.choices(items, cum_weights=_zipf_weights(len(items), skew))[0]
+
+    def weighted(self, weights):
+        """Pick a key of a {value: weight} dict"""
+        return self.choices(list(weights), list(weights.values()))[0]
+
+    def unique_numbers(self, count, digits):
+        """count distinct numbers with exactly `digits` digits, as strings, in random order"""
+        low, high = 10 ** (digits - 1), 10 ** digits
+        if count > high - low:
+            raise ValueError(f"Only {high - low} distinct {digits}-digit numbers exist; {count} requested")
+        return [str(number) for number in self.sample(range(low, high), count)]
+
+
+def insert_many(conn, sql, rows, batch_size=BATCH_SIZE):
+    """
+    executemany() rows in chunks; rows may be any iterable, including a generator
+
+    The caller owns the transaction (commit once at the end).
+
+    Returns:
+        int: Rows inserted
+    """
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+def tune_for_bulk_load(conn):
+    """Favour load speed over durability for a throwaway load-test database"""
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+
+
+class Progress:
+    """Prints how many rows each step wrote and how long it took"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+
+    def step(self, label, count):
+        now = time.perf_counter()
+        print(f"  {label:<24} {count:>10,} rows  {now - self.started:6.1f}s")
+        self.started = now
@@ -25,6 +25,7 @@ def init_db():
             name TEXT NOT NULL,
             email TEXT UNIQUE NOT NULL,
             phone TEXT NOT NULL,
+            phone_e164 TEXT,
             address TEXT,
             password_hash TEXT NOT NULL,
             password_salt TEXT NOT NULL,
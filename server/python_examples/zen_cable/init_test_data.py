@@ -1,9 +1,14 @@
 import sqlite3
 from datetime import datetime, timedelta
+import argparse
 import hashlib
 import secrets
 import random
 
+import reminders
+import telemetry
+from bulk_data import BulkRandom, Progress, insert_many, tune_for_bulk_load
+
 def hash_password(password):
     salt = secrets.token_hex(16)
     hash_obj = hashlib.sha256((password + salt).encode())
@@ -155,5 +160,198 @@ def init_test_data():
     print("Test data initialized successfully")
     print(f"Test account credentials:\nCustomer ID: {customer_id}\nEmail: {test_customer['email']}\nPassword: {test_customer['password']}")
 
-if __name__ == '__main__':
+
+# Bulk load-test data (python init_test_data.py --customers 200000 --months 12 --appointments 50000)
+
+# Share of customers subscribing to each service type, modem makes, and appointment types
+SERVICE_TAKE_UP = {'internet': 0.9, 'cable': 0.55}
+MODEMS = {('Motorola', 'MB8600'): 35, ('Arris', 'SB8200'): 30, ('Netgear', 'CM1000'): 20, ('Technicolor', 'TC4400'): 15}
+APPOINTMENT_TYPES = {'repair': 45, 'installation': 25, 'modem_swap': 18, 'upgrade': 12}
+TIME_SLOTS = {'morning': ('08:00:00', '11:00:00'), 'afternoon': ('14:00:00', '16:00:00'),
+              'evening': ('18:00:00', '20:00:00')}
+PAYMENT_METHODS = {'credit_card': 60, 'bank_transfer': 25, 'debit_card': 15}
+# Appointments extend this many days past today
+FUTURE_DAYS = 30
+# Customers whose modems get --telemetry-hours of minute-by-minute samples
+TELEMETRY_CUSTOMERS = 1000
+
+
+def _bulk_customers(rng, first_id, count, password_hash, password_salt):
+    for n in range(count):
+        first, last = rng.first_name(), rng.last_name()
+        phone = rng.phone()
+        yield (first_id + n, f"{first} {last}", rng.email(first, last, first_id + n), phone, phone, rng.address(),
+               password_hash, password_salt, first, last)
+
+
+def _bulk_modems(rng, customer_ids, now):
+    last_seen = now.strftime('%Y-%m-%d %H:%M:%S')
+    for customer_id in customer_ids:
+        # Locally administered MAC derived from the customer id, so it is unique
+        mac = ':'.join(f"{byte:02X}" for byte in (0x02, 0x5E, *customer_id.to_bytes(4, 'big')))
+        make, model = rng.weighted(MODEMS)
+        yield customer_id, mac, make, model, 'online' if rng.random() < 0.97 else 'offline', last_seen
+
+
+def _bulk_bills(rng, customers, months, today):
+    """Yield (bill row, payment rows) per customer and month, oldest first"""
+    for customer_id, monthly in customers:
+        tenure = rng.randint(1, months)
+        autopay = rng.random() < 0.6
+        method = rng.weighted(PAYMENT_METHODS)
+        for age in range(tenure - 1, -1, -1):
+            due = today + timedelta(days=15 - 30 * age)
+            if age == 0:
+                yield (customer_id, monthly, due.isoformat(), 'pending'), []
+                continue
+            payments = []
+            paid_on = due - timedelta(days=0 if autopay else rng.randint(0, 12))
+            if rng.random() < 0.02:
+                payments.append((customer_id, monthly, paid_on.isoformat(), method, 'failed'))
+                paid_on += timedelta(days=rng.randint(1, 5))
+            payments.append((customer_id, monthly, paid_on.isoformat(), method, 'completed'))
+            yield (customer_id, monthly, due.isoformat(), 'paid'), payments
+
+
+def _bulk_appointments(rng, count, customers, numbers, days, now):
+    start = now - timedelta(days=max(days - FUTURE_DAYS, 0))
+    slots = list(TIME_SLOTS.values())
+    for n in range(count):
+        day = (start + timedelta(days=rng.randrange(days))).strftime('%Y-%m-%d')
+        begins, ends = rng.choice(slots)
+        appointment_type = rng.weighted(APPOINTMENT_TYPES)
+        if f"{day} {begins}" < now.strftime('%Y-%m-%d %H:%M:%S'):
+            status = 'completed' if rng.random() < 0.9 else 'cancelled'
+        else:
+            status = 'scheduled' if rng.random() < 0.95 else 'cancelled'
+        yield (rng.choice(customers), appointment_type, status, f"{day} {begins}", f"{day} {ends}",
+               f"{appointment_type.replace('_', ' ').capitalize()} service event", int(rng.random() < 0.85), numbers[n])
+
+
+def _bulk_telemetry(rng, customer_id, hours, now):
+    """Minute-by-minute modem samples with healthy signal levels and the odd outage"""
+    end = int(now) - int(now) % telemetry.SAMPLE_INTERVAL
+    offline_until = 0
+    for ts in range(end - hours * 3600, end + 1, telemetry.SAMPLE_INTERVAL):
+        if ts >= offline_until and rng.random() < 0.0005:
+            offline_until = ts + 60 * rng.randint(5, 90)
+        if ts < offline_until:
+            yield customer_id, ts, 'offline', None, None
+        else:
+            yield customer_id, ts, 'online', round(rng.gauss(36, 1.5), 1), round(rng.gauss(44, 2.5), 1)
+
+
+def generate_bulk_data(customers=0, months=12, appointments=0, telemetry_hours=0, seed=42, db_path='zen_cable.db'):
+    """
+    Add production-sized customer, billing, payment and appointment volumes
+
+    Each generated customer gets services, a modem and up to `months` monthly
+    bills, settled by payments except the current one. Rows are generated
+    from a seeded BulkRandom and written with executemany in one transaction,
+    so the same arguments always produce the same database. Job numbers are 5
+    digits, which caps how many appointments can exist. Modem telemetry goes
+    through TelemetryStore.ingest (its own transactions) so the rollup tiers
+    are filled too.
+    """
+    rng = BulkRandom(seed)
+    now = datetime.now().replace(microsecond=0)
+    months = max(int(months), 1)
+    progress = Progress()
+    db = sqlite3.connect(db_path)
+    cursor = db.cursor()
+    try:
+        tune_for_bulk_load(db)
+        services = cursor.execute("SELECT id, price, type FROM services ORDER BY id").fetchall()
+        first_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM customers").fetchone()[0] + 1
+        password_hash, password_salt = hash_password('password123')
+        count = insert_many(cursor, '''
+            INSERT INTO customers (id, name, email, phone, phone_e164, address, password_hash, password_salt,
+                                   first_name, last_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _bulk_customers(rng, first_id, customers, password_hash, password_salt))
+        progress.step('customers', count)
+
+        subscriptions, monthly = [], []
+        for customer_id in range(first_id, first_id + customers):
+            chosen = [service for service in services if rng.random() < SERVICE_TAKE_UP.get(service[2], 0.5)]
+            chosen = chosen or [rng.choice(services)]
+            subscriptions.extend((customer_id, service[0]) for service in chosen)
+            monthly.append((customer_id, round(sum(float(service[1]) for service in chosen), 2)))
+        count = insert_many(cursor, "INSERT INTO customer_services (customer_id, service_id, status) VALUES (?, ?, 'active')",
+                            subscriptions)
+        progress.step('customer services', count)
+
+        count = insert_many(cursor, '''
+            INSERT INTO modems (customer_id, mac_address, make, model, status, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', _bulk_modems(rng, range(first_id, first_id + customers), now))
+        progress.step('modems', count)
+
+        # Bills first, then payments: the ledger triggers post each in id order
+        payments = []
+
+        def bill_rows():
+            for bill, bill_payments in _bulk_bills(rng, monthly, months, now.date()):
+                payments.extend(bill_payments)
+                yield bill
+
+        count = insert_many(cursor, "INSERT INTO billing (customer_id, amount, due_date, status) VALUES (?, ?, ?, ?)",
+                            bill_rows())
+        progress.step('bills', count)
+        count = insert_many(cursor, '''
+            INSERT INTO payments (customer_id, amount, payment_date, payment_method, status, transaction_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (payment + (f"BULK{n:09d}",) for n, payment in enumerate(payments)))
+        progress.step('payments', count)
+
+        if appointments:
+            customer_ids = [row[0] for row in cursor.execute("SELECT id FROM customers ORDER BY id")]
+            taken = {row[0] for row in cursor.execute("SELECT job_number FROM appointments WHERE job_number IS NOT NULL")}
+            numbers = [number for number in rng.unique_numbers(min(appointments + len(taken), 90000), 5)
+                       if number not in taken]
+            if len(numbers) < appointments:
+                raise ValueError(f"Only {len(numbers)} unused 5-digit job numbers remain")
+            count = insert_many(cursor, '''
+                INSERT INTO appointments (customer_id, type, status, start_time, end_time, notes, sms_reminder, job_number)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', _bulk_appointments(rng, appointments, customer_ids, numbers, months * 30 + FUTURE_DAYS, now))
+            progress.step('appointments', count)
+            # Databases migrated to the reminder queue need rows for the new upcoming appointments
+            if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'scheduled_reminders'").fetchone():
+                reminders.backfill(db)
+                progress.step('reminders', cursor.execute(
+                    "SELECT COUNT(*) FROM scheduled_reminders WHERE status = 'pending'").fetchone()[0])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    if telemetry_hours:
+        if telemetry_hours * 3600 > telemetry.RAW_RETENTION:
+            raise ValueError(f"Telemetry is kept raw for {telemetry.RAW_RETENTION // 3600} hours at most")
+        store = telemetry.TelemetryStore(db_path)
+        count = 0
+        for customer_id in range(first_id, first_id + min(customers, TELEMETRY_CUSTOMERS)):
+            count += store.ingest(_bulk_telemetry(rng, customer_id, telemetry_hours, now.timestamp()), now.timestamp())
+        progress.step('telemetry samples', count)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load demo data, optionally with bulk load-test volumes')
+    parser.add_argument('--customers', type=int, default=0, help='Extra generated customers')
+    parser.add_argument('--months', type=int, default=12, help='Months of billing history per customer (at most)')
+    parser.add_argument('--appointments', type=int, default=0, help='Extra generated appointments (at most ~90,000)')
+    parser.add_argument('--telemetry-hours', type=int, default=0,
+                        help=f'Hours of modem samples for up to {TELEMETRY_CUSTOMERS} generated customers (at most 48)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+    args = parser.parse_args(argv)
     init_test_data()
+    if args.customers or args.appointments:
+        print(f"Generating bulk data (seed {args.seed})...")
+        generate_bulk_data(args.customers, args.months, args.appointments, args.telemetry_hours, args.seed)
+
+
+if __name__ == '__main__':
+    main()
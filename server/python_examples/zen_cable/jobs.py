@@ -0,0 +1,229 @@
+"""
+In-process background jobs with a bounded worker pool and delayed steps
+
+A job is a list of steps, each run after a delay once the previous step has
+finished. Delays are entries in a single timer heap served by one thread, so
+a job waiting for its next step holds no thread and no database connection;
+steps themselves run on a fixed-size pool. At most one job per (kind, key) is
+active at a time, so a burst of identical requests (e.g. repeated reboot
+requests for the same modem) joins the job already in flight. Job status is
+kept in memory for a while after completion so callers can report progress.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Overridden by JOB_WORKERS when a runner is created
+DEFAULT_WORKERS = 4
+
+# Jobs accepted but not yet finished; beyond this submit() raises JobQueueFull
+# (overridden by JOB_MAX_ACTIVE when a runner is created)
+MAX_ACTIVE_JOBS = 1000
+
+# Finished jobs stay queryable this long (seconds)
+FINISHED_TTL_SECONDS = 600
+
+ACTIVE_STATUSES = ('queued', 'scheduled', 'running')
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(RuntimeError):
+    """Too many jobs are already active"""
+
+
+class Job:
+    """One submitted job and its progress"""
+
+    def __init__(self, kind, key, steps):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = str(key)
+        self.steps = list(steps)  # [(name, delay_seconds, fn), ...]
+        self.step_index = 0
+        self.status = 'queued'
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.run_at = None  # wall-clock time the next step is due
+
+    @property
+    def active(self):
+        return self.status in ACTIVE_STATUSES
+
+    @property
+    def step(self):
+        return self.steps[self.step_index][0] if self.step_index < len(self.steps) else None
+
+    def eta_seconds(self):
+        """Seconds until the job's last step is due, or None once finished"""
+        if not self.active:
+            return None
+        remaining = sum(delay for _, delay, _ in self.steps[self.step_index + 1:])
+        if self.run_at:
+            remaining += max(self.run_at - time.time(), 0)
+        return round(remaining)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'key': self.key,
+            'status': self.status,
+            'step': self.step,
+            'eta_seconds': self.eta_seconds(),
+            'error': self.error,
+            'created_at': datetime.fromtimestamp(self.created_at).isoformat(),
+            'updated_at': datetime.fromtimestamp(self.updated_at).isoformat(),
+        }
+
+
+class JobRunner:
+    """Bounded worker pool plus a timer heap for delayed job steps"""
+
+    def __init__(self, max_workers=None, max_active=None, finished_ttl=FINISHED_TTL_SECONDS):
+        if max_workers is None:
+            max_workers = int(os.getenv('JOB_WORKERS', str(DEFAULT_WORKERS)))
+        if max_active is None:
+            max_active = int(os.getenv('JOB_MAX_ACTIVE', str(MAX_ACTIVE_JOBS)))
+        self.max_active = max_active
+        self.finished_ttl = finished_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._lock = threading.Lock()
+        self._timer_ready = threading.Condition(self._lock)
+        self._heap = []  # (monotonic due time, sequence, job)
+        self._sequence = itertools.count()
+        self._jobs = {}  # job id -> Job
+        self._by_key = {}  # (kind, key) -> latest Job
+        self._counts = {'submitted': 0, 'joined': 0, 'succeeded': 0, 'failed': 0, 'rejected': 0}
+        self._timer = threading.Thread(target=self._run_timer, name='job-timer', daemon=True)
+        self._timer.start()
+
+    def submit(self, kind, key, steps):
+        """
+        Start a job unless one of the same kind is already active for key
+
+        Args:
+            kind: Job type (e.g. 'modem_reboot')
+            key: What the job acts on (e.g. customer id); one active job per (kind, key)
+            steps: [(name, delay_seconds, fn), ...]; each fn() runs after the
+                previous step finished and its delay elapsed
+
+        Returns:
+            Job: The new job, or the active one it joined
+
+        Raises:
+            JobQueueFull: max_active jobs are already in flight
+        """
+        with self._lock:
+            self._prune(time.time())
+            existing = self._by_key.get((kind, str(key)))
+            if existing and existing.active:
+                self._counts['joined'] += 1
+                return existing
+            if sum(1 for job in self._jobs.values() if job.active) >= self.max_active:
+                self._counts['rejected'] += 1
+                raise JobQueueFull(f'{self.max_active} jobs already active')
+            job = Job(kind, key, steps)
+            self._jobs[job.id] = job
+            self._by_key[(kind, job.key)] = job
+            self._counts['submitted'] += 1
+            self._schedule_step(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self, kind, key):
+        """Most recent job of a kind for key (active, or finished within finished_ttl), or None"""
+        with self._lock:
+            return self._by_key.get((kind, str(key)))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats['active'] = sum(1 for job in self._jobs.values() if job.active)
+            stats['delayed'] = len(self._heap)
+        return stats
+
+    def _schedule_step(self, job):
+        # Caller holds self._lock
+        delay = job.steps[job.step_index][1]
+        job.updated_at = time.time()
+        if delay > 0:
+            job.status = 'scheduled'
+            job.run_at = job.updated_at + delay
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), job))
+            self._timer_ready.notify()
+        else:
+            job.run_at = None
+            self._executor.submit(self._run_step, job)
+
+    def _run_timer(self):
+        with self._lock:
+            while True:
+                if not self._heap:
+                    self._timer_ready.wait()
+                    continue
+                due, _, job = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._timer_ready.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                job.run_at = None
+                self._executor.submit(self._run_step, job)
+
+    def _run_step(self, job):
+        with self._lock:
+            job.status = 'running'
+            job.updated_at = time.time()
+            name, _, fn = job.steps[job.step_index]
+        try:
+            fn()
+        except Exception as e:
+            logger.error(f"Job {job.kind} {job.key} failed in step {name}: {str(e)}")
+            with self._lock:
+                job.status = 'failed'
+                job.error = str(e)
+                job.updated_at = time.time()
+                self._counts['failed'] += 1
+            return
+        with self._lock:
+            job.step_index += 1
+            if job.step_index < len(job.steps):
+                self._schedule_step(job)
+            else:
+                job.status = 'succeeded'
+                job.updated_at = time.time()
+                self._counts['succeeded'] += 1
+
+    def _prune(self, now):
+        # Caller holds self._lock
+        expired = [job for job in self._jobs.values() if not job.active and now - job.updated_at > self.finished_ttl]
+        for job in expired:
+            del self._jobs[job.id]
+            if self._by_key.get((job.kind, job.key)) is job:
+                del self._by_key[(job.kind, job.key)]
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    """Return the process-wide job runner"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner()
+    return _runner
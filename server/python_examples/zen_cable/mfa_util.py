@@ -1,12 +1,14 @@
 import logging
 import requests
 import re
+import http_client
 from signalwire.rest import Client as SignalWireClient
 
 class SignalWireMFA:
     def __init__(self, project_id: str, token: str, space: str, from_number: str):
         try:
             self.client = SignalWireClient(project_id, token, signalwire_space_url=f"{space}.signalwire.com")
+            http_client.route_sdk_client(self.client)
             self.project_id = project_id
             self.token = token
             self.space = space
@@ -31,7 +33,7 @@ class SignalWireMFA:
             }
             headers = {"Content-Type": "application/json"}
             logging.debug(f"Sending MFA from {self.from_number} to {to_number}")
-            response = requests.post(url, json=payload, auth=(self.project_id, self.token), headers=headers)
+            response = http_client.post(url, json=payload, auth=(self.project_id, self.token), headers=headers)
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -44,7 +46,7 @@ class SignalWireMFA:
             payload = {"token": token}
             headers = {"Content-Type": "application/json"}
             logging.debug(f"Verifying MFA with ID {mfa_id} using token {token}")
-            response = requests.post(verify_url, json=payload, auth=(self.project_id, self.token), headers=headers)
+            response = http_client.post(verify_url, json=payload, auth=(self.project_id, self.token), headers=headers)
             response.raise_for_status()
             return response.json()
         except requests.HTTPError as e:
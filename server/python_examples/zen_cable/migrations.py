@@ -0,0 +1,141 @@
+"""
+Schema migrations and hot-query registry for Zen Cable
+
+Run `python migrations.py` to EXPLAIN every registered query against
+zen_cable.db, or `python migrations.py --migrate` to apply pending migrations
+first. The app applies pending migrations at startup.
+"""
+
+import db_migrate
+import phone_util
+import billing_ledger
+import reminders
+import telemetry
+
+DB_PATH = 'zen_cable.db'
+
+# (version, name, statements)
+MIGRATIONS = [
+    (1, 'index customer equipment lookups', [
+        "CREATE INDEX IF NOT EXISTS idx_modems_customer_id ON modems (customer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_modems_mac_address ON modems (mac_address)",
+        "CREATE INDEX IF NOT EXISTS idx_modem_history_customer_id ON modem_history (customer_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_password_resets_customer_id ON password_resets (customer_id)",
+    ]),
+    (2, 'index billing and payments by customer', [
+        "CREATE INDEX IF NOT EXISTS idx_billing_customer_due ON billing (customer_id, due_date)",
+        "CREATE INDEX IF NOT EXISTS idx_payments_customer_date ON payments (customer_id, payment_date)",
+        "CREATE INDEX IF NOT EXISTS idx_payment_methods_customer_id ON payment_methods (customer_id)",
+    ]),
+    (3, 'index appointments by customer and day', [
+        "CREATE INDEX IF NOT EXISTS idx_appointments_customer_start ON appointments (customer_id, start_time)",
+        # Matches the WHERE date(start_time) = date(?) slot checks
+        "CREATE INDEX IF NOT EXISTS idx_appointments_start_day ON appointments (date(start_time))",
+        "CREATE INDEX IF NOT EXISTS idx_appointment_history_appointment ON appointment_history (appointment_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_appointment_reminders_appointment ON appointment_reminders (appointment_id, sent_at)",
+    ]),
+    (4, 'canonical E.164 customer phone', [
+        db_migrate.add_column('customers', 'phone_e164', 'TEXT'),
+        "CREATE INDEX IF NOT EXISTS idx_customers_phone_e164 ON customers (phone_e164)",
+    ]),
+    (5, 'persistent reminder queue', reminders.REMINDER_STATEMENTS + [reminders.backfill]),
+    (6, 'modem telemetry tiers', telemetry.TELEMETRY_STATEMENTS + telemetry.STATUS_CHANGE_STATEMENTS),
+    (7, 'append-only billing ledger', billing_ledger.LEDGER_STATEMENTS + [billing_ledger.backfill]),
+]
+
+# Queries issued by the portal and SWAIG functions on every call: name -> (sql, params)
+HOT_QUERIES = {
+    'customer login': (
+        "SELECT * FROM customers WHERE email = ?", ('test@example.com',)),
+    'customer by caller ID': (
+        "SELECT * FROM customers WHERE phone_e164 = ?", ('+15551234567',)),
+    'modem for customer': (
+        "SELECT * FROM modems WHERE customer_id = ?", (8675309,)),
+    'modem MAC in use': (
+        "SELECT * FROM modems WHERE mac_address = ? AND customer_id != ?", ('00:11:22:33:44:55', 8675309)),
+    'current bill': (
+        "SELECT * FROM billing WHERE customer_id = ? ORDER BY due_date DESC LIMIT 1", (8675309,)),
+    'payment history': (
+        "SELECT * FROM payments WHERE customer_id = ? ORDER BY payment_date DESC", (8675309,)),
+    'ledger balance': (
+        "SELECT balance, due_date, created_at FROM billing_ledger WHERE customer_id = ? ORDER BY id DESC LIMIT 1",
+        (8675309,)),
+    'payment methods': (
+        "SELECT * FROM payment_methods WHERE customer_id = ?", (8675309,)),
+    'upcoming appointments': (
+        "SELECT id, type, status, start_time, end_time, notes FROM appointments "
+        "WHERE customer_id = ? AND start_time >= ? ORDER BY start_time ASC", (8675309, '2025-01-01 00:00:00')),
+    'appointment on day for customer': (
+        "SELECT * FROM appointments WHERE customer_id = ? AND date(start_time) = date(?)", (8675309, '2025-01-01')),
+    'slot conflicts on day': (
+        "SELECT * FROM appointments WHERE date(start_time) = date(?) "
+        "AND ((start_time <= ? AND end_time > ?) OR (start_time < ? AND end_time >= ?) "
+        "OR (start_time >= ? AND end_time <= ?))", ('2025-01-01',) + ('2025-01-01 08:00:00',) * 6),
+    'appointment by job number': (
+        "SELECT * FROM appointments WHERE customer_id = ? AND job_number = ?", (8675309, 'ABC123')),
+    'appointment history': (
+        "SELECT * FROM appointment_history WHERE appointment_id = ? ORDER BY created_at DESC", (1,)),
+    'appointment reminders': (
+        "SELECT * FROM appointment_reminders WHERE appointment_id = ? ORDER BY sent_at DESC", (1,)),
+    'appointment page after cursor': (
+        "SELECT a.* FROM appointments a WHERE a.customer_id = ? AND date(a.start_time) BETWEEN ? AND ? "
+        "AND (a.start_time, a.id) < (?, ?) ORDER BY a.start_time desc, a.id desc LIMIT ?",
+        (8675309, '2025-01-01', '2025-12-31', '2025-06-01 08:00:00', 10, 11)),
+    'history for appointment page': (
+        "SELECT * FROM appointment_history WHERE appointment_id IN (?, ?, ?) "
+        "ORDER BY appointment_id DESC, created_at DESC", (1, 2, 3)),
+    'reminders for appointment page': (
+        "SELECT * FROM appointment_reminders WHERE appointment_id IN (?, ?, ?) "
+        "ORDER BY appointment_id DESC, sent_at DESC", (1, 2, 3)),
+    'due reminders': (
+        "SELECT r.id, a.start_time, c.phone FROM scheduled_reminders r "
+        "JOIN appointments a ON a.id = r.appointment_id LEFT JOIN customers c ON c.id = a.customer_id "
+        "WHERE r.status = 'pending' AND r.due_at <= ? ORDER BY r.due_at LIMIT ?", ('2025-01-01 08:00:00', 50)),
+    'next reminder due': (
+        "SELECT MIN(due_at) FROM scheduled_reminders WHERE status = 'pending'", ()),
+    'stale reminder claims': (
+        "UPDATE scheduled_reminders SET status = 'pending' WHERE status = 'sending' AND claimed_at < ?",
+        ('2025-01-01 08:00:00',)),
+    'modem samples in range': (
+        "SELECT ts, status, snr, power FROM modem_samples WHERE customer_id = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+        (8675309, 1735689600, 1735776000)),
+    'modem rollups in range': (
+        "SELECT bucket, samples, offline_samples FROM modem_rollups "
+        "WHERE customer_id = ? AND resolution = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket",
+        (8675309, 300, 1735689600, 1735776000)),
+    'modem status before range': (
+        "SELECT ts, status FROM modem_status_changes WHERE customer_id = ? AND ts <= ? ORDER BY ts DESC LIMIT 1",
+        (8675309, 1735689600)),
+    'modem status changes in range': (
+        "SELECT ts, status FROM modem_status_changes WHERE customer_id = ? AND ts > ? AND ts <= ? ORDER BY ts",
+        (8675309, 1735689600, 1735776000)),
+    'five-minute rollup refresh': (
+        "SELECT COUNT(*) FROM modem_samples WHERE customer_id = ? AND ts >= ? AND ts < ?",
+        (8675309, 1735689600, 1735689900)),
+    'expired modem samples': (
+        "DELETE FROM modem_samples WHERE ts < ?", (1735689600,)),
+    'password reset tokens': (
+        "DELETE FROM password_resets WHERE customer_id = ?", (8675309,)),
+}
+
+
+# (table, phone column, canonical column) filled by the startup backfill
+PHONE_COLUMNS = [
+    ('customers', 'phone', 'phone_e164'),
+]
+
+
+def backfill_phones(conn):
+    """Fill canonical phone columns for rows written without one; returns rows updated"""
+    return sum(phone_util.backfill(conn, table, source, target) for table, source, target in PHONE_COLUMNS)
+
+
+def migrate(conn):
+    """Apply pending migrations and the phone backfill; returns the versions applied"""
+    applied = db_migrate.apply_migrations(conn, MIGRATIONS)
+    backfill_phones(conn)
+    return applied
+
+
+if __name__ == '__main__':
+    raise SystemExit(db_migrate.run_cli(DB_PATH, MIGRATIONS, HOT_QUERIES))
@@ -0,0 +1,152 @@
+"""
+Keyset pagination, cached totals and batched child loading for list endpoints
+
+Pages are addressed by an opaque cursor holding the sort key of the last row
+returned, so fetching page N is an index seek rather than an OFFSET that
+re-reads every earlier row. A cursor also records the sort and filters it
+was issued for, and is refused under any others. The total row count for a filter is cached per
+customer (writes invalidate it) instead of a COUNT(*) on every page, and child
+rows such as appointment history are loaded for a whole page with one
+IN (...) query per relation and grouped in Python.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import time
+
+# Totals are recomputed after this many seconds so writes made by other
+# worker processes show up without cross-process invalidation
+TOTAL_TTL_SECONDS = 60
+MAX_CACHED_TOTALS = 4096
+
+# Stay well under SQLite's bound-parameter limit
+MAX_IN_PARAMS = 500
+
+
+def cursor_scope(*parts):
+    """Fingerprint of the sort and filters a cursor belongs to (e.g. sort_by, sort_order, filter params)"""
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+
+
+def encode_cursor(values, scope):
+    """Opaque cursor for the sort key of the last row on a page, valid only for scope"""
+    payload = json.dumps({'key': values, 'scope': scope}, default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, scope):
+    """Sort key list from a cursor, or None if it is malformed or was issued for another sort or filter"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('scope') != scope:
+        return None
+    values = payload.get('key')
+    return values if isinstance(values, list) else None
+
+
+def fetch_page(db, query, params, sort_expr, sort_field, descending, per_page, after=None, id_expr='id'):
+    """
+    One page of a query in keyset order on (sort column, id)
+
+    Args:
+        query: SELECT ending in a WHERE clause (the keyset condition is ANDed on)
+        sort_expr: SQL for the sort column, non-NULL (e.g. "COALESCE(a.status, '')")
+        sort_field: Name of the sort column in the result rows
+        after: Sort key of the previous page's last row (from its cursor)
+        id_expr: SQL for the unique tiebreaker, returned as 'id'
+
+    Returns:
+        tuple: (rows as dicts, sort key of the last row or None on the last page)
+    """
+    params = list(params)
+    if after:
+        query += f" AND ({sort_expr}, {id_expr}) {'<' if descending else '>'} (?, ?)"
+        params.extend(after)
+    direction = 'DESC' if descending else 'ASC'
+    query += f' ORDER BY {sort_expr} {direction}, {id_expr} {direction} LIMIT ?'
+    params.append(per_page + 1)
+    rows = [dict(row) for row in db.execute(query, params).fetchall()]
+    if len(rows) <= per_page:
+        return rows, None
+    last = rows[per_page - 1]
+    return rows[:per_page], [last[sort_field] if last[sort_field] is not None else '', last['id']]
+
+
+def load_children(db, table, parent_column, parent_ids, order_column, descending=False):
+    """
+    Rows of a child table for many parents, grouped by parent id
+
+    Args:
+        table: Child table (e.g. 'appointment_history')
+        parent_column: Column referencing the parent (e.g. 'appointment_id')
+        parent_ids: Parent ids on the current page
+        order_column: Column ordering rows within each parent (e.g. 'created_at')
+        descending: Newest first; both columns share the direction so a
+            (parent_column, order_column) index is walked without a sort
+
+    Returns:
+        dict: parent id -> list of row dicts (every requested id is present)
+    """
+    parent_ids = list(dict.fromkeys(parent_ids))
+    grouped = {parent_id: [] for parent_id in parent_ids}
+    direction = 'DESC' if descending else 'ASC'
+    for offset in range(0, len(parent_ids), MAX_IN_PARAMS):
+        chunk = parent_ids[offset:offset + MAX_IN_PARAMS]
+        rows = db.execute(
+            f"SELECT * FROM {table} WHERE {parent_column} IN ({', '.join('?' * len(chunk))}) "
+            f"ORDER BY {parent_column} {direction}, {order_column} {direction}",
+            chunk
+        ).fetchall()
+        for row in rows:
+            grouped[row[parent_column]].append(dict(row))
+    return grouped
+
+
+class TotalCache:
+    """Row counts per (owner, filter) with a TTL and per-owner invalidation"""
+
+    def __init__(self, ttl=TOTAL_TTL_SECONDS, max_entries=MAX_CACHED_TOTALS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._totals = {}  # (owner, key) -> (total, computed_at)
+
+    def get(self, owner, key, compute):
+        """Cached total for owner/key, calling compute() when missing or stale"""
+        owner = str(owner)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._totals.get((owner, key))
+        if entry and now - entry[1] < self.ttl:
+            return entry[0]
+        total = compute()
+        with self._lock:
+            if len(self._totals) >= self.max_entries:
+                self._totals.clear()
+            self._totals[(owner, key)] = (total, now)
+        return total
+
+    def invalidate(self, owner):
+        """Forget every cached total for an owner after its rows change"""
+        owner = str(owner)
+        with self._lock:
+            for cache_key in [cache_key for cache_key in self._totals if cache_key[0] == owner]:
+                del self._totals[cache_key]
+
+
+_appointment_totals = None
+_appointment_totals_lock = threading.Lock()
+
+
+def get_appointment_totals():
+    """Return the process-wide cache of appointment list totals (keyed by customer id)"""
+    global _appointment_totals
+    if _appointment_totals is None:
+        with _appointment_totals_lock:
+            if _appointment_totals is None:
+                _appointment_totals = TotalCache()
+    return _appointment_totals
@@ -0,0 +1,371 @@
+"""
+Persistent appointment reminder queue and delivery worker
+
+Each appointment with reminders enabled gets one scheduled_reminders row per
+reminder (an SMS 24 hours before, a call 1 hour before), written in the same
+transaction as the booking, reschedule or cancellation that changes it. A
+single worker thread claims due rows in batches through the (status, due_at)
+index, loads the appointment and customer for the whole batch with one join,
+and sends them concurrently under a shared rate limit. Results are written
+back in one transaction per batch, failed sends are retried with a delay, and
+rows claimed by a worker that died mid-send are released again, so reminders
+survive restarts and are never registered twice.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import db_pool
+
+DEFAULT_DB_PATH = 'zen_cable.db'
+
+# (reminder_type, lead time before the appointment start)
+REMINDER_LEADS = (
+    ('sms', timedelta(hours=24)),
+    ('call', timedelta(hours=1)),
+)
+
+BATCH_SIZE = 50
+MAX_WORKERS = 8
+RATE_PER_SECOND = 5  # overridden by REMINDER_RATE_PER_SECOND when the scheduler is created
+
+# Longest the worker sleeps before looking for due rows again (seconds); also
+# bounds how late a reminder booked by another process can be picked up
+POLL_SECONDS = 30
+
+# A row left in 'sending' this long belongs to a worker that died mid-batch
+CLAIM_TIMEOUT_SECONDS = 300
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 300
+
+# Appointment statuses that still want reminders
+ACTIVE_STATUSES = ('scheduled', 'pending')
+
+# Same layout as appointments.start_time (local time)
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+logger = logging.getLogger(__name__)
+
+REMINDER_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS scheduled_reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        appointment_id INTEGER NOT NULL,
+        reminder_type TEXT NOT NULL,
+        due_at TIMESTAMP NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        claimed_at TIMESTAMP,
+        sent_at TIMESTAMP,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (appointment_id, reminder_type),
+        FOREIGN KEY (appointment_id) REFERENCES appointments (id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_reminders_due ON scheduled_reminders (status, due_at)",
+]
+
+
+def _format(moment):
+    return moment.strftime(TIME_FORMAT)
+
+
+def _wants_reminders(appointment):
+    return appointment['status'] in ACTIVE_STATUSES and bool(appointment['sms_reminder'])
+
+
+def schedule_for(conn, appointment, now=None):
+    """
+    Create or move the reminder rows for an appointment
+
+    Runs inside the caller's transaction. Reminders whose send time has
+    already passed are cancelled, as are all of them when the appointment is
+    no longer active or has reminders turned off.
+
+    Args:
+        appointment: Row or dict with id, start_time, status and sms_reminder
+    """
+    if not _wants_reminders(appointment):
+        cancel_for(conn, appointment['id'])
+        return
+    now = now or datetime.now()
+    start = datetime.strptime(appointment['start_time'], TIME_FORMAT)
+    for reminder_type, lead in REMINDER_LEADS:
+        due_at = start - lead
+        if due_at <= now:
+            conn.execute(
+                "UPDATE scheduled_reminders SET status = 'cancelled' "
+                "WHERE appointment_id = ? AND reminder_type = ? AND status = 'pending'",
+                (appointment['id'], reminder_type)
+            )
+            continue
+        conn.execute("""
+            INSERT INTO scheduled_reminders (appointment_id, reminder_type, due_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT (appointment_id, reminder_type) DO UPDATE SET
+                due_at = excluded.due_at, status = 'pending', attempts = 0,
+                claimed_at = NULL, sent_at = NULL, last_error = NULL
+        """, (appointment['id'], reminder_type, _format(due_at)))
+
+
+def cancel_for(conn, appointment_id):
+    """Cancel an appointment's unsent reminders (inside the caller's transaction)"""
+    conn.execute(
+        "UPDATE scheduled_reminders SET status = 'cancelled' WHERE appointment_id = ? AND status = 'pending'",
+        (appointment_id,)
+    )
+
+
+def backfill(conn):
+    """Queue reminders for upcoming appointments booked before the queue existed (migration step)"""
+    rows = conn.execute(
+        f"SELECT id, start_time, status, sms_reminder FROM appointments "
+        f"WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))}) AND start_time > ?",
+        ACTIVE_STATUSES + (_format(datetime.now()),)
+    ).fetchall()
+    for row in rows:
+        schedule_for(conn, {'id': row[0], 'start_time': row[1], 'status': row[2], 'sms_reminder': row[3]})
+
+
+class RateLimiter:
+    """Token bucket shared by the sending threads"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a send is allowed"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ReminderScheduler:
+    """
+    Background worker delivering due reminders
+
+    sender(reminder) performs one delivery and raises on failure; reminder is
+    a dict with appointment_id, reminder_type, type, start_time, job_number,
+    customer_id, phone and name. It runs on a pool thread with no database
+    connection held.
+    """
+
+    def __init__(self, sender, db_path=DEFAULT_DB_PATH, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS,
+                 rate_per_second=RATE_PER_SECOND, poll_seconds=POLL_SECONDS):
+        self.sender = sender
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.limiter = RateLimiter(rate_per_second)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='reminder-send')
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counts = {'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0, 'batches': 0}
+
+    def start(self):
+        """Start the worker thread (no-op if already running)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def notify(self):
+        """Wake the worker early, e.g. after booking a reminder due soon"""
+        self._wake.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+        conn = db_pool.connect(self.db_path)
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM scheduled_reminders GROUP BY status").fetchall()
+        finally:
+            conn.close()
+        stats['queue'] = {row[0]: row[1] for row in rows}
+        return stats
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                processed = self.run_once()
+                delay = 0 if processed >= self.batch_size else self._seconds_until_due()
+            except Exception as e:
+                logger.error(f"Reminder worker error: {str(e)}")
+                delay = self.poll_seconds
+            if delay > 0:
+                self._wake.wait(delay)
+            self._wake.clear()
+
+    def _seconds_until_due(self):
+        conn = db_pool.connect(self.db_path)
+        try:
+            next_due = conn.execute(
+                "SELECT MIN(due_at) FROM scheduled_reminders WHERE status = 'pending'"
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        if not next_due:
+            return self.poll_seconds
+        delay = (datetime.strptime(next_due, TIME_FORMAT) - datetime.now()).total_seconds()
+        return min(max(delay, 0), self.poll_seconds)
+
+    def run_once(self, now=None):
+        """Claim, send and record one batch of due reminders; returns the number of rows claimed"""
+        now = now or datetime.now()
+        batch, skipped = self._claim(now)
+        if not batch and not skipped:
+            return 0
+        results = []
+        if batch:
+            futures = [(reminder, self._executor.submit(self._deliver, reminder)) for reminder in batch]
+            for reminder, future in futures:
+                error = future.exception()
+                results.append((reminder, str(error) if error else None))
+        self._record(results, datetime.now())
+        with self._lock:
+            self._counts['batches'] += 1
+            self._counts['skipped'] += len(skipped)
+        return len(batch) + len(skipped)
+
+    def _deliver(self, reminder):
+        self.limiter.acquire()
+        self.sender(reminder)
+
+    def _claim(self, now):
+        """Move a batch of due rows to 'sending' and return (to send, skipped)"""
+        now_text = _format(now)
+        conn = db_pool.connect(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE scheduled_reminders SET status = 'pending' WHERE status = 'sending' AND claimed_at < ?",
+                (_format(now - timedelta(seconds=CLAIM_TIMEOUT_SECONDS)),)
+            )
+            rows = conn.execute("""
+                SELECT r.id, r.appointment_id, r.reminder_type, r.attempts,
+                       a.type, a.start_time, a.status, a.sms_reminder, a.job_number, a.customer_id,
+                       c.phone, c.name
+                FROM scheduled_reminders r
+                JOIN appointments a ON a.id = r.appointment_id
+                LEFT JOIN customers c ON c.id = a.customer_id
+                WHERE r.status = 'pending' AND r.due_at <= ?
+                ORDER BY r.due_at
+                LIMIT ?
+            """, (now_text, self.batch_size)).fetchall()
+            batch, skipped = [], []
+            for row in rows:
+                reminder = {
+                    'id': row[0], 'appointment_id': row[1], 'reminder_type': row[2], 'attempts': row[3] + 1,
+                    'type': row[4], 'start_time': row[5], 'job_number': row[8], 'customer_id': row[9],
+                    'phone': row[10], 'name': row[11],
+                }
+                if row[6] not in ACTIVE_STATUSES or not row[7]:
+                    skipped.append((reminder['id'], 'appointment no longer wants reminders'))
+                elif row[5] <= now_text:
+                    skipped.append((reminder['id'], 'appointment already started'))
+                elif not row[10]:
+                    skipped.append((reminder['id'], 'customer has no phone number'))
+                else:
+                    batch.append(reminder)
+            conn.executemany(
+                "UPDATE scheduled_reminders SET status = 'sending', claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                [(now_text, reminder['id']) for reminder in batch]
+            )
+            conn.executemany(
+                "UPDATE scheduled_reminders SET status = 'cancelled', last_error = ? WHERE id = ?",
+                [(reason, reminder_id) for reminder_id, reason in skipped]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return batch, skipped
+
+    def _record(self, results, now):
+        """Write one batch of delivery results"""
+        if not results:
+            return
+        now_text = _format(now)
+        retry_at = _format(now + timedelta(seconds=RETRY_DELAY_SECONDS))
+        sent = [reminder for reminder, error in results if error is None]
+        retried = [(reminder, error) for reminder, error in results if error and reminder['attempts'] < MAX_ATTEMPTS]
+        failed = [(reminder, error) for reminder, error in results if error and reminder['attempts'] >= MAX_ATTEMPTS]
+        for reminder, error in retried + failed:
+            logger.warning(f"Reminder {reminder['id']} ({reminder['reminder_type']}) attempt {reminder['attempts']} failed: {error}")
+        conn = db_pool.connect(self.db_path)
+        try:
+            conn.executemany(
+                "UPDATE scheduled_reminders SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                [(now_text, reminder['id']) for reminder in sent]
+            )
+            conn.executemany(
+                "UPDATE scheduled_reminders SET status = 'pending', due_at = ?, claimed_at = NULL, last_error = ? WHERE id = ?",
+                [(retry_at, error, reminder['id']) for reminder, error in retried]
+            )
+            conn.executemany(
+                "UPDATE scheduled_reminders SET status = 'failed', last_error = ? WHERE id = ?",
+                [(error, reminder['id']) for reminder, error in failed]
+            )
+            conn.executemany(
+                "INSERT INTO appointment_reminders (appointment_id, reminder_type, sent_at, status, error_message) "
+                "VALUES (?, ?, CURRENT_TIMESTAMP, ?, ?)",
+                [(reminder['appointment_id'], reminder['reminder_type'], 'sent', None) for reminder in sent]
+                + [(reminder['appointment_id'], reminder['reminder_type'], 'failed', error) for reminder, error in failed]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        with self._lock:
+            self._counts['sent'] += len(sent)
+            self._counts['retried'] += len(retried)
+            self._counts['failed'] += len(failed)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_reminder_scheduler(sender=None):
+    """Return the process-wide reminder worker, creating it with sender on first use"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                if sender is None:
+                    raise RuntimeError('Reminder scheduler has not been created yet')
+                rate = float(os.getenv('REMINDER_RATE_PER_SECOND', str(RATE_PER_SECOND)))
+                _scheduler = ReminderScheduler(sender, rate_per_second=rate)
+    return _scheduler
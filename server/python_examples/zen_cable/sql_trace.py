@@ -0,0 +1,404 @@
+"""
+Per-thread SQL statement tracing, per-request counters and a slow-query log
+
+While a trace is active on a thread (start() ... stop()), every statement that
+thread runs through a pooled sqlite3 connection or an engine passed to
+instrument_engine() is counted and timed; a full trace also keeps each
+statement with its parameters (request_profiler uses those).
+
+install(app) makes this per-request for a Flask app:
+
+    SQL_DEBUG=true      count the statements each request runs and return the
+                        totals as X-DB-Queries / X-DB-Time response headers;
+                        slow statements are listed at /debug/slow-queries for
+                        requests whose X-Debug-Token header carries
+                        SQL_DEBUG_TOKEN (the route stays hidden without one)
+    SQL_SLOW_MS=250     log statements slower than this (default 250 with
+                        SQL_DEBUG, off otherwise) with their EXPLAIN QUERY
+                        PLAN, from any thread
+    SQL_LOG_PARAMS=true also keep slow statements' parameters in the log and
+                        the list; they carry phone numbers and account data,
+                        so by default they are replaced by '<redacted>'
+    SQL_QUERY_BUDGET=30 warn when one request runs more statements than this,
+                        the usual sign of a new N+1 loop
+
+Tracing is off until enable() is called (install() and request_profiler do so
+when configured): until then db_pool opens plain sqlite3 connections, so
+statements pay nothing. Once enabled, new pooled connections are
+TracedConnection, whose cost with no trace active and no slow-query threshold
+is one thread-local lookup per statement.
+
+Times cover execute() only; for a SELECT that is the work up to the first row,
+not rows fetched afterwards.
+"""
+
+import hmac
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Statements kept per full trace; later ones are still counted and timed
+MAX_STATEMENTS = 500
+
+# Longest parameter repr kept per statement
+MAX_PARAMS_CHARS = 200
+
+# Slow-query threshold used with SQL_DEBUG when SQL_SLOW_MS is not set
+DEFAULT_DEBUG_SLOW_MS = 250
+
+# Slow statements kept for /debug/slow-queries
+SLOW_LOG_SIZE = 200
+
+# Statements EXPLAIN QUERY PLAN accepts (not PRAGMA, BEGIN, DDL, ...)
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+DB_QUERIES_HEADER = 'X-DB-Queries'
+DB_TIME_HEADER = 'X-DB-Time'
+DEBUG_TOKEN_HEADER = 'X-Debug-Token'
+
+# Stands in for slow statements' parameters unless SQL_LOG_PARAMS=true
+REDACTED = '<redacted>'
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_enabled = False
+
+# Seconds; None disables the slow-query log
+_slow_seconds = None
+
+# Whether slow-query entries keep their parameters (SQL_LOG_PARAMS)
+_log_params = False
+
+
+def enable(slow_ms=None):
+    """
+    Trace statements on connections opened from now on (see connection_factory())
+
+    Args:
+        slow_ms: Log statements slower than this many milliseconds (None leaves the threshold as is)
+    """
+    global _enabled, _slow_seconds
+    _enabled = True
+    if slow_ms is not None:
+        _slow_seconds = slow_ms / 1000.0
+
+
+def enabled():
+    return _enabled
+
+
+def slow_threshold_ms():
+    return None if _slow_seconds is None else _slow_seconds * 1000
+
+
+def connection_factory():
+    """sqlite3.connect() factory for new connections: TracedConnection once tracing is enabled"""
+    return TracedConnection if _enabled else sqlite3.Connection
+
+
+def _params_repr(params):
+    if params is None or params == ():
+        return None
+    if isinstance(params, str):
+        return params
+    text = repr(params)
+    return text if len(text) <= MAX_PARAMS_CHARS else text[:MAX_PARAMS_CHARS] + '...'
+
+
+def _normalize(sql):
+    return ' '.join(sql.split())
+
+
+class StatementTrace:
+    """Statements run on one thread while the trace was active"""
+
+    def __init__(self, max_statements=MAX_STATEMENTS):
+        self.max_statements = max_statements
+        self.statements = []
+        self.count = 0
+        self.total_ms = 0.0
+        self.label = None
+
+    def record(self, sql, params, elapsed_ms, source='sqlite3'):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if len(self.statements) < self.max_statements:
+            self.statements.append({
+                'sql': _normalize(sql),
+                'params': _params_repr(params),
+                'ms': round(elapsed_ms, 3),
+                'source': source,
+            })
+
+    def by_statement(self, limit=20):
+        """Statements grouped by SQL text, most total time first (repeated SQL is the N+1 tell)"""
+        grouped = {}
+        for statement in self.statements:
+            entry = grouped.setdefault(statement['sql'], {'sql': statement['sql'], 'count': 0, 'total_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += statement['ms']
+        ordered = sorted(grouped.values(), key=lambda entry: entry['total_ms'], reverse=True)[:limit]
+        for entry in ordered:
+            entry['total_ms'] = round(entry['total_ms'], 3)
+        return ordered
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'truncated': self.count > len(self.statements),
+            'by_statement': self.by_statement(),
+            'statements': list(self.statements),
+        }
+
+
+def start(max_statements=MAX_STATEMENTS, label=None):
+    """
+    Begin tracing statements on the current thread, replacing any active trace
+
+    Args:
+        max_statements: Statements kept with their SQL and parameters; 0 only counts and times
+        label: What the trace covers (e.g. 'GET /api/appointments'), used in slow-query entries
+    """
+    _local.trace = StatementTrace(max_statements)
+    _local.trace.label = label
+    return _local.trace
+
+
+def stop():
+    """Stop tracing on the current thread and return the trace (None if none was active)"""
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    return trace
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+class SlowQueryLog:
+    """The most recent slow statements"""
+
+    def __init__(self, size=SLOW_LOG_SIZE):
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, sql, params, elapsed_ms, plan, source, label):
+        params = _params_repr(params)
+        entry = {
+            'at': datetime.now().isoformat(),
+            'ms': round(elapsed_ms, 3),
+            'sql': _normalize(sql),
+            'params': params if _log_params or params is None else REDACTED,
+            'plan': plan,
+            'source': source,
+            'request': label,
+        }
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning(f"Slow SQL ({entry['ms']}ms{', ' + label if label else ''}): {entry['sql']} "
+                       f"params={entry['params']} plan={plan}")
+        return entry
+
+    def entries(self):
+        """Newest first"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_slow_log = None
+_slow_log_lock = threading.Lock()
+
+
+def get_slow_log():
+    """Return the process-wide slow-query log"""
+    global _slow_log
+    if _slow_log is None:
+        with _slow_log_lock:
+            if _slow_log is None:
+                _slow_log = SlowQueryLog()
+    return _slow_log
+
+
+def explain(conn, sql, params=()):
+    """
+    EXPLAIN QUERY PLAN for a statement, run untraced on a raw sqlite3 connection
+
+    Returns:
+        list: Plan steps (e.g. 'SCAN appointments'), or None when the
+            statement cannot be explained
+    """
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    try:
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params or ()).fetchall()
+    except (sqlite3.Error, ValueError, TypeError):
+        return None
+    return [row[3] for row in rows]
+
+
+def _finish(conn, trace, sql, params, elapsed, source, plan_params=()):
+    """Record a finished statement into the thread's trace and, if it was slow, the slow-query log"""
+    if trace is not None:
+        trace.record(sql, params, elapsed * 1000, source)
+    if _slow_seconds is not None and elapsed >= _slow_seconds:
+        plan = explain(conn, sql, plan_params) if plan_params is not None else None
+        get_slow_log().record(sql, params, elapsed * 1000, plan, source, trace.label if trace else None)
+
+
+class TracedCursor(sqlite3.Cursor):
+    """sqlite3 cursor that times statements into the thread's active trace and the slow-query log"""
+
+    def execute(self, sql, parameters=()):
+        trace = getattr(_local, 'trace', None)
+        if trace is None and _slow_seconds is None:
+            return super().execute(sql, parameters)
+        start_time = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _finish(self.connection, trace, sql, parameters, time.perf_counter() - start_time, 'sqlite3', parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        trace = getattr(_local, 'trace', None)
+        if trace is None and _slow_seconds is None:
+            return super().executemany(sql, seq_of_parameters)
+        start_time = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _finish(self.connection, trace, sql, '<executemany>', time.perf_counter() - start_time, 'sqlite3', None)
+
+    def executescript(self, sql_script):
+        trace = getattr(_local, 'trace', None)
+        if trace is None and _slow_seconds is None:
+            return super().executescript(sql_script)
+        start_time = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _finish(self.connection, trace, sql_script, None, time.perf_counter() - start_time, 'sqlite3', None)
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection (use as sqlite3.connect(factory=...)) whose cursors are TracedCursor"""
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or TracedCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def instrument_engine(engine):
+    """Time statements a SQLAlchemy engine runs into the executing thread's trace and the slow-query log"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if getattr(_local, 'trace', None) is not None or _slow_seconds is not None:
+            conn.info.setdefault('sql_trace_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('sql_trace_start')
+        if starts:
+            _finish(cursor.connection, getattr(_local, 'trace', None), statement,
+                    '<executemany>' if executemany else parameters, time.perf_counter() - starts.pop(),
+                    'sqlalchemy', None if executemany else parameters)
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(exception_context):
+        # A failed statement never reaches after_cursor_execute; drop its start time
+        conn = exception_context.connection
+        starts = conn.info.get('sql_trace_start') if conn is not None else None
+        if starts:
+            starts.pop()
+
+    return engine
+
+
+# Settings applied by install()
+_debug = False
+_debug_token = ''
+_query_budget = None
+
+
+def debug_enabled():
+    """Whether install() turned on per-request counters and /debug/slow-queries (SQL_DEBUG=true)"""
+    return _debug
+
+
+def authorized(headers):
+    """Whether a request may read /debug/slow-queries: SQL_DEBUG is on and the request carries SQL_DEBUG_TOKEN"""
+    supplied = headers.get(DEBUG_TOKEN_HEADER)
+    return (_debug and bool(_debug_token) and supplied is not None
+            and hmac.compare_digest(supplied.encode(), _debug_token.encode()))
+
+
+def install(app):
+    """
+    Count and time each request's SQL on a Flask app, per SQL_DEBUG, SQL_SLOW_MS, SQL_LOG_PARAMS and SQL_QUERY_BUDGET
+
+    Settings are read now, so call it after load_dotenv() and before the app
+    opens pooled connections. A trace already started by request_profiler is
+    shared rather than replaced.
+    """
+    global _debug, _debug_token, _log_params, _query_budget
+    from flask import g, request
+
+    _debug = os.getenv('SQL_DEBUG', 'false').lower() == 'true'
+    _debug_token = os.getenv('SQL_DEBUG_TOKEN', '')
+    _log_params = os.getenv('SQL_LOG_PARAMS', 'false').lower() == 'true'
+    slow_ms = os.getenv('SQL_SLOW_MS') or (DEFAULT_DEBUG_SLOW_MS if _debug else None)
+    budget = os.getenv('SQL_QUERY_BUDGET')
+    _query_budget = int(budget) if budget else None
+    if not (_debug or slow_ms is not None or _query_budget):
+        return app
+    enable(float(slow_ms) if slow_ms is not None else None)
+
+    @app.before_request
+    def _start_sql_trace():
+        # A counting-only trace; slow-query entries also take the request from its label
+        label = f"{request.method} {request.path}"
+        trace = current()
+        g.sql_trace_owned = trace is None
+        if trace is None:
+            start(max_statements=0, label=label)
+        elif trace.label is None:
+            trace.label = label
+
+    @app.after_request
+    def _report_sql_trace(response):
+        trace = current()
+        if trace is None:
+            return response
+        if _query_budget and trace.count > _query_budget:
+            logger.warning(f"{trace.label} ran {trace.count} SQL statements ({trace.total_ms:.1f}ms), "
+                           f"over the budget of {_query_budget}")
+        if _debug:
+            response.headers[DB_QUERIES_HEADER] = str(trace.count)
+            response.headers[DB_TIME_HEADER] = f"{trace.total_ms:.3f}"
+        return response
+
+    @app.teardown_request
+    def _stop_sql_trace(error):
+        if g.pop('sql_trace_owned', False):
+            stop()
+
+    return app
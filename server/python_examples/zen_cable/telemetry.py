@@ -0,0 +1,355 @@
+"""
+Modem telemetry time-series store with rollup tiers
+
+Samples (status, downstream SNR, upstream power) are kept in three tiers:
+raw samples for a couple of days, 5-minute rollups for a month and hourly
+rollups for a year. All three are WITHOUT ROWID tables clustered on
+(customer_id, time), so a customer's range query reads one contiguous run of
+pages. Rollups are recomputed for the buckets each ingest batch touches (5-min
+from raw, hourly from 5-min), which keeps them exact when samples arrive late
+or twice; samples older than the raw tier are ignored, since their buckets
+could no longer be recomputed exactly. Chart queries use the finest tier that
+still covers the range. Expired rows are compacted away during ingestion at
+most once per COMPACT_INTERVAL.
+
+Samples may arrive once a minute from a collector or only when the status
+changes (the portal and the reboot job), so counting samples says nothing
+about time. Each status change is therefore also kept in
+modem_status_changes for a year, and availability() weighs each status by
+how long it lasted, starting from the status the modem was in when the range
+began.
+"""
+
+import threading
+import time
+
+import db_pool
+
+DEFAULT_DB_PATH = 'zen_cable.db'
+
+# Rollup resolutions (seconds) and how long each tier is kept
+FIVE_MINUTES = 300
+HOUR = 3600
+RAW_RETENTION = 2 * 86400
+RETENTION = {
+    FIVE_MINUTES: 30 * 86400,
+    HOUR: 365 * 86400,
+}
+
+# Raw samples are read directly when a range needs at most this many points
+# at the expected collector interval (one sample a minute)
+SAMPLE_INTERVAL = 60
+MAX_POINTS = 300
+
+COMPACT_INTERVAL = 600
+
+TELEMETRY_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS modem_samples (
+        customer_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        snr REAL,
+        power REAL,
+        PRIMARY KEY (customer_id, ts)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS modem_rollups (
+        customer_id INTEGER NOT NULL,
+        resolution INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        samples INTEGER NOT NULL,
+        offline_samples INTEGER NOT NULL,
+        first_offline INTEGER,
+        last_offline INTEGER,
+        snr_min REAL,
+        snr_max REAL,
+        snr_sum REAL,
+        power_min REAL,
+        power_max REAL,
+        power_sum REAL,
+        PRIMARY KEY (customer_id, resolution, bucket)
+    ) WITHOUT ROWID
+    """,
+    # Retention sweeps delete by age across all customers
+    "CREATE INDEX IF NOT EXISTS idx_modem_samples_ts ON modem_samples (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_modem_rollups_bucket ON modem_rollups (resolution, bucket)",
+]
+
+# Status changes kept as long as the hourly tier
+STATUS_RETENTION = RETENTION[HOUR]
+
+STATUS_CHANGE_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS modem_status_changes (
+        customer_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        PRIMARY KEY (customer_id, ts)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_modem_status_changes_ts ON modem_status_changes (ts)",
+]
+
+# Recompute one 5-minute bucket from raw samples
+_ROLLUP_FROM_RAW = f"""
+    INSERT OR REPLACE INTO modem_rollups
+    SELECT customer_id, {FIVE_MINUTES}, :bucket, COUNT(*),
+           SUM(status != 'online'),
+           MIN(CASE WHEN status != 'online' THEN ts END), MAX(CASE WHEN status != 'online' THEN ts END),
+           MIN(snr), MAX(snr), SUM(snr), MIN(power), MAX(power), SUM(power)
+    FROM modem_samples
+    WHERE customer_id = :customer_id AND ts >= :bucket AND ts < :bucket + {FIVE_MINUTES}
+    GROUP BY customer_id
+"""
+
+# Recompute one hourly bucket from its 5-minute buckets
+_ROLLUP_FROM_FIVE_MINUTES = f"""
+    INSERT OR REPLACE INTO modem_rollups
+    SELECT customer_id, {HOUR}, :bucket, SUM(samples), SUM(offline_samples),
+           MIN(first_offline), MAX(last_offline),
+           MIN(snr_min), MAX(snr_max), SUM(snr_sum), MIN(power_min), MAX(power_max), SUM(power_sum)
+    FROM modem_rollups
+    WHERE customer_id = :customer_id AND resolution = {FIVE_MINUTES}
+      AND bucket >= :bucket AND bucket < :bucket + {HOUR}
+    GROUP BY customer_id
+"""
+
+
+def _bucket(ts, resolution):
+    return ts - ts % resolution
+
+
+def _raw_cutoff(now):
+    # Hour-aligned so compaction never leaves a bucket half-populated with raw rows
+    return _bucket(int(now - RAW_RETENTION), HOUR)
+
+
+def _average(total, count):
+    return round(total / count, 2) if total is not None and count else None
+
+
+def _log_status_changes(conn, customer_id, since):
+    """
+    Rewrite a customer's status changes from `since` on from the raw samples
+
+    A late sample can start or end a period in the middle of others, so the
+    changes after it are derived again rather than appended.
+    """
+    before = conn.execute(
+        "SELECT status FROM modem_status_changes WHERE customer_id = ? AND ts < ? ORDER BY ts DESC LIMIT 1",
+        (customer_id, since)
+    ).fetchone()
+    status = before[0] if before else None
+    conn.execute("DELETE FROM modem_status_changes WHERE customer_id = ? AND ts >= ?", (customer_id, since))
+    changes = []
+    for ts, sample_status in conn.execute(
+        "SELECT ts, status FROM modem_samples WHERE customer_id = ? AND ts >= ? ORDER BY ts", (customer_id, since)
+    ).fetchall():
+        if sample_status != status:
+            changes.append((customer_id, ts, sample_status))
+            status = sample_status
+    conn.executemany("INSERT INTO modem_status_changes (customer_id, ts, status) VALUES (?, ?, ?)", changes)
+
+
+class TelemetryStore:
+    """Ingestion, range queries and retention for modem samples"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._last_compact = 0.0
+        self._compact_lock = threading.Lock()
+
+    def ingest(self, samples, now=None):
+        """
+        Store a batch of samples and refresh the rollups they fall in
+
+        Args:
+            samples: Iterable of (customer_id, ts, status, snr, power) with ts
+                in epoch seconds; snr and power may be None. A repeated
+                (customer_id, ts) replaces the earlier sample.
+
+        Returns:
+            int: Number of samples written (older than the raw tier are skipped)
+        """
+        now = now or time.time()
+        cutoff = _raw_cutoff(now)
+        rows = [(int(customer_id), int(ts), status, snr, power)
+                for customer_id, ts, status, snr, power in samples if ts >= cutoff]
+        if not rows:
+            return 0
+        five_minute = {(customer_id, _bucket(ts, FIVE_MINUTES)) for customer_id, ts, _, _, _ in rows}
+        hourly = {(customer_id, _bucket(bucket, HOUR)) for customer_id, bucket in five_minute}
+        earliest = {}
+        for customer_id, ts, _, _, _ in rows:
+            earliest[customer_id] = min(ts, earliest.get(customer_id, ts))
+        conn = db_pool.connect(self.db_path)
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO modem_samples (customer_id, ts, status, snr, power) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            conn.executemany(_ROLLUP_FROM_RAW, [{'customer_id': c, 'bucket': b} for c, b in sorted(five_minute)])
+            conn.executemany(_ROLLUP_FROM_FIVE_MINUTES, [{'customer_id': c, 'bucket': b} for c, b in sorted(hourly)])
+            for customer_id, since in sorted(earliest.items()):
+                _log_status_changes(conn, customer_id, since)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self._maybe_compact(now)
+        return len(rows)
+
+    def record(self, customer_id, status, snr=None, power=None, ts=None):
+        """Store a single sample (e.g. a status change made by the portal or a job)"""
+        return self.ingest([(customer_id, int(ts or time.time()), status, snr, power)])
+
+    def _resolution_for(self, start, end, now, max_points):
+        """Finest tier that still holds start and needs at most max_points points"""
+        if start >= now - RAW_RETENTION and (end - start) / SAMPLE_INTERVAL <= max_points:
+            return 0
+        for resolution in (FIVE_MINUTES, HOUR):
+            if start >= now - RETENTION[resolution] and (end - start) / resolution <= max_points:
+                return resolution
+        return HOUR
+
+    def series(self, customer_id, start, end, max_points=MAX_POINTS):
+        """
+        Points for a chart between two epoch times
+
+        Returns:
+            dict: resolution (0 for raw samples) and points, each with ts,
+                samples, offline_samples, and snr/power min, avg and max
+        """
+        now = time.time()
+        resolution = self._resolution_for(start, end, now, max_points)
+        conn = db_pool.connect(self.db_path)
+        try:
+            if resolution == 0:
+                rows = conn.execute(
+                    "SELECT ts, status, snr, power FROM modem_samples "
+                    "WHERE customer_id = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+                    (customer_id, start, end)
+                ).fetchall()
+                points = [{
+                    'ts': row[0], 'samples': 1, 'offline_samples': int(row[1] != 'online'), 'status': row[1],
+                    'snr_min': row[2], 'snr_avg': row[2], 'snr_max': row[2],
+                    'power_min': row[3], 'power_avg': row[3], 'power_max': row[3],
+                } for row in rows]
+            else:
+                rows = conn.execute(
+                    "SELECT bucket, samples, offline_samples, snr_min, snr_sum, snr_max, power_min, power_sum, power_max "
+                    "FROM modem_rollups WHERE customer_id = ? AND resolution = ? AND bucket >= ? AND bucket <= ? "
+                    "ORDER BY bucket",
+                    (customer_id, resolution, _bucket(int(start), resolution), end)
+                ).fetchall()
+                points = [{
+                    'ts': row[0], 'samples': row[1], 'offline_samples': row[2],
+                    'snr_min': row[3], 'snr_avg': _average(row[4], row[1]), 'snr_max': row[5],
+                    'power_min': row[6], 'power_avg': _average(row[7], row[1]), 'power_max': row[8],
+                } for row in rows]
+        finally:
+            conn.close()
+        return {'resolution': resolution, 'start': int(start), 'end': int(end), 'points': points}
+
+    def availability(self, customer_id, start, end, now=None):
+        """
+        Time online and offline between two epoch times
+
+        Each status lasts until the next change; the range starts in the
+        status of the last change before it. Anything other than 'online'
+        counts as offline, and consecutive offline statuses (e.g. offline,
+        then rebooting) are one outage.
+
+        Returns:
+            dict: known_seconds (time with a known status), offline_seconds,
+                uptime_pct (None when no status is known), outages (offline
+                periods overlapping the range), last_outage_start and
+                last_outage_end (epoch seconds; the end is None while the
+                modem is still offline at the end of the range)
+        """
+        now = now or time.time()
+        start, end = int(start), int(min(end, now))
+        conn = db_pool.connect(self.db_path)
+        try:
+            before = conn.execute(
+                "SELECT ts, status FROM modem_status_changes WHERE customer_id = ? AND ts <= ? "
+                "ORDER BY ts DESC LIMIT 1",
+                (customer_id, start)
+            ).fetchone()
+            changes = conn.execute(
+                "SELECT ts, status FROM modem_status_changes WHERE customer_id = ? AND ts > ? AND ts <= ? ORDER BY ts",
+                (customer_id, start, end)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        summary = {'start': start, 'end': end, 'known_seconds': 0, 'offline_seconds': 0, 'uptime_pct': None,
+                   'outages': 0, 'last_outage_start': None, 'last_outage_end': None}
+        status = before[1] if before else None
+        if status not in (None, 'online'):
+            summary.update(outages=1, last_outage_start=before[0])
+        since = start
+        for ts, new_status in list(changes) + [(end, None)]:
+            if status is not None:
+                summary['known_seconds'] += ts - since
+                if status != 'online':
+                    summary['offline_seconds'] += ts - since
+            if new_status is None:
+                break
+            offline_before = status not in (None, 'online')
+            if offline_before and new_status == 'online':
+                summary['last_outage_end'] = ts
+            elif not offline_before and new_status != 'online':
+                summary.update(outages=summary['outages'] + 1, last_outage_start=ts, last_outage_end=None)
+            status, since = new_status, ts
+        if summary['known_seconds']:
+            online = summary['known_seconds'] - summary['offline_seconds']
+            summary['uptime_pct'] = round(100.0 * online / summary['known_seconds'], 1)
+        return summary
+
+    def _maybe_compact(self, now):
+        with self._compact_lock:
+            if now - self._last_compact < COMPACT_INTERVAL:
+                return
+            self._last_compact = now
+        self.compact(now)
+
+    def compact(self, now=None):
+        """Delete rows older than their tier's retention; returns rows deleted"""
+        now = now or time.time()
+        conn = db_pool.connect(self.db_path)
+        try:
+            deleted = conn.execute("DELETE FROM modem_samples WHERE ts < ?", (_raw_cutoff(now),)).rowcount
+            for resolution, retention in RETENTION.items():
+                deleted += conn.execute(
+                    "DELETE FROM modem_rollups WHERE resolution = ? AND bucket < ?", (resolution, _bucket(int(now - retention), HOUR))
+                ).rowcount
+            # Keep each customer's last change before the cutoff: it is the status the kept history starts in
+            deleted += conn.execute("""
+                DELETE FROM modem_status_changes
+                WHERE ts < :cutoff AND EXISTS (
+                    SELECT 1 FROM modem_status_changes later
+                    WHERE later.customer_id = modem_status_changes.customer_id
+                      AND later.ts > modem_status_changes.ts AND later.ts <= :cutoff)
+            """, {'cutoff': int(now - STATUS_RETENTION)}).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return deleted
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_telemetry_store():
+    """Return the process-wide modem telemetry store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TelemetryStore()
+    return _store
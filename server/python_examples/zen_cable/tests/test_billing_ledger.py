@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import billing_ledger
+
+SCHEMA = """
+CREATE TABLE billing (id INTEGER PRIMARY KEY, customer_id INTEGER, amount DECIMAL(10,2) NOT NULL,
+                      due_date TIMESTAMP NOT NULL, status TEXT NOT NULL);
+CREATE TABLE payments (id INTEGER PRIMARY KEY, customer_id INTEGER, amount DECIMAL(10,2) NOT NULL,
+                       status TEXT NOT NULL);
+"""
+
+
+def make_db(with_ledger=True):
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(SCHEMA)
+    if with_ledger:
+        for statement in billing_ledger.LEDGER_STATEMENTS:
+            conn.execute(statement)
+    return conn
+
+
+def entries(conn, customer_id=1):
+    return [(entry['entry_type'], entry['amount'], entry['balance'])
+            for entry in reversed(billing_ledger.history(conn, customer_id))]
+
+
+def test_bills_and_payments_post_running_balances():
+    conn = make_db()
+    conn.execute("INSERT INTO billing VALUES (1, 1, 89.99, '2025-02-01', 'pending')")
+    conn.execute("INSERT INTO payments VALUES (1, 1, 50, 'completed')")
+    conn.execute("INSERT INTO payments VALUES (2, 1, 20, 'failed')")
+    # A back-dated bill keeps the later due date
+    conn.execute("INSERT INTO billing VALUES (2, 1, 10.01, '2025-01-01', 'pending')")
+    conn.execute("INSERT INTO billing VALUES (3, 2, 5, '2025-03-01', 'pending')")
+
+    assert entries(conn) == [('charge', 89.99, 89.99), ('payment', -50, 39.99), ('charge', 10.01, 50)]
+    assert billing_ledger.balance(conn, 1) == dict(billing_ledger.balance(conn, 1), balance=50.0, due_date='2025-02-01')
+    assert billing_ledger.balance(conn, 2)['balance'] == 5.0
+    assert billing_ledger.balance(conn, 3) is None
+    assert billing_ledger.check(conn) == []
+
+
+def test_failed_and_reinstated_payments_are_reversed_and_reposted():
+    conn = make_db()
+    conn.execute("INSERT INTO billing VALUES (1, 1, 100, '2025-02-01', 'pending')")
+    conn.execute("INSERT INTO payments VALUES (1, 1, 60, 'pending')")
+
+    conn.execute("UPDATE payments SET status = 'failed' WHERE id = 1")
+    assert billing_ledger.balance(conn, 1)['balance'] == 100.0
+    conn.execute("UPDATE payments SET status = 'completed' WHERE id = 1")
+    assert billing_ledger.balance(conn, 1)['balance'] == 40.0
+    assert [entry[0] for entry in entries(conn)] == ['charge', 'payment', 'reversal', 'payment']
+    assert billing_ledger.check(conn) == []
+
+
+def test_ledger_is_append_only():
+    conn = make_db()
+    conn.execute("INSERT INTO billing VALUES (1, 1, 100, '2025-02-01', 'pending')")
+
+    with pytest.raises(sqlite3.IntegrityError, match='append-only'):
+        conn.execute("UPDATE billing_ledger SET balance = 0")
+    with pytest.raises(sqlite3.IntegrityError, match='append-only'):
+        conn.execute("DELETE FROM billing_ledger")
+
+
+def test_backfill_opens_existing_accounts_and_check_covers_later_rows():
+    conn = make_db(with_ledger=False)
+    conn.execute("INSERT INTO billing VALUES (1, 1, 70, '2025-01-01', 'pending')")
+    conn.execute("INSERT INTO billing VALUES (2, 1, 80, '2025-02-01', 'pending')")
+    conn.execute("INSERT INTO payments VALUES (1, 1, 30, 'completed')")
+    for statement in billing_ledger.LEDGER_STATEMENTS:
+        conn.execute(statement)
+    billing_ledger.backfill(conn)
+    billing_ledger.backfill(conn)
+
+    assert entries(conn) == [('opening', 80, 80)]
+    assert billing_ledger.check(conn) == []
+
+    # A bill written with the triggers missing is reported
+    conn.execute("DROP TRIGGER billing_ledger_charge")
+    conn.execute("INSERT INTO billing VALUES (3, 1, 15, '2025-03-01', 'pending')")
+    assert [problem['kind'] for problem in billing_ledger.check(conn)] == ['missing_charge']
+
+
+def test_checker_interval_is_read_from_the_environment_when_created(monkeypatch):
+    monkeypatch.setattr(billing_ledger, '_checker', None)
+    monkeypatch.setenv('LEDGER_CHECK_INTERVAL', '60')
+
+    assert billing_ledger.get_consistency_checker().interval == 60
@@ -0,0 +1,90 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from jobs import JobQueueFull, JobRunner
+
+
+def wait_until_finished(job, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if not job.active:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f'job still {job.status}')
+
+
+def test_steps_run_in_order_after_their_delays():
+    runner = JobRunner(max_workers=2)
+    calls = []
+    job = runner.submit('modem_reboot', 42, [
+        ('rebooting', 0, lambda: calls.append('rebooting')),
+        ('online', 0.05, lambda: calls.append('online')),
+    ])
+
+    wait_until_finished(job)
+    assert calls == ['rebooting', 'online']
+    assert job.status == 'succeeded' and job.eta_seconds() is None
+    assert runner.latest('modem_reboot', '42') is job
+    assert runner.stats()['succeeded'] == 1
+
+
+def test_repeated_submits_join_the_active_job():
+    runner = JobRunner(max_workers=2)
+    release = threading.Event()
+    first = runner.submit('modem_reboot', 42, [('rebooting', 0, release.wait)])
+
+    assert runner.submit('modem_reboot', 42, [('rebooting', 0, lambda: None)]) is first
+    other = runner.submit('modem_reboot', 43, [('rebooting', 0, lambda: None)])
+    assert other is not first
+
+    release.set()
+    wait_until_finished(first)
+    assert runner.submit('modem_reboot', 42, [('rebooting', 0, lambda: None)]) is not first
+    assert runner.stats()['joined'] == 1
+
+
+def test_failed_step_stops_the_job():
+    runner = JobRunner(max_workers=1)
+    calls = []
+
+    def fail():
+        raise RuntimeError('modem unreachable')
+    job = runner.submit('modem_reboot', 42, [('rebooting', 0, fail), ('online', 0, lambda: calls.append('online'))])
+
+    wait_until_finished(job)
+    assert (job.status, job.error, job.step) == ('failed', 'modem unreachable', 'rebooting')
+    assert calls == []
+
+
+def test_active_jobs_are_bounded():
+    runner = JobRunner(max_workers=1, max_active=1)
+    runner.submit('modem_reboot', 1, [('online', 60, lambda: None)])
+
+    with pytest.raises(JobQueueFull):
+        runner.submit('modem_reboot', 2, [('online', 60, lambda: None)])
+    assert runner.stats() == dict(runner.stats(), active=1, delayed=1, rejected=1)
+
+
+def test_finished_jobs_are_pruned_after_their_ttl():
+    runner = JobRunner(max_workers=1, finished_ttl=0)
+    job = runner.submit('modem_reboot', 42, [('online', 0, lambda: None)])
+    wait_until_finished(job)
+
+    runner.submit('modem_reboot', 43, [('online', 0, lambda: None)])
+    assert runner.get(job.id) is None
+    assert runner.latest('modem_reboot', 42) is None
+
+
+def test_limits_are_read_from_the_environment_when_the_runner_is_created(monkeypatch):
+    monkeypatch.setenv('JOB_MAX_ACTIVE', '1')
+    runner = JobRunner(max_workers=1)
+    runner.submit('modem_reboot', 1, [('online', 60, lambda: None)])
+
+    with pytest.raises(JobQueueFull):
+        runner.submit('modem_reboot', 2, [('online', 60, lambda: None)])
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import pagination
+from pagination import (TotalCache, cursor_scope, decode_cursor, encode_cursor, fetch_page,
+                        load_children)
+
+
+@pytest.fixture
+def db():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.executescript('''
+        CREATE TABLE appointments (id INTEGER PRIMARY KEY, customer_id INTEGER, status TEXT);
+        CREATE TABLE appointment_history (id INTEGER PRIMARY KEY, appointment_id INTEGER, created_at TEXT);
+    ''')
+    yield conn
+    conn.close()
+
+
+def test_cursor_round_trips_within_its_scope():
+    scope = cursor_scope('start_time', 'desc', [7, '2026-01-01', '2026-02-01'])
+    cursor = encode_cursor(['2026-01-15 09:00:00', 12], scope)
+
+    assert decode_cursor(cursor, scope) == ['2026-01-15 09:00:00', 12]
+
+
+def test_cursor_is_refused_for_another_sort_or_filter():
+    cursor = encode_cursor(['2026-01-15 09:00:00', 12], cursor_scope('start_time', 'desc', [7]))
+
+    assert decode_cursor(cursor, cursor_scope('start_time', 'asc', [7])) is None
+    assert decode_cursor(cursor, cursor_scope('end_time', 'desc', [7])) is None
+    assert decode_cursor(cursor, cursor_scope('start_time', 'desc', [7, 'scheduled'])) is None
+
+
+def test_malformed_cursors_decode_to_none():
+    scope = cursor_scope('start_time', 'desc', [])
+
+    assert decode_cursor('not a cursor!', scope) is None
+    assert decode_cursor('', scope) is None
+    assert decode_cursor(encode_cursor('a string', scope), scope) is None
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_keyset_pages_cover_tied_sort_values_exactly_once(db, descending):
+    statuses = ['scheduled'] * 5 + ['completed'] * 4 + [None] * 3
+    db.executemany('INSERT INTO appointments (customer_id, status) VALUES (1, ?)', [(s,) for s in statuses])
+    db.execute("INSERT INTO appointments (customer_id, status) VALUES (2, 'scheduled')")
+    query = 'SELECT * FROM appointments WHERE customer_id = ?'
+    sort_expr = "COALESCE(status, '')"
+
+    seen, after, pages = [], None, 0
+    while True:
+        rows, after = fetch_page(db, query, [1], sort_expr, 'status', descending, 4, after=after)
+        seen.extend(rows)
+        pages += 1
+        if after is None:
+            break
+
+    assert pages == 3
+    assert sorted(row['id'] for row in seen) == list(range(1, 13))
+    expected = sorted(seen, key=lambda row: (row['status'] or '', row['id']), reverse=descending)
+    assert [row['id'] for row in seen] == [row['id'] for row in expected]
+
+
+def test_last_page_has_no_next_key(db):
+    db.executemany('INSERT INTO appointments (customer_id, status) VALUES (1, ?)', [('scheduled',)] * 3)
+
+    rows, after = fetch_page(db, 'SELECT * FROM appointments WHERE 1', [], 'status', 'status', False, 3)
+
+    assert len(rows) == 3
+    assert after is None
+
+
+def test_load_children_groups_by_parent_across_chunks(db, monkeypatch):
+    monkeypatch.setattr(pagination, 'MAX_IN_PARAMS', 2)
+    db.executemany('INSERT INTO appointment_history (appointment_id, created_at) VALUES (?, ?)', [
+        (1, '2026-01-01'), (1, '2026-01-03'), (2, '2026-01-02'), (3, '2026-01-05'), (3, '2026-01-04'),
+    ])
+
+    grouped = load_children(db, 'appointment_history', 'appointment_id', [3, 1, 2, 1, 4], 'created_at',
+                            descending=True)
+
+    assert list(grouped) == [3, 1, 2, 4]
+    assert [row['created_at'] for row in grouped[1]] == ['2026-01-03', '2026-01-01']
+    assert [row['created_at'] for row in grouped[3]] == ['2026-01-05', '2026-01-04']
+    assert len(grouped[2]) == 1
+    assert grouped[4] == []
+
+
+def test_load_children_without_parents_runs_no_query():
+    class NoQueries:
+        def execute(self, *args):
+            raise AssertionError('no query expected')
+
+    assert load_children(NoQueries(), 'appointment_history', 'appointment_id', [], 'created_at') == {}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pagination.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_total_is_cached_until_the_ttl_passes(clock):
+    cache = TotalCache(ttl=30)
+    computed = []
+
+    def compute():
+        computed.append(1)
+        return len(computed)
+
+    assert cache.get(7, 'filters', compute) == 1
+    clock[0] += 29
+    assert cache.get('7', 'filters', compute) == 1
+    clock[0] += 1
+    assert cache.get(7, 'filters', compute) == 2
+
+
+def test_invalidate_only_forgets_that_owner(clock):
+    cache = TotalCache(ttl=30)
+    cache.get(7, 'a', lambda: 1)
+    cache.get(7, 'b', lambda: 2)
+    cache.get(8, 'a', lambda: 3)
+
+    cache.invalidate(7)
+
+    assert cache.get(7, 'a', lambda: 10) == 10
+    assert cache.get(7, 'b', lambda: 20) == 20
+    assert cache.get(8, 'a', lambda: 30) == 3
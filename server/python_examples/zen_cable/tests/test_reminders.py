@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import reminders
+from reminders import ReminderScheduler, TIME_FORMAT
+
+NOW = datetime(2025, 6, 2, 9, 0, 0)
+
+SCHEMA = """
+CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, phone TEXT);
+CREATE TABLE appointments (id INTEGER PRIMARY KEY, customer_id INTEGER, type TEXT, status TEXT,
+                           start_time TIMESTAMP, sms_reminder BOOLEAN DEFAULT 1, job_number TEXT);
+CREATE TABLE appointment_reminders (id INTEGER PRIMARY KEY, appointment_id INTEGER, reminder_type TEXT,
+                                    sent_at TIMESTAMP, status TEXT, error_message TEXT);
+"""
+
+
+def make_db(tmp_path):
+    db_path = str(tmp_path / 'zen_cable.db')
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    for statement in reminders.REMINDER_STATEMENTS:
+        conn.execute(statement)
+    conn.execute("INSERT INTO customers VALUES (1, 'Pat Doe', '+15551234567')")
+    conn.commit()
+    return conn, db_path
+
+
+def book(conn, appointment_id, start, status='scheduled', sms_reminder=1, now=NOW):
+    appointment = {'id': appointment_id, 'start_time': start.strftime(TIME_FORMAT), 'status': status,
+                   'sms_reminder': sms_reminder}
+    conn.execute("INSERT OR REPLACE INTO appointments VALUES (?, 1, 'repair', ?, ?, ?, 'J1')",
+                 (appointment_id, status, appointment['start_time'], sms_reminder))
+    reminders.schedule_for(conn, appointment, now=now)
+    conn.commit()
+
+
+def queue(conn):
+    return {(row['appointment_id'], row['reminder_type']): (row['status'], row['due_at'])
+            for row in conn.execute("SELECT * FROM scheduled_reminders")}
+
+
+def test_booking_rescheduling_and_cancelling_keep_one_row_per_reminder(tmp_path):
+    conn, _ = make_db(tmp_path)
+    book(conn, 1, NOW + timedelta(days=2))
+    assert queue(conn) == {(1, 'sms'): ('pending', '2025-06-03 09:00:00'),
+                           (1, 'call'): ('pending', '2025-06-04 08:00:00')}
+
+    # Moved to within 24 hours: the SMS is already past due, so only the call stays
+    book(conn, 1, NOW + timedelta(hours=5))
+    assert queue(conn) == {(1, 'sms'): ('cancelled', '2025-06-03 09:00:00'),
+                           (1, 'call'): ('pending', '2025-06-02 13:00:00')}
+
+    book(conn, 1, NOW + timedelta(hours=5), status='cancelled')
+    assert {status for status, _ in queue(conn).values()} == {'cancelled'}
+
+
+def test_due_reminders_are_sent_once_and_logged(tmp_path):
+    conn, db_path = make_db(tmp_path)
+    book(conn, 1, NOW + timedelta(hours=2))
+    book(conn, 2, NOW + timedelta(hours=3), sms_reminder=0)
+    sent = []
+    scheduler = ReminderScheduler(sent.append, db_path=db_path, rate_per_second=1000)
+
+    assert scheduler.run_once(NOW + timedelta(hours=1, minutes=1)) == 1
+    assert scheduler.run_once(NOW + timedelta(hours=1, minutes=2)) == 0
+    scheduler.stop()
+
+    assert [(r['appointment_id'], r['reminder_type'], r['phone']) for r in sent] == [(1, 'call', '+15551234567')]
+    assert queue(conn)[(1, 'call')][0] == 'sent'
+    assert [tuple(row) for row in conn.execute("SELECT appointment_id, status FROM appointment_reminders")] == [(1, 'sent')]
+
+
+def test_failed_sends_are_retried_then_marked_failed(tmp_path, monkeypatch):
+    # Retries are scheduled from the wall clock, so this test runs on it too
+    now = datetime.now().replace(microsecond=0)
+    conn, db_path = make_db(tmp_path)
+    book(conn, 1, now + timedelta(hours=2), now=now)
+    monkeypatch.setattr(reminders, 'MAX_ATTEMPTS', 2)
+
+    def sender(reminder):
+        raise RuntimeError('carrier unavailable')
+    scheduler = ReminderScheduler(sender, db_path=db_path, rate_per_second=1000)
+
+    scheduler.run_once(now + timedelta(hours=1))
+    row = conn.execute("SELECT * FROM scheduled_reminders WHERE reminder_type = 'call'").fetchone()
+    assert (row['status'], row['attempts'], row['last_error']) == ('pending', 1, 'carrier unavailable')
+
+    scheduler.run_once(datetime.strptime(row['due_at'], TIME_FORMAT))
+    scheduler.stop()
+    row = conn.execute("SELECT * FROM scheduled_reminders WHERE reminder_type = 'call'").fetchone()
+    assert (row['status'], row['attempts']) == ('failed', 2)
+    assert scheduler.stats()['failed'] == 1
+
+
+def test_claims_left_by_a_dead_worker_are_released(tmp_path):
+    conn, db_path = make_db(tmp_path)
+    book(conn, 1, NOW + timedelta(days=2))
+    stale = (NOW - timedelta(seconds=reminders.CLAIM_TIMEOUT_SECONDS + 60)).strftime(TIME_FORMAT)
+    conn.execute("UPDATE scheduled_reminders SET status = 'sending', claimed_at = ? WHERE reminder_type = 'sms'", (stale,))
+    conn.commit()
+    sent = []
+    scheduler = ReminderScheduler(sent.append, db_path=db_path, rate_per_second=1000)
+
+    scheduler.run_once(NOW + timedelta(days=1, minutes=1))
+    scheduler.stop()
+
+    assert [r['reminder_type'] for r in sent] == ['sms']
+
+
+def test_scheduler_rate_is_read_from_the_environment_when_created(monkeypatch):
+    monkeypatch.setattr(reminders, '_scheduler', None)
+    monkeypatch.setenv('REMINDER_RATE_PER_SECOND', '2.5')
+
+    scheduler = reminders.get_reminder_scheduler(lambda reminder: None)
+
+    assert scheduler.limiter.rate == 2.5
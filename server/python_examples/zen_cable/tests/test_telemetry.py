@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import sys
+import time
+
+# Ensure the repository root is on the path when tests are run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import telemetry
+from telemetry import TelemetryStore
+
+CUSTOMER = 8675309
+HOUR = 3600
+
+
+def make_store(tmp_path, name='zen_cable.db'):
+    db_path = str(tmp_path / name)
+    conn = sqlite3.connect(db_path)
+    for statement in telemetry.TELEMETRY_STATEMENTS + telemetry.STATUS_CHANGE_STATEMENTS:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+    return TelemetryStore(db_path)
+
+
+def status_events(store, *events):
+    store.ingest([(CUSTOMER, ts, status, None, None) for ts, status in events])
+
+
+def test_uptime_is_weighted_by_time_not_by_samples(tmp_path):
+    now = int(time.time())
+    start = now - 24 * HOUR
+    short, long = make_store(tmp_path, 'short.db'), make_store(tmp_path, 'long.db')
+
+    status_events(short, (start - HOUR, 'online'), (now - 2 * HOUR, 'rebooting'), (now - 2 * HOUR + 15, 'online'))
+    status_events(long, (start - HOUR, 'online'), (now - 10 * HOUR, 'offline'), (now - 2 * HOUR, 'online'))
+
+    brief = short.availability(CUSTOMER, start, now, now=now)
+    outage = long.availability(CUSTOMER, start, now, now=now)
+    assert (brief['offline_seconds'], brief['uptime_pct']) == (15, 100.0)
+    assert (outage['offline_seconds'], outage['uptime_pct']) == (8 * HOUR, 66.7)
+    assert outage['known_seconds'] == 24 * HOUR
+    assert (outage['last_outage_start'], outage['last_outage_end']) == (now - 10 * HOUR, now - 2 * HOUR)
+
+
+def test_status_before_the_range_is_carried_into_it(tmp_path):
+    store = make_store(tmp_path)
+    now = int(time.time())
+    status_events(store, (now - 30 * HOUR, 'offline'), (now - 20 * HOUR, 'online'), (now - HOUR, 'offline'))
+
+    summary = store.availability(CUSTOMER, now - 24 * HOUR, now, now=now)
+
+    assert summary['offline_seconds'] == 4 * HOUR + HOUR
+    assert summary['outages'] == 2
+    assert (summary['last_outage_start'], summary['last_outage_end']) == (now - HOUR, None)
+
+    # Nothing known before the first status: that time is left out rather than counted as online
+    empty = store.availability(CUSTOMER, now - 40 * HOUR, now - 30 * HOUR, now=now)
+    assert (empty['known_seconds'], empty['uptime_pct']) == (0, None)
+
+
+def test_repeated_statuses_and_late_samples_rewrite_the_changes(tmp_path):
+    store = make_store(tmp_path)
+    now = int(time.time())
+    # Collector samples every minute: offline for two minutes, then online again
+    status_events(store, *[(now - 600 + 60 * i, 'offline' if i in (3, 4) else 'online') for i in range(10)])
+    assert store.availability(CUSTOMER, now - 600, now, now=now)['offline_seconds'] == 120
+
+    # A late sample ends the outage a minute earlier
+    status_events(store, (now - 600 + 60 * 4, 'online'))
+    summary = store.availability(CUSTOMER, now - 600, now, now=now)
+    assert (summary['offline_seconds'], summary['outages']) == (60, 1)
+
+
+def test_compaction_keeps_the_status_history_starts_in(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    now = int(time.time())
+    status_events(store, (now - 3 * HOUR, 'offline'), (now - 2 * HOUR, 'online'), (now - HOUR, 'offline'))
+    monkeypatch.setattr(telemetry, 'STATUS_RETENTION', 90 * 60)
+
+    store.compact(now)
+
+    summary = store.availability(CUSTOMER, now - 90 * 60, now, now=now)
+    assert summary['known_seconds'] == 90 * 60
+    assert summary['offline_seconds'] == HOUR
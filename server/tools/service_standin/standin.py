@@ -0,0 +1,588 @@
+"""
+Local stand-in for the SignalWire and Stripe REST APIs used by the demo apps
+
+Emulates just enough of each API for load tests to run the SMS, MFA, SWML and
+payment flows end to end without touching live services:
+
+    SignalWire  POST [/api/laml]/2010-04-01/Accounts/{project}/Messages(.json)
+                POST [/api/laml]/2010-04-01/Accounts/{project}/Calls(.json)
+                POST /api/relay/rest/mfa/sms | /mfa/call
+                POST /api/relay/rest/mfa/{id}/verify
+                POST /api/laml/voice and any other /api/ path (SWML posts)
+    Stripe      POST /v1/payment_methods
+                POST /v1/payment_intents, GET/POST /v1/payment_intents/{id},
+                POST /v1/payment_intents/{id}/confirm | /cancel
+                POST /v1/refunds
+
+Messages with a StatusCallback get a 'delivered' callback, and payment intents
+that succeed or fail are announced to --stripe-webhook as signed
+payment_intent.* events, the same way Stripe would. Stripe's test cards and
+payment methods decline as they do in test mode (4000000000000002,
+4000000000009995, pm_card_chargeDeclined, ...). MFA codes are always
+--mfa-code so a load script can complete verification.
+
+Latency and failures are injected per service (signalwire, stripe) or per
+route (messages, mfa_send, payment_intents, ...):
+
+    python standin.py --port 8099 --latency signalwire=150:50 --latency stripe=400 \\
+        --error-rate messages=0.02 --error-rate stripe=0.01:500 --seed 7
+
+Point an app at it with SERVICE_STANDIN_URL=http://localhost:8099 (see
+http_client.py). GET /__standin/stats and /__standin/messages report what was
+served; POST /__standin/reset clears them.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+DEFAULT_PORT = 8099
+
+# Code every emulated MFA request is "sent" with
+DEFAULT_MFA_CODE = '123456'
+
+# Messages kept for /__standin/messages
+MESSAGE_LOG_SIZE = 1000
+
+STRIPE_API_VERSION = '2023-10-16'
+
+# Stripe test-mode cards and payment methods that decline, with their decline codes
+DECLINED_CARDS = {
+    '4000000000000002': 'generic_decline',
+    '4000000000009995': 'insufficient_funds',
+    '4000000000009987': 'lost_card',
+    '4000000000000069': 'expired_card',
+    '4000000000000127': 'incorrect_cvc',
+}
+DECLINED_PAYMENT_METHODS = {
+    'pm_card_chargeDeclined': 'generic_decline',
+    'pm_card_chargeDeclinedInsufficientFunds': 'insufficient_funds',
+    'pm_card_chargeDeclinedLostCard': 'lost_card',
+    'pm_card_chargeDeclinedExpiredCard': 'expired_card',
+}
+
+# Status returned for injected failures when the flag does not give one
+DEFAULT_ERROR_STATUS = 503
+
+# (method, path pattern, route name, service)
+ROUTES = [
+    ('POST', r'(?:/api/laml)?/2010-04-01/Accounts/(?P<project>[^/]+)/Messages(?:\.json)?', 'messages', 'signalwire'),
+    ('POST', r'(?:/api/laml)?/2010-04-01/Accounts/(?P<project>[^/]+)/Calls(?:\.json)?', 'calls', 'signalwire'),
+    ('POST', r'/api/relay/rest/mfa/(?P<channel>sms|call)', 'mfa_send', 'signalwire'),
+    ('POST', r'/api/relay/rest/mfa/(?P<mfa_id>[^/]+)/verify', 'mfa_verify', 'signalwire'),
+    ('POST', r'/api/.*', 'swml', 'signalwire'),
+    ('POST', r'/v1/payment_methods', 'payment_methods', 'stripe'),
+    ('POST', r'/v1/payment_intents', 'payment_intents', 'stripe'),
+    ('GET', r'/v1/payment_intents/(?P<intent_id>[^/]+)', 'payment_intents', 'stripe'),
+    ('POST', r'/v1/payment_intents/(?P<intent_id>[^/]+)(?:/(?P<action>confirm|cancel))?', 'payment_intents', 'stripe'),
+    ('POST', r'/v1/refunds', 'refunds', 'stripe'),
+]
+ROUTES = [(method, re.compile(pattern + '$'), name, service) for method, pattern, name, service in ROUTES]
+
+
+def _now_rfc2822():
+    return datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S +0000')
+
+
+def _object_id(prefix):
+    return f"{prefix}_{secrets.token_hex(12)}"
+
+
+def unflatten(pairs):
+    """
+    Turn Stripe's form encoding (metadata[order_id]=1, card[number]=...) back into nested dicts
+
+    Returns:
+        dict: Values as strings, nested one dict per [key] segment
+    """
+    result = {}
+    for key, value in pairs:
+        parts = re.findall(r'[^\[\]]+', key)
+        node = result
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        if parts:
+            node[parts[-1]] = value
+    return result
+
+
+def stripe_signature(payload, secret, timestamp=None):
+    """Stripe-Signature header value for payload (bytes), as stripe.Webhook.construct_event verifies it"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed = f"{timestamp}.".encode() + payload
+    digest = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+class Faults:
+    """Per-service/per-route latency and error injection"""
+
+    def __init__(self, latency=None, errors=None, seed=None):
+        self.latency = latency or {}   # key -> (mean_ms, jitter_ms)
+        self.errors = errors or {}     # key -> (rate, status)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _lookup(table, route, service):
+        for key in (route, service, '*'):
+            if key in table:
+                return table[key]
+        return None
+
+    def delay(self, route, service):
+        """Seconds to wait before answering"""
+        setting = self._lookup(self.latency, route, service)
+        if not setting:
+            return 0.0
+        mean_ms, jitter_ms = setting
+        with self._lock:
+            offset = self._random.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0.0
+        return max(0.0, mean_ms + offset) / 1000.0
+
+    def failure(self, route, service):
+        """HTTP status to fail this request with, or None"""
+        setting = self._lookup(self.errors, route, service)
+        if not setting:
+            return None
+        rate, status = setting
+        with self._lock:
+            return status if self._random.random() < rate else None
+
+
+class StandinState:
+    """Objects created so far, the message log and per-route counters"""
+
+    def __init__(self, mfa_code=DEFAULT_MFA_CODE):
+        self.mfa_code = mfa_code
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.payment_methods = {}
+            self.payment_intents = {}
+            self.mfa_requests = {}
+            self.messages = deque(maxlen=MESSAGE_LOG_SIZE)
+            self.stats = {}
+            self.started = time.time()
+
+    def count(self, route, status, elapsed_ms, injected=False):
+        with self._lock:
+            entry = self.stats.setdefault(route, {'requests': 0, 'errors': 0, 'injected': 0, 'total_ms': 0.0})
+            entry['requests'] += 1
+            entry['total_ms'] += elapsed_ms
+            if status >= 400:
+                entry['errors'] += 1
+            if injected:
+                entry['injected'] += 1
+
+    def log_message(self, message):
+        with self._lock:
+            self.messages.append(message)
+
+    def snapshot(self):
+        with self._lock:
+            routes = {
+                route: {
+                    'requests': entry['requests'],
+                    'errors': entry['errors'],
+                    'injected': entry['injected'],
+                    'avg_ms': round(entry['total_ms'] / entry['requests'], 1) if entry['requests'] else 0.0,
+                }
+                for route, entry in sorted(self.stats.items())
+            }
+            return {
+                'uptime_s': round(time.time() - self.started, 1),
+                'routes': routes,
+                'payment_intents': len(self.payment_intents),
+                'mfa_requests': len(self.mfa_requests),
+                'messages_logged': len(self.messages),
+            }
+
+
+class CallbackSender:
+    """Delivers status callbacks and Stripe webhooks from a small worker pool"""
+
+    def __init__(self, state, webhook_url=None, webhook_secret=None, delay=0.0, workers=4):
+        self.state = state
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.delay = delay
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='standin-callback')
+
+    def _deliver(self, route, url, body, headers):
+        if self.delay:
+            time.sleep(self.delay)
+        start = time.perf_counter()
+        status = 599
+        try:
+            request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+            with urllib.request.urlopen(request, timeout=10) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except Exception as e:
+            print(f"WARNING: {route} to {url} failed: {e}")
+        self.state.count(route, status, (time.perf_counter() - start) * 1000)
+
+    def message_status(self, url, message, status='delivered'):
+        """POST a LaML status callback the way SignalWire reports delivery"""
+        form = {
+            'MessageSid': message['sid'], 'SmsSid': message['sid'], 'AccountSid': message['account_sid'],
+            'From': message['from'], 'To': message['to'], 'MessageStatus': status, 'SmsStatus': status,
+        }
+        body = urlencode(form).encode()
+        self._pool.submit(self._deliver, 'status_callbacks', url, body,
+                          {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def stripe_event(self, event_type, obj):
+        """POST a signed Stripe event to the configured webhook, if any"""
+        if not self.webhook_url:
+            return
+        event = {
+            'id': _object_id('evt'), 'object': 'event', 'api_version': STRIPE_API_VERSION,
+            'created': int(time.time()), 'livemode': False, 'pending_webhooks': 1,
+            'type': event_type, 'data': {'object': obj},
+        }
+        body = json.dumps(event).encode()
+        headers = {'Content-Type': 'application/json'}
+        if self.webhook_secret:
+            headers['Stripe-Signature'] = stripe_signature(body, self.webhook_secret)
+        self._pool.submit(self._deliver, 'webhooks', self.webhook_url, body, headers)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Routes requests to the emulated endpoints; configured through the server attributes"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ServiceStandin/1.0'
+
+    # Quiet by default; --verbose turns the access log back on
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    # --- plumbing -----------------------------------------------------------
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            try:
+                return json.loads(raw or b'{}')
+            except ValueError:
+                return {}
+        return unflatten(parse_qsl(raw.decode('utf-8', 'replace'), keep_blank_values=True))
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        path = urlsplit(self.path).path.rstrip('/') or '/'
+        start = time.perf_counter()
+        state = self.server.state
+
+        if path.startswith('/__standin/'):
+            self._admin(method, path)
+            return
+
+        for route_method, pattern, route, service in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                break
+        else:
+            self._send_json(404, {'error': f"No stand-in for {method} {path}"})
+            return
+
+        body = self._read_body()
+        delay = self.server.faults.delay(route, service)
+        if delay:
+            time.sleep(delay)
+
+        if not self._authorized(service):
+            status, payload = 401, self._error(service, 'authentication_error', 'Missing credentials')
+            injected = False
+        else:
+            status = self.server.faults.failure(route, service)
+            injected = status is not None
+            if injected:
+                payload = self._error(service, 'api_error', 'Injected failure from service stand-in')
+            else:
+                handler = getattr(self, f"_{route}")
+                status, payload = handler(body, **match.groupdict())
+
+        headers = {'Request-Id': _object_id('req')} if service == 'stripe' else None
+        self._send_json(status, payload, headers)
+        state.count(route, status, (time.perf_counter() - start) * 1000, injected=injected)
+
+    def _authorized(self, service):
+        auth = self.headers.get('Authorization') or ''
+        return auth.startswith('Bearer ' if service == 'stripe' else 'Basic ')
+
+    @staticmethod
+    def _error(service, kind, message, **extra):
+        if service == 'stripe':
+            return {'error': dict({'type': kind, 'message': message}, **extra)}
+        return {'code': kind, 'message': message, 'status': 'failed'}
+
+    def _admin(self, method, path):
+        state = self.server.state
+        if method == 'GET' and path == '/__standin/stats':
+            self._send_json(200, state.snapshot())
+        elif method == 'GET' and path == '/__standin/messages':
+            with state._lock:
+                messages = list(state.messages)
+            self._send_json(200, {'messages': messages})
+        elif method == 'POST' and path == '/__standin/reset':
+            self._read_body()
+            state.reset()
+            self._send_json(200, {'reset': True})
+        else:
+            self._send_json(404, {'error': f"Unknown admin route {path}"})
+
+    # --- SignalWire ---------------------------------------------------------
+
+    def _messages(self, body, project):
+        message = {
+            'sid': 'SM' + uuid.uuid4().hex, 'account_sid': project, 'api_version': '2010-04-01',
+            'to': body.get('To'), 'from': body.get('From'), 'body': body.get('Body'),
+            'status': 'queued', 'direction': 'outbound-api', 'num_segments': '1', 'num_media': '0',
+            'price': None, 'price_unit': 'USD', 'error_code': None, 'error_message': None,
+            'date_created': _now_rfc2822(), 'date_updated': _now_rfc2822(), 'date_sent': None,
+        }
+        message['uri'] = f"/api/laml/2010-04-01/Accounts/{project}/Messages/{message['sid']}.json"
+        self.server.state.log_message({'channel': 'sms', 'sid': message['sid'], 'to': message['to'],
+                                       'from': message['from'], 'body': message['body'], 'at': time.time()})
+        if body.get('StatusCallback'):
+            self.server.callbacks.message_status(body['StatusCallback'], message)
+        return 201, message
+
+    def _calls(self, body, project):
+        call = {
+            'sid': 'CA' + uuid.uuid4().hex, 'account_sid': project, 'api_version': '2010-04-01',
+            'to': body.get('To'), 'from': body.get('From'), 'status': 'queued', 'direction': 'outbound-api',
+            'date_created': _now_rfc2822(), 'date_updated': _now_rfc2822(),
+        }
+        self.server.state.log_message({'channel': 'call', 'sid': call['sid'], 'to': call['to'],
+                                       'from': call['from'], 'body': body.get('Twiml') or body.get('Url'),
+                                       'at': time.time()})
+        return 201, call
+
+    def _mfa_send(self, body, channel):
+        state = self.server.state
+        mfa_id = str(uuid.uuid4())
+        with state._lock:
+            state.mfa_requests[mfa_id] = {'to': body.get('to'), 'attempts': 0,
+                                          'max_attempts': int(body.get('max_attempts') or 3)}
+        state.log_message({'channel': f"mfa_{channel}", 'sid': mfa_id, 'to': body.get('to'),
+                           'from': body.get('from'), 'body': f"{body.get('message') or ''}{state.mfa_code}",
+                           'at': time.time()})
+        return 200, {'id': mfa_id, 'success': True, 'to': body.get('to'), 'channel': channel}
+
+    def _mfa_verify(self, body, mfa_id):
+        state = self.server.state
+        with state._lock:
+            request = state.mfa_requests.get(mfa_id)
+            if request is None:
+                return 404, {'success': False, 'message': 'MFA request not found'}
+            request['attempts'] += 1
+            if request['attempts'] > request['max_attempts']:
+                return 200, {'success': False, 'message': 'Too many attempts'}
+        return 200, {'success': str(body.get('token')) == state.mfa_code}
+
+    def _swml(self, body):
+        return 200, {'success': True, 'id': str(uuid.uuid4())}
+
+    # --- Stripe -------------------------------------------------------------
+
+    def _payment_methods(self, body):
+        card = body.get('card') or {}
+        number = re.sub(r'\D', '', str(card.get('number') or '4242424242424242'))
+        method = {
+            'id': _object_id('pm'), 'object': 'payment_method', 'type': body.get('type', 'card'),
+            'created': int(time.time()), 'livemode': False,
+            'billing_details': body.get('billing_details') or {},
+            'card': {'brand': 'visa' if number.startswith('4') else 'mastercard', 'last4': number[-4:],
+                     'exp_month': card.get('exp_month'), 'exp_year': card.get('exp_year')},
+        }
+        with self.server.state._lock:
+            self.server.state.payment_methods[method['id']] = DECLINED_CARDS.get(number)
+        return 200, method
+
+    def _decline_code(self, payment_method):
+        if payment_method in DECLINED_PAYMENT_METHODS:
+            return DECLINED_PAYMENT_METHODS[payment_method]
+        with self.server.state._lock:
+            return self.server.state.payment_methods.get(payment_method)
+
+    def _payment_intents(self, body, intent_id=None, action=None):
+        state = self.server.state
+        if intent_id is None:
+            intent_id = _object_id('pi')
+            intent = {
+                'id': intent_id, 'object': 'payment_intent', 'created': int(time.time()), 'livemode': False,
+                'amount': int(body.get('amount') or 0), 'currency': body.get('currency', 'usd'),
+                'client_secret': f"{intent_id}_secret_{secrets.token_hex(12)}",
+                'description': body.get('description'), 'metadata': body.get('metadata') or {},
+                'payment_method': None, 'status': 'requires_payment_method', 'last_payment_error': None,
+            }
+            with state._lock:
+                state.payment_intents[intent_id] = intent
+        else:
+            with state._lock:
+                intent = state.payment_intents.get(intent_id)
+            if intent is None:
+                return 404, self._error('stripe', 'invalid_request_error', f"No such payment_intent: '{intent_id}'",
+                                        code='resource_missing')
+            if self.command == 'GET':
+                return 200, intent
+            if action == 'cancel':
+                intent['status'] = 'canceled'
+                return 200, intent
+            intent['metadata'] = dict(intent['metadata'], **(body.get('metadata') or {}))
+            if body.get('description'):
+                intent['description'] = body['description']
+
+        if body.get('payment_method'):
+            intent['payment_method'] = body['payment_method']
+            intent['status'] = 'requires_confirmation'
+        if str(body.get('confirm')).lower() == 'true' or action == 'confirm':
+            return self._confirm(intent)
+        return 200, intent
+
+    def _confirm(self, intent):
+        callbacks = self.server.callbacks
+        if not intent['payment_method']:
+            return 400, self._error('stripe', 'invalid_request_error',
+                                    'You cannot confirm this PaymentIntent because it is missing a payment method.',
+                                    code='payment_intent_unexpected_state')
+        decline_code = self._decline_code(intent['payment_method'])
+        if decline_code:
+            intent['status'] = 'requires_payment_method'
+            intent['last_payment_error'] = {'type': 'card_error', 'code': 'card_declined',
+                                            'decline_code': decline_code, 'message': 'Your card was declined.'}
+            callbacks.stripe_event('payment_intent.payment_failed', intent)
+            return 402, self._error('stripe', 'card_error', 'Your card was declined.', code='card_declined',
+                                    decline_code=decline_code, payment_intent=intent)
+        intent['status'] = 'succeeded'
+        intent['amount_received'] = intent['amount']
+        callbacks.stripe_event('payment_intent.succeeded', intent)
+        return 200, intent
+
+    def _refunds(self, body):
+        with self.server.state._lock:
+            intent = self.server.state.payment_intents.get(body.get('payment_intent'))
+        if intent is None or intent['status'] != 'succeeded':
+            return 400, self._error('stripe', 'invalid_request_error', 'This PaymentIntent has not succeeded.')
+        refund = {
+            'id': _object_id('re'), 'object': 'refund', 'created': int(time.time()),
+            'amount': int(body.get('amount') or intent['amount']), 'currency': intent['currency'],
+            'payment_intent': intent['id'], 'status': 'succeeded', 'metadata': body.get('metadata') or {},
+        }
+        self.server.callbacks.stripe_event('charge.refunded', {'object': 'charge', 'payment_intent': intent['id'],
+                                                               'amount_refunded': refund['amount']})
+        return 200, refund
+
+
+def _parse_settings(values, parse):
+    """KEY=VALUE flags into a dict, VALUE parsed by parse"""
+    settings = {}
+    for value in values or []:
+        key, _, setting = value.partition('=')
+        if not setting:
+            raise argparse.ArgumentTypeError(f"Expected KEY=VALUE, got {value!r}")
+        settings[key.strip()] = parse(setting)
+    return settings
+
+
+def _latency(value):
+    mean, _, jitter = value.partition(':')
+    return float(mean), float(jitter or 0)
+
+
+def _error_rate(value):
+    rate, _, status = value.partition(':')
+    return float(rate), int(status or DEFAULT_ERROR_STATUS)
+
+
+def build_server(host='127.0.0.1', port=DEFAULT_PORT, latency=None, errors=None, seed=None,
+                 mfa_code=DEFAULT_MFA_CODE, stripe_webhook=None, stripe_webhook_secret=None,
+                 callback_delay=0.0, verbose=False):
+    """Create (but do not start) a stand-in server"""
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.state = StandinState(mfa_code)
+    server.faults = Faults(latency, errors, seed)
+    server.callbacks = CallbackSender(server.state, stripe_webhook, stripe_webhook_secret, callback_delay)
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local SignalWire/Stripe stand-in for offline load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--latency', action='append', metavar='KEY=MS[:JITTER]',
+                        help='Added response time for a service (signalwire, stripe), a route or * (repeatable)')
+    parser.add_argument('--error-rate', action='append', metavar='KEY=RATE[:STATUS]',
+                        help=f"Fraction of requests to fail, with status (default {DEFAULT_ERROR_STATUS}) (repeatable)")
+    parser.add_argument('--seed', type=int, help='Seed for latency jitter and error injection')
+    parser.add_argument('--mfa-code', default=DEFAULT_MFA_CODE, help='Code every MFA request accepts')
+    parser.add_argument('--stripe-webhook', metavar='URL', help='Where to POST payment_intent.* events')
+    parser.add_argument('--stripe-webhook-secret', metavar='SECRET',
+                        help='Signs webhook events (match the app\'s STRIPE_WEBHOOK_SECRET)')
+    parser.add_argument('--callback-delay', type=float, default=0.0, metavar='MS',
+                        help='Wait before delivering status callbacks and webhooks')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args(argv)
+
+    try:
+        latency = _parse_settings(args.latency, _latency)
+        errors = _parse_settings(args.error_rate, _error_rate)
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+
+    server = build_server(args.host, args.port, latency, errors, args.seed, args.mfa_code,
+                          args.stripe_webhook, args.stripe_webhook_secret, args.callback_delay / 1000.0,
+                          args.verbose)
+    print(f"Service stand-in listening on http://{args.host}:{args.port}")
+    print(f"  latency: {latency or 'none'}  errors: {errors or 'none'}  webhook: {args.stripe_webhook or 'off'}")
+    print(f"  set SERVICE_STANDIN_URL=http://{args.host}:{args.port} for the apps")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()